@@ -0,0 +1,128 @@
+"""
+Compares encode and decode cost per codec on the shapes our feeds publish: a single pose
+sample and a batch of samples in one payload.
+
+    python -m benchmarks.codec_benchmark --repeats 20000
+"""
+
+import argparse
+import time
+import typing as T
+
+from google.protobuf import descriptor_pool, message_factory
+from google.protobuf.descriptor_pb2 import (  # pylint: disable=no-name-in-module
+    FieldDescriptorProto,
+    FileDescriptorProto,
+)
+from google.protobuf.message import Message
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.codec import (
+    Codec,
+    CodecError,
+    JsonCodec,
+    MsgpackCodec,
+    NumpyCodec,
+    ProtobufCodec,
+    StructCodec,
+)
+
+POSE_FIELDS = ["x", "y", "z", "roll", "pitch", "yaw"]
+POSE_DTYPE = [("utime", "<f8")] + [(name, "<f8") for name in POSE_FIELDS] + [("seq", "<u4")]
+POSE_STRUCT = "<d6dI"
+BATCH_SIZE = 100
+
+
+def make_pose_pb_type() -> T.Type[Message]:
+    """Builds the pose message at runtime so the benchmark needs no generated code"""
+    file_proto = FileDescriptorProto(
+        name="benchmarks/pose.proto",
+        package="benchmarks",
+        syntax="proto3",
+        dependency=["google/protobuf/timestamp.proto"],
+    )
+    message_proto = file_proto.message_type.add(name="PoseSample")
+    message_proto.field.add(
+        name="utime",
+        number=1,
+        type=FieldDescriptorProto.TYPE_MESSAGE,
+        type_name=".google.protobuf.Timestamp",
+    )
+    for number, name in enumerate(POSE_FIELDS, start=2):
+        message_proto.field.add(name=name, number=number, type=FieldDescriptorProto.TYPE_DOUBLE)
+    message_proto.field.add(
+        name="seq",
+        number=len(POSE_FIELDS) + 2,
+        type=FieldDescriptorProto.TYPE_UINT32,
+    )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(Timestamp.DESCRIPTOR.file.serialized_pb)
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("benchmarks.PoseSample"))
+
+
+def pose_values(seq: int) -> T.Dict[str, T.Any]:
+    values: T.Dict[str, T.Any] = {name: 0.1 * i + seq for i, name in enumerate(POSE_FIELDS)}
+    values["utime"] = time.time()
+    values["seq"] = seq
+    return values
+
+
+def make_cases() -> T.List[T.Tuple[str, Codec, T.Any]]:
+    pose_type = make_pose_pb_type()
+    sample = pose_values(1)
+    pose_pb = pose_type(**{name: sample[name] for name in POSE_FIELDS + ["seq"]})
+    T.cast(T.Any, pose_pb).utime.FromNanoseconds(int(sample["utime"] * 1e9))
+    pose_tuple = (sample["utime"], *[sample[name] for name in POSE_FIELDS], sample["seq"])
+    batch = [pose_values(seq) for seq in range(BATCH_SIZE)]
+
+    cases: T.List[T.Tuple[str, Codec, T.Any]] = [
+        ("protobuf", ProtobufCodec(pose_type), pose_pb),
+        ("json", JsonCodec(), sample),
+        ("struct", StructCodec(POSE_STRUCT), pose_tuple),
+        ("json batch", JsonCodec(), batch),
+    ]
+    try:
+        cases.append(("msgpack", MsgpackCodec(), sample))
+        cases.append(("msgpack batch", MsgpackCodec(), batch))
+    except CodecError:
+        print("msgpack is not installed, skipping")
+    try:
+        numpy_codec = NumpyCodec(POSE_DTYPE)
+        cases.append(("numpy", numpy_codec, [pose_tuple]))
+        cases.append(
+            (
+                "numpy batch",
+                numpy_codec,
+                [(p["utime"], *[p[name] for name in POSE_FIELDS], p["seq"]) for p in batch],
+            )
+        )
+    except CodecError:
+        print("numpy is not installed, skipping")
+    return cases
+
+
+def time_per_call(func: T.Callable[[], T.Any], repeats: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'codec':<15} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    for name, codec, message in make_cases():
+        data = codec.encode(message)
+        repeats = args.repeats // BATCH_SIZE if "batch" in name else args.repeats
+        encode = time_per_call(lambda c=codec, m=message: c.encode(m), repeats)  # type: ignore
+        decode = time_per_call(lambda c=codec, d=data: c.decode(d), repeats)  # type: ignore
+        print(f"{name:<15} {len(data):>7} {encode * 1e6:>10.2f} {decode * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
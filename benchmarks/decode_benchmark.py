@@ -0,0 +1,85 @@
+"""
+Measures the decode hot path of message_handler with and without message reuse: time per
+message, message instances allocated, garbage collector runs and the peak of memory traced
+while handling a burst.
+
+Note that with the upb backend the message storage lives in C arenas that tracemalloc
+does not see, run with PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python to trace it too.
+
+    python -m benchmarks.decode_benchmark --messages 50000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+import typing as T
+
+from google.protobuf.message import Message
+
+from benchmarks.codec_benchmark import POSE_FIELDS, make_pose_pb_type
+from ry_redis_bus.helpers import message_handler
+
+
+def make_items(pose_type: T.Type[Message], count: int) -> T.List[T.Dict[str, T.Any]]:
+    items = []
+    for seq in range(count):
+        pose = T.cast(T.Any, pose_type(seq=seq, **{name: float(seq) for name in POSE_FIELDS}))
+        pose.utime.GetCurrentTime()
+        items.append({"type": "message", "channel": b"pose", "data": pose.SerializeToString()})
+    return items
+
+
+def make_handler(pose_type: T.Type[Message], reuse: bool) -> T.Callable[[T.Any], None]:
+    def on_pose(message: Message) -> None:
+        del message
+
+    # The annotation has to be the runtime built type for message_handler to infer it
+    on_pose.__annotations__["message"] = pose_type
+    return T.cast(
+        T.Callable[[T.Any], None], message_handler(warn_latency=False, reuse=reuse)(on_pose)
+    )
+
+
+def gc_collections() -> int:
+    return sum(int(stats["collections"]) for stats in gc.get_stats())
+
+
+def run(handler: T.Callable[[T.Any], None], items: T.List[T.Dict[str, T.Any]]) -> None:
+    gc.collect()
+    collections = gc_collections()
+    start = time.perf_counter()
+    for item in items:
+        handler(item)
+    elapsed = time.perf_counter() - start
+    collections = gc_collections() - collections
+
+    pool = getattr(handler, "message_pool")
+    allocated = pool.allocated if pool is not None else len(items)
+
+    tracemalloc.start()
+    for item in items:
+        handler(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{elapsed / len(items) * 1e6:8.2f} us/msg  {allocated:8d} instances  "
+        f"{collections:5d} gc runs  {peak / 1024:8.1f} KiB peak traced"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    pose_type = make_pose_pb_type()
+    items = make_items(pose_type, args.messages)
+    for reuse in (False, True):
+        print(f"{'reuse' if reuse else 'fresh':<6}", end=" ")
+        run(make_handler(pose_type, reuse), items)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Measures what the clients themselves cost per message, from get_message to the handler
+returning, by running them on the in-process broker instead of a Redis server. The
+messages are queued up front, then step() is timed until every one was handled.
+
+    python -m benchmarks.dispatch_benchmark --messages 100000
+"""
+
+import argparse
+import asyncio
+import time
+import typing as T
+import uuid
+
+from google.protobuf.message import Message
+from ryutils.verbose import Verbose
+
+from benchmarks.codec_benchmark import POSE_FIELDS, make_pose_pb_type
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo, message_handler
+from ry_redis_bus.memory_broker import InMemoryBroker
+from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+CHANNEL = Channel("pose", None)
+
+
+def make_payloads(pose_type: T.Type[Message], count: int) -> T.List[bytes]:
+    payloads = []
+    for seq in range(count):
+        pose = T.cast(T.Any, pose_type(seq=seq, **{name: float(seq) for name in POSE_FIELDS}))
+        pose.utime.GetCurrentTime()
+        payloads.append(pose.SerializeToString())
+    return payloads
+
+
+def make_handlers(pose_type: T.Type[Message], counter: T.List[int]) -> T.Dict[str, T.Any]:
+    def raw(item: T.Any) -> None:
+        del item
+        counter[0] += 1
+
+    def on_pose(message: Message) -> None:
+        del message
+        counter[0] += 1
+
+    async def aon_pose(message: Message) -> None:
+        del message
+        counter[0] += 1
+
+    # The annotation has to be the runtime built type for message_handler to infer it
+    on_pose.__annotations__["message"] = pose_type
+    aon_pose.__annotations__["message"] = pose_type
+    return {
+        "raw": raw,
+        "decoded": message_handler(warn_latency=False)(on_pose),
+        "decoded async": message_handler(warn_latency=False)(aon_pose),
+    }
+
+
+def redis_info() -> RedisInfo:
+    return RedisInfo(f"memory-{uuid.uuid4().hex}", 6379, 0, "", "", "benchmark")
+
+
+def run_sync(handler: T.Any, payloads: T.List[bytes], counter: T.List[int]) -> float:
+    broker = InMemoryBroker()
+    client = SyncRedisClientBase(redis_info(), Verbose(verbose_types=["ipc"]), backend=broker)
+    client.cooldown = 0.0
+    client.subscribe(CHANNEL, handler)
+    for payload in payloads:
+        broker.publish(str(CHANNEL), payload)
+
+    counter[0] = 0
+    start = time.perf_counter()
+    while counter[0] < len(payloads):
+        client.step()
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed / len(payloads)
+
+
+async def run_async(handler: T.Any, payloads: T.List[bytes], counter: T.List[int]) -> float:
+    broker = InMemoryBroker()
+    client = AsyncRedisClientBase(redis_info(), Verbose(verbose_types=["ipc"]), backend=broker)
+    await client.subscribe(CHANNEL, handler)
+    for payload in payloads:
+        broker.publish(str(CHANNEL), payload)
+
+    counter[0] = 0
+    start = time.perf_counter()
+    while counter[0] < len(payloads):
+        await client.step()
+        # Handlers run as tasks, let them finish
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return elapsed / len(payloads)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    pose_type = make_pose_pb_type()
+    payloads = make_payloads(pose_type, args.messages)
+    counter = [0]
+    handlers = make_handlers(pose_type, counter)
+
+    for name in ("raw", "decoded"):
+        per_message = run_sync(handlers[name], payloads, counter)
+        print(f"sync  {name:<14} {per_message * 1e6:8.2f} us/msg")
+    for name in ("raw", "decoded async"):
+        per_message = asyncio.run(run_async(handlers[name], payloads, counter))
+        print(f"async {name:<14} {per_message * 1e6:8.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
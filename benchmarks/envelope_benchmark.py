@@ -0,0 +1,50 @@
+"""
+Times the per-message bookkeeping on the way from a received item to a decorated handler,
+the way it was done before against how the clients do it now: decoding the channel name
+against looking up its interned name, and checking the client's RedisInfo against
+RedisInfo.null() against RedisInfo.is_null(). dispatch_benchmark shows what it adds up to
+per message.
+
+    python -m benchmarks.envelope_benchmark --iterations 1000000
+"""
+
+import argparse
+import timeit
+import typing as T
+
+from ry_redis_bus.envelope import channel_name
+from ry_redis_bus.helpers import RedisInfo
+
+
+def cases(item: T.Dict[str, T.Any]) -> T.List[T.Tuple[str, T.Callable[[], T.Any], T.Any]]:
+    redis_info = RedisInfo("localhost", 6379, 0, "", "", "benchmark")
+    return [
+        (
+            "channel name",
+            lambda: item["channel"].decode("utf-8"),
+            lambda: channel_name(item),
+        ),
+        (
+            "null check",
+            lambda: redis_info == RedisInfo.null(),
+            redis_info.is_null,
+        ),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000000)
+    args = parser.parse_args()
+
+    item = {"type": "message", "pattern": None, "channel": b"robot.pose", "data": b"x" * 64}
+    print(f"{'':<14} {'before':>10} {'after':>10}")
+    for name, before, after in cases(item):
+        times = [
+            timeit.timeit(run, number=args.iterations) / args.iterations for run in (before, after)
+        ]
+        print(f"{name:<14} {times[0] * 1e9:7.0f} ns {times[1] * 1e9:7.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Tracks import and construction cost of RedisClientBase.
+
+Each import is measured in a fresh interpreter so module caches do not hide the cost.
+
+    python -m benchmarks.import_benchmark --repeats 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import typing as T
+
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.redis_client_base import RedisClientBase
+from ry_redis_bus.redis_info import RedisInfo
+
+IMPORT_TARGETS = [
+    "ry_redis_bus",
+    "ry_redis_bus.redis_client_base",
+    "ry_redis_bus.redis_client_base_sync",
+    "ry_redis_bus.redis_client_base_async",
+]
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module: str, repeats: int) -> T.List[float]:
+    samples = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        samples.append(float(output.strip()))
+    return samples
+
+
+def time_construction(repeats: int) -> T.List[float]:
+    redis_info = RedisInfo("localhost", 6379, 0, "", "", "benchmark")
+    verbose = Verbose()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        RedisClientBase(redis_info, verbose=verbose)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name: str, samples: T.List[float]) -> None:
+    print(
+        f"{name:<45} median {statistics.median(samples) * 1e6:10.1f} us  "
+        f"min {min(samples) * 1e6:10.1f} us"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    for module in IMPORT_TARGETS:
+        report(f"import {module}", time_import(module, args.repeats))
+    report("construct RedisClientBase", time_construction(args.repeats * 100))
+
+
+if __name__ == "__main__":
+    main()
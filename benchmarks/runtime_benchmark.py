@@ -0,0 +1,118 @@
+"""
+Compares async clients on the default runtime against the same clients with a
+PerformanceProfile, started through ry_redis_bus.performance.run so they get uvloop when it
+is installed. Each message carries the perf_counter of its publish, and the subscriber's
+handler records how long it took to arrive. Publishes go out in windows of --window
+messages, each one stepped until handled, which reports throughput along with the p50
+and p99 latency. Needs a Redis server and is skipped when none answers.
+
+    python -m benchmarks.runtime_benchmark --messages 20000 --size 256
+"""
+
+import argparse
+import asyncio
+import struct
+import time
+import typing as T
+import uuid
+
+from ryutils.verbose import Verbose
+
+from benchmarks.shm_benchmark import redis_available
+from ry_redis_bus import performance
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.performance import PerformanceProfile, hiredis_available
+from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
+
+STAMP = struct.Struct("<d")
+
+
+def make_client(
+    redis_info: RedisInfo, profile: T.Optional[PerformanceProfile]
+) -> AsyncRedisClientBase:
+    client = AsyncRedisClientBase(
+        redis_info, verbose=Verbose(verbose_types=["ipc"]), performance=profile
+    )
+    client.cooldown = 0.0
+    return client
+
+
+def percentile(values: T.Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def measure(
+    redis_info: RedisInfo,
+    channel: Channel,
+    profile: T.Optional[PerformanceProfile],
+    messages: int,
+    size: int,
+    window: int,
+) -> T.Tuple[float, T.List[float]]:
+    """Messages per second and the publish to handler latencies"""
+    publisher, subscriber = make_client(redis_info, profile), make_client(redis_info, profile)
+    latencies: T.List[float] = []
+
+    def handle(item: T.Dict[str, T.Any]) -> None:
+        latencies.append(time.perf_counter() - STAMP.unpack_from(item["data"])[0])
+
+    await subscriber.subscribe(channel, handle)
+    await subscriber.step()
+
+    padding = b"x" * max(size - STAMP.size, 0)
+    try:
+        start = time.perf_counter()
+        while len(latencies) < messages:
+            for _ in range(min(window, messages - len(latencies))):
+                await publisher.publish(channel, STAMP.pack(time.perf_counter()) + padding)
+            expected = min(messages, len(latencies) + window)
+            while len(latencies) < expected:
+                await subscriber.step()
+        return messages / (time.perf_counter() - start), latencies
+    finally:
+        await subscriber.close()
+        await publisher.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    redis_info = RedisInfo(args.host, args.port, 0, "", "", "benchmark")
+    if not redis_available(redis_info):
+        print("redis not reachable, skipping")
+        return
+
+    print(f"hiredis {'available' if hiredis_available() else 'missing'}")
+    profile = PerformanceProfile()
+    name = f"runtime_benchmark_{uuid.uuid4().hex[:8]}"
+    cases: T.List[T.Tuple[str, T.Callable[[T.Coroutine[T.Any, T.Any, T.Any]], T.Any]]] = [
+        ("default", asyncio.run),
+        ("tuned", lambda coroutine: performance.run(coroutine, profile)),
+    ]
+    for label, runner in cases:
+        rate, latencies = runner(
+            measure(
+                redis_info,
+                Channel(f"{name}_{label}", None),
+                profile if label == "tuned" else None,
+                args.messages,
+                args.size,
+                args.window,
+            )
+        )
+        print(
+            f"{label:<8} {rate:10.0f} msg/s  p50 {percentile(latencies, 0.5) * 1e6:8.1f} us"
+            f"  p99 {percentile(latencies, 0.99) * 1e6:8.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compares the round trip of a message between two clients on this host through the shared
+memory ring against the same message going through the Redis server: publish, then poll
+until the subscriber's handler got it. The bare ring, without the clients around it, is
+timed as well; the client paths need a Redis server and are skipped when none answers.
+
+    python -m benchmarks.shm_benchmark --messages 20000 --size 256
+"""
+
+import argparse
+import time
+import typing as T
+import uuid
+
+import redis
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+from ry_redis_bus.shm_transport import SharedMemoryTransport, ShmRingConfig
+
+
+def make_client(redis_info: RedisInfo) -> SyncRedisClientBase:
+    client = SyncRedisClientBase(redis_info, verbose=Verbose(verbose_types=["ipc"]))
+    client.cooldown = 0.0
+    return client
+
+
+def run(redis_info: RedisInfo, channel: Channel, messages: int, size: int) -> float:
+    """Seconds per message from publish to the subscriber's handler"""
+    publisher, subscriber = make_client(redis_info), make_client(redis_info)
+    received: T.List[int] = []
+    subscriber.subscribe(channel, lambda item: received.append(len(item["data"])))
+    subscriber.step()
+
+    payload = b"x" * size
+    try:
+        start = time.perf_counter()
+        for count in range(1, messages + 1):
+            publisher.publish(channel, payload)
+            while len(received) < count:
+                subscriber.step()
+        return (time.perf_counter() - start) / messages
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def run_ring(config: ShmRingConfig, messages: int, size: int) -> float:
+    """Seconds per message for a write and poll of the ring alone"""
+    namespace = uuid.uuid4().hex
+    reader, writer = SharedMemoryTransport(namespace), SharedMemoryTransport(namespace)
+    reader.open_reader("bench", config)
+    ring = writer.writer("bench", config)
+    assert ring is not None
+
+    payload = b"x" * size
+    try:
+        start = time.perf_counter()
+        for _ in range(messages):
+            ring.write(payload)
+            reader.poll(1, now=0.0)
+        return (time.perf_counter() - start) / messages
+    finally:
+        writer.close()
+        reader.close()
+
+
+def redis_available(redis_info: RedisInfo) -> bool:
+    try:
+        return bool(redis.Redis(host=redis_info.host, port=redis_info.port).ping())
+    except redis.exceptions.ConnectionError:
+        return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    redis_info = RedisInfo(args.host, args.port, 0, "", "", "benchmark")
+    name = f"shm_benchmark_{uuid.uuid4().hex[:8]}"
+    ring = ShmRingConfig(slot_size=max(args.size, 64))
+    print(f"{'ring':<6} {run_ring(ring, args.messages, args.size) * 1e6:8.2f} us/msg")
+    if not redis_available(redis_info):
+        print("redis not reachable, skipping the client paths")
+        return
+
+    cases = [
+        ("shm", Channel(name, None, shared_memory=ring)),
+        ("redis", Channel(name + "_redis", None)),
+    ]
+    for label, channel in cases:
+        per_message = run(redis_info, channel, args.messages, args.size)
+        print(f"{label:<6} {per_message * 1e6:8.2f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Columnar archive of the messages an IpcLogger captures.
+
+ArchiveSink is a log_callback for IpcLogger. Messages of the channels it is given are
+decoded through their protobuf types and flattened into one column per singular scalar
+field, with dotted names for nested messages and Timestamp fields as float seconds, next
+to a log_time column. Repeated and bytes fields are left out. Rows are buffered per channel
+and hour and written as files of up to max_rows rows under
+
+    directory/channel=<name>/hour=<YYYYMMDDHH>/part-<first log time>-<id>.<format>
+
+so a query over a few channels and hours only opens their files, and read_columns only
+reads the columns it is asked for. Buffers are written once they are full, older than
+max_delay, or their hour is over, checked as messages come in, and all of them on close().
+A buffer that fails to write keeps its rows and is tried again on the next check. While it
+keeps failing it holds at most max_rows rows; the oldest are dropped to make room and
+counted in rows_dropped.
+
+Files are Parquet when pyarrow is installed. Without it they are NumPy .npz archives with
+one compressed array per column, which np.load reads column by column.
+"""
+
+import collections
+import contextlib
+import os
+import time
+import typing as T
+import urllib.parse
+import uuid
+from dataclasses import dataclass
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.message import DecodeError, Message
+from ryutils import log
+
+from ry_redis_bus.codec import optional_import, require
+from ry_redis_bus.wire import is_repeated
+
+if T.TYPE_CHECKING:
+    from ry_redis_bus.channels import Channel
+    from ry_redis_bus.ipc_logger import LogIpcMessage
+
+DEFAULT_MAX_ROWS = 100_000
+DEFAULT_MAX_DELAY = 300.0
+# Nested messages deeper than this, usually recursive types, are not flattened
+MAX_FLATTEN_DEPTH = 4
+LOG_TIME_COLUMN = "log_time"
+# How often add() looks for buffers that are due, in seconds
+FLUSH_CHECK_PERIOD = 1.0
+# Share of max_rows a failing buffer drops at once, so it does not shift every row
+FAILED_DROP_FRACTION = 0.1
+
+Getter = T.Callable[[Message], T.Any]
+
+
+@dataclass
+class ArchivePolicy:
+    directory: str
+    max_rows: int = DEFAULT_MAX_ROWS
+    max_delay: float = DEFAULT_MAX_DELAY
+    # "parquet" or "npz", parquet when pyarrow is installed by default
+    format: T.Optional[str] = None
+
+
+def _timestamp_getter(getter: Getter) -> Getter:
+    def seconds(message: Message) -> float:
+        timestamp = getter(message)
+        return float(timestamp.seconds + timestamp.nanos / 1_000_000_000)
+
+    return seconds
+
+
+def _child_getter(getter: T.Optional[Getter], name: str) -> Getter:
+    if getter is None:
+        return lambda message: getattr(message, name)
+    return lambda message: getattr(getter(message), name)
+
+
+def flatten_fields(
+    descriptor: T.Any, prefix: str = "", getter: T.Optional[Getter] = None, depth: int = 0
+) -> T.List[T.Tuple[str, Getter]]:
+    """Column names and getters of the singular scalar fields of a message type"""
+    columns: T.List[T.Tuple[str, Getter]] = []
+    for field in descriptor.fields:
+        if is_repeated(field) or field.type == FieldDescriptor.TYPE_BYTES:
+            continue
+        name = f"{prefix}{field.name}"
+        field_getter = _child_getter(getter, field.name)
+        if field.type != FieldDescriptor.TYPE_MESSAGE:
+            columns.append((name, field_getter))
+        elif field.message_type.full_name == "google.protobuf.Timestamp":
+            columns.append((name, _timestamp_getter(field_getter)))
+        elif depth + 1 < MAX_FLATTEN_DEPTH:
+            columns.extend(flatten_fields(field.message_type, f"{name}.", field_getter, depth + 1))
+    return columns
+
+
+def hour_of(seconds: float) -> str:
+    return time.strftime("%Y%m%d%H", time.gmtime(seconds))
+
+
+def channel_path(directory: str, channel: str) -> str:
+    # Hive style, so pyarrow.dataset discovers channel and hour as partition columns
+    return os.path.join(directory, f"channel={urllib.parse.quote(channel, safe='')}")
+
+
+def partition_path(directory: str, channel: str, hour: str) -> str:
+    return os.path.join(channel_path(directory, channel), f"hour={hour}")
+
+
+def write_parquet(path: str, columns: T.Dict[str, T.List[T.Any]]) -> None:
+    pa, pq = require("pyarrow"), require("pyarrow.parquet")
+    pq.write_table(pa.table(columns), path)
+
+
+def write_npz(path: str, columns: T.Dict[str, T.List[T.Any]]) -> None:
+    np = require("numpy")
+    with open(path, "wb") as output:
+        np.savez_compressed(
+            output, **{name: np.asarray(values) for name, values in columns.items()}
+        )
+
+
+WRITERS: T.Dict[str, T.Callable[[str, T.Dict[str, T.List[T.Any]]], None]] = {
+    "parquet": write_parquet,
+    "npz": write_npz,
+}
+
+
+def default_format() -> str:
+    if optional_import("pyarrow.parquet") is not None:
+        return "parquet"
+    if optional_import("numpy") is not None:
+        return "npz"
+    raise ValueError("The archive needs pyarrow or numpy installed")
+
+
+class PartitionBuffer:
+    """Rows of one channel and hour that are not written yet"""
+
+    def __init__(self, names: T.Sequence[str], started_at: float, first_log_time: float) -> None:
+        self.columns: T.Dict[str, T.List[T.Any]] = {name: [] for name in names}
+        self.started_at = started_at
+        self.first_log_time = first_log_time
+        self.rows = 0
+        # A failed write is tried again by flush() rather than on every new row
+        self.failed = False
+
+    def append(self, row: T.Sequence[T.Any]) -> None:
+        for values, value in zip(self.columns.values(), row):
+            values.append(value)
+        self.rows += 1
+
+    def drop_oldest(self, count: int) -> int:
+        count = min(count, self.rows)
+        for values in self.columns.values():
+            del values[:count]
+        self.rows -= count
+        if self.rows:
+            self.first_log_time = self.columns[LOG_TIME_COLUMN][0]
+        return count
+
+
+class ArchiveSink:
+    """IpcLogger callback that writes the messages of the given channels to the archive"""
+
+    def __init__(self, policy: ArchivePolicy, channels: T.Iterable["Channel"]) -> None:
+        self.policy = policy
+        self.format = policy.format or default_format()
+        if self.format not in WRITERS:
+            raise ValueError(f"Unknown archive format {self.format!r}")
+        if optional_import("pyarrow.parquet" if self.format == "parquet" else "numpy") is None:
+            raise ValueError(f"The {self.format} archive format is not available")
+
+        self.message_types: T.Dict[str, T.Type[Message]] = {
+            channel.name: channel.pb_type for channel in channels if channel.pb_type is not Message
+        }
+        self._flatteners: T.Dict[T.Type[Message], T.List[T.Tuple[str, Getter]]] = {}
+        self._buffers: T.Dict[T.Tuple[str, str], PartitionBuffer] = {}
+        self._flush_checked = 0.0
+
+        self.skipped: T.Counter[str] = collections.Counter()
+        self.decode_failures: T.Counter[str] = collections.Counter()
+        self.rows_written = 0
+        self.files_written = 0
+        self.write_failures = 0
+        # Rows given up on while their buffer could not be written, per channel
+        self.rows_dropped: T.Counter[str] = collections.Counter()
+
+    def __call__(self, log_msg: "LogIpcMessage") -> None:
+        self.add(log_msg)
+
+    def _flattener(self, message_type: T.Type[Message]) -> T.List[T.Tuple[str, Getter]]:
+        flattener = self._flatteners.get(message_type)
+        if flattener is None:
+            flattener = self._flatteners[message_type] = flatten_fields(message_type.DESCRIPTOR)
+        return flattener
+
+    def add(self, log_msg: "LogIpcMessage", now: T.Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        message_type = self.message_types.get(log_msg.channel)
+        if message_type is None:
+            self.skipped[log_msg.channel] += 1
+        else:
+            self._add_row(log_msg, message_type, now)
+        if now - self._flush_checked >= FLUSH_CHECK_PERIOD:
+            self._flush_checked = now
+            self.flush(now)
+
+    def _add_row(self, log_msg: "LogIpcMessage", message_type: T.Type[Message], now: float) -> None:
+        data = log_msg.message
+        try:
+            message = message_type.FromString(data.encode() if isinstance(data, str) else data)
+        except DecodeError:
+            self.decode_failures[log_msg.channel] += 1
+            return
+
+        log_time = log_msg.utime.seconds + log_msg.utime.nanos / 1_000_000_000
+        flattener = self._flattener(message_type)
+        key = (log_msg.channel, hour_of(log_time))
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            names = [LOG_TIME_COLUMN] + [name for name, _ in flattener]
+            buffer = self._buffers[key] = PartitionBuffer(names, now, log_time)
+        buffer.append([log_time] + [getter(message) for _, getter in flattener])
+        if buffer.rows < self.policy.max_rows:
+            return
+        if not buffer.failed:
+            self._write(key)
+        elif buffer.rows > self.policy.max_rows:
+            chunk = max(1, int(self.policy.max_rows * FAILED_DROP_FRACTION))
+            self.rows_dropped[log_msg.channel] += buffer.drop_oldest(chunk)
+
+    def flush(self, now: T.Optional[float] = None, force: bool = False) -> None:
+        """Writes the buffers that are full, too old or whose hour is over, all when forced"""
+        now = time.time() if now is None else now
+        current_hour = hour_of(now)
+        due = [
+            key
+            for key, buffer in self._buffers.items()
+            if force
+            or key[1] < current_hour
+            or now - buffer.started_at >= self.policy.max_delay
+            or buffer.rows >= self.policy.max_rows
+        ]
+        for key in due:
+            self._write(key)
+
+    def close(self) -> None:
+        self.flush(force=True)
+
+    def _write(self, key: T.Tuple[str, str]) -> None:
+        """Writes the buffer of key, which is kept to be tried again if that fails"""
+        buffer = self._buffers[key]
+        if not buffer.rows:
+            del self._buffers[key]
+            return
+        directory = partition_path(self.policy.directory, *key)
+        first = int(buffer.first_log_time * 1000)
+        path = os.path.join(directory, f"part-{first}-{uuid.uuid4().hex[:8]}.{self.format}")
+        # Readers never see a half written file
+        partial = path + ".tmp"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            WRITERS[self.format](partial, buffer.columns)
+            os.replace(partial, path)
+        # The writers raise whatever pyarrow or numpy raise, none of it may reach IpcLogger
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self.write_failures += 1
+            buffer.failed = True
+            log.print_fail(f"Failed to write {buffer.rows} archived rows to {path}: {exc}")
+            with contextlib.suppress(OSError):
+                os.remove(partial)
+            return
+        del self._buffers[key]
+        self.rows_written += buffer.rows
+        self.files_written += 1
+
+
+def archive_files(
+    directory: str, channel: str, hours: T.Optional[T.Container[str]] = None
+) -> T.List[str]:
+    """Files of channel, of the given YYYYMMDDHH hours or all of them, oldest first"""
+    root = channel_path(directory, channel)
+    if not os.path.isdir(root):
+        return []
+    files: T.List[str] = []
+    for partition in sorted(os.listdir(root)):
+        if hours is not None and partition.removeprefix("hour=") not in hours:
+            continue
+        files.extend(
+            os.path.join(root, partition, name)
+            for name in sorted(os.listdir(os.path.join(root, partition)))
+            if name.endswith((".parquet", ".npz"))
+        )
+    return files
+
+
+def read_columns(
+    directory: str,
+    channel: str,
+    columns: T.Sequence[str],
+    hours: T.Optional[T.Container[str]] = None,
+) -> T.Dict[str, T.List[T.Any]]:
+    """Reads only the given columns of the archived messages of channel"""
+    result: T.Dict[str, T.List[T.Any]] = {name: [] for name in columns}
+    for path in archive_files(directory, channel, hours):
+        if path.endswith(".parquet"):
+            table = require("pyarrow.parquet").read_table(path, columns=list(columns))
+            for name in columns:
+                result[name].extend(table.column(name).to_pylist())
+        else:
+            with require("numpy").load(path) as archive:
+                for name in columns:
+                    result[name].extend(archive[name].tolist())
+    return result
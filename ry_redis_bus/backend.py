@@ -0,0 +1,17 @@
+import typing as T
+
+from ry_redis_bus.redis_info import RedisInfo
+
+
+class Backend(T.Protocol):
+    """
+    Where a client gets its connection from when it should not talk to a Redis server.
+    The returned objects need the parts of the redis.Redis / redis.asyncio.Redis API the
+    clients use: ping, publish, pubsub, pubsub_numsub, zadd, zrange, hset, hget, hmget,
+    pipeline, client_list and close, and for a key cache get, mget, client_id and
+    client_tracking_on / client_tracking_off / client_trackinginfo.
+    """
+
+    def connect(self, redis_info: RedisInfo, client_name: str) -> T.Any: ...
+
+    async def aconnect(self, redis_info: RedisInfo, client_name: str) -> T.Any: ...
@@ -0,0 +1,132 @@
+import typing as T
+from dataclasses import dataclass, field
+
+from ryutils import log
+
+from ry_redis_bus.subscription import Priority, SubscriptionOptions
+
+DEFAULT_SAMPLE_PERIOD = 5.0
+# Redis defaults to a pubsub soft limit of 8mb over 60 seconds and a hard limit of 32mb
+DEFAULT_OMEM_HIGH_WATER = 4 * 1024 * 1024
+DEFAULT_OMEM_LOW_WATER = 1 * 1024 * 1024
+DEFAULT_BACKLOG_HIGH_WATER = 8000
+DEFAULT_BACKLOG_LOW_WATER = 1000
+
+
+@dataclass
+class BufferStats:
+    """Snapshot of the server side output buffers of our pubsub connections and local backlog"""
+
+    omem: int = 0
+    qbuf: int = 0
+    connections: int = 0
+    backlog: int = 0
+    sampled_at: float = 0.0
+
+
+@dataclass
+class SheddingPolicy:
+    """
+    Configures buffer sampling and what to shed once a slow consumer is detected.
+
+    Shedding starts once either high water mark is crossed and stops once both values
+    are back under their low water marks. Paused channels are unsubscribed on the server
+    so it stops buffering them, and with conflate every remaining non high priority channel
+    only has its newest message handled until the client catches up.
+    """
+
+    sample_period: float = DEFAULT_SAMPLE_PERIOD
+    omem_high_water: int = DEFAULT_OMEM_HIGH_WATER
+    omem_low_water: int = DEFAULT_OMEM_LOW_WATER
+    backlog_high_water: int = DEFAULT_BACKLOG_HIGH_WATER
+    backlog_low_water: int = DEFAULT_BACKLOG_LOW_WATER
+    pause_priorities: T.Tuple[Priority, ...] = field(default_factory=lambda: (Priority.BULK,))
+    conflate: bool = True
+
+    def should_start(self, stats: BufferStats) -> bool:
+        return stats.omem >= self.omem_high_water or stats.backlog >= self.backlog_high_water
+
+    def should_stop(self, stats: BufferStats) -> bool:
+        return stats.omem <= self.omem_low_water and stats.backlog <= self.backlog_low_water
+
+
+def parse_client_list(
+    client_name: str, clients: T.Iterable[T.Dict[str, T.Any]], backlog: int, now: float
+) -> BufferStats:
+    """Sums the buffer usage of the pubsub connections that belong to client_name"""
+    stats = BufferStats(backlog=backlog, sampled_at=now)
+    for client in clients:
+        if client.get("name") != client_name:
+            continue
+        if int(client.get("sub", 0)) == 0 and int(client.get("psub", 0)) == 0:
+            continue
+        stats.omem += int(client.get("omem", 0))
+        stats.qbuf += int(client.get("qbuf", 0))
+        stats.connections += 1
+    return stats
+
+
+class LoadShedder:
+    """
+    Shedding state of one client: the last buffer sample, whether it is shedding and the
+    channels it paused. The client samples the buffers and (un)subscribes what update returns.
+    """
+
+    def __init__(self, policy: T.Optional[SheddingPolicy], owner: str) -> None:
+        self.policy = policy
+        self.owner = owner
+        self.stats = BufferStats()
+        self.active = False
+        self.paused: T.Set[str] = set()
+        self._sampled_at = 0.0
+
+    def due(self, now: float) -> bool:
+        """Whether the buffers should be sampled now, which is remembered if so"""
+        if self.policy is None or now - self._sampled_at < self.policy.sample_period:
+            return False
+        self._sampled_at = now
+        return True
+
+    def conflates(self, priority: bool) -> bool:
+        """Whether messages of the lane are conflated because the client is shedding"""
+        return self.active and self.policy is not None and self.policy.conflate and not priority
+
+    def update(
+        self, stats: BufferStats, subscriptions: T.Mapping[str, SubscriptionOptions], verbose: bool
+    ) -> T.Tuple[T.List[str], T.List[str]]:
+        """Returns the channels to unsubscribe and to subscribe again after a new sample"""
+        policy = T.cast(SheddingPolicy, self.policy)
+        if verbose:
+            log.print_normal(
+                f"Output buffer omem={stats.omem} qbuf={stats.qbuf} backlog={stats.backlog}"
+            )
+
+        if not self.active and policy.should_start(stats):
+            self.active = True
+            log.print_warn(
+                f"{self.owner} is a slow consumer "
+                f"(omem={stats.omem} backlog={stats.backlog}), shedding load..."
+            )
+            paused = [
+                channel
+                for channel, options in subscriptions.items()
+                if options.priority in policy.pause_priorities
+            ]
+            for channel in paused:
+                log.print_warn(f"Paused '{channel}' channel.")
+            self.paused.update(paused)
+            return paused, []
+
+        if self.active and policy.should_stop(stats):
+            resumed = [channel for channel in self.paused if channel in subscriptions]
+            self.reset()
+            log.print_ok(
+                f"{self.owner} caught up "
+                f"(omem={stats.omem} backlog={stats.backlog}), resumed all channels."
+            )
+            return [], resumed
+        return [], []
+
+    def reset(self) -> None:
+        self.active = False
+        self.paused.clear()
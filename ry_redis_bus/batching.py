@@ -0,0 +1,207 @@
+"""
+Batch handlers receive every message of a channel drained in one step() with a single call.
+
+    @batch_message_handler(fields=["x", "y", "utime.seconds"], max_batch=500)
+    def on_poses(self, columns: T.Dict[str, np.ndarray]) -> None:
+        ...
+
+The client collects the raw items per channel and hands them over at the end of the step,
+or earlier once max_batch items are pending. With max_delay the batch is held across
+steps until its oldest item is that many seconds old.
+"""
+
+import asyncio
+import functools
+import inspect
+import operator
+import time
+import typing as T
+from dataclasses import dataclass, field
+
+from google.protobuf.message import Message
+from ryutils import log
+
+from ry_redis_bus.codec import optional_import
+from ry_redis_bus.helpers import FuncTyping, decode_message
+
+DEFAULT_MAX_BATCH = 1000
+
+Columns = T.Dict[str, T.Any]
+
+
+@dataclass
+class BatchOptions:
+    fields: T.Optional[T.Sequence[str]] = None
+    max_batch: int = DEFAULT_MAX_BATCH
+    max_delay: float = 0.0
+    message_type: T.Optional[T.Type[Message]] = None
+
+
+@dataclass
+class PendingBatch:
+    started_at: float
+    items: T.List[T.Any] = field(default_factory=list)
+
+
+def batch_options(handler: T.Any) -> T.Optional[BatchOptions]:
+    """Options of a batch_message_handler, also found through bound methods"""
+    return T.cast(T.Optional[BatchOptions], getattr(handler, "batch_options", None))
+
+
+def infer_batch_message_type(func: FuncTyping) -> T.Optional[T.Type[Message]]:
+    """Finds X in a List[X] / Sequence[X] annotation of the batch parameter"""
+    parameters = list(inspect.signature(func).parameters.values())  # type: ignore
+    index = 1 if parameters and parameters[0].name == "self" else 0
+    for arg in T.get_args(parameters[index].annotation):
+        if inspect.isclass(arg) and issubclass(arg, Message):
+            return arg
+    return None
+
+
+def to_columns(messages: T.Sequence[T.Any], fields: T.Sequence[str]) -> Columns:
+    """
+    Gathers the selected scalar fields into one numpy array per field, or lists without
+    numpy. Dotted names reach into nested messages. Structured numpy records, as decoded
+    by NumpyCodec, are concatenated and sliced without touching each record.
+    """
+    np = optional_import("numpy")
+    if np is not None and messages and isinstance(messages[0], np.ndarray):
+        records = np.concatenate(messages)
+        return {name: records[name] for name in fields}
+
+    columns: Columns = {}
+    for name in fields:
+        getter = operator.attrgetter(name)
+        values = [getter(message) for message in messages]
+        columns[name] = np.asarray(values) if np is not None else values
+    return columns
+
+
+def decode_batch(
+    items: T.Sequence[T.Any], options: BatchOptions, verbose: bool = False
+) -> T.Union[T.List[T.Any], Columns]:
+    messages = []
+    for item in items:
+        message = decode_message(item, options.message_type, verbose=verbose)
+        if message is not None:
+            messages.append(message)
+
+    if options.fields is None:
+        return messages
+    return to_columns(messages, options.fields)
+
+
+def batch_message_handler(
+    func: T.Optional[FuncTyping] = None,
+    *,
+    fields: T.Optional[T.Sequence[str]] = None,
+    max_batch: int = DEFAULT_MAX_BATCH,
+    max_delay: float = 0.0,
+    message_type: T.Optional[T.Type[Message]] = None,
+    verbose: bool = False,
+) -> T.Any:
+    """
+    A decorator for handlers that take every pending message of a channel at once.
+    Can be used as:
+        @batch_message_handler
+        @batch_message_handler(max_batch=100, max_delay=0.5)
+        @batch_message_handler(fields=["x", "y"], message_type=PoseMsg)
+
+    The handler gets a list of decoded messages, or with fields a dict of one array per
+    field. The protobuf type is taken from a List[X] annotation unless message_type is
+    given, channels with a codec decode with it instead.
+    """
+
+    def decorate(f: FuncTyping) -> T.Any:
+        options = BatchOptions(
+            fields=list(fields) if fields is not None else None,
+            max_batch=max_batch,
+            max_delay=max_delay,
+            message_type=message_type or infer_batch_message_type(f),
+        )
+        return _batch_message_handler(f, options, verbose)
+
+    if func is None:
+        return decorate
+    return decorate(func)
+
+
+def _batch_message_handler(func: FuncTyping, options: BatchOptions, verbose: bool) -> T.Any:
+    parameters = list(inspect.signature(func).parameters.values())  # type: ignore
+    is_method = bool(parameters) and parameters[0].name == "self"
+
+    def split_args(self: T.Any, args: T.Tuple[T.Any, ...]) -> T.Tuple[T.Any, T.Any]:
+        # Standalone functions get the items in place of self
+        if is_method:
+            return self, args[0]
+        return None, self
+
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(self: T.Any, *args: T.Any) -> None:
+            owner, items = split_args(self, args)
+            batch = decode_batch(items, options, verbose)
+            if verbose:
+                log.print_normal(f"Received batch of {len(items)} messages")
+            if is_method:
+                await func(owner, batch)
+            else:
+                await func(batch)
+
+        setattr(async_wrapper, "batch_options", options)
+        return async_wrapper
+
+    sfunc = T.cast(T.Callable[..., None], func)
+
+    @functools.wraps(sfunc)
+    def sync_wrapper(self: T.Any, *args: T.Any) -> None:
+        owner, items = split_args(self, args)
+        batch = decode_batch(items, options, verbose)
+        if verbose:
+            log.print_normal(f"Received batch of {len(items)} messages")
+        if is_method:
+            return sfunc(owner, batch)
+        return sfunc(batch)
+
+    setattr(sync_wrapper, "batch_options", options)
+    return sync_wrapper
+
+
+class BatchCollector:
+    """Raw items waiting for the batch handler of their channel"""
+
+    def __init__(self) -> None:
+        self._pending: T.Dict[str, PendingBatch] = {}
+
+    def __len__(self) -> int:
+        return sum(len(batch.items) for batch in self._pending.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._pending)
+
+    def add(self, channel: str, item: T.Any, options: BatchOptions) -> bool:
+        """Queues the item, returns True once the channel reached max_batch"""
+        batch = self._pending.get(channel)
+        if batch is None:
+            batch = self._pending[channel] = PendingBatch(started_at=time.time())
+        batch.items.append(item)
+        return len(batch.items) >= options.max_batch
+
+    def take(self, channel: str) -> T.List[T.Any]:
+        batch = self._pending.pop(channel, None)
+        return batch.items if batch is not None else []
+
+    def due(
+        self, now: float, delays: T.Callable[[str], float], force: bool = False
+    ) -> T.List[T.Tuple[str, T.List[T.Any]]]:
+        """Removes and returns the batches whose max_delay elapsed"""
+        ready = []
+        for channel, batch in self._pending.items():
+            delay = delays(channel)
+            if force or delay <= 0.0 or now - batch.started_at >= delay:
+                ready.append(channel)
+        return [(channel, self.take(channel)) for channel in ready]
+
+    def clear(self) -> None:
+        self._pending.clear()
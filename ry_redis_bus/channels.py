@@ -3,13 +3,30 @@ import typing as T
 
 from google.protobuf.message import Message
 
+from ry_redis_bus.codec import Codec, ProtobufCodec
+
+if T.TYPE_CHECKING:
+    from ry_redis_bus.shm_transport import ShmRingConfig
+
 
 class Channel:
     REQUIRED_FIELDS = ["utime"]
 
-    def __init__(self, name: str, msg_type: T.Type[Message] | None) -> None:
+    def __init__(
+        self,
+        name: str,
+        msg_type: T.Type[Message] | None,
+        codec: Codec | None = None,
+        shared_memory: "ShmRingConfig | None" = None,
+    ) -> None:
         self.name = name
         self.pb_type = msg_type or Message
+        # Same host peers exchange this channel through a shared memory ring when set
+        self.shared_memory = shared_memory
+        # publish encodes with it, message_handler once it is in codec_registry
+        self.codec: Codec | None = codec
+        if codec is None and msg_type is not None and msg_type != Message:
+            self.codec = ProtobufCodec(msg_type)
 
         if msg_type is None or msg_type == Message:
             return
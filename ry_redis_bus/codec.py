@@ -0,0 +1,226 @@
+"""
+Serialization codecs that can be attached to a Channel.
+
+Protobuf stays the default. msgpack, orjson and numpy are optional, and are only
+imported once a codec that needs them is created so declaring channels stays cheap.
+"""
+
+import importlib
+import json
+import struct
+import types
+import typing as T
+
+from google.protobuf.message import DecodeError, Message
+
+# Key of the subscribed channel's codec in the items handed to handlers
+CODEC_KEY = "codec"
+
+
+class CodecError(Exception):
+    pass
+
+
+def optional_import(module: str) -> T.Optional[types.ModuleType]:
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        return None
+
+
+def require(module: str) -> types.ModuleType:
+    imported = optional_import(module)
+    if imported is None:
+        raise CodecError(f"{module} is not installed")
+    return imported
+
+
+class Codec:
+    """Turns message objects into the bytes published on a channel and back"""
+
+    name = "raw"
+
+    def encode(self, message: T.Any) -> bytes:
+        if isinstance(message, str):
+            return message.encode()
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            return bytes(message)
+        raise CodecError(f"{self.name} codec cannot encode {type(message).__name__}")
+
+    def decode(self, data: bytes) -> T.Any:
+        return data
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}()"
+
+
+class ProtobufCodec(Codec):
+    name = "protobuf"
+
+    def __init__(self, message_type: T.Type[Message]) -> None:
+        self.message_type = message_type
+
+    def encode(self, message: T.Any) -> bytes:
+        return T.cast(bytes, message.SerializeToString())
+
+    def decode(self, data: bytes) -> Message:
+        message = self.message_type()
+        try:
+            message.ParseFromString(data)
+        except DecodeError as exc:
+            raise CodecError(f"Failed to decode {self.message_type.__name__}: {exc}") from exc
+        return message
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.message_type.__name__})"
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def __init__(self) -> None:
+        self._msgpack = require("msgpack")
+
+    def encode(self, message: T.Any) -> bytes:
+        return T.cast(bytes, self._msgpack.packb(message, use_bin_type=True))
+
+    def decode(self, data: bytes) -> T.Any:
+        try:
+            return self._msgpack.unpackb(data, raw=False)
+        except (ValueError, self._msgpack.UnpackException) as exc:
+            raise CodecError(f"Failed to decode msgpack: {exc}") from exc
+
+
+class JsonCodec(Codec):
+    """JSON through orjson when it is installed, the standard library otherwise"""
+
+    name = "json"
+
+    def __init__(self) -> None:
+        self._orjson = optional_import("orjson")
+
+    def encode(self, message: T.Any) -> bytes:
+        if self._orjson is not None:
+            return T.cast(bytes, self._orjson.dumps(message))
+        return json.dumps(message, separators=(",", ":")).encode()
+
+    def decode(self, data: bytes) -> T.Any:
+        try:
+            if self._orjson is not None:
+                return self._orjson.loads(data)
+            return json.loads(data)
+        except ValueError as exc:
+            raise CodecError(f"Failed to decode json: {exc}") from exc
+
+
+class StructCodec(Codec):
+    """Fixed layout records packed with the struct module, decoded as tuples"""
+
+    name = "struct"
+
+    def __init__(self, fmt: str) -> None:
+        self.struct = struct.Struct(fmt)
+
+    def encode(self, message: T.Any) -> bytes:
+        return self.struct.pack(*message)
+
+    def decode(self, data: bytes) -> T.Tuple[T.Any, ...]:
+        try:
+            return self.struct.unpack(data)
+        except struct.error as exc:
+            raise CodecError(f"Failed to decode {self.struct.format!r}: {exc}") from exc
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.struct.format!r})"
+
+
+class NumpyCodec(Codec):
+    """
+    Records of a numpy structured dtype. One payload may hold several records and is
+    decoded without copying into a read only array.
+    """
+
+    name = "numpy"
+
+    def __init__(self, dtype: T.Any) -> None:
+        self._np = require("numpy")
+        self.dtype = self._np.dtype(dtype)
+
+    def encode(self, message: T.Any) -> bytes:
+        return T.cast(bytes, self._np.asarray(message, dtype=self.dtype).tobytes())
+
+    def decode(self, data: bytes) -> T.Any:
+        if len(data) % self.dtype.itemsize:
+            raise CodecError(
+                f"Payload of {len(data)} bytes is not a multiple of {self.dtype.itemsize}"
+            )
+        return self._np.frombuffer(data, dtype=self.dtype)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.dtype})"
+
+
+def same_codec(first: Codec, second: Codec) -> bool:
+    """True for codecs of the same type and parameters, which encode alike"""
+    return first is second or (type(first) is type(second) and repr(first) == repr(second))
+
+
+class CodecRegistry:
+    """
+    Codecs message_handler decodes with, looked up by channel name. Channels keep their
+    codec to themselves until it is registered here.
+    """
+
+    def __init__(self) -> None:
+        self._codecs: T.Dict[str, Codec] = {}
+
+    def __len__(self) -> int:
+        return len(self._codecs)
+
+    def register(self, channel: T.Any, codec: T.Optional[Codec] = None) -> None:
+        """
+        Registers codec, or the codec of the Channel given, for the channel name. Raises
+        CodecError if the name already has a different codec.
+        """
+        name = str(channel)
+        codec = codec or getattr(channel, "codec", None)
+        if codec is None:
+            raise CodecError(f"Channel '{name}' has no codec to register")
+        existing = self._codecs.get(name)
+        if existing is not None and not same_codec(existing, codec):
+            raise CodecError(f"Channel '{name}' is already registered with {existing}, not {codec}")
+        self._codecs[name] = codec
+
+    def unregister(self, channel: str) -> None:
+        self._codecs.pop(channel, None)
+
+    def get(self, channel: str) -> T.Optional[Codec]:
+        return self._codecs.get(channel)
+
+
+codec_registry = CodecRegistry()
+
+
+def with_codec(dispatch: T.Callable[[T.Any], T.Any], codec: Codec) -> T.Callable[[T.Any], T.Any]:
+    """Hands items to dispatch with the codec of the channel they were received on"""
+
+    def attach(item: T.Any) -> T.Any:
+        item[CODEC_KEY] = codec
+        return dispatch(item)
+
+    return attach
+
+
+def encode_message(
+    channel: str, message: T.Any, codec: T.Optional[Codec] = None
+) -> T.Union[str, bytes]:
+    """Encodes a message object with the given codec or the one registered for the channel"""
+    if isinstance(message, (str, bytes)):
+        return message
+
+    codec = codec or codec_registry.get(channel)
+    if codec is not None:
+        return codec.encode(message)
+    if isinstance(message, Message):
+        return message.SerializeToString()
+    raise CodecError(f"No codec registered for '{channel}' to encode {type(message).__name__}")
@@ -0,0 +1,63 @@
+import collections
+import typing as T
+
+from google.protobuf.message import DecodeError, Message
+from ryutils import log
+
+from ry_redis_bus.subscription import ConflationKey
+
+
+class ConflationBuffer:
+    """
+    Holds the newest pending message per channel (or per channel and key) so that
+    state-style channels are only handled once per step, no matter how far behind
+    the consumer is.
+    """
+
+    def __init__(self) -> None:
+        self._pending: T.Dict[T.Tuple[str, T.Hashable], T.Any] = {}
+        self._skipped_since_drain: T.Counter[str] = collections.Counter()
+        self.skipped: T.Counter[str] = collections.Counter()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def offer(self, channel: str, item: T.Any, key_func: T.Optional[ConflationKey] = None) -> None:
+        """Stores the item, replacing any older pending item for the same slot."""
+        slot = (channel, key_func(item) if key_func is not None else None)
+        if slot in self._pending:
+            # Re-insert so drain order follows the arrival of the newest message
+            del self._pending[slot]
+            self.skipped[channel] += 1
+            self._skipped_since_drain[channel] += 1
+        self._pending[slot] = item
+
+    def drain(self) -> T.Tuple[T.List[T.Tuple[str, T.Any]], T.Counter[str]]:
+        """Returns the pending items in arrival order and the skipped counts since last drain."""
+        items = [(channel, item) for (channel, _), item in self._pending.items()]
+        skipped = self._skipped_since_drain
+        self._pending = {}
+        self._skipped_since_drain = collections.Counter()
+        return items, skipped
+
+    def flush(self, verbose: bool = False) -> T.List[T.Tuple[str, T.Any]]:
+        """Drains the pending items, logging what was skipped since the last drain if verbose"""
+        items, skipped = self.drain()
+        if verbose:
+            for channel, count in skipped.items():
+                log.print_normal(f"Conflated {count} stale messages on '{channel}' channel.")
+        return items
+
+
+def field_key(message_class: T.Type[Message], field_name: str) -> ConflationKey:
+    """Builds a conflation key function that keys on a field of the decoded message."""
+
+    def _key(item: T.Any) -> T.Hashable:
+        message_pb = message_class()
+        try:
+            message_pb.ParseFromString(item["data"])
+        except (DecodeError, KeyError, TypeError):
+            return None
+        return T.cast(T.Hashable, getattr(message_pb, field_name, None))
+
+    return _key
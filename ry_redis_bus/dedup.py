@@ -0,0 +1,160 @@
+import collections
+import hashlib
+import math
+import typing as T
+from dataclasses import dataclass
+
+OVERLAP_WINDOW = 5.0
+
+
+def item_fingerprint(item: T.Any) -> int:
+    """Cheap in-process identity of a redis message, its channel and payload"""
+    return hash((item.get("channel"), item.get("data")))
+
+
+class OverlapFilter:
+    """
+    Remembers the messages handled from one connection, so the copies that also arrive
+    on another connection while subscriptions are moved are only handled once.
+    Entries are matched once each and the whole filter expires after window seconds.
+    With max_entries the oldest entries are dropped first once the filter is full.
+    """
+
+    def __init__(self, window: float = OVERLAP_WINDOW, max_entries: T.Optional[int] = None) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self._seen: T.Counter[int] = collections.Counter()
+        self._expires_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def record(self, item: T.Any, now: float) -> None:
+        self._seen[item_fingerprint(item)] += 1
+        self._expires_at = now + self.window
+        if self.max_entries is not None and len(self._seen) > self.max_entries:
+            del self._seen[next(iter(self._seen))]
+
+    def clear(self) -> None:
+        self._seen.clear()
+
+    def consume(self, item: T.Any, now: float) -> bool:
+        """Returns True if the item was already handled from the other connection"""
+        if now > self._expires_at:
+            self._seen.clear()
+            return False
+
+        fingerprint = item_fingerprint(item)
+        if self._seen[fingerprint] <= 0:
+            return False
+
+        self._seen[fingerprint] -= 1
+        if self._seen[fingerprint] == 0:
+            del self._seen[fingerprint]
+        return True
+
+
+DEDUP_WINDOW = 60.0
+DEDUP_CAPACITY = 100000
+DEDUP_FALSE_POSITIVE_RATE = 0.001
+
+DedupKey = T.Callable[[T.Any], bytes]
+
+
+def payload_key(item: T.Any) -> bytes:
+    data = item.get("data", b"")
+    return data.encode() if isinstance(data, str) else bytes(data)
+
+
+@dataclass
+class DedupPolicy:
+    """
+    Drops messages seen before on the channel within window seconds, before they are
+    decoded. key takes the raw redis message and returns its identity, the payload by
+    default. Up to capacity messages per window are remembered with false_positive_rate
+    odds of dropping a message that was not seen, memory does not grow past that.
+    """
+
+    window: float = DEDUP_WINDOW
+    capacity: int = DEDUP_CAPACITY
+    false_positive_rate: float = DEDUP_FALSE_POSITIVE_RATE
+    key: T.Optional[DedupKey] = None
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float) -> None:
+        if capacity < 1 or not 0.0 < false_positive_rate < 1.0:
+            raise ValueError(f"Invalid capacity {capacity} or rate {false_positive_rate}")
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: bytes) -> T.Iterator[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hashes):
+            yield (first + index * second) % self.size
+
+    def add(self, key: bytes) -> bool:
+        """Adds key, returns whether it was (probably) there already"""
+        present = True
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        self.count += not present
+        return present
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key)
+        )
+
+    def false_positive_rate(self) -> float:
+        """Estimate from the keys added so far"""
+        return float((1.0 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes)
+
+
+class DuplicateFilter:
+    """
+    Two Bloom filters, the current one and the one before it, swapped every window seconds
+    or once the current one holds capacity keys. A message is remembered for at least one
+    window, and the odds of a false duplicate stay below twice the policy rate.
+    """
+
+    def __init__(self, policy: DedupPolicy, now: float) -> None:
+        self.policy = policy
+        self._key = policy.key or payload_key
+        self._current = BloomFilter(policy.capacity, policy.false_positive_rate)
+        self._previous = BloomFilter(policy.capacity, policy.false_positive_rate)
+        self._rotated_at = now
+
+    def _rotate(self, now: float) -> None:
+        # After two quiet windows nothing in either filter is recent enough to keep
+        if now - self._rotated_at >= 2 * self.policy.window:
+            self._current = BloomFilter(self.policy.capacity, self.policy.false_positive_rate)
+        self._previous = self._current
+        self._current = BloomFilter(self.policy.capacity, self.policy.false_positive_rate)
+        self._rotated_at = now
+
+    def false_positive_rate(self) -> float:
+        current = self._current.false_positive_rate()
+        previous = self._previous.false_positive_rate()
+        return 1.0 - (1.0 - current) * (1.0 - previous)
+
+    def is_duplicate(self, item: T.Any, now: float) -> bool:
+        """Records the item, returns True if it was seen within the window"""
+        if (
+            now - self._rotated_at >= self.policy.window
+            or self._current.count >= self.policy.capacity
+        ):
+            self._rotate(now)
+
+        key = self._key(item)
+        if key in self._previous:
+            self._current.add(key)
+            return True
+        return self._current.add(key)
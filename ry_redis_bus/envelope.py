@@ -0,0 +1,37 @@
+"""
+Channel names of received messages.
+
+Handlers get the dict redis-py returns as it is. Its channel name is decoded once per
+message and interned, which makes the lookups of every per-channel table on the way to the
+handler hash a string Python already knows the hash of, and spares message_handler from
+decoding it again. Names are cached by the raw channel bytes, whose hash Python keeps too.
+"""
+
+import sys
+import typing as T
+
+# Pattern subscriptions can see any number of channels, so the names are not kept forever
+MAX_INTERNED_CHANNELS = 4096
+
+_CHANNEL_NAMES: T.Dict[T.Any, str] = {}
+
+
+def intern_channel(channel: T.Any) -> str:
+    """Interned str of a channel name given as bytes or str"""
+    name = _CHANNEL_NAMES.get(channel)
+    if name is None:
+        if len(_CHANNEL_NAMES) >= MAX_INTERNED_CHANNELS:
+            _CHANNEL_NAMES.clear()
+        text = channel.decode() if isinstance(channel, bytes) else str(channel)
+        name = _CHANNEL_NAMES[channel] = sys.intern(text)
+    return name
+
+
+def make_item(channel: str, data: T.Any) -> T.Dict[str, T.Any]:
+    """The item redis-py would return for a message that did not come from redis-py"""
+    return {"type": "message", "pattern": None, "channel": channel.encode(), "data": data}
+
+
+def channel_name(item: T.Any) -> str:
+    """Channel name of a received item"""
+    return intern_channel(item.get("channel", b"None"))
@@ -2,6 +2,7 @@ import asyncio
 import datetime
 import functools
 import inspect
+import os
 import time
 import typing as T
 
@@ -11,6 +12,13 @@ from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-i
 from ryutils import log
 from ryutils.path_util import get_backtrace_file_name
 
+from ry_redis_bus.codec import CODEC_KEY, Codec, CodecError, codec_registry
+from ry_redis_bus.envelope import channel_name
+from ry_redis_bus.local_router import LOCAL_MESSAGE_KEY
+from ry_redis_bus.message_pool import MessagePool
+from ry_redis_bus.performance import PerformanceProfile, connection_kwargs
+from ry_redis_bus.redis_info import RedisInfo
+
 FuncTyping = T.Union[
     T.Callable[..., T.Optional[None]],
     T.Coroutine[T.Any, T.Any, T.Optional[None]],
@@ -28,57 +36,32 @@ DEFAULT_COOLDOWN_TIMEOUT = 0.1
 ITERATION_SLEEP_TIME = 0.01
 MAX_COOLDOWN_TIMEOUT = 10.0
 TIME_BETWEEN_RE_SUBSCRIBE = 60.0 * 60.0 * 12.0
+RESUBSCRIBE_ACK_TIMEOUT = 1.0
 NO_SUBSCRIBE_IF_NO_CALLBACK = True
 SUBSCRIBE_BACKTRACE_FRAME = 4
 LATENCY_BACKTRACE_FRAME = 7
 DEFAULT_MESSAGE_BACKTRACE_FRAME = 3
 MAX_PUBLISH_LATENCY_TIME = 2.0
-
-
-class RedisInfo:
-    def __init__(self, host: str, port: int, db: int, user: str, password: str, db_name: str):
-        self.host = host
-        self.port = port
-        self.db = db
-        self.user = user
-        self.password = password
-        self.db_name = db_name
-
-    @classmethod
-    def null(cls) -> "RedisInfo":
-        return cls("", 0, 0, "", "", "")
-
-    def __eq__(self, other: T.Any) -> bool:
-        if not isinstance(other, RedisInfo):
-            return False
-
-        return (
-            self.host == other.host
-            and self.port == other.port
-            and self.db == other.db
-            and self.user == other.user
-            and self.password == other.password
-            and self.db_name == other.db_name
-        )
-
-    def __repr__(self) -> str:
-        values = [
-            f"{key}={'*' * min(8, len(value)) if key == 'password' and value else value}"
-            for key, value in self.__dict__.items()
-        ]
-        values_string = "\n\t".join(values)
-        return f"RedisInfo(\n\t{values_string}\n)"
-
-    def __str__(self) -> str:
-        return self.__repr__()
-
-    def __hash__(self) -> int:
-        return hash((self.host, self.port, self.db, self.user, self.password, self.db_name))
+CLIENT_NAME_PREFIX = "ry-redis-bus"
 
 
 def get_redis_client(
     redis_info: RedisInfo,
+    client_name: T.Optional[str] = None,
+    profile: T.Optional[PerformanceProfile] = None,
 ) -> redis.Redis:
+    if profile is not None:
+        pool = redis.ConnectionPool(
+            host=redis_info.host,
+            port=redis_info.port,
+            db=redis_info.db,
+            username=redis_info.user or None,
+            password=redis_info.password or None,
+            client_name=client_name,
+            **connection_kwargs(profile, is_async=False),
+        )
+        return redis.Redis(connection_pool=pool)
+
     if redis_info.user and redis_info.password:
         return T.cast(
             redis.Redis,
@@ -88,6 +71,7 @@ def get_redis_client(
                 db=redis_info.db,
                 username=redis_info.user,
                 password=redis_info.password,
+                client_name=client_name,
             ),
         )
 
@@ -99,19 +83,33 @@ def get_redis_client(
                 port=redis_info.port,
                 db=redis_info.db,
                 password=redis_info.password,
+                client_name=client_name,
             ),
         )
 
     return T.cast(
-        redis.Redis, redis.Redis(host=redis_info.host, port=redis_info.port, db=redis_info.db)
+        redis.Redis,
+        redis.Redis(
+            host=redis_info.host,
+            port=redis_info.port,
+            db=redis_info.db,
+            client_name=client_name,
+        ),
     )
 
 
+def make_client_name(client: T.Any) -> str:
+    """Unique connection name so a client can find its own entries in CLIENT LIST"""
+    return f"{CLIENT_NAME_PREFIX}-{os.getpid()}-{id(client):x}"
+
+
 def get_redis_connection(
     redis_info: RedisInfo,
     redis_client: T.Optional[redis.Redis] = None,
     retry_counts: int = 2,
     retry_delay: int = 5,
+    client_name: T.Optional[str] = None,
+    profile: T.Optional[PerformanceProfile] = None,
 ) -> redis.Redis:
     """Gets the Redis connection with retry"""
     if redis_client is not None:
@@ -122,12 +120,12 @@ def get_redis_connection(
             # Connection is stale, will retry below
             pass
 
-    if redis_info == RedisInfo.null():
+    if redis_info.is_null():
         raise redis.exceptions.ConnectionError("Redis info is null")
 
     for _ in range(retry_counts):
         try:
-            redis_client = get_redis_client(redis_info)
+            redis_client = get_redis_client(redis_info, client_name=client_name, profile=profile)
             redis_client.ping()
             return redis_client
         except KeyboardInterrupt as exc:
@@ -141,16 +139,22 @@ def get_redis_connection(
 
 
 def deserialize_message(
-    message: T.Any, message_class: T.Type[Message], verbose: bool = False
+    message: T.Any,
+    message_class: T.Type[Message],
+    verbose: bool = False,
+    into: T.Optional[Message] = None,
 ) -> T.Optional[Message]:
-    """Deserializes the message from the Redis server"""
+    """
+    Deserializes the message from the Redis server, into a reused instance if given.
+    ParseFromString clears the instance first so nothing of the previous message remains.
+    """
     if not isinstance(message, dict) or "data" not in message:
         log.print_fail(f"Invalid message format, expected dict with 'data' key: {message}")
         return None
 
     data = message["data"]
     try:
-        message_pb: Message = message_class()
+        message_pb: Message = into if into is not None else message_class()
         message_pb.ParseFromString(data)
     except DecodeError:
         log.print_fail(f"Failed to decode message as {message_class.__name__}: {message}")
@@ -162,6 +166,49 @@ def deserialize_message(
     return message_pb
 
 
+def decode_message(
+    message: T.Any,
+    message_class: T.Optional[T.Type[Message]],
+    verbose: bool = False,
+    into: T.Optional[Message] = None,
+    codec: T.Optional[Codec] = None,
+) -> T.Optional[T.Any]:
+    """
+    Decodes the message with codec, the codec of the channel it was subscribed with, or the
+    one registered for its channel, falling back to message_class
+    """
+    if isinstance(message, dict):
+        local = message.get(LOCAL_MESSAGE_KEY)
+        # Delivered in process, the published object is already there
+        if local is not None and (message_class is None or isinstance(local, message_class)):
+            return local
+        if codec is None:
+            codec = message.get(CODEC_KEY)
+        if codec is None and codec_registry:
+            codec = codec_registry.get(channel_name(message))
+
+    if codec is None:
+        if message_class is None:
+            log.print_fail(f"No codec registered to decode message: {message}")
+            return None
+        return deserialize_message(message, message_class, verbose=verbose, into=into)
+
+    if "data" not in message:
+        log.print_fail(f"Invalid message format, expected dict with 'data' key: {message}")
+        return None
+
+    try:
+        decoded = codec.decode(message["data"])
+    except CodecError as exc:
+        log.print_fail(f"Failed to decode message with {codec}: {exc}")
+        return None
+
+    if verbose:
+        log.print_normal(f"Received message: {decoded}")
+
+    return decoded
+
+
 def get_timestamp_pb_from_string(timestamp: str) -> Timestamp:
     mtime_timestamp = Timestamp()
     message_timestamp = datetime.datetime.fromisoformat(timestamp)
@@ -189,6 +236,38 @@ def infer_func_pb_type(func: FuncTyping) -> T.Type[Message]:
     return message_type
 
 
+def infer_func_message_class(func: FuncTyping) -> T.Optional[T.Type[Message]]:
+    """
+    Like infer_func_pb_type, but handlers of channels with a non protobuf codec may annotate
+    the message with any type, in which case there is no protobuf class to fall back to.
+    check_handler_codec makes sure those handlers are only subscribed to such channels.
+    """
+    signature = inspect.signature(func)  # type: ignore
+    parameters = list(signature.parameters.values())
+    index = 1 if parameters and parameters[0].name == "self" else 0
+    annotation = parameters[index].annotation
+
+    assert (
+        annotation is not inspect.Parameter.empty
+    ), "Message type must be annotated on the first handler parameter"
+
+    if inspect.isclass(annotation) and issubclass(annotation, Message):
+        return annotation
+    return None
+
+
+def check_handler_codec(channel: str, handler: T.Any, codec: T.Optional[Codec]) -> None:
+    """
+    Checked when handler is subscribed to channel, so a message_handler annotated with a
+    type no codec of the channel produces fails once instead of on every message.
+    """
+    if getattr(handler, "message_class", Message) is not None:
+        return
+    assert (
+        codec is not None or codec_registry.get(channel) is not None
+    ), f"Message type must be a subclass of google.protobuf.Message for '{channel}' channel"
+
+
 def find_message_in_args(
     self: T.Any, args: T.Tuple[T.Any, ...], kwargs: T.Dict[str, T.Any]
 ) -> T.Any:
@@ -231,9 +310,13 @@ def deserialize_checks(channel: str, message_pb: Message, warn_latency: bool = T
     return True
 
 
-def _message_handler(func: FuncTyping, warn_latency: bool = True, verbose: bool = False) -> T.Any:
+def _message_handler(
+    func: FuncTyping, warn_latency: bool = True, verbose: bool = False, reuse: bool = False
+) -> T.Any:
     """Internal implementation of message handler decorator"""
-    message_type = infer_func_pb_type(func)
+    message_type = infer_func_message_class(func)
+    type_name = message_type.__name__ if message_type is not None else "decoded"
+    pool = MessagePool(message_type) if reuse and message_type is not None else None
 
     # Check if the function is a method (has 'self' as first parameter) or standalone
     signature = inspect.signature(func)  # type: ignore
@@ -253,31 +336,37 @@ def _message_handler(func: FuncTyping, warn_latency: bool = True, verbose: bool
 
             message, args, kwargs = find_message_in_args(self, args, kwargs)
 
-            # Deserialize the message using the inferred type
-            deserialized_message_pb = deserialize_message(
-                message, message_type, verbose=verbose_ipc
-            )
-
-            if deserialized_message_pb is None:
-                return None  # Early return if deserialization fails
-
-            channel = message.get("channel", b"None").decode("utf-8")
-            deserialize_checks(
-                channel=channel, message_pb=deserialized_message_pb, warn_latency=warn_latency
-            )
-
-            if verbose_ipc:
-                class_name = self.__class__.__name__ if hasattr(self, "__class__") else "Handler"
-                log.print_normal(
-                    f"{class_name} Received {message_type.__name__} "
-                    f"message:\n{deserialized_message_pb}"
+            reused = pool.acquire() if pool is not None else None
+            try:
+                # Deserialize the message using the inferred type
+                deserialized_message_pb = decode_message(
+                    message, message_type, verbose=verbose_ipc, into=reused
                 )
-            # For methods, pass self; for standalone functions, don't pass self
-            if is_method:
-                await func(self, deserialized_message_pb, *args, **kwargs)
-            else:
-                await func(deserialized_message_pb, *args, **kwargs)
 
+                if deserialized_message_pb is None:
+                    return None  # Early return if deserialization fails
+
+                if warn_latency:
+                    deserialize_checks(channel_name(message), deserialized_message_pb)
+
+                if verbose_ipc:
+                    class_name = (
+                        self.__class__.__name__ if hasattr(self, "__class__") else "Handler"
+                    )
+                    log.print_normal(
+                        f"{class_name} Received {type_name} message:\n{deserialized_message_pb}"
+                    )
+                # For methods, pass self; for standalone functions, don't pass self
+                if is_method:
+                    await func(self, deserialized_message_pb, *args, **kwargs)
+                else:
+                    await func(deserialized_message_pb, *args, **kwargs)
+            finally:
+                if pool is not None and reused is not None:
+                    pool.release(reused)
+
+        setattr(async_wrapper, "message_pool", pool)
+        setattr(async_wrapper, "message_class", message_type)
         return async_wrapper
 
     sfunc = T.cast(T.Callable[..., None], func)
@@ -293,30 +382,36 @@ def _message_handler(func: FuncTyping, warn_latency: bool = True, verbose: bool
 
         message, args, kwargs = find_message_in_args(self, args, kwargs)
 
-        # Deserialize the message using the inferred type
-        deserialized_message_pb = deserialize_message(message, message_type, verbose=verbose_ipc)
+        reused = pool.acquire() if pool is not None else None
+        try:
+            # Deserialize the message using the inferred type
+            deserialized_message_pb = decode_message(
+                message, message_type, verbose=verbose_ipc, into=reused
+            )
 
-        if deserialized_message_pb is None:
-            return None  # Early return if deserialization fails
+            if deserialized_message_pb is None:
+                return None  # Early return if deserialization fails
 
-        channel = message.get("channel", b"None").decode("utf-8")
-        deserialize_checks(
-            channel=channel, message_pb=deserialized_message_pb, warn_latency=warn_latency
-        )
+            if warn_latency:
+                deserialize_checks(channel_name(message), deserialized_message_pb)
 
-        if verbose_ipc:
-            class_name = self.__class__.__name__ if hasattr(self, "__class__") else "Handler"
-            log.print_normal(
-                f"{class_name} Received {message_type.__name__} "
-                f"message:\n{deserialized_message_pb}"
-            )
+            if verbose_ipc:
+                class_name = self.__class__.__name__ if hasattr(self, "__class__") else "Handler"
+                log.print_normal(
+                    f"{class_name} Received {type_name} message:\n{deserialized_message_pb}"
+                )
 
-        # For methods, pass self; for standalone functions, don't pass self
-        if is_method:
-            return sfunc(self, deserialized_message_pb, *args, **kwargs)
+            # For methods, pass self; for standalone functions, don't pass self
+            if is_method:
+                return sfunc(self, deserialized_message_pb, *args, **kwargs)
 
-        return sfunc(deserialized_message_pb, *args, **kwargs)
+            return sfunc(deserialized_message_pb, *args, **kwargs)
+        finally:
+            if pool is not None and reused is not None:
+                pool.release(reused)
 
+    setattr(sync_wrapper, "message_pool", pool)
+    setattr(sync_wrapper, "message_class", message_type)
     return sync_wrapper
 
 
@@ -325,6 +420,7 @@ def message_handler(
     *,
     warn_latency: bool = True,
     verbose: bool = False,
+    reuse: bool = False,
 ) -> T.Any:
     """
     A decorator to handle deserialization of a message and logging.
@@ -333,7 +429,15 @@ def message_handler(
         @message_handler(warn_latency=False)
         @message_handler(verbose=True)
         @message_handler(warn_latency=False, verbose=True)
+        @message_handler(reuse=True)
+
+    With reuse=True protobuf messages are parsed into pooled instances instead of new ones.
+    Only use it for handlers that do not keep the message, or anything nested in it, after
+    they return; copy what must outlive the call with CopyFrom. The pool is exposed as
+    the message_pool attribute of the decorated function.
     """
     if func is None:
-        return lambda f: _message_handler(f, warn_latency=warn_latency, verbose=verbose)
-    return _message_handler(func, warn_latency=warn_latency, verbose=verbose)
+        return lambda f: _message_handler(
+            f, warn_latency=warn_latency, verbose=verbose, reuse=reuse
+        )
+    return _message_handler(func, warn_latency=warn_latency, verbose=verbose, reuse=reuse)
@@ -13,6 +13,7 @@ from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-i
 from ryutils import log
 from ryutils.verbose import Verbose
 
+from ry_redis_bus.envelope import channel_name
 from ry_redis_bus.redis_client_base import RedisClientBase, RedisInfo
 
 
@@ -57,7 +58,7 @@ class IpcLogger(RedisClientBase):
         if message is None:
             return None
 
-        channel = message["channel"].decode("utf-8")
+        channel = channel_name(message)
 
         data = message["data"]
         if self.verbose.logger:
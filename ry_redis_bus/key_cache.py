@@ -0,0 +1,382 @@
+"""
+In-process cache for key reads, kept coherent with Redis client side caching.
+
+The client reads through a dedicated connection with CLIENT TRACKING ON REDIRECT <id>,
+where <id> is a pubsub connection subscribed to __redis__:invalidate. Redis remembers the
+keys that connection read and publishes their names there when they change, expire or
+get evicted, or None when the server flushed or tracking was reset. Pending invalidations
+are applied before every read, which only polls the socket, so hits need no round trip.
+
+A read that was in flight while an invalidation arrived is not cached, as the value may
+be older than the invalidation. Every check_period the client asks CLIENT TRACKINGINFO
+whether tracking still redirects to the invalidation connection, a reconnect of either
+connection ends it silently, and starts over with an empty cache if not.
+"""
+
+import collections
+import threading
+import time
+import typing as T
+from dataclasses import dataclass
+
+import redis
+import redis.asyncio as aioredis
+from ryutils import log
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+DEFAULT_KEY_CACHE_SIZE = 10000
+TRACKING_CHECK_PERIOD = 1.0
+TRACKING_REPLY_TIMEOUT = 1.0
+
+Entry = T.Tuple[bytes, ...]
+
+
+@dataclass
+class KeyCachePolicy:
+    max_entries: int = DEFAULT_KEY_CACHE_SIZE
+    check_period: float = TRACKING_CHECK_PERIOD
+
+
+@dataclass
+class KeyCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else 0.0
+
+
+def to_key(value: T.Union[str, bytes]) -> bytes:
+    return value.encode() if isinstance(value, str) else value
+
+
+def tracking_redirect(info: T.Any) -> T.Optional[int]:
+    """Redirect id of CLIENT TRACKINGINFO, None unless tracking is on and unbroken"""
+    if isinstance(info, (list, tuple)):
+        info = dict(zip(info[::2], info[1::2]))
+    flags = {to_key(flag) for flag in info.get(b"flags", info.get("flags", []))}
+    if b"on" not in flags or b"broken_redirect" in flags:
+        return None
+    return int(info.get(b"redirect", info.get("redirect", -1)))
+
+
+class KeyCache:
+    """
+    LRU of key reads. Entries are (key,) for GET and (key, field) for HGET, so every
+    entry of a key goes when Redis invalidates it.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_KEY_CACHE_SIZE) -> None:
+        self.max_entries = max_entries
+        self.stats = KeyCacheStats()
+        self._entries: "collections.OrderedDict[Entry, T.Any]" = collections.OrderedDict()
+        self._by_key: T.Dict[bytes, T.Set[Entry]] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def epoch(self) -> int:
+        """Changes with every invalidation, taken before a read to store its result"""
+        return self._epoch
+
+    def lookup(self, entry: Entry) -> T.Tuple[bool, T.Any]:
+        with self._lock:
+            if entry in self._entries:
+                self._entries.move_to_end(entry)
+                self.stats.hits += 1
+                return True, self._entries[entry]
+            self.stats.misses += 1
+            return False, None
+
+    def store(self, entry: Entry, value: T.Any, epoch: int) -> None:
+        """Caches value unless an invalidation arrived since epoch was taken"""
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._entries[entry] = value
+            self._entries.move_to_end(entry)
+            self._by_key.setdefault(entry[0], set()).add(entry)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget(evicted)
+                self.stats.evictions += 1
+
+    def _forget(self, entry: Entry) -> None:
+        entries = self._by_key.get(entry[0])
+        if entries is not None:
+            entries.discard(entry)
+            if not entries:
+                del self._by_key[entry[0]]
+
+    def invalidate(self, keys: T.Optional[T.Iterable[T.Union[str, bytes]]]) -> None:
+        """Drops the entries of keys, or everything for None"""
+        with self._lock:
+            self._epoch += 1
+            self.stats.invalidations += 1
+            if keys is None:
+                self._entries.clear()
+                self._by_key.clear()
+                return
+            for key in keys:
+                for entry in self._by_key.pop(to_key(key), ()):
+                    self._entries.pop(entry, None)
+
+    def clear(self) -> None:
+        self.invalidate(None)
+
+
+class KeyCacheReader:
+    """
+    Cached GET, HGET and MGET of a sync client. client returns the connection of the client,
+    which the invalidation connection comes from, and connect opens the tracked connection.
+    Without connect it is a single connection of the client's pool.
+    """
+
+    def __init__(
+        self,
+        policy: KeyCachePolicy,
+        client: T.Callable[[], redis.Redis],
+        connect: T.Optional[T.Callable[[], redis.Redis]] = None,
+    ) -> None:
+        self.policy = policy
+        self.cache = KeyCache(policy.max_entries)
+        self._client = client
+        self._connect = connect
+        self.reader: T.Optional[redis.Redis] = None
+        self.invalidations: T.Optional[redis.client.PubSub] = None
+        self.invalidation_id = 0
+        self.checked_at = 0.0
+
+    def get(self, key: str) -> T.Optional[bytes]:
+        return T.cast(T.Optional[bytes], self._cached_read((to_key(key),), "get", key))
+
+    def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        entry = (to_key(key), to_key(field))
+        return T.cast(T.Optional[bytes], self._cached_read(entry, "hget", key, field))
+
+    def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Fetches only the keys the cache misses, in a single MGET"""
+        reader = self._tracked_reader()
+        values, missing = _lookup_many(self.cache, keys)
+        if missing:
+            epoch = self.cache.epoch
+            fetched = T.cast(T.List[T.Optional[bytes]], reader.mget(missing))
+            _store_many(self.cache, values, missing, fetched, epoch)
+        return [values[key] for key in keys]
+
+    def _cached_read(self, entry: Entry, command: str, *args: str) -> T.Any:
+        reader = self._tracked_reader()
+        found, value = self.cache.lookup(entry)
+        if found:
+            return value
+
+        epoch = self.cache.epoch
+        value = getattr(reader, command)(*args)
+        self.cache.store(entry, value, epoch)
+        return value
+
+    def _tracked_reader(self) -> redis.Redis:
+        """The connection reads go through, once pending invalidations are applied"""
+        now = time.time()
+        try:
+            if self.reader is None:
+                self._start(now)
+            elif now - self.checked_at > self.policy.check_period:
+                self.checked_at = now
+                info = T.cast(redis.Redis, self.reader).client_trackinginfo()
+                if tracking_redirect(info) != self.invalidation_id:
+                    log.print_warn("Key cache lost its invalidations, starting over...")
+                    self.close()
+                    self._start(now)
+            self._poll_invalidations()
+        except redis.exceptions.ConnectionError:
+            self.close()
+            raise
+        return T.cast(redis.Redis, self.reader)
+
+    def _start(self, now: float) -> None:
+        invalidations = self._client().pubsub()  # type: ignore
+        # The id has to be asked before subscribing, afterwards only pubsub commands work
+        invalidations.execute_command("CLIENT", "ID")
+        self.invalidation_id = int(invalidations.parse_response(block=True))
+        invalidations.subscribe(INVALIDATE_CHANNEL)  # type: ignore
+        self.invalidations = invalidations
+
+        if self._connect is not None:
+            reader = self._connect()
+        else:
+            # Tracking is per connection, so reads keep to one connection of the pool
+            reader = redis.Redis(
+                connection_pool=self._client().connection_pool, single_connection_client=True
+            )
+        reader.client_tracking_on(clientid=self.invalidation_id)
+        self.reader = reader
+        self.checked_at = now
+        self.cache.clear()
+
+    def _poll_invalidations(self) -> None:
+        if self.invalidations is None:
+            return
+        while True:
+            item = self.invalidations.get_message(timeout=0.0)
+            if item is None:
+                return
+            if item.get("type") == "message":
+                self.cache.invalidate(item.get("data"))
+
+    def close(self) -> None:
+        """Closes both tracking connections, the cache cannot be trusted without them"""
+        self.cache.clear()
+        reader, self.reader = self.reader, None
+        invalidations, self.invalidations = self.invalidations, None
+        try:
+            if reader is not None:
+                reader.client_tracking_off()
+                reader.close()
+            if invalidations is not None:
+                invalidations.close()
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to close key cache connections: {exc}")
+
+
+class AsyncKeyCacheReader:
+    """Async version of KeyCacheReader"""
+
+    def __init__(
+        self,
+        policy: KeyCachePolicy,
+        client: T.Callable[[], T.Awaitable[aioredis.Redis]],
+        connect: T.Optional[T.Callable[[], T.Awaitable[aioredis.Redis]]] = None,
+    ) -> None:
+        self.policy = policy
+        self.cache = KeyCache(policy.max_entries)
+        self._client = client
+        self._connect = connect
+        self.reader: T.Optional[aioredis.Redis] = None
+        self.invalidations: T.Optional[aioredis.client.PubSub] = None
+        self.invalidation_id = 0
+        self.checked_at = 0.0
+
+    async def get(self, key: str) -> T.Optional[bytes]:
+        return T.cast(T.Optional[bytes], await self._cached_read((to_key(key),), "get", key))
+
+    async def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        entry = (to_key(key), to_key(field))
+        return T.cast(T.Optional[bytes], await self._cached_read(entry, "hget", key, field))
+
+    async def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Fetches only the keys the cache misses, in a single MGET"""
+        reader = await self._tracked_reader()
+        values, missing = _lookup_many(self.cache, keys)
+        if missing:
+            epoch = self.cache.epoch
+            fetched = T.cast(T.List[T.Optional[bytes]], await reader.mget(missing))
+            _store_many(self.cache, values, missing, fetched, epoch)
+        return [values[key] for key in keys]
+
+    async def _cached_read(self, entry: Entry, command: str, *args: str) -> T.Any:
+        reader = await self._tracked_reader()
+        found, value = self.cache.lookup(entry)
+        if found:
+            return value
+
+        epoch = self.cache.epoch
+        value = await getattr(reader, command)(*args)
+        self.cache.store(entry, value, epoch)
+        return value
+
+    async def _tracked_reader(self) -> aioredis.Redis:
+        now = time.time()
+        try:
+            if self.reader is None:
+                await self._start(now)
+            elif now - self.checked_at > self.policy.check_period:
+                self.checked_at = now
+                info = await T.cast(aioredis.Redis, self.reader).client_trackinginfo()
+                if tracking_redirect(info) != self.invalidation_id:
+                    log.print_warn("Key cache lost its invalidations, starting over...")
+                    await self.close()
+                    await self._start(now)
+            await self._poll_invalidations()
+        except redis.exceptions.ConnectionError:
+            await self.close()
+            raise
+        return T.cast(aioredis.Redis, self.reader)
+
+    async def _start(self, now: float) -> None:
+        invalidations = (await self._client()).pubsub()
+        # The id has to be asked before subscribing, see KeyCacheReader
+        await invalidations.execute_command("CLIENT", "ID")
+        self.invalidation_id = int(await invalidations.parse_response(block=True))
+        await invalidations.subscribe(INVALIDATE_CHANNEL)
+        self.invalidations = invalidations
+
+        if self._connect is not None:
+            reader = await self._connect()
+        else:
+            reader = aioredis.Redis(
+                connection_pool=(await self._client()).connection_pool,
+                single_connection_client=True,
+            )
+        await reader.client_tracking_on(clientid=self.invalidation_id)
+        self.reader = reader
+        self.checked_at = now
+        self.cache.clear()
+
+    async def _poll_invalidations(self) -> None:
+        if self.invalidations is None:
+            return
+        while True:
+            item = await self.invalidations.get_message(timeout=0.0)
+            if item is None:
+                return
+            if item.get("type") == "message":
+                self.cache.invalidate(item.get("data"))
+
+    async def close(self) -> None:
+        """Closes both tracking connections, the cache cannot be trusted without them"""
+        self.cache.clear()
+        reader, self.reader = self.reader, None
+        invalidations, self.invalidations = self.invalidations, None
+        try:
+            if reader is not None:
+                await reader.client_tracking_off()
+                await reader.close()
+            if invalidations is not None:
+                await invalidations.close()
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to close key cache connections: {exc}")
+
+
+def _lookup_many(
+    cache: KeyCache, keys: T.Sequence[str]
+) -> T.Tuple[T.Dict[str, T.Optional[bytes]], T.List[str]]:
+    """The cached values of keys, and the keys that have to be read"""
+    values: T.Dict[str, T.Optional[bytes]] = {}
+    missing = []
+    for key in keys:
+        found, value = cache.lookup((to_key(key),))
+        if found:
+            values[key] = value
+        else:
+            missing.append(key)
+    return values, missing
+
+
+def _store_many(
+    cache: KeyCache,
+    values: T.Dict[str, T.Optional[bytes]],
+    keys: T.Sequence[str],
+    fetched: T.Sequence[T.Optional[bytes]],
+    epoch: int,
+) -> None:
+    for key, value in zip(keys, fetched):
+        cache.store((to_key(key),), value, epoch)
+        values[key] = value
@@ -0,0 +1,69 @@
+import typing as T
+
+from ry_redis_bus.envelope import make_item
+
+LATEST_HASH_SUFFIX = "latest"
+
+
+def latest_hash_key(db_name: str) -> str:
+    """Name of the Redis hash holding the latest payload of every channel"""
+    return f"{db_name}:{LATEST_HASH_SUFFIX}"
+
+
+def snapshot_item(channel: str, data: bytes) -> T.Dict[str, T.Any]:
+    """Builds a redis style message so snapshots go through the regular handlers"""
+    return make_item(channel, data)
+
+
+class LastValueCache:
+    """
+    In-process read-through copy of the newest payload per channel.
+
+    Channels subscribed since the last step are fetched from the Redis hash in a single
+    HMGET and delivered before any live message. The first live message after a
+    snapshot is skipped when it carries the same payload, which happens when a publish
+    lands between our SUBSCRIBE and the HMGET.
+    """
+
+    def __init__(self, hash_key: str) -> None:
+        self.hash_key = hash_key
+        self._values: T.Dict[str, bytes] = {}
+        self._pending: T.Dict[str, None] = {}
+        self._echo: T.Dict[str, bytes] = {}
+
+    def get(self, channel: str) -> T.Optional[bytes]:
+        return self._values.get(channel)
+
+    def update(self, channel: str, data: T.Any) -> None:
+        if isinstance(data, str):
+            data = data.encode()
+        if isinstance(data, bytes):
+            self._values[channel] = data
+
+    def request_snapshot(self, channel: str) -> None:
+        self._pending[channel] = None
+
+    def take_pending(self) -> T.List[str]:
+        channels = list(self._pending)
+        self._pending.clear()
+        return channels
+
+    def apply_snapshot(
+        self, channels: T.Sequence[str], values: T.Sequence[T.Optional[bytes]]
+    ) -> T.List[T.Tuple[str, T.Dict[str, T.Any]]]:
+        """Caches the fetched values and returns the items to deliver"""
+        items = []
+        for channel, data in zip(channels, values):
+            if data is None:
+                continue
+            self._values[channel] = data
+            self._echo[channel] = data
+            items.append((channel, snapshot_item(channel, data)))
+        return items
+
+    def is_echo(self, channel: str, data: T.Any) -> bool:
+        """Returns True for a live message that repeats the snapshot we just delivered"""
+        if not self._echo:
+            return False
+        snapshot = self._echo.pop(channel, None)
+        return snapshot is not None and snapshot == data
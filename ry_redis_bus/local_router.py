@@ -0,0 +1,238 @@
+"""
+In-process delivery between clients of the same Redis server.
+
+Clients created with a LoopbackPolicy register with the process wide local_router. When
+one of them publishes, every registered client subscribed to the channel, or to a pattern
+matching it, gets the message queued on its inbox before it goes out to Redis, and handles
+it in its next step(). Protobuf messages are copied when they are published and the copy
+is carried next to the encoded bytes, so message_handler hands it over without decoding it
+again and the publisher is free to reuse its message. Handlers share the copy and must not
+modify it. Other objects are decoded from the bytes like messages from Redis.
+
+Redis still gets every publish for subscribers in other processes. The copies that come
+back from Redis, or from a shared memory ring, are dropped by clients that already got the
+message locally, unless the policy keeps the echo.
+"""
+
+import collections
+import fnmatch
+import threading
+import typing as T
+import weakref
+from dataclasses import dataclass
+
+from google.protobuf.message import Message
+
+from ry_redis_bus.dedup import item_fingerprint
+
+LOOPBACK_ECHO_WINDOW = 1.0
+MAX_PENDING_ECHOES = 4096
+# Key of the published object in locally delivered items
+LOCAL_MESSAGE_KEY = "message"
+
+
+@dataclass
+class LoopbackPolicy:
+    """
+    dedup_echo drops the Redis copy of messages already delivered in process, matched
+    on channel and payload within echo_window seconds of the publish.
+    """
+
+    dedup_echo: bool = True
+    echo_window: float = LOOPBACK_ECHO_WINDOW
+
+
+class EchoFilter:
+    """
+    Payloads delivered in process and how many copies of each are still expected from
+    Redis, one per subscription matching the channel. Each copy that arrives consumes one,
+    and entries are forgotten window seconds after their last publish.
+    """
+
+    def __init__(self, window: float, max_entries: int = MAX_PENDING_ECHOES) -> None:
+        self.window = window
+        self.max_entries = max_entries
+        self._entries: T.Dict[int, T.Tuple[int, float]] = {}
+        # Publishers record from their own thread while the subscriber steps in another
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record(self, item: T.Any, now: float, copies: int = 1) -> None:
+        fingerprint = item_fingerprint(item)
+        with self._lock:
+            pending, _ = self._entries.pop(fingerprint, (0, 0.0))
+            self._entries[fingerprint] = (pending + copies, now + self.window)
+            # Entries are kept in expiry order, so the stale ones are all at the front
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][1] >= now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[oldest]
+
+    def consume(self, item: T.Any, now: float) -> bool:
+        """True if the item is an expected copy, which is then no longer expected"""
+        if not self._entries:
+            return False
+        fingerprint = item_fingerprint(item)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None or now > entry[1]:
+                return False
+            pending, expires_at = entry
+            if pending > 1:
+                self._entries[fingerprint] = (pending - 1, expires_at)
+            else:
+                del self._entries[fingerprint]
+        return True
+
+
+def snapshot(message: T.Any) -> T.Optional[Message]:
+    """
+    Copy of a published protobuf message that later changes by the publisher do not reach.
+    Anything else is left to be decoded from the published bytes.
+    """
+    if not isinstance(message, Message):
+        return None
+    copy = type(message)()
+    copy.CopyFrom(message)
+    return copy
+
+
+class LoopbackEndpoint:
+    """The inbox of one client, and the payloads it should not take from Redis again"""
+
+    def __init__(
+        self,
+        namespace: str,
+        policy: LoopbackPolicy,
+        channels: T.Container[str],
+        patterns: T.Iterable[str],
+    ) -> None:
+        self.namespace = namespace
+        self.policy = policy
+        self.channels = channels
+        self.patterns = patterns
+        self.inbox: T.Deque[T.Dict[str, T.Any]] = collections.deque()
+        self.echoes = EchoFilter(policy.echo_window)
+        self.delivered = 0
+        self.echoes_dropped = 0
+
+    def routes(self, channel: str) -> T.List[T.Tuple[str, T.Optional[str]]]:
+        """Item type and pattern of every subscription that receives channel from Redis"""
+        routes: T.List[T.Tuple[str, T.Optional[str]]] = []
+        if channel in self.channels:
+            routes.append(("message", None))
+        routes.extend(
+            ("pmessage", pattern)
+            for pattern in self.patterns
+            if fnmatch.fnmatchcase(channel, pattern)
+        )
+        return routes
+
+    def offer(
+        self,
+        channel: str,
+        data: bytes,
+        message: T.Optional[Message],
+        now: float,
+        routes: T.Sequence[T.Tuple[str, T.Optional[str]]],
+    ) -> None:
+        item_type, pattern = routes[0]
+        item = {
+            "type": item_type,
+            "pattern": pattern.encode() if pattern is not None else None,
+            "channel": channel.encode(),
+            "data": data,
+            LOCAL_MESSAGE_KEY: message,
+        }
+        if self.policy.dedup_echo:
+            self.echoes.record(item, now, copies=len(routes))
+        self.inbox.append(item)
+
+    def is_echo(self, item: T.Any, now: float) -> bool:
+        """True for a copy of a message that was already delivered in process"""
+        if LOCAL_MESSAGE_KEY in item or not self.echoes.consume(item, now):
+            return False
+        self.echoes_dropped += 1
+        return True
+
+    def drain(self, limit: int) -> T.List[T.Dict[str, T.Any]]:
+        items: T.List[T.Dict[str, T.Any]] = []
+        while self.inbox and len(items) < limit:
+            items.append(self.inbox.popleft())
+        self.delivered += len(items)
+        return items
+
+    def publish(self, channel: str, data: T.Union[str, bytes], message: T.Any, now: float) -> int:
+        """Hands what the client publishes to every local subscriber of its namespace"""
+        return local_router.deliver(self.namespace, channel, data, message, now)
+
+    def close(self) -> None:
+        local_router.unregister(self.namespace, self)
+
+
+class LocalRouter:
+    """Registered endpoints, grouped by the Redis server and db their client uses"""
+
+    def __init__(self) -> None:
+        self._endpoints: T.Dict[str, "weakref.WeakSet[LoopbackEndpoint]"] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(endpoints) for endpoints in self._endpoints.values())
+
+    def register(self, namespace: str, endpoint: LoopbackEndpoint) -> None:
+        with self._lock:
+            self._endpoints.setdefault(namespace, weakref.WeakSet()).add(endpoint)
+
+    def unregister(self, namespace: str, endpoint: LoopbackEndpoint) -> None:
+        with self._lock:
+            endpoints = self._endpoints.get(namespace)
+            if endpoints is not None:
+                endpoints.discard(endpoint)
+                if not endpoints:
+                    del self._endpoints[namespace]
+
+    def deliver(
+        self, namespace: str, channel: str, data: T.Union[str, bytes], message: T.Any, now: float
+    ) -> int:
+        """Queues the message for every local subscriber, returns how many got it"""
+        endpoints = self._endpoints.get(namespace)
+        if not endpoints:
+            return 0
+
+        payload = data.encode() if isinstance(data, str) else data
+        with self._lock:
+            targets = list(endpoints)
+
+        delivered = 0
+        local: T.Optional[Message] = None
+        for endpoint in targets:
+            routes = endpoint.routes(channel)
+            if not routes:
+                continue
+            if delivered == 0:
+                # One copy shared by every local subscriber, only made when there is one
+                local = snapshot(message)
+            endpoint.offer(channel, payload, local, now, routes)
+            delivered += 1
+        return delivered
+
+
+local_router = LocalRouter()
+
+
+def open_loopback(
+    namespace: str,
+    policy: T.Optional[LoopbackPolicy],
+    channels: T.Container[str],
+    patterns: T.Iterable[str],
+) -> T.Optional[LoopbackEndpoint]:
+    """The registered endpoint of a client, None when it has no loopback policy"""
+    if policy is None:
+        return None
+    endpoint = LoopbackEndpoint(namespace, policy, channels, patterns)
+    local_router.register(namespace, endpoint)
+    return endpoint
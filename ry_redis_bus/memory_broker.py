@@ -0,0 +1,690 @@
+"""
+In-process stand-in for the Redis server, for tests and for measuring dispatch overhead
+without a network in the way.
+
+    broker = InMemoryBroker()
+    client = RedisClientBase(redis_info, verbose, backend=broker)
+
+Clients given the broker as backend get MemoryRedis / AsyncMemoryRedis connections. Their
+pubsub objects follow the get_message contract of redis-py: subscribe acknowledgements and
+messages come back as dicts with type, pattern, channel and data, with bytes for names and
+payloads, and None once nothing is pending. Publishes are delivered synchronously into the
+queue of every subscribed connection, exact channels first and then one pmessage per
+matching pattern, like the server does.
+
+Only the commands the clients use are implemented, with Redis semantics for them: publish,
+pubsub_numsub, get, set, delete, mget, zadd, zrange, zremrangebyscore, hset, hget, hmget,
+client_list and non-transactional pipelines of those. CLIENT ID and CLIENT TRACKING in
+REDIRECT mode are supported too, so the key cache can be tested without a server.
+"""
+
+import asyncio
+import collections
+import fnmatch
+import threading
+import time
+import typing as T
+import weakref
+
+from ry_redis_bus.key_cache import INVALIDATE_CHANNEL
+from ry_redis_bus.redis_info import RedisInfo
+
+Item = T.Dict[str, T.Any]
+Score = T.Union[float, str]
+
+
+def encode(value: T.Any) -> bytes:
+    """Converts a command argument to the bytes Redis would store"""
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, (int, float)):
+        return repr(value).encode()
+    raise TypeError(f"Invalid input of type {type(value).__name__}, convert to bytes first")
+
+
+def parse_score(value: Score) -> T.Tuple[float, bool]:
+    """Score bound of ZRANGE BYSCORE and ZREMRANGEBYSCORE, with whether it is exclusive"""
+    if isinstance(value, (int, float)):
+        return float(value), False
+    text = value.decode() if isinstance(value, bytes) else str(value)
+    exclusive = text.startswith("(")
+    return float(text[1:] if exclusive else text), exclusive
+
+
+def in_range(score: float, low: T.Tuple[float, bool], high: T.Tuple[float, bool]) -> bool:
+    above = score > low[0] if low[1] else score >= low[0]
+    below = score < high[0] if high[1] else score <= high[0]
+    return above and below
+
+
+class PubSubConnection:
+    """Server side state of one pubsub connection: its subscriptions and pending replies"""
+
+    def __init__(self, broker: "InMemoryBroker", client_name: str) -> None:
+        self.broker = broker
+        self.client_name = client_name
+        self.id = broker.next_client_id()
+        self.closed = False
+        self.channels: T.Dict[bytes, None] = {}
+        self.patterns: T.Dict[bytes, None] = {}
+        self.pending: T.Deque[Item] = collections.deque()
+        self.pending_bytes = 0
+        self._ready = threading.Condition()
+
+    @property
+    def subscriptions(self) -> int:
+        return len(self.channels) + len(self.patterns)
+
+    def push(self, item: Item) -> None:
+        with self._ready:
+            self.pending.append(item)
+            if isinstance(item["data"], bytes):
+                self.pending_bytes += len(item["data"])
+            self._ready.notify()
+
+    def pop(self, timeout: float = 0.0) -> T.Optional[Item]:
+        with self._ready:
+            if not self.pending and timeout > 0:
+                self._ready.wait(timeout)
+            if not self.pending:
+                return None
+            item = self.pending.popleft()
+            if isinstance(item["data"], bytes):
+                self.pending_bytes -= len(item["data"])
+            return item
+
+    def _ack(self, kind: str, name: T.Optional[bytes]) -> None:
+        self.push({"type": kind, "pattern": None, "channel": name, "data": self.subscriptions})
+
+    def subscribe(self, names: T.Iterable[T.Any], pattern: bool = False) -> None:
+        kind = "psubscribe" if pattern else "subscribe"
+        subscribed = self.patterns if pattern else self.channels
+        for name in (encode(name) for name in names):
+            subscribed[name] = None
+            self.broker.attach(self, name, pattern)
+            self._ack(kind, name)
+
+    def unsubscribe(self, names: T.Iterable[T.Any], pattern: bool = False) -> None:
+        """Without names everything is unsubscribed, replying once even if that was nothing"""
+        kind = "punsubscribe" if pattern else "unsubscribe"
+        subscribed = self.patterns if pattern else self.channels
+        targets = [encode(name) for name in names] or list(subscribed)
+        if not targets:
+            self._ack(kind, None)
+        for name in targets:
+            subscribed.pop(name, None)
+            self.broker.detach(self, name, pattern)
+            self._ack(kind, name)
+
+    def close(self) -> None:
+        self.closed = True
+        for name in list(self.channels):
+            self.broker.detach(self, name, pattern=False)
+        for name in list(self.patterns):
+            self.broker.detach(self, name, pattern=True)
+        self.channels.clear()
+        self.patterns.clear()
+        with self._ready:
+            self.pending.clear()
+            self.pending_bytes = 0
+
+
+# pylint: disable-next=too-many-public-methods
+class InMemoryBroker:
+    """The server: subscriptions, sorted sets and hashes shared by every connection"""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._channels: T.Dict[bytes, T.Dict[PubSubConnection, None]] = {}
+        self._patterns: T.Dict[bytes, T.Dict[PubSubConnection, None]] = {}
+        self._connections: "weakref.WeakValueDictionary[int, PubSubConnection]" = (
+            weakref.WeakValueDictionary()
+        )
+        self._client_ids = 0
+        # Tracking client id -> redirect client id, and key -> tracking client ids that read it
+        self._redirects: T.Dict[int, int] = {}
+        self._tracked: T.Dict[bytes, T.Set[int]] = {}
+        self.strings: T.Dict[bytes, bytes] = {}
+        self.sorted_sets: T.Dict[bytes, T.Dict[bytes, float]] = {}
+        self.hashes: T.Dict[bytes, T.Dict[bytes, bytes]] = {}
+        self.published = 0
+
+    def next_client_id(self) -> int:
+        with self._lock:
+            self._client_ids += 1
+            return self._client_ids
+
+    def connect(self, redis_info: RedisInfo, client_name: str) -> "MemoryRedis":
+        del redis_info
+        return MemoryRedis(self, client_name)
+
+    async def aconnect(self, redis_info: RedisInfo, client_name: str) -> "AsyncMemoryRedis":
+        del redis_info
+        return AsyncMemoryRedis(self, client_name)
+
+    def open_pubsub(self, client_name: str) -> PubSubConnection:
+        connection = PubSubConnection(self, client_name)
+        with self._lock:
+            self._connections[connection.id] = connection
+        return connection
+
+    def attach(self, connection: PubSubConnection, name: bytes, pattern: bool) -> None:
+        with self._lock:
+            (self._patterns if pattern else self._channels).setdefault(name, {})[connection] = None
+
+    def detach(self, connection: PubSubConnection, name: bytes, pattern: bool) -> None:
+        with self._lock:
+            table = self._patterns if pattern else self._channels
+            subscribers = table.get(name)
+            if subscribers is not None:
+                subscribers.pop(connection, None)
+                if not subscribers:
+                    del table[name]
+
+    def publish(self, channel: T.Any, data: T.Any) -> int:
+        """Queues data for every subscriber, returns how many connections received it"""
+        name, payload = encode(channel), encode(data)
+        with self._lock:
+            direct = list(self._channels.get(name, ()))
+            matched = [
+                (pattern, connection)
+                for pattern, connections in self._patterns.items()
+                if fnmatch.fnmatchcase(name, pattern)
+                for connection in connections
+            ]
+            self.published += 1
+
+        for connection in direct:
+            connection.push({"type": "message", "pattern": None, "channel": name, "data": payload})
+        for pattern, connection in matched:
+            connection.push(
+                {"type": "pmessage", "pattern": pattern, "channel": name, "data": payload}
+            )
+        return len(direct) + len(matched)
+
+    def pubsub_numsub(self, *channels: T.Any) -> T.List[T.Tuple[bytes, int]]:
+        with self._lock:
+            return [(encode(c), len(self._channels.get(encode(c), ()))) for c in channels]
+
+    def pubsub_numpat(self) -> int:
+        with self._lock:
+            return len(self._patterns)
+
+    def client_list(self, _type: T.Optional[str] = None) -> T.List[T.Dict[str, T.Any]]:
+        """CLIENT LIST of the pubsub connections, omem is what they have not read yet"""
+        del _type
+        with self._lock:
+            connections = list(self._connections.values())
+        return [
+            {
+                "name": connection.client_name,
+                "sub": len(connection.channels),
+                "psub": len(connection.patterns),
+                "omem": connection.pending_bytes,
+                "qbuf": 0,
+            }
+            for connection in connections
+        ]
+
+    def track(self, client_id: int, redirect: T.Optional[int]) -> None:
+        """CLIENT TRACKING ON REDIRECT redirect, or OFF for None"""
+        with self._lock:
+            if redirect is None:
+                self._redirects.pop(client_id, None)
+            else:
+                self._redirects[client_id] = redirect
+
+    def tracking_info(self, client_id: int) -> T.List[T.Any]:
+        """CLIENT TRACKINGINFO in its RESP2 shape"""
+        with self._lock:
+            redirect = self._redirects.get(client_id)
+            if redirect is None:
+                return [b"flags", [b"off"], b"redirect", -1, b"prefixes", []]
+            target = self._connections.get(redirect)
+        flags = [b"on"] if target is not None and not target.closed else [b"on", b"broken_redirect"]
+        return [b"flags", flags, b"redirect", redirect, b"prefixes", []]
+
+    def _read(self, client_id: T.Optional[int], *names: bytes) -> None:
+        """Remembers the keys a tracking client read, call with the lock held"""
+        if client_id is not None and client_id in self._redirects:
+            for name in names:
+                self._tracked.setdefault(name, set()).add(client_id)
+
+    def _invalidate(self, names: T.Optional[T.Sequence[bytes]]) -> None:
+        """Tells the tracking clients that read names, or all of them for None"""
+        with self._lock:
+            targets: T.Dict[int, T.Optional[T.List[bytes]]] = {}
+            if names is None:
+                targets = {client_id: None for client_id in self._redirects}
+                self._tracked.clear()
+            for name in names or ():
+                for client_id in self._tracked.pop(name, ()):
+                    targets.setdefault(client_id, [])
+                    T.cast(T.List[bytes], targets[client_id]).append(name)
+            connections = [
+                (self._connections.get(self._redirects.get(client_id, -1)), keys)
+                for client_id, keys in targets.items()
+            ]
+
+        for connection, keys in connections:
+            if connection is not None and encode(INVALIDATE_CHANNEL) in connection.channels:
+                connection.push(
+                    {
+                        "type": "message",
+                        "pattern": None,
+                        "channel": encode(INVALIDATE_CHANNEL),
+                        "data": keys,
+                    }
+                )
+
+    def get(self, name: T.Any, client_id: T.Optional[int] = None) -> T.Optional[bytes]:
+        with self._lock:
+            self._read(client_id, encode(name))
+            return self.strings.get(encode(name))
+
+    def mget(
+        self, names: T.Sequence[T.Any], client_id: T.Optional[int] = None
+    ) -> T.List[T.Optional[bytes]]:
+        keys = [encode(name) for name in names]
+        with self._lock:
+            self._read(client_id, *keys)
+            return [self.strings.get(key) for key in keys]
+
+    def set(self, name: T.Any, value: T.Any) -> bool:
+        with self._lock:
+            self.strings[encode(name)] = encode(value)
+        self._invalidate([encode(name)])
+        return True
+
+    def delete(self, *names: T.Any) -> int:
+        keys = [encode(name) for name in names]
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                for table in (self.strings, self.hashes, self.sorted_sets):
+                    deleted += table.pop(key, None) is not None  # type: ignore[attr-defined]
+        self._invalidate(keys)
+        return deleted
+
+    def zadd(self, name: T.Any, mapping: T.Mapping[T.Any, float]) -> int:
+        self._invalidate([encode(name)])
+        with self._lock:
+            members = self.sorted_sets.setdefault(encode(name), {})
+            added = 0
+            for member, score in mapping.items():
+                key = encode(member)
+                added += key not in members
+                members[key] = float(score)
+            return added
+
+    # pylint: disable-next=too-many-arguments
+    def zrange(
+        self,
+        name: T.Any,
+        start: T.Union[int, Score],
+        end: T.Union[int, Score],
+        byscore: bool = False,
+        offset: T.Optional[int] = None,
+        num: T.Optional[int] = None,
+        withscores: bool = False,
+    ) -> T.List[T.Any]:
+        with self._lock:
+            ordered = sorted(
+                self.sorted_sets.get(encode(name), {}).items(), key=lambda kv: (kv[1], kv[0])
+            )
+        if byscore:
+            low, high = parse_score(start), parse_score(end)
+            selected = [(m, s) for m, s in ordered if in_range(s, low, high)]
+            if offset is not None and num is not None:
+                selected = selected[offset : offset + num if num >= 0 else None]
+        else:
+            first, last = int(start), int(end)
+            last = len(ordered) + last if last < 0 else last
+            selected = ordered[first : last + 1]
+        return selected if withscores else [member for member, _ in selected]
+
+    def zremrangebyscore(self, name: T.Any, low: Score, high: Score) -> int:
+        self._invalidate([encode(name)])
+        bounds = parse_score(low), parse_score(high)
+        with self._lock:
+            members = self.sorted_sets.get(encode(name), {})
+            removed = [member for member, score in members.items() if in_range(score, *bounds)]
+            for member in removed:
+                del members[member]
+            return len(removed)
+
+    def hset(
+        self,
+        name: T.Any,
+        key: T.Any = None,
+        value: T.Any = None,
+        mapping: T.Optional[T.Mapping[T.Any, T.Any]] = None,
+    ) -> int:
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        self._invalidate([encode(name)])
+        with self._lock:
+            fields = self.hashes.setdefault(encode(name), {})
+            added = 0
+            for field, field_value in items.items():
+                added += encode(field) not in fields
+                fields[encode(field)] = encode(field_value)
+            return added
+
+    def hget(self, name: T.Any, key: T.Any, client_id: T.Optional[int] = None) -> T.Optional[bytes]:
+        with self._lock:
+            self._read(client_id, encode(name))
+            return self.hashes.get(encode(name), {}).get(encode(key))
+
+    def hmget(
+        self, name: T.Any, keys: T.Any, *args: T.Any, client_id: T.Optional[int] = None
+    ) -> T.List[T.Optional[bytes]]:
+        names = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        with self._lock:
+            self._read(client_id, encode(name))
+            fields = self.hashes.get(encode(name), {})
+            return [fields.get(encode(key)) for key in names + list(args)]
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self.strings.clear()
+            self.sorted_sets.clear()
+            self.hashes.clear()
+        self._invalidate(None)
+        return True
+
+
+class MemoryPubSub:
+    """redis.client.PubSub over a broker connection"""
+
+    def __init__(self, broker: InMemoryBroker, client_name: str) -> None:
+        self.connection = broker.open_pubsub(client_name)
+        self._reply: T.Any = None
+
+    @property
+    def channels(self) -> T.Dict[bytes, None]:
+        return self.connection.channels
+
+    @property
+    def patterns(self) -> T.Dict[bytes, None]:
+        return self.connection.patterns
+
+    def subscribe(self, *channels: T.Any) -> None:
+        self.connection.subscribe(channels)
+
+    def psubscribe(self, *patterns: T.Any) -> None:
+        self.connection.subscribe(patterns, pattern=True)
+
+    def unsubscribe(self, *channels: T.Any) -> None:
+        self.connection.unsubscribe(channels)
+
+    def punsubscribe(self, *patterns: T.Any) -> None:
+        self.connection.unsubscribe(patterns, pattern=True)
+
+    def get_message(self, timeout: float = 0.0) -> T.Optional[Item]:
+        return self.connection.pop(timeout or 0.0)
+
+    def execute_command(self, *args: T.Any) -> None:
+        """Only CLIENT ID, which is what may be asked before subscribing"""
+        assert [encode(arg).upper() for arg in args] == [b"CLIENT", b"ID"], args
+        self._reply = self.connection.id
+
+    def parse_response(self, block: bool = True, timeout: float = 0.0) -> T.Any:
+        del block, timeout
+        reply, self._reply = self._reply, None
+        return reply
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class AsyncMemoryPubSub:
+    """redis.asyncio.client.PubSub over a broker connection"""
+
+    POLL_INTERVAL = 0.001
+
+    def __init__(self, broker: InMemoryBroker, client_name: str) -> None:
+        self.connection = broker.open_pubsub(client_name)
+        self._reply: T.Any = None
+
+    @property
+    def channels(self) -> T.Dict[bytes, None]:
+        return self.connection.channels
+
+    @property
+    def patterns(self) -> T.Dict[bytes, None]:
+        return self.connection.patterns
+
+    async def subscribe(self, *channels: T.Any) -> None:
+        self.connection.subscribe(channels)
+
+    async def psubscribe(self, *patterns: T.Any) -> None:
+        self.connection.subscribe(patterns, pattern=True)
+
+    async def unsubscribe(self, *channels: T.Any) -> None:
+        self.connection.unsubscribe(channels)
+
+    async def punsubscribe(self, *patterns: T.Any) -> None:
+        self.connection.unsubscribe(patterns, pattern=True)
+
+    async def get_message(self, timeout: T.Optional[float] = 0.0) -> T.Optional[Item]:
+        # Waiting on the connection would block the event loop, so poll until the deadline
+        deadline = time.monotonic() + (timeout or 0.0)
+        while True:
+            item = self.connection.pop()
+            if item is not None or time.monotonic() >= deadline:
+                return item
+            await asyncio.sleep(self.POLL_INTERVAL)
+
+    async def execute_command(self, *args: T.Any) -> None:
+        """Only CLIENT ID, which is what may be asked before subscribing"""
+        assert [encode(arg).upper() for arg in args] == [b"CLIENT", b"ID"], args
+        self._reply = self.connection.id
+
+    async def parse_response(self, block: bool = True, timeout: T.Optional[float] = None) -> T.Any:
+        del block, timeout
+        reply, self._reply = self._reply, None
+        return reply
+
+    async def close(self) -> None:
+        self.connection.close()
+
+
+class PipelineCommands:
+    """Commands queued on a non-transactional pipeline, run in order on execute"""
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        self.broker = broker
+        self._commands: T.List[T.Callable[[], T.Any]] = []
+
+    def _queue(self, command: T.Callable[..., T.Any], *args: T.Any, **kwargs: T.Any) -> None:
+        self._commands.append(lambda: command(*args, **kwargs))
+
+    def publish(self, channel: T.Any, data: T.Any) -> None:
+        self._queue(self.broker.publish, channel, data)
+
+    def zadd(self, name: T.Any, mapping: T.Mapping[T.Any, float]) -> None:
+        self._queue(self.broker.zadd, name, mapping)
+
+    def zremrangebyscore(self, name: T.Any, low: Score, high: Score) -> None:
+        self._queue(self.broker.zremrangebyscore, name, low, high)
+
+    def hset(self, name: T.Any, key: T.Any = None, value: T.Any = None) -> None:
+        self._queue(self.broker.hset, name, key, value)
+
+    def run(self) -> T.List[T.Any]:
+        commands, self._commands = self._commands, []
+        return [command() for command in commands]
+
+
+class MemoryPipeline(PipelineCommands):
+    def execute(self) -> T.List[T.Any]:
+        return self.run()
+
+
+class AsyncMemoryPipeline(PipelineCommands):
+    async def execute(self) -> T.List[T.Any]:
+        return self.run()
+
+
+# pylint: disable-next=too-many-public-methods
+class MemoryRedis:
+    """redis.Redis talking to the broker"""
+
+    def __init__(self, broker: InMemoryBroker, client_name: str) -> None:
+        self.broker = broker
+        self.client_name = client_name
+        self.id = broker.next_client_id()
+
+    def ping(self) -> bool:
+        return True
+
+    def pubsub(self) -> MemoryPubSub:
+        return MemoryPubSub(self.broker, self.client_name)
+
+    def pipeline(self, transaction: bool = True) -> MemoryPipeline:
+        del transaction
+        return MemoryPipeline(self.broker)
+
+    def publish(self, channel: T.Any, data: T.Any) -> int:
+        return self.broker.publish(channel, data)
+
+    def pubsub_numsub(self, *channels: T.Any) -> T.List[T.Tuple[bytes, int]]:
+        return self.broker.pubsub_numsub(*channels)
+
+    def pubsub_numpat(self) -> int:
+        return self.broker.pubsub_numpat()
+
+    def client_list(self, _type: T.Optional[str] = None) -> T.List[T.Dict[str, T.Any]]:
+        return self.broker.client_list(_type)
+
+    def zadd(self, name: T.Any, mapping: T.Mapping[T.Any, float]) -> int:
+        return self.broker.zadd(name, mapping)
+
+    def zrange(self, name: T.Any, start: T.Any, end: T.Any, **kwargs: T.Any) -> T.List[T.Any]:
+        return self.broker.zrange(name, start, end, **kwargs)
+
+    def hset(self, name: T.Any, key: T.Any = None, value: T.Any = None) -> int:
+        return self.broker.hset(name, key, value)
+
+    def hget(self, name: T.Any, key: T.Any) -> T.Optional[bytes]:
+        return self.broker.hget(name, key, client_id=self.id)
+
+    def hmget(self, name: T.Any, keys: T.Any, *args: T.Any) -> T.List[T.Optional[bytes]]:
+        return self.broker.hmget(name, keys, *args, client_id=self.id)
+
+    def get(self, name: T.Any) -> T.Optional[bytes]:
+        return self.broker.get(name, client_id=self.id)
+
+    def mget(self, keys: T.Any, *args: T.Any) -> T.List[T.Optional[bytes]]:
+        names = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        return self.broker.mget(names + list(args), client_id=self.id)
+
+    def set(self, name: T.Any, value: T.Any) -> bool:
+        return self.broker.set(name, value)
+
+    def delete(self, *names: T.Any) -> int:
+        return self.broker.delete(*names)
+
+    def client_id(self) -> int:
+        return self.id
+
+    def client_tracking_on(self, clientid: T.Optional[int] = None) -> bool:
+        self.broker.track(self.id, clientid if clientid is not None else self.id)
+        return True
+
+    def client_tracking_off(self) -> bool:
+        self.broker.track(self.id, None)
+        return True
+
+    def client_trackinginfo(self) -> T.List[T.Any]:
+        return self.broker.tracking_info(self.id)
+
+    def flushdb(self) -> bool:
+        return self.broker.flushdb()
+
+    def close(self) -> None:
+        self.broker.track(self.id, None)
+
+
+# pylint: disable-next=too-many-public-methods
+class AsyncMemoryRedis:
+    """redis.asyncio.Redis talking to the broker"""
+
+    def __init__(self, broker: InMemoryBroker, client_name: str) -> None:
+        self.broker = broker
+        self.client_name = client_name
+        self.id = broker.next_client_id()
+
+    async def ping(self) -> bool:
+        return True
+
+    def pubsub(self) -> AsyncMemoryPubSub:
+        return AsyncMemoryPubSub(self.broker, self.client_name)
+
+    def pipeline(self, transaction: bool = True) -> AsyncMemoryPipeline:
+        del transaction
+        return AsyncMemoryPipeline(self.broker)
+
+    async def publish(self, channel: T.Any, data: T.Any) -> int:
+        return self.broker.publish(channel, data)
+
+    async def pubsub_numsub(self, *channels: T.Any) -> T.List[T.Tuple[bytes, int]]:
+        return self.broker.pubsub_numsub(*channels)
+
+    async def pubsub_numpat(self) -> int:
+        return self.broker.pubsub_numpat()
+
+    async def client_list(self, _type: T.Optional[str] = None) -> T.List[T.Dict[str, T.Any]]:
+        return self.broker.client_list(_type)
+
+    async def zadd(self, name: T.Any, mapping: T.Mapping[T.Any, float]) -> int:
+        return self.broker.zadd(name, mapping)
+
+    async def zrange(self, name: T.Any, start: T.Any, end: T.Any, **kwargs: T.Any) -> T.List[T.Any]:
+        return self.broker.zrange(name, start, end, **kwargs)
+
+    async def hset(self, name: T.Any, key: T.Any = None, value: T.Any = None) -> int:
+        return self.broker.hset(name, key, value)
+
+    async def hget(self, name: T.Any, key: T.Any) -> T.Optional[bytes]:
+        return self.broker.hget(name, key, client_id=self.id)
+
+    async def hmget(self, name: T.Any, keys: T.Any, *args: T.Any) -> T.List[T.Optional[bytes]]:
+        return self.broker.hmget(name, keys, *args, client_id=self.id)
+
+    async def get(self, name: T.Any) -> T.Optional[bytes]:
+        return self.broker.get(name, client_id=self.id)
+
+    async def mget(self, keys: T.Any, *args: T.Any) -> T.List[T.Optional[bytes]]:
+        names = [keys] if isinstance(keys, (str, bytes)) else list(keys)
+        return self.broker.mget(names + list(args), client_id=self.id)
+
+    async def set(self, name: T.Any, value: T.Any) -> bool:
+        return self.broker.set(name, value)
+
+    async def delete(self, *names: T.Any) -> int:
+        return self.broker.delete(*names)
+
+    async def client_id(self) -> int:
+        return self.id
+
+    async def client_tracking_on(self, clientid: T.Optional[int] = None) -> bool:
+        self.broker.track(self.id, clientid if clientid is not None else self.id)
+        return True
+
+    async def client_tracking_off(self) -> bool:
+        self.broker.track(self.id, None)
+        return True
+
+    async def client_trackinginfo(self) -> T.List[T.Any]:
+        return self.broker.tracking_info(self.id)
+
+    async def flushdb(self) -> bool:
+        return self.broker.flushdb()
+
+    async def close(self) -> None:
+        self.broker.track(self.id, None)
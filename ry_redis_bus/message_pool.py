@@ -0,0 +1,35 @@
+import typing as T
+
+from google.protobuf.message import Message
+
+DEFAULT_POOL_SIZE = 8
+
+
+class MessagePool:
+    """
+    Free list of decoded protobuf instances for handlers that do not keep the message
+    past their return. ParseFromString clears the instance before merging, so a released
+    message can be parsed into again without allocating a new object tree.
+
+    Sync handlers keep cycling one instance. Async handlers can have several messages in
+    flight, each takes its own instance and up to size of them are kept once released.
+    """
+
+    def __init__(self, message_class: T.Type[Message], size: int = DEFAULT_POOL_SIZE) -> None:
+        self.message_class = message_class
+        self.size = size
+        self.allocated = 0
+        self._free: T.List[Message] = []
+
+    def __len__(self) -> int:
+        return len(self._free)
+
+    def acquire(self) -> Message:
+        if self._free:
+            return self._free.pop()
+        self.allocated += 1
+        return self.message_class()
+
+    def release(self, message: Message) -> None:
+        if len(self._free) < self.size:
+            self._free.append(message)
@@ -0,0 +1,141 @@
+"""
+Opt-in performance profile for the Redis connections of a client.
+
+With performance=PerformanceProfile() a client connects through connection classes that
+tune every socket they open, command and pubsub connections alike: TCP_NODELAY,
+keepalive probes to notice dead peers within seconds, and larger kernel buffers so bursts
+are absorbed instead of pushing back on the server. It also warns when redis-py parses
+replies in Python because hiredis is not installed.
+
+uvloop has to be in place before the event loop starts, so async programs start with
+performance.run(main()) instead of asyncio.run(main()). It falls back to asyncio when
+uvloop is not installed, and clients with a profile warn when they find themselves on
+the default loop.
+"""
+
+import asyncio
+import socket
+import typing as T
+from dataclasses import dataclass
+
+import redis
+import redis.asyncio as aioredis
+import redis.utils
+from ryutils import log
+
+from ry_redis_bus.codec import optional_import
+
+DEFAULT_RECEIVE_BUFFER = 4 * 1024 * 1024
+DEFAULT_SEND_BUFFER = 1024 * 1024
+
+Result = T.TypeVar("Result")
+
+
+@dataclass
+class PerformanceProfile:
+    uvloop: bool = True
+    require_hiredis: bool = True
+    tcp_nodelay: bool = True
+    keepalive: bool = True
+    keepalive_idle: int = 10
+    keepalive_interval: int = 5
+    keepalive_count: int = 3
+    receive_buffer: T.Optional[int] = DEFAULT_RECEIVE_BUFFER
+    send_buffer: T.Optional[int] = DEFAULT_SEND_BUFFER
+
+
+def socket_options(profile: PerformanceProfile) -> T.List[T.Tuple[int, int, int]]:
+    """(level, option, value) of the profile that the platform supports"""
+    options = []
+    if profile.tcp_nodelay:
+        options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+    if profile.keepalive:
+        options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        for name, value in (
+            ("TCP_KEEPIDLE", profile.keepalive_idle),
+            ("TCP_KEEPINTVL", profile.keepalive_interval),
+            ("TCP_KEEPCNT", profile.keepalive_count),
+        ):
+            if hasattr(socket, name):
+                options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    if profile.receive_buffer is not None:
+        options.append((socket.SOL_SOCKET, socket.SO_RCVBUF, profile.receive_buffer))
+    if profile.send_buffer is not None:
+        options.append((socket.SOL_SOCKET, socket.SO_SNDBUF, profile.send_buffer))
+    return options
+
+
+def tune_socket(sock: T.Optional[socket.socket], profile: PerformanceProfile) -> None:
+    if sock is None or sock.family not in (socket.AF_INET, socket.AF_INET6):
+        return
+    for level, option, value in socket_options(profile):
+        try:
+            sock.setsockopt(level, option, value)
+        except OSError as exc:
+            log.print_warn(f"Failed to set socket option {option} to {value}: {exc}")
+
+
+class TunedConnection(redis.connection.Connection):
+    def __init__(self, *args: T.Any, profile: PerformanceProfile, **kwargs: T.Any) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore[no-untyped-call]
+        self.profile = profile
+
+    def _connect(self) -> socket.socket:
+        sock = super()._connect()  # type: ignore[no-untyped-call]
+        tune_socket(sock, self.profile)
+        return T.cast(socket.socket, sock)
+
+
+class AsyncTunedConnection(aioredis.connection.Connection):
+    def __init__(self, *args: T.Any, profile: PerformanceProfile, **kwargs: T.Any) -> None:
+        super().__init__(*args, **kwargs)  # type: ignore[no-untyped-call]
+        self.profile = profile
+
+    async def _connect(self) -> None:
+        await super()._connect()  # type: ignore[no-untyped-call]
+        writer = getattr(self, "_writer", None)
+        if writer is not None:
+            tune_socket(writer.transport.get_extra_info("socket"), self.profile)
+
+
+def connection_kwargs(
+    profile: T.Optional[PerformanceProfile], is_async: bool
+) -> T.Dict[str, T.Any]:
+    """Extra arguments for redis.Redis / ConnectionPool.from_url to use tuned connections"""
+    if profile is None:
+        return {}
+    return {
+        "connection_class": AsyncTunedConnection if is_async else TunedConnection,
+        "profile": profile,
+    }
+
+
+def hiredis_available() -> bool:
+    return bool(redis.utils.HIREDIS_AVAILABLE)
+
+
+def uvloop_running() -> bool:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return type(loop).__module__.startswith("uvloop")
+
+
+def check_runtime(profile: PerformanceProfile, is_async: bool) -> None:
+    """Warns about the parts of the profile the running process does not get"""
+    if profile.require_hiredis and not hiredis_available():
+        log.print_warn("hiredis is not installed, redis-py parses replies in Python.")
+    if is_async and profile.uvloop and not uvloop_running():
+        reason = "is not installed" if optional_import("uvloop") is None else "is not running"
+        log.print_warn(f"uvloop {reason}, start with ry_redis_bus.performance.run(main()).")
+
+
+def run(
+    main: T.Coroutine[T.Any, T.Any, Result], profile: T.Optional[PerformanceProfile] = None
+) -> Result:
+    """asyncio.run on a uvloop event loop when the profile allows it and uvloop is there"""
+    uvloop = optional_import("uvloop") if (profile or PerformanceProfile()).uvloop else None
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(main)
@@ -0,0 +1,89 @@
+"""
+Publish side rate limiting.
+
+A channel with a PublishPolicy goes out at most max_rate times per second, with bursts of
+up to burst publishes. Publishes over the rate are held back when the policy coalesces:
+only the newest is kept and sent once a token is available, either by the next publish
+to the channel or by the client's step(). Without coalescing they are dropped.
+"""
+
+import collections
+import typing as T
+from dataclasses import dataclass
+
+
+@dataclass
+class PublishPolicy:
+    max_rate: float
+    burst: int = 1
+    coalesce: bool = True
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int, now: float) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid rate {rate} or burst {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self._refill(now)
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+class PublishLimiter:
+    """Buckets and held back messages of the channels that have a policy"""
+
+    def __init__(self) -> None:
+        self.policies: T.Dict[str, PublishPolicy] = {}
+        self._buckets: T.Dict[str, TokenBucket] = {}
+        # Newest held back (channel, message) per channel, in the order they were held
+        self._pending: T.Dict[str, T.Tuple[T.Any, T.Any]] = {}
+        self.suppressed: T.Counter[str] = collections.Counter()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def set_policy(self, channel: str, policy: T.Optional[PublishPolicy], now: float) -> None:
+        self._pending.pop(channel, None)
+        if policy is None:
+            self.policies.pop(channel, None)
+            self._buckets.pop(channel, None)
+            return
+        self.policies[channel] = policy
+        self._buckets[channel] = TokenBucket(policy.max_rate, policy.burst, now)
+
+    def admit(self, channel: T.Any, message: T.Any, now: float) -> T.List[T.Tuple[T.Any, T.Any]]:
+        """Returns what should be published now for a publish of message to channel"""
+        name = str(channel)
+        policy = self.policies.get(name)
+        if policy is None:
+            return [(channel, message)]
+
+        if self._buckets[name].take(now):
+            # Anything held back is older than this message, which wins
+            if self._pending.pop(name, None) is not None:
+                self.suppressed[name] += 1
+            return [(channel, message)]
+
+        if not policy.coalesce or self._pending.pop(name, None) is not None:
+            self.suppressed[name] += 1
+        if policy.coalesce:
+            self._pending[name] = (channel, message)
+        return []
+
+    def due(self, now: float, force: bool = False) -> T.List[T.Tuple[T.Any, T.Any]]:
+        """Held back messages that may go out now, all of them when forced"""
+        if not self._pending:
+            return []
+        ready = [name for name in self._pending if force or self._buckets[name].take(now)]
+        return [self._pending.pop(name) for name in ready]
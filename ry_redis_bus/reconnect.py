@@ -0,0 +1,129 @@
+import collections
+import enum
+import random
+import typing as T
+from dataclasses import dataclass, field
+
+from ry_redis_bus.helpers import DEFAULT_COOLDOWN_TIMEOUT, MAX_COOLDOWN_TIMEOUT
+
+DEFAULT_OUTAGE_HISTORY = 100
+
+
+class ConnectionState(enum.Enum):
+    CONNECTED = "connected"
+    DISCONNECTED = "disconnected"
+    RESTORING = "restoring"
+
+
+@dataclass
+class Backoff:
+    """
+    Exponential backoff with equal jitter: each delay is drawn between half and all of
+    base * 2^attempts, capped, so clients that lost the same server do not retry in step.
+    """
+
+    base: float = DEFAULT_COOLDOWN_TIMEOUT
+    cap: float = MAX_COOLDOWN_TIMEOUT
+    attempts: int = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.cap, self.base * 2.0**self.attempts)
+        self.attempts += 1
+        return random.uniform(ceiling / 2.0, ceiling)
+
+    def reset(self) -> None:
+        self.attempts = 0
+
+
+@dataclass
+class Outage:
+    """A single loss of the pubsub connection and its recovery"""
+
+    started_at: float
+    restored_at: float
+    last_message_at: float
+    attempts: int
+
+    @property
+    def duration(self) -> float:
+        return self.restored_at - self.started_at
+
+    @property
+    def lost_window(self) -> T.Tuple[float, float]:
+        """
+        Time range in which published messages may not have reached us. It opens at the
+        last message received before the outage, since the connection may have been dead
+        for a while before the error surfaced, and closes once the server acknowledged
+        the restored subscriptions.
+        """
+        if 0.0 < self.last_message_at <= self.started_at:
+            return (self.last_message_at, self.restored_at)
+        return (self.started_at, self.restored_at)
+
+
+@dataclass
+class RecoveryMetrics:
+    outages: int = 0
+    total_outage_time: float = 0.0
+    total_lost_time: float = 0.0
+    history: T.Deque[Outage] = field(
+        default_factory=lambda: collections.deque(maxlen=DEFAULT_OUTAGE_HISTORY)
+    )
+
+    @property
+    def last_outage(self) -> T.Optional[Outage]:
+        return self.history[-1] if self.history else None
+
+    def record(self, outage: Outage) -> None:
+        start, end = outage.lost_window
+        self.outages += 1
+        self.total_outage_time += outage.duration
+        self.total_lost_time += end - start
+        self.history.append(outage)
+
+
+class ReconnectMachine:
+    """
+    Tracks the pubsub connection through CONNECTED -> DISCONNECTED -> RESTORING -> CONNECTED.
+    A failed restore goes back to DISCONNECTED with a longer backoff.
+    """
+
+    def __init__(self, backoff: T.Optional[Backoff] = None) -> None:
+        self.state = ConnectionState.CONNECTED
+        self.backoff = backoff or Backoff()
+        self.metrics = RecoveryMetrics()
+        self.retry_at = 0.0
+        self._down_since = 0.0
+        self._last_message_at = 0.0
+
+    @property
+    def connected(self) -> bool:
+        return self.state == ConnectionState.CONNECTED
+
+    def connection_lost(self, now: float, last_message_at: float) -> float:
+        """Moves to DISCONNECTED and returns how long to wait before restoring"""
+        if self.state == ConnectionState.CONNECTED:
+            self._down_since = now
+            self._last_message_at = last_message_at
+        self.state = ConnectionState.DISCONNECTED
+        delay = self.backoff.next_delay()
+        self.retry_at = now + delay
+        return delay
+
+    def should_restore(self, now: float) -> bool:
+        return self.state == ConnectionState.DISCONNECTED and now >= self.retry_at
+
+    def restoring(self) -> None:
+        self.state = ConnectionState.RESTORING
+
+    def restored(self, now: float) -> Outage:
+        outage = Outage(
+            started_at=self._down_since,
+            restored_at=now,
+            last_message_at=self._last_message_at,
+            attempts=self.backoff.attempts,
+        )
+        self.metrics.record(outage)
+        self.backoff.reset()
+        self.state = ConnectionState.CONNECTED
+        return outage
@@ -1,30 +1,111 @@
+"""
+Combined sync and async client.
+
+Each half, and the redis/redis.asyncio/protobuf imports it needs, is only created the
+first time it is used, so short lived tools that only publish pay for the sync half.
+"""
+
+from __future__ import annotations
+
 import typing as T
 
-import redis
-import redis.asyncio as aioredis
-from ryutils.verbose import Verbose
+from ry_redis_bus.redis_info import RedisInfo
+
+if T.TYPE_CHECKING:
+    import asyncio
+    import concurrent.futures
+
+    import redis
+    import redis.asyncio as aioredis
+    from google.protobuf.message import Message
+    from ryutils.verbose import Verbose
 
-from ry_redis_bus.channels import Channel
-from ry_redis_bus.helpers import RedisInfo, RedisMessageCallback
-from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
-from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+    from ry_redis_bus.backend import Backend
+    from ry_redis_bus.backpressure import SheddingPolicy
+    from ry_redis_bus.channels import Channel
+    from ry_redis_bus.helpers import RedisMessageCallback
+    from ry_redis_bus.key_cache import KeyCachePolicy
+    from ry_redis_bus.local_router import LoopbackPolicy
+    from ry_redis_bus.performance import PerformanceProfile
+    from ry_redis_bus.rate_limit import PublishPolicy
+    from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
+    from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+    from ry_redis_bus.subscription import SubscriptionOptions
 
 
-# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-public-methods,import-outside-toplevel
 class RedisClientBase:
     """
     A class that combines both the async and sync redis clients.
     """
 
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
     def __init__(
         self,
         redis_info: RedisInfo,
         verbose: Verbose,
         default_message_callback: RedisMessageCallback = None,
+        shedding_policy: T.Optional[SheddingPolicy] = None,
+        last_value_cache: bool = False,
+        loopback: T.Optional[LoopbackPolicy] = None,
+        backend: T.Optional[Backend] = None,
+        key_cache: T.Optional[KeyCachePolicy] = None,
+        performance: T.Optional[PerformanceProfile] = None,
     ):
+        self.redis_info = redis_info
         self.verbose = verbose
-        self.async_client = AsyncRedisClientBase(redis_info, verbose, default_message_callback)
-        self.sync_client = SyncRedisClientBase(redis_info, verbose, default_message_callback)
+        self.default_message_callback = default_message_callback
+        self.shedding_policy = shedding_policy
+        self.last_value_cache = last_value_cache
+        self.loopback = loopback
+        self.backend = backend
+        self.key_cache = key_cache
+        self.performance = performance
+        self.publish_policies: T.Dict[str, T.Optional[PublishPolicy]] = {}
+        self._async_client: T.Optional[AsyncRedisClientBase] = None
+        self._sync_client: T.Optional[SyncRedisClientBase] = None
+
+    @property
+    def async_client(self) -> AsyncRedisClientBase:
+        """Async half, created on first use."""
+        if self._async_client is None:
+            from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
+
+            self._async_client = AsyncRedisClientBase(
+                self.redis_info,
+                self.verbose,
+                self.default_message_callback,
+                self.shedding_policy,
+                self.last_value_cache,
+                self.loopback,
+                self.backend,
+                self.key_cache,
+                self.performance,
+            )
+            for channel, policy in self.publish_policies.items():
+                self._async_client.set_publish_policy(channel, policy)
+        return self._async_client
+
+    @property
+    def sync_client(self) -> SyncRedisClientBase:
+        """Sync half, created on first use."""
+        if self._sync_client is None:
+            from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+            self._sync_client = SyncRedisClientBase(
+                self.redis_info,
+                self.verbose,
+                self.default_message_callback,
+                self.shedding_policy,
+                self.last_value_cache,
+                self.loopback,
+                self.backend,
+                self.key_cache,
+                self.performance,
+            )
+            for channel, policy in self.publish_policies.items():
+                self._sync_client.set_publish_policy(channel, policy)
+        return self._sync_client
 
     @property
     async def aclient(self) -> aioredis.Redis:
@@ -46,13 +127,13 @@ class RedisClientBase:
         """Sync Redis pubsub client."""
         return self.sync_client.pubsub
 
-    async def azadd(self, data: T.Any) -> None:
+    async def azadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
         """Async version of zadd."""
-        await self.async_client.zadd(data)
+        await self.async_client.zadd(data, key)
 
-    def zadd(self, data: T.Any) -> None:
+    def zadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
         """Sync version of zadd."""
-        self.sync_client.zadd(data)
+        self.sync_client.zadd(data, key)
 
     async def asubscribe_all(self) -> None:
         """Async version of subscribe_all."""
@@ -62,13 +143,86 @@ class RedisClientBase:
         """Sync version of subscribe_all."""
         self.sync_client.subscribe_all()
 
-    async def asubscribe(self, channel: Channel, callback: RedisMessageCallback) -> None:
+    async def asubscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
         """Async version of subscribe."""
-        await self.async_client.subscribe(channel, callback)
+        await self.async_client.subscribe(channel, callback, options)
 
-    def subscribe(self, channel: Channel, callback: RedisMessageCallback) -> None:
+    def subscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
         """Sync version of subscribe."""
-        self.sync_client.subscribe(channel, callback)
+        self.sync_client.subscribe(channel, callback, options)
+
+    async def asubscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Async version of subscribe_many."""
+        await self.async_client.subscribe_many(channels, options)
+
+    def subscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Sync version of subscribe_many."""
+        self.sync_client.subscribe_many(channels, options)
+
+    async def aget_latest(self, channel: Channel) -> T.Optional[bytes]:
+        """Async version of get_latest."""
+        return await self.async_client.get_latest(channel)
+
+    def get_latest(self, channel: Channel) -> T.Optional[bytes]:
+        """Sync version of get_latest."""
+        return self.sync_client.get_latest(channel)
+
+    async def aget(self, key: str) -> T.Optional[bytes]:
+        """Async version of get."""
+        return await self.async_client.get(key)
+
+    def get(self, key: str) -> T.Optional[bytes]:
+        """Sync version of get."""
+        return self.sync_client.get(key)
+
+    async def ahget(self, key: str, field: str) -> T.Optional[bytes]:
+        """Async version of hget."""
+        return await self.async_client.hget(key, field)
+
+    def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        """Sync version of hget."""
+        return self.sync_client.hget(key, field)
+
+    async def amget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Async version of mget."""
+        return await self.async_client.mget(keys)
+
+    def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Sync version of mget."""
+        return self.sync_client.mget(keys)
+
+    def set_publish_policy(self, channel: Channel | str, policy: T.Optional[PublishPolicy]) -> None:
+        """Limits the publish rate of channel on both halves, None removes the limit."""
+        self.publish_policies[str(channel)] = policy
+        for client in (self._async_client, self._sync_client):
+            if client is not None:
+                client.set_publish_policy(channel, policy)
+
+    def aadd_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        """Calls callback with the time of every step of the async half, coroutines are awaited."""
+        self.async_client.add_step_callback(callback)
+
+    def add_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        """Calls callback with the time of every step of the sync half."""
+        self.sync_client.add_step_callback(callback)
 
     async def apublish(self, channel: Channel, message: T.Any) -> None:
         """Async version of publish."""
@@ -78,6 +232,34 @@ class RedisClientBase:
         """Sync version of publish."""
         self.sync_client.publish(channel, message)
 
+    async def asend_rpc(self, channel: str, data: bytes) -> None:
+        """Async version of send_rpc."""
+        await self.async_client.send_rpc(channel, data)
+
+    def send_rpc(self, channel: str, data: bytes) -> None:
+        """Sync version of send_rpc."""
+        self.sync_client.send_rpc(channel, data)
+
+    async def arequest(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> asyncio.Future[T.Any]:
+        """Async version of request."""
+        return await self.async_client.request(channel, message, timeout, reply_type)
+
+    def request(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> concurrent.futures.Future[T.Any]:
+        """Sync version of request."""
+        return self.sync_client.request(channel, message, timeout, reply_type)
+
     async def aunsubscribe(self, channel: Channel) -> None:
         """Async version of unsubscribe."""
         await self.async_client.unsubscribe(channel)
@@ -86,13 +268,31 @@ class RedisClientBase:
         """Sync version of unsubscribe."""
         self.sync_client.unsubscribe(channel)
 
+    async def aunsubscribe_many(self, channels: T.Iterable[Channel]) -> None:
+        """Async version of unsubscribe_many."""
+        await self.async_client.unsubscribe_many(channels)
+
+    def unsubscribe_many(self, channels: T.Iterable[Channel]) -> None:
+        """Sync version of unsubscribe_many."""
+        self.sync_client.unsubscribe_many(channels)
+
+    async def aresubscribe(self) -> None:
+        """Async version of resubscribe."""
+        await self.async_client.resubscribe()
+
+    def resubscribe(self) -> None:
+        """Sync version of resubscribe."""
+        self.sync_client.resubscribe()
+
     async def astop(self) -> None:
         """Async version of stop."""
-        await self.async_client.stop()
+        if self._async_client is not None:
+            await self._async_client.stop()
 
     def stop(self) -> None:
         """Sync version of stop."""
-        self.sync_client.stop()
+        if self._sync_client is not None:
+            self._sync_client.stop()
 
     async def astart(self) -> None:
         """Async version of start."""
@@ -120,8 +320,10 @@ class RedisClientBase:
 
     async def aclose(self) -> None:
         """Async version of close."""
-        await self.async_client.close()
+        if self._async_client is not None:
+            await self._async_client.close()
 
     def close(self) -> None:
         """Sync version of close."""
-        self.sync_client.close()
+        if self._sync_client is not None:
+            self._sync_client.close()
@@ -4,37 +4,86 @@ import typing as T
 
 import redis.asyncio as aioredis
 import redis.exceptions as redis_exc
+from google.protobuf.message import Message
 from ryutils import log
 from ryutils.path_util import get_backtrace_file_name
 from ryutils.verbose import Verbose
 
+from ry_redis_bus.backend import Backend
+from ry_redis_bus.backpressure import (
+    BufferStats,
+    LoadShedder,
+    SheddingPolicy,
+    parse_client_list,
+)
+from ry_redis_bus.batching import BatchCollector, batch_options
 from ry_redis_bus.channels import Channel
+from ry_redis_bus.codec import Codec, encode_message, with_codec
+from ry_redis_bus.conflation import ConflationBuffer
+from ry_redis_bus.dedup import OverlapFilter
+from ry_redis_bus.envelope import channel_name
 from ry_redis_bus.helpers import (
     DEFAULT_COOLDOWN_TIMEOUT,
     DEFAULT_MESSAGE_BACKTRACE_FRAME,
     ITERATION_SLEEP_TIME,
-    MAX_COOLDOWN_TIMEOUT,
     NO_SUBSCRIBE_IF_NO_CALLBACK,
+    RESUBSCRIBE_ACK_TIMEOUT,
     SUBSCRIBE_BACKTRACE_FRAME,
     TIME_BETWEEN_RE_SUBSCRIBE,
     RedisInfo,
     RedisMessageCallback,
+    check_handler_codec,
+    make_client_name,
+)
+from ry_redis_bus.key_cache import AsyncKeyCacheReader, KeyCache, KeyCachePolicy
+from ry_redis_bus.last_value import LastValueCache, latest_hash_key
+from ry_redis_bus.local_router import LoopbackPolicy, open_loopback
+from ry_redis_bus.performance import (
+    PerformanceProfile,
+    check_runtime,
+    connection_kwargs,
+)
+from ry_redis_bus.rate_limit import PublishLimiter, PublishPolicy
+from ry_redis_bus.reconnect import ReconnectMachine
+from ry_redis_bus.rpc import REPLY_SUBSCRIBE_POLL, REPLY_SUBSCRIBE_TIMEOUT, RpcCaller
+from ry_redis_bus.scheduling import DEFAULT_BULK_BUDGET, ChannelScheduler
+from ry_redis_bus.shm_transport import SharedMemoryTransport, shm_item
+from ry_redis_bus.subscription import (
+    MessageFilters,
+    Priority,
+    SubscriptionOptions,
+    is_priority,
+    split_lanes,
 )
 
 
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
 class AsyncRedisClientBase:
     MESSAGE_WAIT_TIMEOUT = 0
+    MAX_PROCESS_MESSAGES_PER_ITERATION = 10000
+    BULK_BUDGET_PER_ITERATION = DEFAULT_BULK_BUDGET
 
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments,too-many-statements
     def __init__(
         self,
         redis_info: RedisInfo,
         verbose: Verbose,
         default_message_callback: RedisMessageCallback = None,
+        shedding_policy: T.Optional[SheddingPolicy] = None,
+        last_value_cache: bool = False,
+        loopback: T.Optional[LoopbackPolicy] = None,
+        backend: T.Optional[Backend] = None,
+        key_cache: T.Optional[KeyCachePolicy] = None,
+        performance: T.Optional[PerformanceProfile] = None,
     ):
         self._client: T.Optional[aioredis.Redis] = None
         self._pubsub: T.Optional[aioredis.client.PubSub] = None
+        self._priority_pubsub: T.Optional[aioredis.client.PubSub] = None
         self.redis_info: RedisInfo = redis_info
+        self.backend = backend
+        self.performance = performance
         self.verbose: Verbose = verbose
+        self.client_name = make_client_name(self)
 
         self.stop_listen = False
         self.cooldown = 0.1
@@ -42,6 +91,38 @@ class AsyncRedisClientBase:
         self.cooldown_start = 0.0
 
         self.channel_map: T.Dict[str, RedisMessageCallback] = {}
+        self.subscription_options: T.Dict[str, SubscriptionOptions] = {}
+        self.patterns: T.Set[str] = set()
+        self._overlap = OverlapFilter()
+        # What the replacement connections delivered while their acks were awaited
+        self._resubscribe_overlap = OverlapFilter()
+        self._conflation = ConflationBuffer()
+        self._filters = MessageFilters()
+        # Per channel handler and what its messages are handed to, see _dispatch
+        self._dispatchers: T.Dict[str, T.Tuple[T.Any, T.Callable[[T.Any], T.Any]]] = {}
+        self._codecs: T.Dict[str, Codec] = {}
+        self._scheduler = ChannelScheduler(bulk_budget=self.BULK_BUDGET_PER_ITERATION)
+        self._batches = BatchCollector()
+        # Called with the time of every step, coroutines are awaited
+        self._step_callbacks: T.List[T.Callable[[float], T.Any]] = []
+        self._publish_limiter = PublishLimiter()
+
+        self.shedder = LoadShedder(shedding_policy, self.__class__.__name__)
+
+        self.last_values: T.Optional[LastValueCache] = (
+            LastValueCache(latest_hash_key(redis_info.db_name)) if last_value_cache else None
+        )
+
+        self.key_reader: T.Optional[AsyncKeyCacheReader] = None
+        if key_cache is not None:
+            connect = (lambda: backend.aconnect(redis_info, self.client_name)) if backend else None
+            self.key_reader = AsyncKeyCacheReader(key_cache, lambda: self.client, connect)
+
+        self.reconnect = ReconnectMachine()
+        self._namespace = f"{redis_info.host}:{redis_info.port}/{redis_info.db}"
+        self.rpc = RpcCaller(redis_info.db_name, self._namespace)
+        self._shm = SharedMemoryTransport(self._namespace)
+        self._loopback = open_loopback(self._namespace, loopback, self.channel_map, self.patterns)
         self.default_message_callback: RedisMessageCallback = default_message_callback
         if self.default_message_callback and callable(self.default_message_callback):
             calling_file = get_backtrace_file_name(frame=DEFAULT_MESSAGE_BACKTRACE_FRAME)
@@ -53,7 +134,12 @@ class AsyncRedisClientBase:
     async def client(self) -> aioredis.Redis:
         """Returns the Redis client, retrying to connect if necessary."""
         if not self._client:
-            self._client = await self._get_redis_connection(self.redis_info)
+            if self.backend is not None:
+                self._client = await self.backend.aconnect(self.redis_info, self.client_name)
+            else:
+                if self.performance is not None:
+                    check_runtime(self.performance, is_async=True)
+                self._client = await self._get_redis_connection(self.redis_info)
         return self._client
 
     @property
@@ -63,9 +149,51 @@ class AsyncRedisClientBase:
             self._pubsub = (await self.client).pubsub()
         return self._pubsub
 
-    async def zadd(self, data: T.Any) -> None:
-        """Adds the data to the Redis database"""
-        await (await self.client).zadd(self.redis_info.db_name, data)
+    @property
+    async def priority_pubsub(self) -> aioredis.client.PubSub:
+        """Returns the dedicated pubsub client for high priority channels"""
+        if self._priority_pubsub is None:
+            self._priority_pubsub = (await self.client).pubsub()
+        return self._priority_pubsub
+
+    @property
+    def backlog(self) -> int:
+        """Number of received messages waiting to be dispatched"""
+        return len(self._scheduler) + len(self._conflation) + len(self._batches)
+
+    async def sample_buffers(self) -> BufferStats:
+        """Samples the server side output buffers of our pubsub connections"""
+        clients = await (await self.client).client_list(_type="pubsub")
+        self.shedder.stats = parse_client_list(self.client_name, clients, self.backlog, time.time())
+        return self.shedder.stats
+
+    async def _check_buffers(self, now: float) -> None:
+        if not self.shedder.due(now):
+            return
+
+        try:
+            stats = await self.sample_buffers()
+        except redis_exc.RedisError as exc:
+            log.print_fail(f"Failed to sample Redis output buffers: {exc}")
+            return
+
+        paused, resumed = self.shedder.update(stats, self.subscription_options, self.verbose.ipc)
+        for channel in paused:
+            await (await self._pubsub_for(channel)).unsubscribe(channel)
+        for channel in resumed:
+            await (await self._pubsub_for(channel)).subscribe(channel)
+
+    def _is_priority(self, channel: str) -> bool:
+        return is_priority(self.subscription_options.get(channel))
+
+    async def _pubsub_for(self, channel: str) -> aioredis.client.PubSub:
+        if self._is_priority(channel):
+            return await self.priority_pubsub
+        return await self.pubsub
+
+    async def zadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
+        """Adds the data to the sorted set at key, or the db_name set by default"""
+        await (await self.client).zadd(key or self.redis_info.db_name, data)
 
     async def _get_redis_connection(
         self, redis_info: RedisInfo, retry_counts: int = 5, retry_delay: int = 5
@@ -87,7 +215,11 @@ class AsyncRedisClientBase:
                 else:
                     redis_url = f"redis://{redis_info.host}:{redis_info.port}/{redis_info.db}"
 
-                client = aioredis.from_url(redis_url)  # type: ignore
+                client = aioredis.from_url(  # type: ignore
+                    redis_url,
+                    client_name=self.client_name,
+                    **connection_kwargs(self.performance, is_async=True),
+                )
                 await client.ping()  # Test connection
                 return T.cast(aioredis.Redis, client)
             except redis_exc.ConnectionError as exc:
@@ -99,15 +231,73 @@ class AsyncRedisClientBase:
     async def subscribe_all(self) -> None:
         """Subscribe to all channels."""
         log.print_bright("Subscribing to all channels...")
+        self.patterns.add("*")
         await (await self.pubsub).psubscribe("*")
 
-    async def subscribe(self, channel: Channel, callback: RedisMessageCallback = None) -> None:
-        await self._subscribe(str(channel), callback)
+    @property
+    def conflation_skipped(self) -> T.Counter[str]:
+        """Total number of stale messages skipped by conflation, per channel"""
+        return self._conflation.skipped
+
+    @property
+    def filtered_out(self) -> T.Counter[str]:
+        """Messages the where predicates of their subscription rejected, per channel"""
+        return self._filters.filtered_out
+
+    @property
+    def stale_dropped(self) -> T.Counter[str]:
+        """Messages older than the max_age of their subscription, per channel"""
+        return self._filters.stale_dropped
+
+    @property
+    def duplicates_skipped(self) -> T.Counter[str]:
+        """Messages the dedup policy of their subscription saw before, per channel"""
+        return self._filters.duplicates_skipped
+
+    @property
+    def key_cache(self) -> T.Optional[KeyCache]:
+        """The cache behind get, hget and mget, None unless a key cache policy was given"""
+        return self.key_reader.cache if self.key_reader is not None else None
+
+    @property
+    def publish_suppressed(self) -> T.Counter[str]:
+        """Publishes held back and replaced, or dropped, by the publish policy, per channel"""
+        return self._publish_limiter.suppressed
+
+    def set_publish_policy(
+        self, channel: T.Union[Channel, str], policy: T.Optional[PublishPolicy]
+    ) -> None:
+        """Limits the publish rate of channel, None removes the limit"""
+        self._publish_limiter.set_policy(str(channel), policy, time.time())
 
-    async def _subscribe(self, channel: str, callback: RedisMessageCallback = None) -> None:
+    def add_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        """Calls callback with the time of every step, after the messages were handled"""
+        self._step_callbacks.append(callback)
+
+    def remove_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        if callback in self._step_callbacks:
+            self._step_callbacks.remove(callback)
+
+    async def subscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback = None,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        self._shm.subscribe(channel)
+        self._keep_codec(channel, callback)
+        self._filters.compile(channel, options)
+        await self._subscribe(str(channel), callback, options)
+
+    async def _subscribe(
+        self,
+        channel: str,
+        callback: RedisMessageCallback = None,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
         calling_file = get_backtrace_file_name(frame=SUBSCRIBE_BACKTRACE_FRAME)
 
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail(
                 f"Redis info is null for {calling_file}. Cannot subscribe to Redis server."
             )
@@ -123,34 +313,365 @@ class AsyncRedisClientBase:
         sub_string = "resubscribing" if channel_str in self.channel_map else "subscribed"
 
         self.channel_map[channel_str] = registered_callback
+        if options is not None:
+            self.subscription_options[channel_str] = options
 
-        await (await self.pubsub).subscribe(channel_str)  # This must be awaited
+        await (await self._pubsub_for(channel_str)).subscribe(channel_str)  # This must be awaited
+        if self.last_values is not None:
+            self.last_values.request_snapshot(channel_str)
 
         log.print_bright(
             f"{calling_file} {sub_string} to '{channel}' channel. Waiting for messages..."
         )
 
+    async def subscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Subscribes to every channel with a single command per connection"""
+        if self.redis_info.is_null():
+            log.print_fail("Redis info is null. Cannot subscribe to Redis server.")
+            return
+
+        channel_strs = []
+        for channel, callback in channels.items():
+            if NO_SUBSCRIBE_IF_NO_CALLBACK and not callback:
+                log.print_fail(f"Cannot subscribe to '{channel}' channel without a callback.")
+                continue
+            channel_str = str(channel)
+            self._shm.subscribe(channel)
+            self._keep_codec(channel, callback)
+            self._filters.compile(channel, options)
+            self.channel_map[channel_str] = callback or (lambda x: None)
+            if options is not None:
+                self.subscription_options[channel_str] = options
+            channel_strs.append(channel_str)
+
+        await self._subscribe_batch(channel_strs)
+
+    async def unsubscribe_many(
+        self, channels: T.Iterable[Channel], delete_map: bool = True
+    ) -> None:
+        """Unsubscribes from every channel with a single command per connection"""
+        if self.redis_info.is_null():
+            log.print_fail("Redis info is null. Cannot unsubscribe to Redis server.")
+            return
+        channel_strs = [str(channel) for channel in channels]
+        if delete_map:
+            for channel_str in channel_strs:
+                self._shm.close_reader(channel_str)
+        await self._unsubscribe_batch(channel_strs, delete_map)
+
+    async def _subscribe_batch(
+        self, channels: T.Sequence[str], patterns: T.Iterable[str] = (), snapshot: bool = True
+    ) -> None:
+        normal, priority = split_lanes(channels, self.subscription_options)
+        if normal:
+            await (await self.pubsub).subscribe(*normal)
+        if priority:
+            await (await self.priority_pubsub).subscribe(*priority)
+        patterns = list(patterns)
+        if patterns:
+            await (await self.pubsub).psubscribe(*patterns)
+
+        if snapshot and self.last_values is not None:
+            for channel in channels:
+                self.last_values.request_snapshot(channel)
+
+        if channels or patterns:
+            log.print_bright(
+                f"{self.__class__.__name__} subscribed to {len(channels)} channels and "
+                f"{len(patterns)} patterns. Waiting for messages..."
+            )
+
+    async def _unsubscribe_batch(self, channels: T.Sequence[str], delete_map: bool = True) -> None:
+        normal, priority = split_lanes(channels, self.subscription_options)
+        if delete_map:
+            for channel in channels:
+                self._forget(channel)
+        if normal and self._pubsub is not None:
+            await self._pubsub.unsubscribe(*normal)
+        if priority and self._priority_pubsub is not None:
+            await self._priority_pubsub.unsubscribe(*priority)
+
+        if channels:
+            log.print_bright(
+                f"{self.__class__.__name__} unsubscribed from {len(channels)} channels."
+            )
+
+    async def _restore_subscriptions(self, now: float) -> bool:
+        """Subscribes everything again on fresh connections once the server is back"""
+        self.reconnect.restoring()
+        try:
+            if self._client is not None:
+                await self._client.ping()
+            channels = [c for c in self.channel_map if c not in self.shedder.paused]
+            await self._subscribe_batch(channels, self.patterns)
+            for pubsub in (self._pubsub, self._priority_pubsub):
+                if pubsub is not None:
+                    await self._wait_for_subscriptions(pubsub, now, pubsub is self._priority_pubsub)
+        except redis_exc.RedisError as exc:
+            self._connection_lost(now, exc)
+            return False
+
+        outage = self.reconnect.restored(time.time())
+        start, end = outage.lost_window
+        log.print_ok(
+            f"{self.__class__.__name__} restored {len(channels)} channels and "
+            f"{len(self.patterns)} patterns after {outage.duration:.2f}s "
+            f"({outage.attempts} attempts), messages from the last {end - start:.2f}s "
+            "may have been lost."
+        )
+        return True
+
+    def _connection_lost(self, now: float, exc: Exception) -> None:
+        self.cooldown = self.reconnect.connection_lost(now, self.time_since_last_message)
+        self.cooldown_start = now
+        log.print_fail(f"Redis connection error: {exc}")
+        if self.shedder.stats.omem > 0:
+            log.print_fail_arrow(
+                f"Last sampled output buffer was {self.shedder.stats.omem} bytes, "
+                "the server may have dropped us as a slow consumer"
+            )
+        log.print_fail_arrow(f"Attempting to reconnect in {self.cooldown:.2f} seconds...")
+        # Subscriptions are restored in one batch on fresh connections
+        self._pubsub = None
+        self._priority_pubsub = None
+
+    async def resubscribe(self) -> None:
+        """
+        Moves every subscription onto fresh connections without a gap. The new connections
+        are subscribed and acknowledged before the old ones are unsubscribed and drained,
+        and messages that arrive on both are only handled once.
+        """
+        now = time.time()
+        old_connections = [(self._pubsub, False), (self._priority_pubsub, True)]
+        self._pubsub = None
+        self._priority_pubsub = None
+
+        channels = [channel for channel in self.channel_map if channel not in self.shedder.paused]
+        await self._subscribe_batch(channels, self.patterns, snapshot=False)
+        for pubsub, priority in ((self._pubsub, False), (self._priority_pubsub, True)):
+            if pubsub is not None:
+                await self._wait_for_subscriptions(pubsub, now, priority)
+
+        for pubsub, priority in old_connections:
+            if pubsub is None:
+                continue
+            try:
+                await pubsub.unsubscribe()
+                await pubsub.punsubscribe()
+                await self._drain_unsubscribed(pubsub, now, priority)
+                await pubsub.close()
+            except redis_exc.ConnectionError as exc:
+                log.print_fail(f"Failed to drain replaced connection: {exc}")
+        self._resubscribe_overlap.clear()
+
+    async def _wait_for_subscriptions(
+        self, pubsub: aioredis.client.PubSub, now: float, priority: bool
+    ) -> None:
+        """Reads subscription acknowledgements until the server confirmed all of them"""
+        expected = len(pubsub.channels) + len(pubsub.patterns)
+        deadline = time.time() + RESUBSCRIBE_ACK_TIMEOUT
+        while expected > 0 and time.time() < deadline:
+            item = await pubsub.get_message(timeout=RESUBSCRIBE_ACK_TIMEOUT / 10.0)
+            if not item:
+                continue
+            if item.get("type") in ("subscribe", "psubscribe"):
+                expected -= 1
+            else:
+                self._resubscribe_overlap.record(item, now)
+                self._handle_item(item, now, priority)
+
+    async def _drain_unsubscribed(
+        self, pubsub: aioredis.client.PubSub, now: float, priority: bool
+    ) -> None:
+        """
+        Handles what is left on a replaced connection, skipping what the replacement already
+        delivered and remembering the rest so the replacement's copies are skipped later
+        """
+        deadline = time.time() + RESUBSCRIBE_ACK_TIMEOUT
+        while time.time() < deadline:
+            item = await pubsub.get_message(timeout=RESUBSCRIBE_ACK_TIMEOUT / 10.0)
+            if not item:
+                continue
+            if item.get("type") in ("unsubscribe", "punsubscribe"):
+                if item.get("data") == 0:
+                    return
+                continue
+            if self._resubscribe_overlap.consume(item, now):
+                continue
+            self._overlap.record(item, now)
+            self._handle_item(item, now, priority, check_overlap=False)
+
     async def unsubscribe(self, channel: Channel, delete_map: bool = True) -> None:
+        if delete_map:
+            self._shm.close_reader(str(channel))
         await self._unsubscribe(str(channel), delete_map)
 
+    def _keep_codec(self, channel: Channel, callback: RedisMessageCallback) -> None:
+        # Handed to message_handler with every message of the channel, see _dispatch
+        codec = channel.codec if isinstance(channel, Channel) else None
+        check_handler_codec(str(channel), callback, codec)
+        if codec is not None:
+            self._codecs[str(channel)] = codec
+
+    def _forget(self, channel: str) -> None:
+        self.channel_map.pop(channel, None)
+        self.subscription_options.pop(channel, None)
+        self._filters.discard(channel)
+        self._dispatchers.pop(channel, None)
+        self._codecs.pop(channel, None)
+
     async def _unsubscribe(self, channel: str, delete_map: bool = True) -> None:
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail("Redis info is null. Cannot unsubscribe to Redis server.")
             return
         channel_str = str(channel)
+        pubsub = await self._pubsub_for(channel_str)
 
         if channel_str in self.channel_map and delete_map:
-            del self.channel_map[channel_str]
-        await (await self.pubsub).unsubscribe(channel_str)
+            self._forget(channel_str)
+        await pubsub.unsubscribe(channel_str)
         log.print_bright(f"Unsubscribed from '{channel}' channel.")
 
-    async def publish(self, channel: Channel, message: T.Union[str, bytes]) -> None:
-        """Publishes message to channel without blocking using create_task."""
-        await self._publish(str(channel), message)
+    async def get(self, key: str) -> T.Optional[bytes]:
+        """Reads key, served from the key cache when it is enabled and holds it"""
+        if self.key_reader is None:
+            return T.cast(T.Optional[bytes], await (await self.client).get(key))
+        return await self.key_reader.get(key)
+
+    async def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        """Reads field of the hash at key, served from the key cache like get"""
+        if self.key_reader is None:
+            return T.cast(T.Optional[bytes], await (await self.client).hget(key, field))
+        return await self.key_reader.hget(key, field)
+
+    async def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Reads keys, fetching only the ones the key cache misses in a single MGET"""
+        if self.key_reader is None:
+            return T.cast(T.List[T.Optional[bytes]], await (await self.client).mget(keys))
+        return await self.key_reader.mget(keys)
+
+    async def get_latest(self, channel: Channel) -> T.Optional[bytes]:
+        """Returns the newest payload of the channel, reading through to Redis on a miss"""
+        if self.last_values is None:
+            log.print_fail("Last value cache is not enabled.")
+            return None
+
+        channel_str = str(channel)
+        data = self.last_values.get(channel_str)
+        if data is None:
+            data = T.cast(
+                T.Optional[bytes],
+                await (await self.client).hget(self.last_values.hash_key, channel_str),
+            )
+            if data is not None:
+                self.last_values.update(channel_str, data)
+        return data
+
+    async def _deliver_snapshots(self) -> None:
+        """Fetches the latest payload of newly subscribed channels in one round trip"""
+        if self.last_values is None:
+            return
+
+        channels = self.last_values.take_pending()
+        if not channels:
+            return
+
+        try:
+            values = T.cast(
+                T.List[T.Optional[bytes]],
+                await (await self.client).hmget(self.last_values.hash_key, channels),
+            )
+        except redis_exc.RedisError as exc:
+            log.print_fail(f"Failed to fetch last value snapshot: {exc}")
+            return
+
+        for channel, item in self.last_values.apply_snapshot(channels, values):
+            self._dispatch(channel, item)
+
+    async def request(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> asyncio.Future[T.Any]:
+        """
+        Sends a request to an rpc_handler and returns a future resolved by its reply.
+        The request is queued and sent by the next step(), which also dispatches the reply,
+        so run() must be going in another task.
+        """
+        future: asyncio.Future[T.Any] = asyncio.get_running_loop().create_future()
+        if self.redis_info.is_null():
+            future.set_exception(redis_exc.ConnectionError("Redis info is null"))
+            return future
+
+        self.rpc.queue(str(channel), message, future, timeout, reply_type)
+        return future
+
+    async def _send_requests(self, now: float) -> None:
+        """Sends the queued requests, subscribing the reply channel before the first one"""
+        if not self.rpc.outbox:
+            return
+        if self.rpc.reply_channel not in self.channel_map:
+            await self._subscribe_rpc_replies(now)
+        for channel, data in self.rpc.take_requests():
+            await self.send_rpc(channel, data)
+
+    async def _subscribe_rpc_replies(self, now: float) -> None:
+        await self._subscribe(
+            self.rpc.reply_channel,
+            self.rpc.handle_reply,
+            SubscriptionOptions(priority=Priority.HIGH),
+        )
+        # Replies published before the server registers the subscription would be lost
+        pubsub = await self.priority_pubsub
+        deadline = time.time() + REPLY_SUBSCRIBE_TIMEOUT
+        while time.time() < deadline:
+            item = await pubsub.get_message(timeout=REPLY_SUBSCRIBE_POLL)
+            if not item:
+                continue
+            if self.rpc.is_subscribed(item):
+                return
+            self._handle_item(item, now, priority=True)
+
+    async def send_rpc(self, channel: str, data: bytes) -> None:
+        """
+        Publishes a request or reply straight to Redis. RPC traffic is addressed to one
+        caller, so it skips the publish limits and is never kept in the last value cache.
+        """
+        try:
+            await (await self.client).publish(channel, data)
+        except redis_exc.RedisError as exc:
+            log.print_fail(f"Failed to connect to Redis server: {exc}")
+            log.print_fail_arrow("Is the server running?")
+
+    async def publish(self, channel: Channel, message: T.Any) -> None:
+        """
+        Publishes message to channel without blocking using create_task. Objects are
+        encoded with the codec of the channel, str and bytes are sent as they are.
+        """
+        for admitted_channel, admitted in self._publish_limiter.admit(
+            channel, message, time.time()
+        ):
+            await self._publish_now(admitted_channel, admitted)
+
+    async def _publish_now(self, channel: Channel, message: T.Any) -> None:
+        codec = channel.codec if isinstance(channel, Channel) else None
+        data = encode_message(str(channel), message, codec)
+        if self._loopback is not None:
+            self._loopback.publish(str(channel), data, message, time.time())
+        # The last value cache is kept in Redis, so it has to see every publish
+        keep = self.last_values is not None
+        if await self._shm.apublish(channel, data, keep, lambda: self.client):
+            await self._publish(str(channel), data)
 
     async def _publish(self, channel: str, message: T.Union[str, bytes]) -> None:
         """Publishes the message to the Redis server with timestamp."""
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail("Redis info is null. Cannot publish to Redis server.")
             return
 
@@ -159,32 +680,47 @@ class AsyncRedisClientBase:
 
         try:
             client = await self.client
-            await client.publish(channel, message)
+            if self.last_values is None:
+                await client.publish(channel, message)
+            else:
+                pipeline = client.pipeline(transaction=False)
+                pipeline.hset(self.last_values.hash_key, channel, message)
+                pipeline.publish(channel, message)
+                await pipeline.execute()
+                self.last_values.update(channel, message)
         except redis_exc.RedisError as exc:
             log.print_fail(f"Failed to connect to Redis server: {exc}")
             log.print_fail_arrow("Is the server running?")
 
     async def stop(self) -> None:
         self.stop_listen = True
-        channels = list(self.channel_map.keys())
-        for channel in channels:
-            await self._unsubscribe(channel, delete_map=False)
+        self._flush_batches(time.time(), force=True)
+        await self._unsubscribe_batch(list(self.channel_map.keys()), delete_map=False)
         if self._pubsub is not None:
             await (await self.pubsub).close()
             self._pubsub = None
+        if self._priority_pubsub is not None:
+            await self._priority_pubsub.close()
+            self._priority_pubsub = None
+        self._scheduler.clear()
+        self.shedder.reset()
 
     async def close(self) -> None:
         """Close all connections and clean up resources"""
+        await self._flush_publishes(time.time(), force=True)
         await self.stop()
+        if self.key_reader is not None:
+            await self.key_reader.close()
+        self._shm.close()
+        if self._loopback is not None:
+            self._loopback.close()
         if self._client is not None:
             await self._client.close()
             self._client = None
 
     async def start(self) -> None:
         self.stop_listen = False
-        channels = list(self.channel_map.keys())
-        for channel in channels:
-            await self._subscribe(channel, self.channel_map[channel])
+        await self._subscribe_batch(list(self.channel_map.keys()), self.patterns)
 
     async def step(self) -> None:
         """Steps the redis server"""
@@ -196,16 +732,47 @@ class AsyncRedisClientBase:
         if now - self.cooldown_start < self.cooldown:
             return
 
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
+            return
+
+        await self._flush_publishes(now)
+
+        if self.reconnect.should_restore(now) and not await self._restore_subscriptions(now):
             return
 
-        while await self._process_redis_message(now):
-            pass
+        await self._send_requests(now)
+        await self._deliver_snapshots()
+        self._poll_loopback(now)
+        self._poll_shared_memory(now)
+        await self._drain_priority(now)
+
+        processed_messages = 0
+        while len(self._scheduler) < self.MAX_PROCESS_MESSAGES_PER_ITERATION:
+            if not await self._process_redis_message(now):
+                break
+            processed_messages += 1
+            if processed_messages > self.MAX_PROCESS_MESSAGES_PER_ITERATION:
+                break
+
+        self._flush_conflated()
+
+        for batch in self._scheduler.rounds():
+            for channel, item in batch:
+                self._dispatch(channel, item)
+            # Keep control path latency flat while working through bulk traffic
+            await self._drain_priority(now)
+
+        self._flush_batches(now)
+        for callback in self._step_callbacks:
+            result = callback(now)
+            if asyncio.iscoroutine(result):
+                await result
+        await self._check_buffers(now)
+        self.rpc.expire(now)
 
         if now - self.time_since_last_message > TIME_BETWEEN_RE_SUBSCRIBE:
             log.print_bright("Resubscribing to the redis channel...")
-            await self.stop()
-            await self.start()
+            await self.resubscribe()
             self.time_since_last_message = now
 
     async def _call_handler(self, handler: RedisMessageCallback, channel: str, item: T.Any) -> None:
@@ -219,33 +786,148 @@ class AsyncRedisClientBase:
         else:
             log.print_fail(f"Handler for channel {channel} is not callable.")
 
-    async def _process_redis_message(self, now: float) -> bool:
+    async def _drain_priority(self, now: float) -> None:
+        """Dispatches everything pending on the high priority connection"""
+        if self._priority_pubsub is None:
+            return
+
+        processed_messages = 0
+        while await self._process_redis_message(now, priority=True):
+            processed_messages += 1
+            if processed_messages > self.MAX_PROCESS_MESSAGES_PER_ITERATION:
+                break
+
+    async def _process_redis_message(self, now: float, priority: bool = False) -> bool:
         try:
-            item = await (await self.pubsub).get_message(timeout=self.MESSAGE_WAIT_TIMEOUT)
-            if item and item.get("type", "") in ["message", "pmessage"]:
-                asyncio.create_task(self._handle_message(item))
-                self.time_since_last_message = now
+            pubsub = await self.priority_pubsub if priority else await self.pubsub
+            item = await pubsub.get_message(timeout=self.MESSAGE_WAIT_TIMEOUT)
+            if item:
+                self._handle_item(item, now, priority)
             self.cooldown = DEFAULT_COOLDOWN_TIMEOUT
             self.cooldown_start = 0.0
             return item is not None
         except redis_exc.ConnectionError as exc:
-            self.cooldown = min(MAX_COOLDOWN_TIMEOUT, self.cooldown * 2.0)
-            self.cooldown_start = now
-            log.print_fail(f"Failed to connect to Redis server: {exc}")
-            log.print_fail_arrow(f"Is the server running? Sleeping for {self.cooldown}...")
+            self._connection_lost(now, exc)
             return False
 
-    async def _handle_message(self, item: T.Any) -> None:
-        channel = item.get("channel", "UNKNOWN").decode()
+    def _handle_item(
+        self, item: T.Any, now: float, priority: bool, check_overlap: bool = True
+    ) -> None:
+        if item.get("type", "") not in ["message", "pmessage"]:
+            return
+        if check_overlap and self._overlap and self._overlap.consume(item, now):
+            return
+        if check_overlap and self._shm and self._shm.is_echo(item, now):
+            return
+        if self._loopback is not None and self._loopback.is_echo(item, now):
+            return
 
-        # Check if the handler is a coroutine and await it if so
-        handler = self.channel_map.get(channel)
-        if handler:
-            await self._call_handler(handler, channel, item)
-        elif self.default_message_callback and callable(self.default_message_callback):
-            await self._call_handler(self.default_message_callback, channel, item)
+        channel = channel_name(item)
+        options = self.subscription_options.get(channel)
+        if self._filters.drops(channel, item, options, now):
+            return
+        if self.last_values is not None and self.last_values.is_echo(channel, item.get("data")):
+            return
+        if self.last_values is not None:
+            self.last_values.update(channel, item.get("data"))
+        if (options is not None and options.conflate) or self.shedder.conflates(priority):
+            key_func = options.conflate_key if options is not None else None
+            self._conflation.offer(channel, item, key_func)
+        elif priority:
+            self._dispatch(channel, item)
         else:
-            log.print_fail(f"Received message from unknown channel: {channel}")
+            self._scheduler.enqueue(channel, item, options)
+        self.time_since_last_message = now
+
+    def _dispatch(self, channel: str, item: T.Any) -> None:
+        """Schedules the handler of the item, or queues it for a batch handler"""
+        handler = self.channel_map.get(channel)
+        cached = self._dispatchers.get(channel)
+        if cached is not None and cached[0] is handler:
+            cached[1](item)
+            return
+
+        if not handler:
+            if self.default_message_callback and callable(self.default_message_callback):
+                asyncio.create_task(
+                    self._call_handler(self.default_message_callback, channel, item)
+                )
+            else:
+                log.print_fail(f"Received message from unknown channel: {channel}")
+            return
+
+        dispatch = self._make_dispatcher(channel, handler)
+        codec = self._codecs.get(channel)
+        if codec is not None:
+            dispatch = with_codec(dispatch, codec)
+        self._dispatchers[channel] = (handler, dispatch)
+        dispatch(item)
+
+    def _make_dispatcher(self, channel: str, handler: T.Any) -> T.Callable[[T.Any], T.Any]:
+        """What the messages of channel are handed to, worked out once per handler"""
+        options = batch_options(handler)
+        if options is not None:
+            batches = self._batches
+
+            def add_to_batch(item: T.Any) -> None:
+                if batches.add(channel, item, options):
+                    asyncio.create_task(self._call_handler(handler, channel, batches.take(channel)))
+
+            return add_to_batch
+
+        if asyncio.iscoroutinefunction(handler):
+            return lambda item: asyncio.create_task(handler(item))
+        if callable(handler):
+            # Runs after step() returns like a handler task would, without the task
+            return lambda item: asyncio.get_running_loop().call_soon(handler, item)
+
+        def not_callable(item: T.Any) -> None:
+            asyncio.create_task(self._call_handler(handler, channel, item))
+
+        return not_callable
+
+    def _batch_delay(self, channel: str) -> float:
+        options = batch_options(self.channel_map.get(channel))
+        return options.max_delay if options is not None else 0.0
+
+    def _flush_batches(self, now: float, force: bool = False) -> None:
+        """Hands the batches collected this step to their batch handlers"""
+        if not self._batches:
+            return
+
+        for channel, items in self._batches.due(now, self._batch_delay, force):
+            handler = self.channel_map.get(channel)
+            if handler:
+                asyncio.create_task(self._call_handler(handler, channel, items))
+
+    def _poll_loopback(self, now: float) -> None:
+        """Handles what clients in this process published since the last step"""
+        if self._loopback is None or not self._loopback.inbox:
+            return
+
+        for item in self._loopback.drain(self.MAX_PROCESS_MESSAGES_PER_ITERATION):
+            self._handle_item(item, now, self._is_priority(channel_name(item)), check_overlap=False)
+
+    def _poll_shared_memory(self, now: float) -> None:
+        """Handles what same host publishers wrote to the rings since the last step"""
+        if not self._shm:
+            return
+
+        for channel, data in self._shm.poll(self.MAX_PROCESS_MESSAGES_PER_ITERATION, now):
+            item = shm_item(channel, data)
+            self._handle_item(item, now, self._is_priority(channel), check_overlap=False)
+
+    async def _flush_publishes(self, now: float, force: bool = False) -> None:
+        for channel, message in self._publish_limiter.due(now, force):
+            await self._publish_now(channel, message)
+
+    def _flush_conflated(self) -> None:
+        """Handles the newest message of each conflated channel drained this step"""
+        if not self._conflation:
+            return
+
+        for channel, item in self._conflation.flush(self.verbose.ipc):
+            self._dispatch(channel, item)
 
     async def run(self) -> None:
         """Runs the redis server asynchronously"""
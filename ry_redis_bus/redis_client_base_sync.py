@@ -1,40 +1,87 @@
+import concurrent.futures
+import functools
 import time
 import typing as T
 
 import redis
+from google.protobuf.message import Message
 from ryutils import log
 from ryutils.path_util import get_backtrace_file_name
 from ryutils.verbose import Verbose
 
+from ry_redis_bus.backend import Backend
+from ry_redis_bus.backpressure import (
+    BufferStats,
+    LoadShedder,
+    SheddingPolicy,
+    parse_client_list,
+)
+from ry_redis_bus.batching import BatchCollector, batch_options
 from ry_redis_bus.channels import Channel
+from ry_redis_bus.codec import Codec, encode_message, with_codec
+from ry_redis_bus.conflation import ConflationBuffer
+from ry_redis_bus.dedup import OverlapFilter
+from ry_redis_bus.envelope import channel_name
 from ry_redis_bus.helpers import (
     DEFAULT_COOLDOWN_TIMEOUT,
     DEFAULT_MESSAGE_BACKTRACE_FRAME,
     ITERATION_SLEEP_TIME,
     MAX_COOLDOWN_TIMEOUT,
     NO_SUBSCRIBE_IF_NO_CALLBACK,
+    RESUBSCRIBE_ACK_TIMEOUT,
     SUBSCRIBE_BACKTRACE_FRAME,
     TIME_BETWEEN_RE_SUBSCRIBE,
     RedisInfo,
     RedisMessageCallback,
+    check_handler_codec,
     get_redis_connection,
+    make_client_name,
+)
+from ry_redis_bus.key_cache import KeyCache, KeyCachePolicy, KeyCacheReader
+from ry_redis_bus.last_value import LastValueCache, latest_hash_key
+from ry_redis_bus.local_router import LoopbackPolicy, open_loopback
+from ry_redis_bus.performance import PerformanceProfile, check_runtime
+from ry_redis_bus.rate_limit import PublishLimiter, PublishPolicy
+from ry_redis_bus.reconnect import ReconnectMachine
+from ry_redis_bus.rpc import REPLY_SUBSCRIBE_POLL, REPLY_SUBSCRIBE_TIMEOUT, RpcCaller
+from ry_redis_bus.scheduling import DEFAULT_BULK_BUDGET, ChannelScheduler
+from ry_redis_bus.shm_transport import SharedMemoryTransport, shm_item
+from ry_redis_bus.subscription import (
+    MessageFilters,
+    Priority,
+    SubscriptionOptions,
+    is_priority,
+    split_lanes,
 )
 
 
+# pylint: disable=too-many-instance-attributes,too-many-public-methods
 class SyncRedisClientBase:
     MESSAGE_WAIT_TIMEOUT = 0  # 0 means no blocking, which we need to support multiple clients
     MAX_PROCESS_MESSAGES_PER_ITERATION = 10000
+    BULK_BUDGET_PER_ITERATION = DEFAULT_BULK_BUDGET
 
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments,too-many-statements
     def __init__(
         self,
         redis_info: RedisInfo,
         verbose: Verbose,
         default_message_callback: RedisMessageCallback = None,
+        shedding_policy: T.Optional[SheddingPolicy] = None,
+        last_value_cache: bool = False,
+        loopback: T.Optional[LoopbackPolicy] = None,
+        backend: T.Optional[Backend] = None,
+        key_cache: T.Optional[KeyCachePolicy] = None,
+        performance: T.Optional[PerformanceProfile] = None,
     ):
         self._client: T.Optional[redis.Redis] = None
         self._pubsub: T.Optional[redis.client.PubSub] = None
+        self._priority_pubsub: T.Optional[redis.client.PubSub] = None
         self.redis_info: RedisInfo = redis_info
+        self.backend = backend
+        self.performance = performance
         self.verbose: Verbose = verbose
+        self.client_name = make_client_name(self)
 
         self.stop_listen = False
         self.cooldown = 0.1
@@ -42,6 +89,38 @@ class SyncRedisClientBase:
         self.cooldown_start = time.time()
 
         self.channel_map: T.Dict[str, RedisMessageCallback] = {}
+        self.subscription_options: T.Dict[str, SubscriptionOptions] = {}
+        self.patterns: T.Set[str] = set()
+        self._overlap = OverlapFilter()
+        # What the replacement connections delivered while their acks were awaited
+        self._resubscribe_overlap = OverlapFilter()
+        self._conflation = ConflationBuffer()
+        self._filters = MessageFilters()
+        # Per channel handler and what its messages are handed to, see _dispatch
+        self._dispatchers: T.Dict[str, T.Tuple[T.Any, T.Callable[[T.Any], None]]] = {}
+        self._codecs: T.Dict[str, Codec] = {}
+        self._scheduler = ChannelScheduler(bulk_budget=self.BULK_BUDGET_PER_ITERATION)
+        self._batches = BatchCollector()
+        # Called with the time of every step, for work that is due without new messages
+        self._step_callbacks: T.List[T.Callable[[float], T.Any]] = []
+        self._publish_limiter = PublishLimiter()
+
+        self.shedder = LoadShedder(shedding_policy, self.__class__.__name__)
+
+        self.last_values: T.Optional[LastValueCache] = (
+            LastValueCache(latest_hash_key(redis_info.db_name)) if last_value_cache else None
+        )
+
+        self.key_reader: T.Optional[KeyCacheReader] = None
+        if key_cache is not None:
+            connect = (lambda: backend.connect(redis_info, self.client_name)) if backend else None
+            self.key_reader = KeyCacheReader(key_cache, lambda: self.client, connect)
+
+        self.reconnect = ReconnectMachine()
+        self._namespace = f"{redis_info.host}:{redis_info.port}/{redis_info.db}"
+        self.rpc = RpcCaller(redis_info.db_name, self._namespace)
+        self._shm = SharedMemoryTransport(self._namespace)
+        self._loopback = open_loopback(self._namespace, loopback, self.channel_map, self.patterns)
         self.default_message_callback: RedisMessageCallback = default_message_callback
 
         if self.default_message_callback and callable(self.default_message_callback):
@@ -53,8 +132,19 @@ class SyncRedisClientBase:
     @property
     def client(self) -> redis.Redis:
         """Returns the Redis client, retrying to connect if necessary."""
+        if self.backend is not None:
+            if self._client is None:
+                self._client = self.backend.connect(self.redis_info, self.client_name)
+            return T.cast(redis.Redis, self._client)
+        if self._client is None and self.performance is not None:
+            check_runtime(self.performance, is_async=False)
         self._client = get_redis_connection(
-            redis_client=self._client, redis_info=self.redis_info, retry_counts=5, retry_delay=5
+            redis_client=self._client,
+            redis_info=self.redis_info,
+            retry_counts=5,
+            retry_delay=5,
+            client_name=self.client_name,
+            profile=self.performance,
         )
         return self._client
 
@@ -65,21 +155,119 @@ class SyncRedisClientBase:
             self._pubsub = self.client.pubsub()  # type: ignore
         return T.cast(redis.client.PubSub, self._pubsub)
 
-    def zadd(self, data: T.Any) -> None:
-        """Adds the data to the Redis database"""
-        self.client.zadd(self.redis_info.db_name, data)
+    @property
+    def priority_pubsub(self) -> redis.client.PubSub:
+        """Returns the dedicated pubsub client for high priority channels"""
+        if self._priority_pubsub is None:
+            self._priority_pubsub = self.client.pubsub()  # type: ignore
+        return T.cast(redis.client.PubSub, self._priority_pubsub)
+
+    @property
+    def backlog(self) -> int:
+        """Number of received messages waiting to be dispatched"""
+        return len(self._scheduler) + len(self._conflation) + len(self._batches)
+
+    def sample_buffers(self) -> BufferStats:
+        """Samples the server side output buffers of our pubsub connections"""
+        clients = self.client.client_list(_type="pubsub")
+        self.shedder.stats = parse_client_list(self.client_name, clients, self.backlog, time.time())
+        return self.shedder.stats
+
+    def _check_buffers(self, now: float) -> None:
+        if not self.shedder.due(now):
+            return
+
+        try:
+            stats = self.sample_buffers()
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to sample Redis output buffers: {exc}")
+            return
+
+        paused, resumed = self.shedder.update(stats, self.subscription_options, self.verbose.ipc)
+        for channel in paused:
+            self._pubsub_for(channel).unsubscribe(channel)  # type: ignore
+        for channel in resumed:
+            self._pubsub_for(channel).subscribe(channel)  # type: ignore
+
+    def _is_priority(self, channel: str) -> bool:
+        return is_priority(self.subscription_options.get(channel))
+
+    def _pubsub_for(self, channel: str) -> redis.client.PubSub:
+        return self.priority_pubsub if self._is_priority(channel) else self.pubsub
+
+    def zadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
+        """Adds the data to the sorted set at key, or the db_name set by default"""
+        self.client.zadd(key or self.redis_info.db_name, data)
 
     def subscribe_all(self) -> None:
         log.print_bright("Subscribing to all channels...")
+        self.patterns.add("*")
         self.pubsub.psubscribe("*")  # type: ignore
 
-    def subscribe(self, channel: Channel, callback: RedisMessageCallback = None) -> None:
-        self._subscribe(str(channel), callback)
+    @property
+    def conflation_skipped(self) -> T.Counter[str]:
+        """Total number of stale messages skipped by conflation, per channel"""
+        return self._conflation.skipped
+
+    @property
+    def filtered_out(self) -> T.Counter[str]:
+        """Messages the where predicates of their subscription rejected, per channel"""
+        return self._filters.filtered_out
+
+    @property
+    def stale_dropped(self) -> T.Counter[str]:
+        """Messages older than the max_age of their subscription, per channel"""
+        return self._filters.stale_dropped
+
+    @property
+    def duplicates_skipped(self) -> T.Counter[str]:
+        """Messages the dedup policy of their subscription saw before, per channel"""
+        return self._filters.duplicates_skipped
 
-    def _subscribe(self, channel: str, callback: RedisMessageCallback = None) -> None:
+    @property
+    def key_cache(self) -> T.Optional[KeyCache]:
+        """The cache behind get, hget and mget, None unless a key cache policy was given"""
+        return self.key_reader.cache if self.key_reader is not None else None
+
+    @property
+    def publish_suppressed(self) -> T.Counter[str]:
+        """Publishes held back and replaced, or dropped, by the publish policy, per channel"""
+        return self._publish_limiter.suppressed
+
+    def set_publish_policy(
+        self, channel: T.Union[Channel, str], policy: T.Optional[PublishPolicy]
+    ) -> None:
+        """Limits the publish rate of channel, None removes the limit"""
+        self._publish_limiter.set_policy(str(channel), policy, time.time())
+
+    def add_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        """Calls callback with the time of every step, after the messages were handled"""
+        self._step_callbacks.append(callback)
+
+    def remove_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        if callback in self._step_callbacks:
+            self._step_callbacks.remove(callback)
+
+    def subscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback = None,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        self._shm.subscribe(channel)
+        self._keep_codec(channel, callback)
+        self._filters.compile(channel, options)
+        self._subscribe(str(channel), callback, options)
+
+    def _subscribe(
+        self,
+        channel: str,
+        callback: RedisMessageCallback = None,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
         calling_file = get_backtrace_file_name(frame=SUBSCRIBE_BACKTRACE_FRAME)
 
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail(
                 f"Redis info is null for {calling_file}. Cannot subscribe to Redis server."
             )
@@ -95,32 +283,358 @@ class SyncRedisClientBase:
         sub_string = "resubscribing" if channel_str in self.channel_map else "subscribed"
 
         self.channel_map[channel_str] = registered_callback
-        self.pubsub.subscribe(channel_str)  # type: ignore
+        if options is not None:
+            self.subscription_options[channel_str] = options
+        self._pubsub_for(channel_str).subscribe(channel_str)  # type: ignore
+        if self.last_values is not None:
+            self.last_values.request_snapshot(channel_str)
 
         log.print_bright(
             f"{calling_file} {sub_string} to '{channel}' channel. Waiting for messages..."
         )
 
+    def subscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Subscribes to every channel with a single command per connection"""
+        if self.redis_info.is_null():
+            log.print_fail("Redis info is null. Cannot subscribe to Redis server.")
+            return
+
+        channel_strs = []
+        for channel, callback in channels.items():
+            if NO_SUBSCRIBE_IF_NO_CALLBACK and not callback:
+                log.print_fail(f"Cannot subscribe to '{channel}' channel without a callback.")
+                continue
+            channel_str = str(channel)
+            self._shm.subscribe(channel)
+            self._keep_codec(channel, callback)
+            self._filters.compile(channel, options)
+            self.channel_map[channel_str] = callback or (lambda x: None)
+            if options is not None:
+                self.subscription_options[channel_str] = options
+            channel_strs.append(channel_str)
+
+        self._subscribe_batch(channel_strs)
+
+    def unsubscribe_many(self, channels: T.Iterable[Channel], delete_map: bool = True) -> None:
+        """Unsubscribes from every channel with a single command per connection"""
+        if self.redis_info.is_null():
+            log.print_fail("Redis info is null. Cannot unsubscribe to Redis server.")
+            return
+        channel_strs = [str(channel) for channel in channels]
+        if delete_map:
+            for channel_str in channel_strs:
+                self._shm.close_reader(channel_str)
+        self._unsubscribe_batch(channel_strs, delete_map)
+
+    def _subscribe_batch(
+        self, channels: T.Sequence[str], patterns: T.Iterable[str] = (), snapshot: bool = True
+    ) -> None:
+        normal, priority = split_lanes(channels, self.subscription_options)
+        if normal:
+            self.pubsub.subscribe(*normal)  # type: ignore
+        if priority:
+            self.priority_pubsub.subscribe(*priority)  # type: ignore
+        patterns = list(patterns)
+        if patterns:
+            self.pubsub.psubscribe(*patterns)  # type: ignore
+
+        if snapshot and self.last_values is not None:
+            for channel in channels:
+                self.last_values.request_snapshot(channel)
+
+        if channels or patterns:
+            log.print_bright(
+                f"{self.__class__.__name__} subscribed to {len(channels)} channels and "
+                f"{len(patterns)} patterns. Waiting for messages..."
+            )
+
+    def _unsubscribe_batch(self, channels: T.Sequence[str], delete_map: bool = True) -> None:
+        normal, priority = split_lanes(channels, self.subscription_options)
+        if delete_map:
+            for channel in channels:
+                self._forget(channel)
+        if normal and self._pubsub is not None:
+            self._pubsub.unsubscribe(*normal)  # type: ignore
+        if priority and self._priority_pubsub is not None:
+            self._priority_pubsub.unsubscribe(*priority)  # type: ignore
+
+        if channels:
+            log.print_bright(
+                f"{self.__class__.__name__} unsubscribed from {len(channels)} channels."
+            )
+
+    def _restore_subscriptions(self, now: float) -> bool:
+        """Subscribes everything again on fresh connections once the server is back"""
+        self.reconnect.restoring()
+        try:
+            if self._client is not None:
+                self._client.ping()
+            channels = [c for c in self.channel_map if c not in self.shedder.paused]
+            self._subscribe_batch(channels, self.patterns)
+            for pubsub in (self._pubsub, self._priority_pubsub):
+                if pubsub is not None:
+                    self._wait_for_subscriptions(pubsub, now, pubsub is self._priority_pubsub)
+        except (redis.exceptions.RedisError, ValueError) as exc:
+            self._connection_lost(now, exc)
+            return False
+
+        outage = self.reconnect.restored(time.time())
+        start, end = outage.lost_window
+        log.print_ok(
+            f"{self.__class__.__name__} restored {len(channels)} channels and "
+            f"{len(self.patterns)} patterns after {outage.duration:.2f}s "
+            f"({outage.attempts} attempts), messages from the last {end - start:.2f}s "
+            "may have been lost."
+        )
+        return True
+
+    def _connection_lost(self, now: float, exc: Exception) -> None:
+        self.cooldown = self.reconnect.connection_lost(now, self.time_since_last_message)
+        self.cooldown_start = now
+        log.print_fail(f"Redis connection error: {exc}")
+        if self.shedder.stats.omem > 0:
+            log.print_fail_arrow(
+                f"Last sampled output buffer was {self.shedder.stats.omem} bytes, "
+                "the server may have dropped us as a slow consumer"
+            )
+        log.print_fail_arrow(f"Attempting to reconnect in {self.cooldown:.2f} seconds...")
+        # Subscriptions are restored in one batch on fresh connections
+        self._pubsub = None
+        self._priority_pubsub = None
+
+    def resubscribe(self) -> None:
+        """
+        Moves every subscription onto fresh connections without a gap. The new connections
+        are subscribed and acknowledged before the old ones are unsubscribed and drained,
+        and messages that arrive on both are only handled once.
+        """
+        now = time.time()
+        old_connections = [(self._pubsub, False), (self._priority_pubsub, True)]
+        self._pubsub = None
+        self._priority_pubsub = None
+
+        channels = [channel for channel in self.channel_map if channel not in self.shedder.paused]
+        self._subscribe_batch(channels, self.patterns, snapshot=False)
+        for pubsub, priority in ((self._pubsub, False), (self._priority_pubsub, True)):
+            if pubsub is not None:
+                self._wait_for_subscriptions(pubsub, now, priority)
+
+        for pubsub, priority in old_connections:
+            if pubsub is None:
+                continue
+            try:
+                pubsub.unsubscribe()  # type: ignore
+                pubsub.punsubscribe()  # type: ignore
+                self._drain_unsubscribed(pubsub, now, priority)
+                pubsub.close()
+            except redis.exceptions.ConnectionError as exc:
+                log.print_fail(f"Failed to drain replaced connection: {exc}")
+        self._resubscribe_overlap.clear()
+
+    def _wait_for_subscriptions(
+        self, pubsub: redis.client.PubSub, now: float, priority: bool
+    ) -> None:
+        """Reads subscription acknowledgements until the server confirmed all of them"""
+        expected = len(pubsub.channels) + len(pubsub.patterns)
+        deadline = time.time() + RESUBSCRIBE_ACK_TIMEOUT
+        while expected > 0 and time.time() < deadline:
+            item = pubsub.get_message(timeout=RESUBSCRIBE_ACK_TIMEOUT / 10.0)
+            if not item:
+                continue
+            if item.get("type") in ("subscribe", "psubscribe"):
+                expected -= 1
+            else:
+                self._resubscribe_overlap.record(item, now)
+                self._handle_item(item, now, priority)
+
+    def _drain_unsubscribed(self, pubsub: redis.client.PubSub, now: float, priority: bool) -> None:
+        """
+        Handles what is left on a replaced connection, skipping what the replacement already
+        delivered and remembering the rest so the replacement's copies are skipped later
+        """
+        deadline = time.time() + RESUBSCRIBE_ACK_TIMEOUT
+        while time.time() < deadline:
+            item = pubsub.get_message(timeout=RESUBSCRIBE_ACK_TIMEOUT / 10.0)
+            if not item:
+                continue
+            if item.get("type") in ("unsubscribe", "punsubscribe"):
+                if item.get("data") == 0:
+                    return
+                continue
+            if self._resubscribe_overlap.consume(item, now):
+                continue
+            self._overlap.record(item, now)
+            self._handle_item(item, now, priority, check_overlap=False)
+
     def unsubscribe(self, channel: Channel, delete_map: bool = True) -> None:
+        if delete_map:
+            self._shm.close_reader(str(channel))
         self._unsubscribe(str(channel), delete_map)
 
+    def _keep_codec(self, channel: Channel, callback: RedisMessageCallback) -> None:
+        # Handed to message_handler with every message of the channel, see _dispatch
+        codec = channel.codec if isinstance(channel, Channel) else None
+        check_handler_codec(str(channel), callback, codec)
+        if codec is not None:
+            self._codecs[str(channel)] = codec
+
+    def _forget(self, channel: str) -> None:
+        self.channel_map.pop(channel, None)
+        self.subscription_options.pop(channel, None)
+        self._filters.discard(channel)
+        self._dispatchers.pop(channel, None)
+        self._codecs.pop(channel, None)
+
     def _unsubscribe(self, channel: str, delete_map: bool = True) -> None:
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail("Redis info is null. Cannot unsubscribe to Redis server.")
             return
         channel_str = str(channel)
+        pubsub = self._pubsub_for(channel_str)
 
         if channel_str in self.channel_map and delete_map:
-            del self.channel_map[channel_str]
-        self.pubsub.unsubscribe(channel_str)  # type: ignore
+            self._forget(channel_str)
+        pubsub.unsubscribe(channel_str)  # type: ignore
         log.print_bright(f"Unsubscribed from '{channel}' channel.")
 
-    def publish(self, channel: Channel, message: T.Union[str, bytes]) -> None:
-        self._publish(str(channel), message)
+    def get_latest(self, channel: Channel) -> T.Optional[bytes]:
+        """Returns the newest payload of the channel, reading through to Redis on a miss"""
+        if self.last_values is None:
+            log.print_fail("Last value cache is not enabled.")
+            return None
+
+        channel_str = str(channel)
+        data = self.last_values.get(channel_str)
+        if data is None:
+            data = T.cast(
+                T.Optional[bytes], self.client.hget(self.last_values.hash_key, channel_str)
+            )
+            if data is not None:
+                self.last_values.update(channel_str, data)
+        return data
+
+    def get(self, key: str) -> T.Optional[bytes]:
+        """Reads key, served from the key cache when it is enabled and holds it"""
+        if self.key_reader is None:
+            return T.cast(T.Optional[bytes], self.client.get(key))
+        return self.key_reader.get(key)
+
+    def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        """Reads field of the hash at key, served from the key cache like get"""
+        if self.key_reader is None:
+            return T.cast(T.Optional[bytes], self.client.hget(key, field))
+        return self.key_reader.hget(key, field)
+
+    def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Reads keys, fetching only the ones the key cache misses in a single MGET"""
+        if self.key_reader is None:
+            return T.cast(T.List[T.Optional[bytes]], self.client.mget(keys))
+        return self.key_reader.mget(keys)
+
+    def _deliver_snapshots(self) -> None:
+        """Fetches the latest payload of newly subscribed channels in one round trip"""
+        if self.last_values is None:
+            return
+
+        channels = self.last_values.take_pending()
+        if not channels:
+            return
+
+        try:
+            values = T.cast(
+                T.List[T.Optional[bytes]], self.client.hmget(self.last_values.hash_key, channels)
+            )
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to fetch last value snapshot: {exc}")
+            return
+
+        for channel, item in self.last_values.apply_snapshot(channels, values):
+            self._dispatch(channel, item)
+
+    def request(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> concurrent.futures.Future[T.Any]:
+        """
+        Sends a request to an rpc_handler and returns a future resolved by its reply.
+        Safe to call while run() is going in another thread: the request is queued and sent
+        by the next step(), which also dispatches the reply.
+        """
+        future: concurrent.futures.Future[T.Any] = concurrent.futures.Future()
+        if self.redis_info.is_null():
+            future.set_exception(redis.exceptions.ConnectionError("Redis info is null"))
+            return future
+
+        self.rpc.queue(str(channel), message, future, timeout, reply_type)
+        return future
+
+    def _send_requests(self, now: float) -> None:
+        """Sends the queued requests, subscribing the reply channel before the first one"""
+        if not self.rpc.outbox:
+            return
+        if self.rpc.reply_channel not in self.channel_map:
+            self._subscribe_rpc_replies(now)
+        for channel, data in self.rpc.take_requests():
+            self.send_rpc(channel, data)
+
+    def _subscribe_rpc_replies(self, now: float) -> None:
+        self._subscribe(
+            self.rpc.reply_channel,
+            self.rpc.handle_reply,
+            SubscriptionOptions(priority=Priority.HIGH),
+        )
+        # Replies published before the server registers the subscription would be lost
+        pubsub = self.priority_pubsub
+        deadline = time.time() + REPLY_SUBSCRIBE_TIMEOUT
+        while time.time() < deadline:
+            item = pubsub.get_message(timeout=REPLY_SUBSCRIBE_POLL)
+            if not item:
+                continue
+            if self.rpc.is_subscribed(item):
+                return
+            self._handle_item(item, now, priority=True)
+
+    def send_rpc(self, channel: str, data: bytes) -> None:
+        """
+        Publishes a request or reply straight to Redis. RPC traffic is addressed to one
+        caller, so it skips the publish limits and is never kept in the last value cache.
+        """
+        try:
+            self.client.publish(channel, data)
+        except redis.exceptions.ConnectionError as exc:
+            log.print_fail(f"Failed to connect to Redis server: {exc}")
+            log.print_fail_arrow("Is the server running?")
+
+    def publish(self, channel: Channel, message: T.Any) -> None:
+        """
+        Publishes message to channel. Objects are encoded with the codec of the channel,
+        str and bytes are sent as they are.
+        """
+        for admitted_channel, admitted in self._publish_limiter.admit(
+            channel, message, time.time()
+        ):
+            self._publish_now(admitted_channel, admitted)
+
+    def _publish_now(self, channel: Channel, message: T.Any) -> None:
+        codec = channel.codec if isinstance(channel, Channel) else None
+        data = encode_message(str(channel), message, codec)
+        if self._loopback is not None:
+            self._loopback.publish(str(channel), data, message, time.time())
+        # The last value cache is kept in Redis, so it has to see every publish
+        keep = self.last_values is not None
+        if self._shm.publish(channel, data, keep, lambda: self.client):
+            self._publish(str(channel), data)
 
     def _publish(self, channel: str, message: T.Union[str, bytes]) -> None:
         """Publishes the message to the Redis server with timestamp."""
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             log.print_fail("Redis info is null. Cannot publish to Redis server.")
             return
 
@@ -128,32 +642,47 @@ class SyncRedisClientBase:
             log.print_normal(f"Sending message: {message!r} to channel: {channel}...")
 
         try:
-            self.client.publish(str(channel), message)
+            if self.last_values is None:
+                self.client.publish(str(channel), message)
+            else:
+                pipeline = self.client.pipeline(transaction=False)
+                pipeline.hset(self.last_values.hash_key, channel, message)
+                pipeline.publish(channel, message)
+                pipeline.execute()
+                self.last_values.update(channel, message)
         except redis.exceptions.ConnectionError as exc:
             log.print_fail(f"Failed to connect to Redis server: {exc}")
             log.print_fail_arrow("Is the server running?")
 
     def stop(self) -> None:
         self.stop_listen = True
-        channels = list(self.channel_map.keys())
-        for channel in channels:
-            self._unsubscribe(channel, delete_map=False)
+        self._flush_batches(time.time(), force=True)
+        self._unsubscribe_batch(list(self.channel_map.keys()), delete_map=False)
         if self._pubsub is not None:
             self.pubsub.close()
             self._pubsub = None
+        if self._priority_pubsub is not None:
+            self._priority_pubsub.close()
+            self._priority_pubsub = None
+        self._scheduler.clear()
+        self.shedder.reset()
 
     def close(self) -> None:
         """Close all connections and clean up resources"""
+        self._flush_publishes(time.time(), force=True)
         self.stop()
+        if self.key_reader is not None:
+            self.key_reader.close()
+        self._shm.close()
+        if self._loopback is not None:
+            self._loopback.close()
         if self._client is not None:
             self._client.close()
             self._client = None
 
     def start(self) -> None:
         self.stop_listen = False
-        channels = list(self.channel_map.keys())
-        for channel in channels:
-            self._subscribe(channel, self.channel_map[channel])
+        self._subscribe_batch(list(self.channel_map.keys()), self.patterns)
 
     def step(self) -> None:
         """Steps the redis server"""
@@ -162,22 +691,48 @@ class SyncRedisClientBase:
 
         now = time.time()
 
-        if self.redis_info == RedisInfo.null():
+        if self.redis_info.is_null():
             return
 
         if now - self.cooldown_start < self.cooldown:
             return
 
+        self._flush_publishes(now)
+
+        if self.reconnect.should_restore(now) and not self._restore_subscriptions(now):
+            return
+
+        self._send_requests(now)
+        self._deliver_snapshots()
+        self._poll_loopback(now)
+        self._poll_shared_memory(now)
+        self._drain_priority(now)
+
         processed_messages = 0
-        while self._process_redis_message(now):
+        while len(self._scheduler) < self.MAX_PROCESS_MESSAGES_PER_ITERATION:
+            if not self._process_redis_message(now):
+                break
             processed_messages += 1
             if processed_messages > self.MAX_PROCESS_MESSAGES_PER_ITERATION:
                 break
 
+        self._flush_conflated()
+
+        for batch in self._scheduler.rounds():
+            for channel, item in batch:
+                self._dispatch(channel, item)
+            # Keep control path latency flat while working through bulk traffic
+            self._drain_priority(now)
+
+        self._flush_batches(now)
+        for callback in self._step_callbacks:
+            callback(now)
+        self._check_buffers(now)
+        self.rpc.expire(now)
+
         if now - self.time_since_last_message > TIME_BETWEEN_RE_SUBSCRIBE:
             log.print_bright("Resubscribing to the redis channel...")
-            self.stop()
-            self.start()
+            self.resubscribe()
             self.time_since_last_message = now
 
     def _call_handler(self, handler: RedisMessageCallback, channel: str, item: T.Any) -> None:
@@ -186,22 +741,29 @@ class SyncRedisClientBase:
         else:
             log.print_fail(f"Handler for channel {channel} is not callable.")
 
-    def _process_redis_message(self, now: float) -> bool:
+    def _drain_priority(self, now: float) -> None:
+        """Dispatches everything pending on the high priority connection"""
+        if self._priority_pubsub is None:
+            return
+
+        processed_messages = 0
+        while self._process_redis_message(now, priority=True):
+            processed_messages += 1
+            if processed_messages > self.MAX_PROCESS_MESSAGES_PER_ITERATION:
+                break
+
+    def _process_redis_message(self, now: float, priority: bool = False) -> bool:
         item = {}
 
         try:
-            item = self.pubsub.get_message(timeout=self.MESSAGE_WAIT_TIMEOUT)
+            pubsub = self.priority_pubsub if priority else self.pubsub
+            item = pubsub.get_message(timeout=self.MESSAGE_WAIT_TIMEOUT)
             self.cooldown = DEFAULT_COOLDOWN_TIMEOUT
             self.cooldown_start = 0.0
         except KeyboardInterrupt as exc:
             raise KeyboardInterrupt from exc
         except (redis.exceptions.ConnectionError, ValueError) as exc:
-            self.cooldown = min(MAX_COOLDOWN_TIMEOUT, self.cooldown * 2.0)
-            self.cooldown_start = now
-            log.print_fail(f"Redis connection error: {exc}")
-            log.print_fail_arrow(f"Attempting to reconnect in {self.cooldown} seconds...")
-            # Force reconnection by resetting the pubsub client
-            self._pubsub = None
+            self._connection_lost(now, exc)
             return False
         except Exception as exc:  # pylint: disable=broad-exception-caught
             self.cooldown = min(MAX_COOLDOWN_TIMEOUT, self.cooldown * 2.0)
@@ -210,19 +772,125 @@ class SyncRedisClientBase:
             log.print_fail_arrow(f"Sleeping for {self.cooldown} seconds...")
             return False
 
-        if item and item.get("type", "") in ["message", "pmessage"]:
-            channel = item.get("channel", "UNKNOWN").decode()
+        if item:
+            self._handle_item(item, now, priority)
 
-            handler = self.channel_map.get(channel)
-            if handler:
-                self._call_handler(handler, channel, item)
-            elif self.default_message_callback and callable(self.default_message_callback):
+        return item is not None
+
+    def _handle_item(
+        self, item: T.Any, now: float, priority: bool, check_overlap: bool = True
+    ) -> None:
+        if item.get("type", "") in ["message", "pmessage"]:
+            if check_overlap and self._overlap and self._overlap.consume(item, now):
+                return
+            if check_overlap and self._shm and self._shm.is_echo(item, now):
+                return
+            if self._loopback is not None and self._loopback.is_echo(item, now):
+                return
+
+            channel = channel_name(item)
+            options = self.subscription_options.get(channel)
+            if self._filters.drops(channel, item, options, now):
+                return
+
+            if self.last_values is not None:
+                if self.last_values.is_echo(channel, item.get("data")):
+                    return
+                self.last_values.update(channel, item.get("data"))
+
+            if (options is not None and options.conflate) or self.shedder.conflates(priority):
+                key_func = options.conflate_key if options is not None else None
+                self._conflation.offer(channel, item, key_func)
+            elif priority:
+                self._dispatch(channel, item)
+            else:
+                self._scheduler.enqueue(channel, item, options)
+            self.time_since_last_message = now
+
+    def _dispatch(self, channel: str, item: T.Any) -> None:
+        handler = self.channel_map.get(channel)
+        cached = self._dispatchers.get(channel)
+        if cached is not None and cached[0] is handler:
+            cached[1](item)
+            return
+
+        if not handler:
+            if self.default_message_callback and callable(self.default_message_callback):
                 self._call_handler(self.default_message_callback, channel, item)
             else:
                 log.print_fail(f"Received message from unknown channel: {channel}")
-            self.time_since_last_message = now
+            return
 
-        return item is not None
+        dispatch = self._make_dispatcher(channel, handler)
+        codec = self._codecs.get(channel)
+        if codec is not None:
+            dispatch = with_codec(dispatch, codec)
+        self._dispatchers[channel] = (handler, dispatch)
+        dispatch(item)
+
+    def _make_dispatcher(self, channel: str, handler: T.Any) -> T.Callable[[T.Any], None]:
+        """What the messages of channel are handed to, worked out once per handler"""
+        options = batch_options(handler)
+        if options is None:
+            return T.cast(
+                T.Callable[[T.Any], None],
+                (
+                    handler
+                    if callable(handler)
+                    else functools.partial(self._call_handler, handler, channel)
+                ),
+            )
+
+        batches = self._batches
+
+        def add_to_batch(item: T.Any) -> None:
+            if batches.add(channel, item, options):
+                self._call_handler(handler, channel, batches.take(channel))
+
+        return add_to_batch
+
+    def _batch_delay(self, channel: str) -> float:
+        options = batch_options(self.channel_map.get(channel))
+        return options.max_delay if options is not None else 0.0
+
+    def _flush_batches(self, now: float, force: bool = False) -> None:
+        """Hands the batches collected this step to their batch handlers"""
+        if not self._batches:
+            return
+
+        for channel, items in self._batches.due(now, self._batch_delay, force):
+            handler = self.channel_map.get(channel)
+            if handler:
+                self._call_handler(handler, channel, items)
+
+    def _poll_loopback(self, now: float) -> None:
+        """Handles what clients in this process published since the last step"""
+        if self._loopback is None or not self._loopback.inbox:
+            return
+
+        for item in self._loopback.drain(self.MAX_PROCESS_MESSAGES_PER_ITERATION):
+            self._handle_item(item, now, self._is_priority(channel_name(item)), check_overlap=False)
+
+    def _poll_shared_memory(self, now: float) -> None:
+        """Handles what same host publishers wrote to the rings since the last step"""
+        if not self._shm:
+            return
+
+        for channel, data in self._shm.poll(self.MAX_PROCESS_MESSAGES_PER_ITERATION, now):
+            item = shm_item(channel, data)
+            self._handle_item(item, now, self._is_priority(channel), check_overlap=False)
+
+    def _flush_publishes(self, now: float, force: bool = False) -> None:
+        for channel, message in self._publish_limiter.due(now, force):
+            self._publish_now(channel, message)
+
+    def _flush_conflated(self) -> None:
+        """Handles the newest message of each conflated channel drained this step"""
+        if not self._conflation:
+            return
+
+        for channel, item in self._conflation.flush(self.verbose.ipc):
+            self._dispatch(channel, item)
 
     def run(self) -> None:
         """Runs the redis server"""
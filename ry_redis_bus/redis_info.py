@@ -0,0 +1,49 @@
+import typing as T
+
+
+class RedisInfo:
+    def __init__(self, host: str, port: int, db: int, user: str, password: str, db_name: str):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.user = user
+        self.password = password
+        self.db_name = db_name
+
+    @classmethod
+    def null(cls) -> "RedisInfo":
+        return cls("", 0, 0, "", "", "")
+
+    def is_null(self) -> bool:
+        """Same as == RedisInfo.null(), without building one on every call"""
+        return self == _NULL
+
+    def __eq__(self, other: T.Any) -> bool:
+        if not isinstance(other, RedisInfo):
+            return False
+
+        return (
+            self.host == other.host
+            and self.port == other.port
+            and self.db == other.db
+            and self.user == other.user
+            and self.password == other.password
+            and self.db_name == other.db_name
+        )
+
+    def __repr__(self) -> str:
+        values = [
+            f"{key}={'*' * min(8, len(value)) if key == 'password' and value else value}"
+            for key, value in self.__dict__.items()
+        ]
+        values_string = "\n\t".join(values)
+        return f"RedisInfo(\n\t{values_string}\n)"
+
+    def __str__(self) -> str:
+        return self.__repr__()
+
+    def __hash__(self) -> int:
+        return hash((self.host, self.port, self.db, self.user, self.password, self.db_name))
+
+
+_NULL = RedisInfo.null()
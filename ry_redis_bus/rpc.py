@@ -0,0 +1,312 @@
+"""
+Request/reply over the bus.
+
+Requests carry a correlation id and the reply channel of the caller in a small binary
+header in front of the serialized message. Each client subscribes its own reply channel
+before its first request and keeps it, so concurrent calls need no temporary subscriptions.
+Requests and replies are published with send_rpc, around the publish limits and the last
+value cache, since they are addressed to one caller and are meaningless to replay.
+"""
+
+import asyncio
+import collections
+import functools
+import inspect
+import os
+import socket
+import struct
+import threading
+import time
+import typing as T
+import uuid
+from dataclasses import dataclass
+
+from google.protobuf.message import DecodeError, Message
+from ryutils import log
+
+from ry_redis_bus.envelope import channel_name
+from ry_redis_bus.helpers import FuncTyping, message_handler
+
+DEFAULT_RPC_TIMEOUT = 5.0
+REPLY_SUBSCRIBE_TIMEOUT = 1.0
+REPLY_SUBSCRIBE_POLL = 0.005
+
+REQUEST_MAGIC = b"RQ1"
+REPLY_MAGIC = b"RP1"
+CORRELATION_ID_SIZE = 16
+REQUEST_HEADER = struct.Struct(f"!{len(REQUEST_MAGIC)}s{CORRELATION_ID_SIZE}sH")
+REPLY_HEADER = struct.Struct(f"!{len(REPLY_MAGIC)}s{CORRELATION_ID_SIZE}sB")
+
+REPLY_NODE_SEPARATOR = "@"
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class RpcError(Exception):
+    """Raised on the caller when the remote handler failed"""
+
+
+@dataclass
+class RpcRequest:
+    correlation_id: bytes
+    reply_channel: str
+    payload: bytes
+
+
+@dataclass
+class RpcReply:
+    correlation_id: bytes
+    status: int
+    payload: bytes
+
+
+def reply_channel_name(db_name: str, node: str) -> str:
+    """
+    A new reply channel, one per client. It ends with the Redis node the client subscribes
+    it on, so servers behind several nodes know where to send the reply.
+    """
+    caller = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    return f"{db_name}:rpc:{caller}{REPLY_NODE_SEPARATOR}{node}"
+
+
+def reply_node(reply_channel: str) -> T.Optional[str]:
+    """The node reply_channel is subscribed on, None for names without one"""
+    _, separator, node = reply_channel.rpartition(REPLY_NODE_SEPARATOR)
+    return node if separator else None
+
+
+def new_correlation_id() -> bytes:
+    return uuid.uuid4().bytes
+
+
+def to_bytes(message: T.Any) -> bytes:
+    if isinstance(message, bytes):
+        return message
+    if isinstance(message, str):
+        return message.encode()
+    return T.cast(bytes, message.SerializeToString())
+
+
+def encode_request(correlation_id: bytes, reply_channel: str, payload: bytes) -> bytes:
+    reply_channel_bytes = reply_channel.encode()
+    header = REQUEST_HEADER.pack(REQUEST_MAGIC, correlation_id, len(reply_channel_bytes))
+    return header + reply_channel_bytes + payload
+
+
+def decode_request(data: bytes) -> T.Optional[RpcRequest]:
+    if len(data) < REQUEST_HEADER.size or not data.startswith(REQUEST_MAGIC):
+        return None
+    _, correlation_id, channel_size = REQUEST_HEADER.unpack_from(data)
+    payload_start = REQUEST_HEADER.size + channel_size
+    reply_channel = data[REQUEST_HEADER.size : payload_start].decode()
+    return RpcRequest(correlation_id, reply_channel, data[payload_start:])
+
+
+def encode_reply(correlation_id: bytes, status: int, payload: bytes) -> bytes:
+    return REPLY_HEADER.pack(REPLY_MAGIC, correlation_id, status) + payload
+
+
+def decode_reply(data: bytes) -> T.Optional[RpcReply]:
+    if len(data) < REPLY_HEADER.size or not data.startswith(REPLY_MAGIC):
+        return None
+    _, correlation_id, status = REPLY_HEADER.unpack_from(data)
+    return RpcReply(correlation_id, status, data[REPLY_HEADER.size :])
+
+
+class PendingCalls:
+    """
+    Outstanding requests keyed by correlation id.
+
+    Works with both concurrent.futures.Future and asyncio.Future, and is locked since
+    sync callers usually wait on their future while another thread runs step().
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: T.Dict[bytes, T.Tuple[T.Any, float, T.Optional[T.Type[Message]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def add(
+        self,
+        correlation_id: bytes,
+        future: T.Any,
+        deadline: float,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> None:
+        with self._lock:
+            self._calls[correlation_id] = (future, deadline, reply_type)
+
+    def resolve(self, data: bytes) -> bool:
+        """Completes the future the reply belongs to, returns False for unknown replies"""
+        reply = decode_reply(data)
+        if reply is None:
+            log.print_fail("Received malformed RPC reply.")
+            return False
+
+        with self._lock:
+            call = self._calls.pop(reply.correlation_id, None)
+        if call is None:
+            # The call already timed out
+            return False
+
+        future, _, reply_type = call
+        if not future.done():
+            self._complete(future, reply, reply_type)
+        return True
+
+    @staticmethod
+    def _complete(future: T.Any, reply: RpcReply, reply_type: T.Optional[T.Type[Message]]) -> None:
+        if reply.status != STATUS_OK:
+            future.set_exception(RpcError(reply.payload.decode(errors="replace")))
+        elif reply_type is None:
+            future.set_result(reply.payload)
+        else:
+            try:
+                reply_pb = reply_type()
+                reply_pb.ParseFromString(reply.payload)
+                future.set_result(reply_pb)
+            except DecodeError as exc:
+                future.set_exception(RpcError(f"Failed to decode reply as {reply_type}: {exc}"))
+
+    def expire(self, now: float) -> int:
+        """Fails every call whose deadline has passed"""
+        if not self._calls:
+            return 0
+
+        with self._lock:
+            expired = [key for key, (_, deadline, _) in self._calls.items() if deadline <= now]
+            calls = [self._calls.pop(key) for key in expired]
+
+        for future, _, _ in calls:
+            if not future.done():
+                future.set_exception(TimeoutError("RPC request timed out"))
+        return len(calls)
+
+
+class RpcCaller:
+    """
+    The reply channel of one client, its outstanding calls and the requests it queued.
+    Requests may be queued from any thread, the client sends them and handles the replies
+    from step(), which owns the pubsub connections.
+    """
+
+    def __init__(self, db_name: str, node: str) -> None:
+        self.reply_channel = reply_channel_name(db_name, node)
+        self.calls = PendingCalls()
+        self.outbox: T.Deque[T.Tuple[str, bytes]] = collections.deque()
+
+    def queue(
+        self,
+        channel: str,
+        message: T.Any,
+        future: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> None:
+        """Queues a request, future is resolved by its reply or fails once timeout passed"""
+        correlation_id = new_correlation_id()
+        timeout = DEFAULT_RPC_TIMEOUT if timeout is None else timeout
+        self.calls.add(correlation_id, future, time.time() + timeout, reply_type)
+        self.outbox.append(
+            (channel, encode_request(correlation_id, self.reply_channel, to_bytes(message)))
+        )
+
+    def take_requests(self) -> T.List[T.Tuple[str, bytes]]:
+        requests = []
+        while self.outbox:
+            requests.append(self.outbox.popleft())
+        return requests
+
+    def is_subscribed(self, item: T.Any) -> bool:
+        """True for the acknowledgement of the reply channel subscription"""
+        return item.get("type") == "subscribe" and channel_name(item) == self.reply_channel
+
+    def handle_reply(self, item: T.Any) -> None:
+        self.calls.resolve(item["data"])
+
+    def expire(self, now: float) -> int:
+        return self.calls.expire(now)
+
+
+def _reply_for(result: T.Any) -> T.Tuple[int, bytes]:
+    if result is None:
+        return STATUS_ERROR, b"Request could not be handled"
+    return STATUS_OK, to_bytes(result)
+
+
+def _rpc_handler(func: FuncTyping, warn_latency: bool = True, verbose: bool = False) -> T.Any:
+    """Internal implementation of the rpc handler decorator"""
+    signature = inspect.signature(func)  # type: ignore
+    parameters = list(signature.parameters.values())
+    assert (
+        parameters and parameters[0].name == "self"
+    ), "rpc_handler must decorate a method of a client that can send replies"
+
+    handler = T.cast(
+        T.Callable[..., T.Any], message_handler(warn_latency=warn_latency, verbose=verbose)(func)
+    )
+
+    def unwrap(item: T.Any) -> T.Tuple[T.Optional[RpcRequest], T.Any]:
+        request = decode_request(item.get("data", b"")) if isinstance(item, dict) else None
+        if request is None:
+            log.print_fail(f"Received malformed RPC request: {item}")
+            return None, item
+        return request, {**item, "data": request.payload}
+
+    if asyncio.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(self: T.Any, item: T.Any, *args: T.Any, **kwargs: T.Any) -> None:
+            request, inner_item = unwrap(item)
+            if request is None:
+                return
+
+            try:
+                status, payload = _reply_for(await handler(self, inner_item, *args, **kwargs))
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                status, payload = STATUS_ERROR, str(exc).encode()
+
+            reply = encode_reply(request.correlation_id, status, payload)
+            send = getattr(self, "asend_rpc", None) or self.send_rpc
+            await send(request.reply_channel, reply)
+
+        return async_wrapper
+
+    sfunc = T.cast(T.Callable[..., T.Any], func)
+
+    @functools.wraps(sfunc)
+    def sync_wrapper(self: T.Any, item: T.Any, *args: T.Any, **kwargs: T.Any) -> None:
+        request, inner_item = unwrap(item)
+        if request is None:
+            return
+
+        try:
+            status, payload = _reply_for(handler(self, inner_item, *args, **kwargs))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            status, payload = STATUS_ERROR, str(exc).encode()
+
+        reply = encode_reply(request.correlation_id, status, payload)
+        self.send_rpc(request.reply_channel, reply)
+
+    return sync_wrapper
+
+
+def rpc_handler(
+    func: T.Optional[FuncTyping] = None,
+    *,
+    warn_latency: bool = True,
+    verbose: bool = False,
+) -> T.Any:
+    """
+    A decorator that serves requests made with request(). The handler is wrapped with
+    message_handler and returns the reply message, which is published back to the caller.
+    Can be used as:
+        @rpc_handler
+        @rpc_handler(warn_latency=False, verbose=True)
+    """
+    if func is None:
+        return lambda f: _rpc_handler(f, warn_latency=warn_latency, verbose=verbose)
+    return _rpc_handler(func, warn_latency=warn_latency, verbose=verbose)
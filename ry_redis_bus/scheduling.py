@@ -0,0 +1,77 @@
+import collections
+import typing as T
+
+from ry_redis_bus.subscription import Priority, SubscriptionOptions
+
+PRIORITY_WEIGHTS = {
+    Priority.HIGH: 16,
+    Priority.NORMAL: 4,
+    Priority.BULK: 1,
+}
+DEFAULT_BULK_BUDGET = 1000
+
+
+class ChannelScheduler:
+    """
+    Per-channel message queues dispatched in weighted round-robin.
+
+    Each round every channel with pending messages gets up to its weight of messages,
+    so a flood on one channel cannot starve the others. Bulk channels additionally
+    share a budget per iteration, anything over it stays queued for the next step.
+    """
+
+    def __init__(self, bulk_budget: int = DEFAULT_BULK_BUDGET) -> None:
+        self.bulk_budget = bulk_budget
+        self._queues: T.Dict[str, T.Deque[T.Any]] = {}
+        self._weights: T.Dict[str, int] = {}
+        self._bulk: T.Set[str] = set()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def enqueue(
+        self, channel: str, item: T.Any, options: T.Optional[SubscriptionOptions] = None
+    ) -> None:
+        queue = self._queues.get(channel)
+        if queue is None:
+            queue = self._queues[channel] = collections.deque()
+            priority = options.priority if options is not None else Priority.NORMAL
+            weight = options.weight if options is not None else None
+            self._weights[channel] = max(1, weight or PRIORITY_WEIGHTS[priority])
+            if priority == Priority.BULK:
+                self._bulk.add(channel)
+        queue.append(item)
+        self._size += 1
+
+    def rounds(self) -> T.Iterator[T.List[T.Tuple[str, T.Any]]]:
+        """Yields the messages of each round-robin round until the queues or budget run out"""
+        bulk_budget = self.bulk_budget
+        while self._queues:
+            batch: T.List[T.Tuple[str, T.Any]] = []
+            for channel in list(self._queues):
+                queue = self._queues[channel]
+                take = min(len(queue), self._weights[channel])
+                if channel in self._bulk:
+                    take = min(take, bulk_budget)
+                    bulk_budget -= take
+                batch.extend((channel, queue.popleft()) for _ in range(take))
+                if not queue:
+                    self._remove(channel)
+
+            if not batch:
+                return
+
+            self._size -= len(batch)
+            yield batch
+
+    def clear(self) -> None:
+        self._queues.clear()
+        self._weights.clear()
+        self._bulk.clear()
+        self._size = 0
+
+    def _remove(self, channel: str) -> None:
+        del self._queues[channel]
+        del self._weights[channel]
+        self._bulk.discard(channel)
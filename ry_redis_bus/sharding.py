@@ -0,0 +1,354 @@
+"""
+Channel sharding across several Redis servers without Redis Cluster.
+
+Every channel belongs to one node of a consistent hash ring, so publishers and
+subscribers in different processes agree on it as long as they are given the same nodes.
+Adding or removing a node only moves the channels it owns. A channel name may carry a
+hash tag like Redis Cluster keys: only the part in the first {...} is hashed, so
+"robot.{7}.pose" and "robot.{7}.cmd" always share a node.
+
+ShardedRedisClient keeps one client, and so one pubsub connection, per node and steps
+them all from the same loop. subscribe_all subscribes on every node. Requests go to the
+node of their service channel, where the caller also waits for the reply, and replies are
+sent back to the node named in the reply channel.
+
+astep() steps the nodes concurrently, so a node that is slow or reconnecting only holds up
+its own channels. step() goes through the nodes one after the other: a node blocked in a
+call to its server, such as the connection retries of the sync client, stalls every other
+node until it returns. Use arun() when nodes may be down independently.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import time
+import typing as T
+
+from ry_redis_bus.helpers import ITERATION_SLEEP_TIME, RedisMessageCallback
+from ry_redis_bus.redis_client_base import RedisClientBase
+from ry_redis_bus.redis_info import RedisInfo
+from ry_redis_bus.rpc import reply_node
+
+if T.TYPE_CHECKING:
+    import concurrent.futures
+
+    from google.protobuf.message import Message
+    from ryutils.verbose import Verbose
+
+    from ry_redis_bus.channels import Channel
+    from ry_redis_bus.rate_limit import PublishPolicy
+    from ry_redis_bus.subscription import SubscriptionOptions
+
+DEFAULT_VIRTUAL_NODES = 160
+
+
+def node_name(redis_info: RedisInfo) -> str:
+    return f"{redis_info.host}:{redis_info.port}/{redis_info.db}"
+
+
+def hash_tag(name: str) -> str:
+    """Part of name that decides its node, the first non empty {...} if there is one"""
+    start = name.find("{")
+    if start != -1:
+        end = name.find("}", start + 1)
+        if end > start + 1:
+            return name[start + 1 : end]
+    return name
+
+
+def ring_point(value: str) -> int:
+    # Python's hash() differs between processes, which would split the bus
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring of Redis nodes, each placed at virtual_nodes points"""
+
+    def __init__(
+        self, nodes: T.Sequence[RedisInfo], virtual_nodes: int = DEFAULT_VIRTUAL_NODES
+    ) -> None:
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        names = [node_name(node) for node in nodes]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicate nodes in {names}")
+
+        self.nodes = list(nodes)
+        points = sorted(
+            (ring_point(f"{name}#{replica}"), index)
+            for index, name in enumerate(names)
+            for replica in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def index_for(self, name: str) -> int:
+        """Index in nodes of the node that owns channel or key name"""
+        position = bisect.bisect(self._points, ring_point(hash_tag(name)))
+        return self._owners[position % len(self._points)]
+
+    def node_for(self, name: str) -> RedisInfo:
+        return self.nodes[self.index_for(name)]
+
+
+# pylint: disable=too-many-public-methods
+class ShardedRedisClient:
+    """
+    RedisClientBase over several nodes. Publishes, subscriptions and key reads go to the
+    node that owns the channel or key, step() handles the messages of every node.
+    """
+
+    def __init__(
+        self,
+        nodes: T.Sequence[RedisInfo],
+        verbose: Verbose,
+        default_message_callback: RedisMessageCallback = None,
+        virtual_nodes: int = DEFAULT_VIRTUAL_NODES,
+        **client_kwargs: T.Any,
+    ) -> None:
+        self.ring = HashRing(nodes, virtual_nodes)
+        self.verbose = verbose
+        self.clients = [
+            RedisClientBase(node, verbose, default_message_callback, **client_kwargs)
+            for node in self.ring.nodes
+        ]
+        self._node_indexes = {node_name(node): index for index, node in enumerate(self.ring.nodes)}
+        # Called with the time of every step, once every node handled its messages
+        self._step_callbacks: T.List[T.Callable[[float], T.Any]] = []
+
+    def client_for(self, name: T.Union[Channel, str]) -> RedisClientBase:
+        return self.clients[self.ring.index_for(str(name))]
+
+    def _reply_client(self, reply_channel: str) -> RedisClientBase:
+        """Client of the node the caller waits for its reply on"""
+        index = self._node_indexes.get(reply_node(reply_channel) or "")
+        return self.clients[index] if index is not None else self.client_for(reply_channel)
+
+    def _group(self, names: T.Iterable[T.Any]) -> T.Dict[int, T.List[T.Any]]:
+        groups: T.Dict[int, T.List[T.Any]] = {}
+        for name in names:
+            groups.setdefault(self.ring.index_for(str(name)), []).append(name)
+        return groups
+
+    async def asubscribe_all(self) -> None:
+        """Async version of subscribe_all."""
+        for client in self.clients:
+            await client.asubscribe_all()
+
+    def subscribe_all(self) -> None:
+        for client in self.clients:
+            client.subscribe_all()
+
+    async def asubscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Async version of subscribe."""
+        await self.client_for(channel).asubscribe(channel, callback, options)
+
+    def subscribe(
+        self,
+        channel: Channel,
+        callback: RedisMessageCallback,
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        self.client_for(channel).subscribe(channel, callback, options)
+
+    async def asubscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Async version of subscribe_many."""
+        for index, group in self._group(channels).items():
+            await self.clients[index].asubscribe_many(
+                {channel: channels[channel] for channel in group}, options
+            )
+
+    def subscribe_many(
+        self,
+        channels: T.Mapping[Channel, RedisMessageCallback],
+        options: T.Optional[SubscriptionOptions] = None,
+    ) -> None:
+        """Subscribes with a single command per node"""
+        for index, group in self._group(channels).items():
+            self.clients[index].subscribe_many(
+                {channel: channels[channel] for channel in group}, options
+            )
+
+    async def aunsubscribe(self, channel: Channel) -> None:
+        """Async version of unsubscribe."""
+        await self.client_for(channel).aunsubscribe(channel)
+
+    def unsubscribe(self, channel: Channel) -> None:
+        self.client_for(channel).unsubscribe(channel)
+
+    async def aunsubscribe_many(self, channels: T.Iterable[Channel]) -> None:
+        """Async version of unsubscribe_many."""
+        for index, group in self._group(channels).items():
+            await self.clients[index].aunsubscribe_many(group)
+
+    def unsubscribe_many(self, channels: T.Iterable[Channel]) -> None:
+        for index, group in self._group(channels).items():
+            self.clients[index].unsubscribe_many(group)
+
+    async def apublish(self, channel: Channel, message: T.Any) -> None:
+        """Async version of publish."""
+        await self.client_for(channel).apublish(channel, message)
+
+    def publish(self, channel: Channel, message: T.Any) -> None:
+        self.client_for(channel).publish(channel, message)
+
+    async def azadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
+        """Async version of zadd."""
+        await self.client_for(key or self.ring.nodes[0].db_name).azadd(data, key)
+
+    def zadd(self, data: T.Any, key: T.Optional[str] = None) -> None:
+        """Adds data to the sorted set at key, or the db_name set, on the node owning it"""
+        self.client_for(key or self.ring.nodes[0].db_name).zadd(data, key)
+
+    def set_publish_policy(self, channel: Channel | str, policy: T.Optional[PublishPolicy]) -> None:
+        """Limits the publish rate of channel on its node, None removes the limit."""
+        self.client_for(channel).set_publish_policy(channel, policy)
+
+    def add_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        """Calls callback with the time of every step, after every node was stepped."""
+        self._step_callbacks.append(callback)
+
+    def remove_step_callback(self, callback: T.Callable[[float], T.Any]) -> None:
+        if callback in self._step_callbacks:
+            self._step_callbacks.remove(callback)
+
+    async def arequest(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> asyncio.Future[T.Any]:
+        """Async version of request."""
+        return await self.client_for(channel).arequest(channel, message, timeout, reply_type)
+
+    def request(
+        self,
+        channel: Channel,
+        message: T.Any,
+        timeout: T.Optional[float] = None,
+        reply_type: T.Optional[T.Type[Message]] = None,
+    ) -> concurrent.futures.Future[T.Any]:
+        """Sends a request through the node of channel, which also receives the reply."""
+        return self.client_for(channel).request(channel, message, timeout, reply_type)
+
+    async def asend_rpc(self, channel: str, data: bytes) -> None:
+        """Async version of send_rpc."""
+        await self._reply_client(channel).asend_rpc(channel, data)
+
+    def send_rpc(self, channel: str, data: bytes) -> None:
+        """Sends a reply to the node its reply channel is subscribed on."""
+        self._reply_client(channel).send_rpc(channel, data)
+
+    async def aget_latest(self, channel: Channel) -> T.Optional[bytes]:
+        """Async version of get_latest."""
+        return await self.client_for(channel).aget_latest(channel)
+
+    def get_latest(self, channel: Channel) -> T.Optional[bytes]:
+        return self.client_for(channel).get_latest(channel)
+
+    async def aget(self, key: str) -> T.Optional[bytes]:
+        """Async version of get."""
+        return await self.client_for(key).aget(key)
+
+    def get(self, key: str) -> T.Optional[bytes]:
+        return self.client_for(key).get(key)
+
+    async def ahget(self, key: str, field: str) -> T.Optional[bytes]:
+        """Async version of hget."""
+        return await self.client_for(key).ahget(key, field)
+
+    def hget(self, key: str, field: str) -> T.Optional[bytes]:
+        return self.client_for(key).hget(key, field)
+
+    async def amget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Async version of mget."""
+        values: T.Dict[str, T.Optional[bytes]] = {}
+        for index, group in self._group(keys).items():
+            values.update(zip(group, await self.clients[index].amget(group)))
+        return [values[key] for key in keys]
+
+    def mget(self, keys: T.Sequence[str]) -> T.List[T.Optional[bytes]]:
+        """Reads the keys with one MGET per node, in the order given"""
+        values: T.Dict[str, T.Optional[bytes]] = {}
+        for index, group in self._group(keys).items():
+            values.update(zip(group, self.clients[index].mget(group)))
+        return [values[key] for key in keys]
+
+    async def aresubscribe(self) -> None:
+        """Async version of resubscribe."""
+        for client in self.clients:
+            await client.aresubscribe()
+
+    def resubscribe(self) -> None:
+        for client in self.clients:
+            client.resubscribe()
+
+    async def astop(self) -> None:
+        """Async version of stop."""
+        for client in self.clients:
+            await client.astop()
+
+    def stop(self) -> None:
+        for client in self.clients:
+            client.stop()
+
+    async def astart(self) -> None:
+        """Async version of start."""
+        for client in self.clients:
+            await client.astart()
+
+    def start(self) -> None:
+        for client in self.clients:
+            client.start()
+
+    async def astep(self) -> None:
+        """Async version of step, stepping the nodes concurrently."""
+        await asyncio.gather(*(client.astep() for client in self.clients))
+        now = time.time()
+        for callback in self._step_callbacks:
+            result = callback(now)
+            if asyncio.iscoroutine(result):
+                await result
+
+    def step(self) -> None:
+        """Handles the pending messages of every node, one node after the other"""
+        for client in self.clients:
+            client.step()
+        now = time.time()
+        for callback in self._step_callbacks:
+            callback(now)
+
+    async def arun(self) -> None:
+        """Async version of run."""
+        while not all(client.async_client.stop_listen for client in self.clients):
+            await self.astep()
+            await asyncio.sleep(ITERATION_SLEEP_TIME)
+
+    def run(self) -> None:
+        while not all(client.sync_client.stop_listen for client in self.clients):
+            self.step()
+            time.sleep(ITERATION_SLEEP_TIME)
+
+    async def aclose(self) -> None:
+        """Async version of close."""
+        for client in self.clients:
+            await client.aclose()
+
+    def close(self) -> None:
+        for client in self.clients:
+            client.close()
@@ -0,0 +1,462 @@
+"""
+Shared memory transport for publishers and subscribers on the same host.
+
+Each channel gets a single producer, multiple consumer ring in a named shared memory block:
+
+    header: magic | slot_count | slot_size | writer_pid | write_seq | writer_id | reserved
+            | readers[MAX_READERS] (pid | id)
+    slot:   seq | length | flags | payload[slot_size]
+
+The writer and reader slots name a process and a client in it, so several clients of one
+process each get their own slot; a slot whose process died is free again. Creating the
+ring and claiming slots happen under an exclusive lock file next to it.
+
+The writer invalidates a slot, copies the payload, then commits the slot and the header
+sequence. Readers copy a slot and check its sequence again afterwards, so a slot that was
+overwritten while being read counts as lost instead of being delivered torn. Readers that
+fall more than slot_count behind skip ahead and count the overrun as lost as well.
+
+Only one client per host publishes a channel through the ring, the first one to claim it.
+Other publishers, payloads larger than a slot and channels with subscribers that do not
+read the ring go through Redis as before. Whether such subscribers exist is checked at
+most every remote_check_period seconds, so one that subscribes in between misses what is
+published until the next check. Local readers stay subscribed on Redis to hear
+remote publishers, and deliver a message published on both only once, from whichever path
+it arrives on first: the Redis copy of a message already read from the ring is dropped, and
+so is the ring entry of a message whose Redis copy was handled before the ring was polled.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import itertools
+import os
+import struct
+import sys
+import tempfile
+import time
+import typing as T
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+
+import redis
+import redis.asyncio as aioredis
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.dedup import OverlapFilter
+from ry_redis_bus.envelope import channel_name, make_item
+
+MAGIC = b"RRB2"
+MAX_READERS = 32
+DEFAULT_SLOT_COUNT = 1024
+DEFAULT_SLOT_SIZE = 4096
+REMOTE_CHECK_PERIOD = 1.0
+# Bit set on slots that were also published on Redis, so readers expect an echo
+FLAG_ON_REDIS = 0x1
+
+_HEADER = struct.Struct(f"<4sIII Q II {MAX_READERS * 2}I")
+HEADER_SIZE = 512
+_WRITER_PID_OFFSET = 12
+_WRITE_SEQ_OFFSET = 16
+_WRITER_ID_OFFSET = 24
+_READERS_OFFSET = 32
+_OWNER = struct.Struct("<II")
+_SLOT_SEQ = struct.Struct("<Q")
+_SLOT_META = struct.Struct("<II")
+SLOT_HEADER_SIZE = _SLOT_SEQ.size + _SLOT_META.size
+
+
+@dataclass
+class ShmRingConfig:
+    """
+    Ring geometry used by whichever process creates the ring first. The publisher checks
+    for subscribers that do not read the ring every remote_check_period seconds, 0 checks
+    on every publish at the cost of a round trip.
+    """
+
+    slot_count: int = DEFAULT_SLOT_COUNT
+    slot_size: int = DEFAULT_SLOT_SIZE
+    remote_check_period: float = REMOTE_CHECK_PERIOD
+
+    @property
+    def size(self) -> int:
+        return HEADER_SIZE + self.slot_count * (SLOT_HEADER_SIZE + self.slot_size)
+
+
+def ring_name(namespace: str, channel: str) -> str:
+    """Short, filesystem safe name; macOS limits shared memory names to 31 characters"""
+    digest = hashlib.sha1(f"{namespace}:{channel}".encode()).hexdigest()[:20]
+    return f"rrb_{digest}"
+
+
+@contextlib.contextmanager
+def ring_lock(name: str) -> T.Iterator[None]:
+    """Exclusive lock of the ring between every process and thread of the host"""
+    fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def pid_alive(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def open_shared_memory(name: str, config: ShmRingConfig) -> shared_memory.SharedMemory:
+    """
+    Attaches to the ring, creating it if needed. The resource tracker is kept out of it:
+    before 3.13 it unlinks every block a process touched when that process exits, which
+    would pull the ring out from under the other processes still using it.
+    """
+    try:
+        shm = _attach(name, create=True, size=config.size)
+    except FileExistsError:
+        shm = _attach(name, create=False, size=0)
+    return shm
+
+
+def _attach(name: str, create: bool, size: int) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        # pylint: disable-next=unexpected-keyword-arg
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # pylint: disable-next=protected-access
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory) -> None:
+    if sys.version_info < (3, 13):
+        # unlink() unregisters the block again, the tracker has to know it for that
+        # pylint: disable-next=protected-access
+        resource_tracker.register(shm._name, "shared_memory")  # type: ignore[attr-defined]
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        if sys.version_info < (3, 13):
+            # pylint: disable-next=protected-access
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+
+
+class ShmRing:
+    """One attachment to a channel ring, used for writing, reading or both"""
+
+    def __init__(self, name: str, config: ShmRingConfig) -> None:
+        self.name = name
+        with ring_lock(name):
+            self.shm = open_shared_memory(name, config)
+            self.buf = T.cast(memoryview, self.shm.buf)
+            magic, slot_count, slot_size, *_ = _HEADER.unpack_from(self.buf, 0)
+            if magic != MAGIC:
+                zeros = [0] * (4 + 2 * MAX_READERS)
+                _HEADER.pack_into(self.buf, 0, MAGIC, config.slot_count, config.slot_size, *zeros)
+                slot_count, slot_size = config.slot_count, config.slot_size
+        self.slot_count: int = slot_count
+        self.slot_size: int = slot_size
+        self.stride = SLOT_HEADER_SIZE + slot_size
+        self.read_seq = self.write_seq
+        self.lost = 0
+
+    @property
+    def write_seq(self) -> int:
+        return T.cast(int, _SLOT_SEQ.unpack_from(self.buf, _WRITE_SEQ_OFFSET)[0])
+
+    @property
+    def writer_pid(self) -> int:
+        return T.cast(int, struct.unpack_from("<I", self.buf, _WRITER_PID_OFFSET)[0])
+
+    def _writer(self) -> T.Tuple[int, int]:
+        return self.writer_pid, struct.unpack_from("<I", self.buf, _WRITER_ID_OFFSET)[0]
+
+    def _set_writer(self, pid: int, client_id: int) -> None:
+        struct.pack_into("<I", self.buf, _WRITER_PID_OFFSET, pid)
+        struct.pack_into("<I", self.buf, _WRITER_ID_OFFSET, client_id)
+
+    def _readers(self) -> T.List[T.Tuple[int, int]]:
+        return [
+            _OWNER.unpack_from(self.buf, _READERS_OFFSET + _OWNER.size * index)
+            for index in range(MAX_READERS)
+        ]
+
+    def live_readers(self) -> int:
+        return sum(1 for pid, _ in self._readers() if pid_alive(pid))
+
+    def claim_writer(self, pid: int, client_id: int = 0) -> bool:
+        """Makes the client the producer unless another live one already is"""
+        with ring_lock(self.name):
+            current = self._writer()
+            if current not in ((0, 0), (pid, client_id)) and pid_alive(current[0]):
+                return False
+            self._set_writer(pid, client_id)
+            return True
+
+    def release_writer(self, pid: int, client_id: int = 0) -> None:
+        with ring_lock(self.name):
+            if self._writer() == (pid, client_id):
+                self._set_writer(0, 0)
+
+    def register_reader(self, pid: int, client_id: int = 0) -> bool:
+        with ring_lock(self.name):
+            for index, (current, current_id) in enumerate(self._readers()):
+                if (current, current_id) == (pid, client_id) or not pid_alive(current):
+                    _OWNER.pack_into(
+                        self.buf, _READERS_OFFSET + _OWNER.size * index, pid, client_id
+                    )
+                    self.read_seq = self.write_seq
+                    return True
+        return False
+
+    def unregister_reader(self, pid: int, client_id: int = 0) -> None:
+        with ring_lock(self.name):
+            for index, owner in enumerate(self._readers()):
+                if owner == (pid, client_id):
+                    _OWNER.pack_into(self.buf, _READERS_OFFSET + _OWNER.size * index, 0, 0)
+
+    def write(self, data: bytes, flags: int = 0) -> bool:
+        """Appends data to the ring, returns False if it does not fit in a slot"""
+        if len(data) > self.slot_size:
+            return False
+        seq = self.write_seq + 1
+        offset = HEADER_SIZE + ((seq - 1) % self.slot_count) * self.stride
+        _SLOT_SEQ.pack_into(self.buf, offset, 0)
+        payload = offset + SLOT_HEADER_SIZE
+        self.buf[payload : payload + len(data)] = data
+        _SLOT_META.pack_into(self.buf, offset + _SLOT_SEQ.size, len(data), flags)
+        _SLOT_SEQ.pack_into(self.buf, offset, seq)
+        _SLOT_SEQ.pack_into(self.buf, _WRITE_SEQ_OFFSET, seq)
+        return True
+
+    def read(self, limit: int) -> T.List[T.Tuple[bytes, int]]:
+        """Returns up to limit (payload, flags) committed since the last read"""
+        write_seq = self.write_seq
+        if write_seq - self.read_seq > self.slot_count:
+            self.lost += write_seq - self.read_seq - self.slot_count
+            self.read_seq = write_seq - self.slot_count
+
+        messages: T.List[T.Tuple[bytes, int]] = []
+        while self.read_seq < write_seq and len(messages) < limit:
+            seq = self.read_seq + 1
+            offset = HEADER_SIZE + ((seq - 1) % self.slot_count) * self.stride
+            slot_seq = _SLOT_SEQ.unpack_from(self.buf, offset)[0]
+            if slot_seq == 0:
+                break  # Being written, pick it up next time
+            if slot_seq == seq:
+                length, flags = _SLOT_META.unpack_from(self.buf, offset + _SLOT_SEQ.size)
+                payload = offset + SLOT_HEADER_SIZE
+                data = bytes(self.buf[payload : payload + length])
+                if _SLOT_SEQ.unpack_from(self.buf, offset)[0] == seq:
+                    messages.append((data, flags))
+                else:
+                    self.lost += 1
+            else:
+                self.lost += 1
+            self.read_seq = seq
+        return messages
+
+    def close(self) -> None:
+        """Detaches, and removes the ring once no live process uses it anymore"""
+        with ring_lock(self.name):
+            unused = not pid_alive(self.writer_pid) and self.live_readers() == 0
+            del self.buf
+            self.shm.close()
+            if unused:
+                _unlink(self.shm)
+
+
+def has_remote_subscribers(
+    client: T.Callable[[], redis.Redis], channel: str, ring_readers: int
+) -> bool:
+    """Whether channel has subscribers on Redis that do not read its ring, True if unsure"""
+    # Pattern subscribers, like IpcLogger, do not read the rings. NUMPAT does not say
+    # which channels the patterns match, so any of them keeps every channel on Redis
+    try:
+        counts = client().pubsub_numsub(channel)
+        if counts and int(counts[0][1]) > ring_readers:
+            return True
+        return int(client().pubsub_numpat()) > 0
+    except redis.exceptions.RedisError:
+        return True
+
+
+async def ahas_remote_subscribers(
+    client: T.Callable[[], T.Awaitable[aioredis.Redis]], channel: str, ring_readers: int
+) -> bool:
+    """Async version of has_remote_subscribers"""
+    try:
+        connection = await client()
+        counts = await connection.pubsub_numsub(channel)
+        if counts and int(counts[0][1]) > ring_readers:
+            return True
+        return int(await connection.pubsub_numpat()) > 0
+    except redis.exceptions.RedisError:
+        return True
+
+
+_client_ids = itertools.count(1)
+
+
+class SharedMemoryTransport:
+    """The rings of one client, keyed by channel"""
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.pid = os.getpid()
+        # Tells the rings this client's slots from those of other clients of the process
+        self.client_id = next(_client_ids)
+        self.readers: T.Dict[str, ShmRing] = {}
+        self.writers: T.Dict[str, T.Optional[ShmRing]] = {}
+        self._remote_checked: T.Dict[str, T.Tuple[float, bool]] = {}
+        # Messages on both paths that were delivered from the ring, and from Redis first
+        self._echoes = OverlapFilter(max_entries=DEFAULT_SLOT_COUNT * 4)
+        self._early = OverlapFilter(max_entries=DEFAULT_SLOT_COUNT * 4)
+
+    def __bool__(self) -> bool:
+        return bool(self.readers)
+
+    @property
+    def lost(self) -> int:
+        return sum(ring.lost for ring in self.readers.values())
+
+    def subscribe(self, channel: Channel) -> None:
+        """Reads channel from its ring as well, if it has one"""
+        if isinstance(channel, Channel) and channel.shared_memory is not None:
+            self.open_reader(str(channel), channel.shared_memory)
+
+    def open_reader(self, channel: str, config: ShmRingConfig) -> None:
+        if channel in self.readers:
+            return
+        ring = ShmRing(ring_name(self.namespace, channel), config)
+        if not ring.register_reader(self.pid, self.client_id):
+            ring.close()
+            return  # Every reader slot is taken, the channel keeps working over Redis
+        self.readers[channel] = ring
+
+    def close_reader(self, channel: str) -> None:
+        ring = self.readers.pop(channel, None)
+        if ring is not None:
+            ring.unregister_reader(self.pid, self.client_id)
+            ring.close()
+
+    def writer(self, channel: str, config: ShmRingConfig) -> T.Optional[ShmRing]:
+        """The ring this client produces channel into, None if another client does"""
+        if channel not in self.writers:
+            ring: T.Optional[ShmRing] = ShmRing(ring_name(self.namespace, channel), config)
+            if ring is not None and not ring.claim_writer(self.pid, self.client_id):
+                ring.close()
+                ring = None
+            self.writers[channel] = ring
+        return self.writers[channel]
+
+    def cached_remote(
+        self, channel: str, now: float, period: float = REMOTE_CHECK_PERIOD
+    ) -> T.Optional[bool]:
+        """
+        Cached answer of whether channel has subscribers that do not read the ring, None
+        once it is period seconds old and Redis has to be asked again
+        """
+        checked_at, remote = self._remote_checked.get(channel, (0.0, True))
+        return remote if now - checked_at < period else None
+
+    def set_remote(self, channel: str, remote: bool, now: float) -> None:
+        self._remote_checked[channel] = (now, remote)
+
+    def publish(
+        self,
+        channel: Channel,
+        data: T.Union[str, bytes],
+        keep_on_redis: bool,
+        client: T.Callable[[], redis.Redis],
+    ) -> bool:
+        """
+        Writes data to the ring of channel, if it has one this client produces. Returns
+        whether Redis still needs it, which keep_on_redis forces.
+        """
+        found = self._publish_ring(channel)
+        if found is None:
+            return True
+        ring, config = found
+        now = time.time()
+        remote = self.cached_remote(str(channel), now, config.remote_check_period)
+        if remote is None:
+            remote = has_remote_subscribers(client, str(channel), ring.live_readers())
+            self.set_remote(str(channel), remote, now)
+        return _write(ring, data, remote or keep_on_redis)
+
+    async def apublish(
+        self,
+        channel: Channel,
+        data: T.Union[str, bytes],
+        keep_on_redis: bool,
+        client: T.Callable[[], T.Awaitable[aioredis.Redis]],
+    ) -> bool:
+        """Async version of publish"""
+        found = self._publish_ring(channel)
+        if found is None:
+            return True
+        ring, config = found
+        now = time.time()
+        remote = self.cached_remote(str(channel), now, config.remote_check_period)
+        if remote is None:
+            remote = await ahas_remote_subscribers(client, str(channel), ring.live_readers())
+            self.set_remote(str(channel), remote, now)
+        return _write(ring, data, remote or keep_on_redis)
+
+    def _publish_ring(self, channel: Channel) -> T.Optional[T.Tuple[ShmRing, ShmRingConfig]]:
+        config = channel.shared_memory if isinstance(channel, Channel) else None
+        ring = self.writer(str(channel), config) if config is not None else None
+        return (ring, T.cast(ShmRingConfig, config)) if ring is not None else None
+
+    def poll(self, limit: int, now: float) -> T.List[T.Tuple[str, bytes]]:
+        messages = []
+        for channel, ring in self.readers.items():
+            for data, flags in ring.read(limit):
+                if flags & FLAG_ON_REDIS:
+                    item = shm_item(channel, data)
+                    if self._early and self._early.consume(item, now):
+                        continue
+                    self._echoes.record(item, now)
+                messages.append((channel, data))
+        return messages
+
+    def is_echo(self, item: T.Any, now: float) -> bool:
+        """
+        True for the Redis copy of a message already delivered from the ring. Other messages
+        of ring channels are remembered, so their ring entry is dropped if it comes later.
+        """
+        if self._echoes and self._echoes.consume(item, now):
+            return True
+        if channel_name(item) in self.readers:
+            self._early.record(item, now)
+        return False
+
+    def close(self) -> None:
+        for channel in list(self.readers):
+            self.close_reader(channel)
+        for ring in self.writers.values():
+            if ring is not None:
+                ring.release_writer(self.pid, self.client_id)
+                ring.close()
+        self.writers.clear()
+
+
+def _write(ring: ShmRing, data: T.Union[str, bytes], remote: bool) -> bool:
+    payload = data.encode() if isinstance(data, str) else data
+    if not ring.write(payload, FLAG_ON_REDIS if remote else 0):
+        return True
+    return remote
+
+
+def shm_item(channel: str, data: bytes) -> T.Dict[str, T.Any]:
+    """Builds the same item shape redis-py returns, so handlers cannot tell the difference"""
+    return make_item(channel, data)
@@ -0,0 +1,452 @@
+"""
+Streaming pipelines over a subscription.
+
+A Stream decodes the messages of a channel and pushes each one through its operators as
+it arrives, so handlers that filter, window and aggregate before republishing are written
+as one chain:
+
+    speeds = (
+        Stream(POSE)
+        .filter(lambda pose: pose.moving)
+        .window(size=10.0, slide=1.0)
+        .aggregate(mean(lambda pose: pose.speed), key=lambda pose: pose.robot_id)
+        .map(lambda result: SpeedMsg(robot_id=result.key, speed=result.value))
+        .publish(AVERAGE_SPEED)
+    )
+    speeds.attach(client)
+
+Windows hold one partial aggregate per key and slide step (pane) rather than the
+messages, so sliding windows need aggregators that can merge partials. The number of
+keys is bounded by max_keys. Windows are timed by the arrival time of messages, or by
+timestamp(value) when given, and close when the first message past their end arrives or
+on flush(now). Attached streams also tick on every step of their client, so windows of
+quiet channels close on time: by the clock, or for timestamped windows by the newest
+timestamp plus the time since it arrived.
+Messages older than every open window are counted as late and dropped.
+"""
+
+import collections
+import math
+import time
+import typing as T
+from dataclasses import dataclass
+
+from google.protobuf.message import Message
+from ryutils import log
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import decode_message
+
+DEFAULT_MAX_KEYS = 10000
+
+Timestamp = T.Callable[[T.Any], float]
+KeyFunc = T.Callable[[T.Any], T.Hashable]
+
+
+@dataclass
+class Aggregator:
+    """
+    Incremental fold: initial() starts a partial, add folds a value into it, merge combines
+    two partials (needed by sliding windows) and result turns a partial into the output.
+    """
+
+    initial: T.Callable[[], T.Any]
+    add: T.Callable[[T.Any, T.Any], T.Any]
+    merge: T.Optional[T.Callable[[T.Any, T.Any], T.Any]] = None
+    result: T.Callable[[T.Any], T.Any] = lambda partial: partial
+
+
+def _identity(value: T.Any) -> T.Any:
+    return value
+
+
+def count() -> Aggregator:
+    return Aggregator(lambda: 0, lambda total, _: total + 1, lambda a, b: a + b)
+
+
+def total(field: T.Callable[[T.Any], float] = _identity) -> Aggregator:
+    return Aggregator(lambda: 0.0, lambda acc, value: acc + field(value), lambda a, b: a + b)
+
+
+def mean(field: T.Callable[[T.Any], float] = _identity) -> Aggregator:
+    return Aggregator(
+        lambda: (0.0, 0),
+        lambda acc, value: (acc[0] + field(value), acc[1] + 1),
+        lambda a, b: (a[0] + b[0], a[1] + b[1]),
+        lambda acc: acc[0] / acc[1] if acc[1] else math.nan,
+    )
+
+
+def minimum(field: T.Callable[[T.Any], float] = _identity) -> Aggregator:
+    return Aggregator(lambda: math.inf, lambda acc, value: min(acc, field(value)), min)
+
+
+def maximum(field: T.Callable[[T.Any], float] = _identity) -> Aggregator:
+    return Aggregator(lambda: -math.inf, lambda acc, value: max(acc, field(value)), max)
+
+
+def latest() -> Aggregator:
+    return Aggregator(lambda: None, lambda _, value: value, lambda _, b: b)
+
+
+@dataclass
+class WindowResult:
+    start: float
+    end: float
+    key: T.Hashable
+    value: T.Any
+
+
+class Operator:
+    """One stage of a stream, turns a value into zero or more values for the next stage"""
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        raise NotImplementedError
+
+    def flush(self, now: T.Optional[float]) -> T.List[T.Any]:
+        """Values held back until now, or all of them for None"""
+        del now
+        return []
+
+    def tick(self, now: float) -> T.List[T.Any]:
+        """Values held back that are due by the clock, when no message came in to push"""
+        del now
+        return []
+
+
+class FilterOperator(Operator):
+    def __init__(self, predicate: T.Callable[[T.Any], bool]) -> None:
+        self.predicate = predicate
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        return [value] if self.predicate(value) else []
+
+
+class MapOperator(Operator):
+    def __init__(self, func: T.Callable[[T.Any], T.Any]) -> None:
+        self.func = func
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        return [self.func(value)]
+
+
+class SinkOperator(Operator):
+    """Hands every value to a callback and passes it on"""
+
+    def __init__(self, callback: T.Callable[[T.Any], T.Any]) -> None:
+        self.callback = callback
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        self.callback(value)
+        return [value]
+
+
+class PublishOperator(Operator):
+    """Queues every value to be published by the client the stream is attached to"""
+
+    def __init__(self, channel: Channel) -> None:
+        self.channel = channel
+        self.outbox: T.List[T.Any] = []
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        self.outbox.append(value)
+        return [value]
+
+
+class AggregateOperator(Operator):
+    """Running aggregate per key, emits (key, result) after every value"""
+
+    def __init__(
+        self, aggregator: Aggregator, key: T.Optional[KeyFunc], max_keys: int = DEFAULT_MAX_KEYS
+    ) -> None:
+        self.aggregator = aggregator
+        self.key = key
+        self.max_keys = max_keys
+        self.evicted = 0
+        self._partials: "collections.OrderedDict[T.Hashable, T.Any]" = collections.OrderedDict()
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        key = self.key(value) if self.key is not None else None
+        partial = self._partials.pop(key) if key in self._partials else self.aggregator.initial()
+        partial = self.aggregator.add(partial, value)
+        self._partials[key] = partial
+        if len(self._partials) > self.max_keys:
+            # The least recently updated key starts over if it shows up again
+            self._partials.popitem(last=False)
+            self.evicted += 1
+        return [(key, self.aggregator.result(partial))]
+
+
+class WindowOperator(Operator):
+    """
+    Tumbling (slide == size) or sliding windows of an aggregate per key. Values are folded
+    into the pane of slide seconds they fall in, a window merges the size / slide panes it
+    covers when it closes.
+    """
+
+    def __init__(
+        self,
+        size: float,
+        slide: float,
+        aggregator: Aggregator,
+        key: T.Optional[KeyFunc] = None,
+        timestamp: T.Optional[Timestamp] = None,
+        max_keys: int = DEFAULT_MAX_KEYS,
+    ) -> None:
+        panes = size / slide
+        if size <= 0 or slide <= 0 or abs(panes - round(panes)) > 1e-9:
+            raise ValueError(f"Window size {size} must be a positive multiple of slide {slide}")
+        self.panes = round(panes)
+        if self.panes > 1 and aggregator.merge is None:
+            raise ValueError("Sliding windows need an aggregator with merge")
+
+        self.size = size
+        self.slide = slide
+        self.aggregator = aggregator
+        self.key = key
+        self.timestamp = timestamp
+        self.max_keys = max_keys
+        self.late = 0
+        self.overflow = 0
+        self._partials: T.Dict[int, T.Dict[T.Hashable, T.Any]] = {}
+        # Pane index the next window to close ends at
+        self._next_end: T.Optional[int] = None
+        # Newest timestamp pushed and the clock time it arrived at
+        self._newest = (-math.inf, 0.0)
+
+    def push(self, value: T.Any, now: float) -> T.List[T.Any]:
+        at = self.timestamp(value) if self.timestamp else now
+        if at > self._newest[0]:
+            self._newest = (at, now)
+        pane = math.floor(at / self.slide)
+        if self._next_end is None:
+            self._next_end = pane + 1
+        if pane < self._next_end - self.panes:
+            self.late += 1
+            return []
+
+        results = self._close(pane)
+        partials = self._partials.setdefault(pane, {})
+        key = self.key(value) if self.key is not None else None
+        if key not in partials:
+            if len(partials) >= self.max_keys:
+                self.overflow += 1
+                return results
+            partials[key] = self.aggregator.initial()
+        partials[key] = self.aggregator.add(partials[key], value)
+        return results
+
+    def flush(self, now: T.Optional[float]) -> T.List[T.Any]:
+        if not self._partials:
+            return []
+        if now is None:
+            return self._close(max(self._partials) + self.panes)
+        return self._close(math.floor(now / self.slide))
+
+    def tick(self, now: float) -> T.List[T.Any]:
+        """
+        Closes the windows that are over by the clock. Timestamped windows count the time
+        since the newest value arrived on from its timestamp.
+        """
+        if not self._partials:
+            return []
+        newest, arrived_at = self._newest
+        return self.flush(now if self.timestamp is None else newest + now - arrived_at)
+
+    def _close(self, pane: int) -> T.List[WindowResult]:
+        """Emits the windows ending at or before pane, skipping the ones with no data"""
+        assert self._next_end is not None
+        if pane < self._next_end:
+            return []
+
+        ends = sorted(
+            {
+                end
+                for index in self._partials
+                for end in range(index + 1, index + self.panes + 1)
+                if self._next_end <= end <= pane
+            }
+        )
+        results = [result for end in ends for result in self._window(end)]
+        self._next_end = pane + 1
+        for index in [index for index in self._partials if index < self._next_end - self.panes]:
+            del self._partials[index]
+        return results
+
+    def _window(self, end: int) -> T.List[WindowResult]:
+        merged: T.Dict[T.Hashable, T.Any] = {}
+        for index in range(end - self.panes, end):
+            for key, partial in self._partials.get(index, {}).items():
+                if key in merged:
+                    assert self.aggregator.merge is not None
+                    merged[key] = self.aggregator.merge(merged[key], partial)
+                else:
+                    merged[key] = partial
+        start = (end - self.panes) * self.slide
+        return [
+            WindowResult(start, start + self.size, key, self.aggregator.result(partial))
+            for key, partial in merged.items()
+        ]
+
+
+class WindowedStream:
+    """A stream between window() and the aggregate() that completes it"""
+
+    def __init__(
+        self, stream: "Stream", size: float, slide: float, timestamp: T.Optional[Timestamp]
+    ) -> None:
+        self.stream = stream
+        self.size = size
+        self.slide = slide
+        self.timestamp = timestamp
+
+    def aggregate(
+        self,
+        aggregator: Aggregator,
+        key: T.Optional[KeyFunc] = None,
+        max_keys: int = DEFAULT_MAX_KEYS,
+    ) -> "Stream":
+        """Emits a WindowResult per key for every window that closes"""
+        return self.stream.then(
+            WindowOperator(self.size, self.slide, aggregator, key, self.timestamp, max_keys)
+        )
+
+
+class Stream:
+    """Operators applied to every decoded message of channel"""
+
+    def __init__(self, channel: Channel, message_type: T.Optional[T.Type[Message]] = None) -> None:
+        self.channel = channel
+        # An explicit message_type overrides the codec of the channel
+        self.codec = channel.codec if message_type is None else None
+        if message_type is None and channel.pb_type is not Message:
+            message_type = channel.pb_type
+        self.message_type = message_type
+        self.operators: T.List[Operator] = []
+        self.decode_failures = 0
+        self._client: T.Any = None
+
+    def then(self, operator: Operator) -> "Stream":
+        self.operators.append(operator)
+        return self
+
+    def filter(self, predicate: T.Callable[[T.Any], bool]) -> "Stream":
+        return self.then(FilterOperator(predicate))
+
+    def map(self, func: T.Callable[[T.Any], T.Any]) -> "Stream":
+        return self.then(MapOperator(func))
+
+    def window(
+        self, size: float, slide: T.Optional[float] = None, timestamp: T.Optional[Timestamp] = None
+    ) -> WindowedStream:
+        """Tumbling windows of size seconds, or sliding ones that advance every slide"""
+        return WindowedStream(self, size, slide or size, timestamp)
+
+    def aggregate(
+        self,
+        aggregator: Aggregator,
+        key: T.Optional[KeyFunc] = None,
+        max_keys: int = DEFAULT_MAX_KEYS,
+    ) -> "Stream":
+        """Emits (key, result) of the running aggregate after every value"""
+        return self.then(AggregateOperator(aggregator, key, max_keys))
+
+    def sink(self, callback: T.Callable[[T.Any], T.Any]) -> "Stream":
+        return self.then(SinkOperator(callback))
+
+    def publish(self, channel: Channel) -> "Stream":
+        """Publishes every value to channel through the client the stream is attached to"""
+        return self.then(PublishOperator(channel))
+
+    def _run(self, values: T.List[T.Any], start: int, now: T.Optional[float]) -> None:
+        clock = time.time() if now is None else now
+        for operator in self.operators[start:]:
+            values = [output for value in values for output in operator.push(value, clock)]
+            if not values:
+                return
+
+    def process(self, value: T.Any, now: T.Optional[float] = None) -> None:
+        """Pushes an already decoded value through the operators"""
+        self._run([value], 0, now)
+
+    def _advance(self, now: T.Optional[float], due: T.Callable[[Operator], T.List[T.Any]]) -> None:
+        for index, operator in enumerate(self.operators):
+            values = due(operator)
+            if values:
+                self._run(values, index + 1, now)
+
+    def flush(self, now: T.Optional[float] = None) -> None:
+        """Closes the windows that ended by now, or every open window for None"""
+        self._advance(now, lambda operator: operator.flush(now))
+        for channel, message in self._take_outbox():
+            self._client.publish(channel, message)
+
+    async def aflush(self, now: T.Optional[float] = None) -> None:
+        """Async version of flush."""
+        self._advance(now, lambda operator: operator.flush(now))
+        for channel, message in self._take_outbox():
+            await self._client.publish(channel, message)
+
+    def tick(self, now: float) -> None:
+        """Closes the windows that are over by the clock, the attached client calls it"""
+        self._advance(now, lambda operator: operator.tick(now))
+        for channel, message in self._take_outbox():
+            self._client.publish(channel, message)
+
+    async def atick(self, now: float) -> None:
+        """Async version of tick."""
+        self._advance(now, lambda operator: operator.tick(now))
+        for channel, message in self._take_outbox():
+            await self._client.publish(channel, message)
+
+    def _decode(self, item: T.Any) -> T.Optional[T.Any]:
+        value = decode_message(item, self.message_type, codec=self.codec)
+        if value is None:
+            self.decode_failures += 1
+        return value
+
+    def _outboxes(self) -> T.Iterator[PublishOperator]:
+        for operator in self.operators:
+            if isinstance(operator, PublishOperator) and operator.outbox:
+                yield operator
+
+    def _take_outbox(self) -> T.List[T.Tuple[Channel, T.Any]]:
+        messages: T.List[T.Tuple[Channel, T.Any]] = []
+        for operator in self._outboxes():
+            messages.extend((operator.channel, value) for value in operator.outbox)
+            operator.outbox.clear()
+        if messages and self._client is None:
+            log.print_fail(f"Stream of {self.channel} is not attached, results are not published")
+            return []
+        return messages
+
+    def handle(self, item: T.Any) -> None:
+        """Subscription callback for sync clients"""
+        value = self._decode(item)
+        if value is not None:
+            self.process(value)
+        for channel, message in self._take_outbox():
+            self._client.publish(channel, message)
+
+    async def ahandle(self, item: T.Any) -> None:
+        """Subscription callback for async clients"""
+        value = self._decode(item)
+        if value is not None:
+            self.process(value)
+        for channel, message in self._take_outbox():
+            await self._client.publish(channel, message)
+
+    def attach(self, client: T.Any, options: T.Any = None) -> None:
+        """
+        Subscribes a SyncRedisClientBase or RedisClientBase, which also publishes and
+        closes windows on its steps
+        """
+        self._client = client
+        client.subscribe(self.channel, self.handle, options)
+        client.add_step_callback(self.tick)
+
+    async def aattach(self, client: T.Any, options: T.Any = None) -> None:
+        """Subscribes an AsyncRedisClientBase, which also publishes and ticks on its steps"""
+        self._client = client
+        await client.subscribe(self.channel, self.ahandle, options)
+        client.add_step_callback(self.atick)
@@ -0,0 +1,138 @@
+import collections
+import enum
+import typing as T
+from dataclasses import dataclass
+
+from google.protobuf.message import Message
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.dedup import DedupPolicy, DuplicateFilter
+from ry_redis_bus.wire import FieldPredicate, MaxAgeFilter, WireChecks, WireFilter
+
+ConflationKey = T.Callable[[T.Any], T.Hashable]
+
+
+class Priority(enum.Enum):
+    """
+    Dispatch priority of a subscription.
+
+    HIGH channels get a dedicated pubsub connection and are dispatched before anything else
+    NORMAL channels share the default connection and are dispatched round-robin
+    BULK channels share the default connection with a per-iteration dispatch budget
+    """
+
+    HIGH = "high"
+    NORMAL = "normal"
+    BULK = "bulk"
+
+
+@dataclass
+class SubscriptionOptions:
+    """
+    Per-subscription dispatch options.
+
+    conflate: only the newest pending message is handled each step, older ones are skipped
+    conflate_key: optional key function on the raw redis message. When set, the newest
+        message is kept per key instead of per channel (e.g. one pose per robot id)
+    priority: dispatch lane of the channel
+    weight: messages handled per round-robin turn, defaults to the weight of the priority
+    dedup: drop messages already received on the channel, before they are decoded
+    where: only handle messages whose protobuf fields match every predicate, checked on
+        the wire bytes before they are decoded
+    max_age: drop messages whose utime is more than max_age seconds old, read from the wire
+        bytes before they are decoded
+    """
+
+    conflate: bool = False
+    conflate_key: T.Optional[ConflationKey] = None
+    priority: Priority = Priority.NORMAL
+    weight: T.Optional[int] = None
+    dedup: T.Optional[DedupPolicy] = None
+    where: T.Optional[T.Sequence[FieldPredicate]] = None
+    max_age: T.Optional[float] = None
+
+
+def is_priority(options: T.Optional[SubscriptionOptions]) -> bool:
+    return options is not None and options.priority == Priority.HIGH
+
+
+def split_lanes(
+    channels: T.Iterable[str], subscriptions: T.Mapping[str, SubscriptionOptions]
+) -> T.Tuple[T.List[str], T.List[str]]:
+    """Splits channels into the ones of the default connection and the high priority one"""
+    normal: T.List[str] = []
+    priority: T.List[str] = []
+    for channel in channels:
+        (priority if is_priority(subscriptions.get(channel)) else normal).append(channel)
+    return normal, priority
+
+
+class MessageFilters:
+    """
+    The wire checks and duplicate filters of the subscriptions of a client, and per channel
+    counts of what each of them dropped
+    """
+
+    def __init__(self) -> None:
+        self._wire_checks: T.Dict[str, WireChecks] = {}
+        self._dedup: T.Dict[str, DuplicateFilter] = {}
+        self.filtered_out: T.Counter[str] = collections.Counter()
+        self.stale_dropped: T.Counter[str] = collections.Counter()
+        self.duplicates_skipped: T.Counter[str] = collections.Counter()
+
+    def compile(self, channel: Channel, options: T.Optional[SubscriptionOptions]) -> None:
+        """Resolves the wire checks of options against the protobuf type of channel"""
+        channel_str = str(channel)
+        self._wire_checks.pop(channel_str, None)
+        if options is None or (not options.where and options.max_age is None):
+            return
+        pb_type = channel.pb_type if isinstance(channel, Channel) else Message
+        if pb_type is Message:
+            raise ValueError(f"Channel {channel} needs a protobuf type to filter on its fields")
+        self._wire_checks[channel_str] = WireChecks(
+            WireFilter(pb_type, options.where) if options.where else None,
+            MaxAgeFilter(pb_type, options.max_age) if options.max_age is not None else None,
+        )
+
+    def discard(self, channel: str) -> None:
+        self._wire_checks.pop(channel, None)
+        self._dedup.pop(channel, None)
+
+    def drops(
+        self, channel: str, item: T.Any, options: T.Optional[SubscriptionOptions], now: float
+    ) -> bool:
+        """Counts and returns True for messages that should not be handled"""
+        return (
+            self._is_stale(channel, item, now)
+            or self._is_filtered_out(channel, item)
+            or self._is_duplicate(channel, item, options, now)
+        )
+
+    def _is_stale(self, channel: str, item: T.Any, now: float) -> bool:
+        checks = self._wire_checks.get(channel)
+        if checks is None or checks.max_age is None:
+            return False
+        if not checks.max_age.is_stale(item.get("data", b""), now):
+            return False
+        self.stale_dropped[channel] += 1
+        return True
+
+    def _is_filtered_out(self, channel: str, item: T.Any) -> bool:
+        checks = self._wire_checks.get(channel)
+        if checks is None or checks.where is None or checks.where.matches(item.get("data", b"")):
+            return False
+        self.filtered_out[channel] += 1
+        return True
+
+    def _is_duplicate(
+        self, channel: str, item: T.Any, options: T.Optional[SubscriptionOptions], now: float
+    ) -> bool:
+        if options is None or options.dedup is None:
+            return False
+        dedup = self._dedup.get(channel)
+        if dedup is None or dedup.policy is not options.dedup:
+            dedup = self._dedup[channel] = DuplicateFilter(options.dedup, now)
+        if not dedup.is_duplicate(item, now):
+            return False
+        self.duplicates_skipped[channel] += 1
+        return True
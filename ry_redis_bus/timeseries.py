@@ -0,0 +1,274 @@
+"""
+Time-series history on top of sorted sets.
+
+Each channel gets its own key scored by publish time. Writes are buffered and sent as
+one pipelined ZADD per key, old entries are trimmed with ZREMRANGEBYSCORE on a timer and
+reads page through ZRANGE BYSCORE so long scans run in constant memory.
+
+Sorted set members are unique, so an identical payload written twice keeps only the
+newest score. Payloads that repeat should carry their own timestamp (e.g. utime).
+"""
+
+import time
+import typing as T
+
+import redis
+from ryutils import log
+
+from ry_redis_bus.redis_client_base_async import AsyncRedisClientBase
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_RANGE_CHUNK = 1000
+DEFAULT_TRIM_PERIOD = 60.0
+
+Member = T.Union[str, bytes]
+Score = T.Union[float, str]
+
+
+def series_key(db_name: str, channel: str) -> str:
+    return f"{db_name}:{channel}"
+
+
+class _Page:
+    """Tracks the ZRANGE BYSCORE cursor, an offset is kept for members that tie on score"""
+
+    def __init__(self, start: Score) -> None:
+        self.low: Score = start
+        self.offset = 0
+
+    def advance(self, page: T.List[T.Tuple[bytes, float]]) -> None:
+        last_score = page[-1][1]
+        ties = sum(1 for _, score in page if score == last_score)
+        if self.low == last_score:
+            self.offset += ties
+        else:
+            self.low = last_score
+            self.offset = ties
+
+
+class _TimeSeriesBuffer:
+    def __init__(
+        self, db_name: str, retention: T.Optional[float], batch_size: int, trim_period: float
+    ) -> None:
+        self.db_name = db_name
+        self.retention = retention
+        self.batch_size = batch_size
+        self.trim_period = trim_period
+        self.keys: T.Set[str] = set()
+        self.pending: T.Dict[str, T.Dict[Member, float]] = {}
+        self.pending_count = 0
+        self.last_trim = time.time()
+
+    def add(self, channel: str, member: Member, score: T.Optional[float]) -> bool:
+        """Buffers the entry and returns True once a batch is ready to flush"""
+        key = series_key(self.db_name, channel)
+        self.keys.add(key)
+        mapping = self.pending.setdefault(key, {})
+        # A member written again replaces its score, so it is only counted once
+        self.pending_count += member not in mapping
+        mapping[member] = time.time() if score is None else score
+        return self.pending_count >= self.batch_size
+
+    def take(self) -> T.Dict[str, T.Dict[Member, float]]:
+        pending = self.pending
+        self.pending = {}
+        self.pending_count = 0
+        return pending
+
+    def restore(self, pending: T.Dict[str, T.Dict[Member, float]]) -> None:
+        """Puts a batch that failed to write back, behind what was added since"""
+        for key, mapping in pending.items():
+            current = self.pending.setdefault(key, {})
+            for member, score in mapping.items():
+                if member not in current:
+                    current[member] = score
+                    self.pending_count += 1
+
+    def trim_due(self, now: float) -> bool:
+        return self.retention is not None and now - self.last_trim >= self.trim_period
+
+
+class TimeSeriesWriter:
+    """Pipelined time-series writer and range reader for a SyncRedisClientBase"""
+
+    def __init__(
+        self,
+        redis_client: SyncRedisClientBase,
+        retention: T.Optional[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        trim_period: float = DEFAULT_TRIM_PERIOD,
+    ) -> None:
+        self.redis_client = redis_client
+        self._buffer = _TimeSeriesBuffer(
+            redis_client.redis_info.db_name, retention, batch_size, trim_period
+        )
+
+    def append(self, channel: str, member: Member, score: T.Optional[float] = None) -> None:
+        """Queues an entry scored by score, or by the current time"""
+        if self._buffer.add(str(channel), member, score):
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes everything buffered in one pipeline round trip. A batch that fails stays
+        buffered for the next flush.
+        """
+        pending = self._buffer.take()
+        if not pending:
+            return 0
+
+        pipeline = self.redis_client.client.pipeline(transaction=False)
+        for key, mapping in pending.items():
+            pipeline.zadd(key, T.cast(T.Dict[T.Any, float], mapping))
+        try:
+            pipeline.execute()
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to write time-series batch: {exc}")
+            self._buffer.restore(pending)
+            return 0
+        return sum(len(mapping) for mapping in pending.values())
+
+    def trim(self, now: T.Optional[float] = None) -> int:
+        """Removes every entry older than the retention from the written keys"""
+        if self._buffer.retention is None or not self._buffer.keys:
+            return 0
+
+        now = time.time() if now is None else now
+        self._buffer.last_trim = now
+        pipeline = self.redis_client.client.pipeline(transaction=False)
+        for key in self._buffer.keys:
+            pipeline.zremrangebyscore(key, "-inf", f"({now - self._buffer.retention}")
+        try:
+            return sum(T.cast(T.List[int], pipeline.execute()))
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to trim time-series: {exc}")
+            return 0
+
+    def step(self) -> None:
+        """Flushes pending writes and trims on schedule, call it from the run loop"""
+        self.flush()
+        now = time.time()
+        if self._buffer.trim_due(now):
+            self.trim(now)
+
+    def range(
+        self,
+        channel: str,
+        start: Score = "-inf",
+        end: Score = "+inf",
+        chunk: int = DEFAULT_RANGE_CHUNK,
+    ) -> T.Iterator[T.Tuple[bytes, float]]:
+        """Yields (member, score) pairs between start and end, fetching chunk at a time"""
+        key = series_key(self._buffer.db_name, str(channel))
+        cursor = _Page(start)
+        while True:
+            page = T.cast(
+                T.List[T.Tuple[bytes, float]],
+                self.redis_client.client.zrange(
+                    key,
+                    cursor.low,
+                    end,
+                    byscore=True,
+                    offset=cursor.offset,
+                    num=chunk,
+                    withscores=True,
+                ),
+            )
+            yield from page
+            if len(page) < chunk:
+                return
+            cursor.advance(page)
+
+
+class AsyncTimeSeriesWriter:
+    """Pipelined time-series writer and range reader for an AsyncRedisClientBase"""
+
+    def __init__(
+        self,
+        redis_client: AsyncRedisClientBase,
+        retention: T.Optional[float] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        trim_period: float = DEFAULT_TRIM_PERIOD,
+    ) -> None:
+        self.redis_client = redis_client
+        self._buffer = _TimeSeriesBuffer(
+            redis_client.redis_info.db_name, retention, batch_size, trim_period
+        )
+
+    async def append(self, channel: str, member: Member, score: T.Optional[float] = None) -> None:
+        """Queues an entry scored by score, or by the current time"""
+        if self._buffer.add(str(channel), member, score):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Writes everything buffered in one pipeline round trip. A batch that fails stays
+        buffered for the next flush.
+        """
+        pending = self._buffer.take()
+        if not pending:
+            return 0
+
+        pipeline = (await self.redis_client.client).pipeline(transaction=False)
+        for key, mapping in pending.items():
+            pipeline.zadd(key, T.cast(T.Dict[T.Any, float], mapping))
+        try:
+            await pipeline.execute()
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to write time-series batch: {exc}")
+            self._buffer.restore(pending)
+            return 0
+        return sum(len(mapping) for mapping in pending.values())
+
+    async def trim(self, now: T.Optional[float] = None) -> int:
+        """Removes every entry older than the retention from the written keys"""
+        if self._buffer.retention is None or not self._buffer.keys:
+            return 0
+
+        now = time.time() if now is None else now
+        self._buffer.last_trim = now
+        pipeline = (await self.redis_client.client).pipeline(transaction=False)
+        for key in self._buffer.keys:
+            pipeline.zremrangebyscore(key, "-inf", f"({now - self._buffer.retention}")
+        try:
+            return sum(T.cast(T.List[int], await pipeline.execute()))
+        except redis.exceptions.RedisError as exc:
+            log.print_fail(f"Failed to trim time-series: {exc}")
+            return 0
+
+    async def step(self) -> None:
+        """Flushes pending writes and trims on schedule, call it from the run loop"""
+        await self.flush()
+        now = time.time()
+        if self._buffer.trim_due(now):
+            await self.trim(now)
+
+    async def range(
+        self,
+        channel: str,
+        start: Score = "-inf",
+        end: Score = "+inf",
+        chunk: int = DEFAULT_RANGE_CHUNK,
+    ) -> T.AsyncIterator[T.Tuple[bytes, float]]:
+        """Yields (member, score) pairs between start and end, fetching chunk at a time"""
+        key = series_key(self._buffer.db_name, str(channel))
+        cursor = _Page(start)
+        while True:
+            page = T.cast(
+                T.List[T.Tuple[bytes, float]],
+                await (await self.redis_client.client).zrange(
+                    key,
+                    cursor.low,
+                    end,
+                    byscore=True,
+                    offset=cursor.offset,
+                    num=chunk,
+                    withscores=True,
+                ),
+            )
+            for entry in page:
+                yield entry
+            if len(page) < chunk:
+                return
+            cursor.advance(page)
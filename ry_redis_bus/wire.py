@@ -0,0 +1,261 @@
+"""
+Predicates on protobuf fields evaluated on the wire bytes.
+
+A subscription with SubscriptionOptions(where=[FieldPredicate("robot_id", 7)]) only hands
+messages on where robot_id is 7. The field is resolved by name or number through the
+descriptor of the channel's protobuf type when subscribing, and each message is checked
+by walking its top-level fields up to the wanted one, without parsing the message. Only
+singular scalar, string and bytes fields can be tested. A field missing from the bytes
+has its default value. Serializers write each field once; bytes of concatenated messages,
+where parsing keeps the last value, are judged by the first. Payloads that are not valid
+protobuf are passed on for the handler to report.
+
+SubscriptionOptions(max_age=...) reads the utime Timestamp the same way, so messages that
+waited too long in a backlog are dropped before they cost a decode and a handler call.
+"""
+
+import struct
+import typing as T
+from dataclasses import dataclass
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.message import Message
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+_MISSING = object()
+
+
+class WireError(ValueError):
+    pass
+
+
+def read_varint(data: bytes, position: int) -> T.Tuple[int, int]:
+    """Value of the varint at position and the position after it"""
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+    result = byte & 0x7F
+    shift = 7
+    position += 1
+    while True:
+        if position >= len(data) or shift > 63:
+            raise WireError("Truncated varint")
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def scan_field(data: bytes, number: int) -> T.Tuple[int, T.Any]:
+    """
+    Wire type and raw value of the first occurrence of top-level field number: an int for
+    varints, bytes for the others. The value is a sentinel when the field is missing.
+    """
+    position = 0
+    end = len(data)
+    while position < end:
+        key = data[position]
+        if key < 0x80:
+            position += 1
+        else:
+            key, position = read_varint(data, position)
+        wire_type = key & 0x7
+        if wire_type == WIRE_VARINT:
+            if key >> 3 == number:
+                return wire_type, read_varint(data, position)[0]
+            while data[position] & 0x80:
+                position += 1
+            position += 1
+            continue
+        if wire_type == WIRE_LENGTH_DELIMITED:
+            length, position = read_varint(data, position)
+        elif wire_type == WIRE_FIXED64:
+            length = 8
+        elif wire_type == WIRE_FIXED32:
+            length = 4
+        else:
+            raise WireError(f"Unsupported wire type {wire_type}")
+        if position + length > end:
+            raise WireError("Truncated field")
+        if key >> 3 == number:
+            return wire_type, data[position : position + length]
+        position += length
+    return -1, _MISSING
+
+
+def _signed(bits: int) -> T.Callable[[int], int]:
+    def convert(value: int) -> int:
+        value &= (1 << bits) - 1
+        return value - (1 << bits) if value >> (bits - 1) else value
+
+    return convert
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _unpack(fmt: str) -> T.Callable[[bytes], T.Any]:
+    return lambda value: struct.unpack(fmt, value)[0]
+
+
+_VARINT_TYPES: T.Dict[int, T.Callable[[int], T.Any]] = {
+    FieldDescriptor.TYPE_INT32: _signed(32),
+    FieldDescriptor.TYPE_INT64: _signed(64),
+    FieldDescriptor.TYPE_UINT32: int,
+    FieldDescriptor.TYPE_UINT64: int,
+    FieldDescriptor.TYPE_ENUM: _signed(32),
+    FieldDescriptor.TYPE_BOOL: bool,
+    FieldDescriptor.TYPE_SINT32: _zigzag,
+    FieldDescriptor.TYPE_SINT64: _zigzag,
+}
+
+_FIXED_TYPES: T.Dict[int, T.Tuple[int, T.Callable[[bytes], T.Any]]] = {
+    FieldDescriptor.TYPE_FIXED32: (WIRE_FIXED32, _unpack("<I")),
+    FieldDescriptor.TYPE_SFIXED32: (WIRE_FIXED32, _unpack("<i")),
+    FieldDescriptor.TYPE_FLOAT: (WIRE_FIXED32, _unpack("<f")),
+    FieldDescriptor.TYPE_FIXED64: (WIRE_FIXED64, _unpack("<Q")),
+    FieldDescriptor.TYPE_SFIXED64: (WIRE_FIXED64, _unpack("<q")),
+    FieldDescriptor.TYPE_DOUBLE: (WIRE_FIXED64, _unpack("<d")),
+    FieldDescriptor.TYPE_STRING: (WIRE_LENGTH_DELIMITED, lambda value: value.decode()),
+    FieldDescriptor.TYPE_BYTES: (WIRE_LENGTH_DELIMITED, bytes),
+}
+
+
+@dataclass
+class FieldPredicate:
+    """
+    Condition on one top-level field, given by name or number: equal to equals, or test
+    returning True for the decoded value when given.
+    """
+
+    field: T.Union[str, int]
+    equals: T.Any = None
+    test: T.Optional[T.Callable[[T.Any], bool]] = None
+
+
+def is_repeated(field: FieldDescriptor) -> bool:
+    # Newer protobuf releases drop label in favour of is_repeated
+    if hasattr(field, "is_repeated"):
+        return bool(field.is_repeated)
+    return bool(getattr(field, "label") == FieldDescriptor.LABEL_REPEATED)
+
+
+class FieldReader:
+    """Reads one scalar field of a message type from its wire bytes"""
+
+    def __init__(self, descriptor: T.Any, field: T.Union[str, int]) -> None:
+        fields = (
+            descriptor.fields_by_number if isinstance(field, int) else descriptor.fields_by_name
+        )
+        if field not in fields:
+            raise ValueError(f"{descriptor.full_name} has no field {field!r}")
+        field_descriptor = fields[field]  # type: ignore[index]
+        if is_repeated(field_descriptor):
+            raise ValueError(f"{field_descriptor.full_name} is repeated")
+
+        self.name = field_descriptor.name
+        self.number = field_descriptor.number
+        self.default = field_descriptor.default_value
+        field_type = field_descriptor.type
+        if field_type in _VARINT_TYPES:
+            self.wire_type = WIRE_VARINT
+            self.convert: T.Callable[[T.Any], T.Any] = _VARINT_TYPES[field_type]
+        elif field_type in _FIXED_TYPES:
+            self.wire_type, self.convert = _FIXED_TYPES[field_type]
+        else:
+            raise ValueError(f"{field_descriptor.full_name} is not a scalar field")
+
+    def read(self, data: bytes) -> T.Any:
+        wire_type, value = scan_field(data, self.number)
+        if value is _MISSING:
+            return self.default
+        if wire_type != self.wire_type:
+            raise WireError(f"Field {self.name} has wire type {wire_type}")
+        return self.convert(value)
+
+
+class WireFilter:
+    """All the predicates of a subscription, resolved against its message type"""
+
+    def __init__(
+        self, message_type: T.Type[Message], predicates: T.Sequence[FieldPredicate]
+    ) -> None:
+        descriptor = message_type.DESCRIPTOR
+        self.checks = [
+            (FieldReader(descriptor, predicate.field), predicate) for predicate in predicates
+        ]
+
+    def matches(self, data: T.Any) -> bool:
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            for reader, predicate in self.checks:
+                value = reader.read(data)
+                if predicate.test is not None:
+                    if not predicate.test(value):
+                        return False
+                elif value != predicate.equals:
+                    return False
+        except (WireError, IndexError, UnicodeDecodeError, struct.error):
+            return True
+        return True
+
+
+class PublishTimeReader:
+    """Reads the seconds of a google.protobuf.Timestamp field, utime by default"""
+
+    def __init__(self, message_type: T.Type[Message], field: str = "utime") -> None:
+        descriptor = message_type.DESCRIPTOR
+        field_descriptor = descriptor.fields_by_name.get(field)
+        if (
+            field_descriptor is None
+            or field_descriptor.message_type is None
+            or field_descriptor.message_type.full_name != "google.protobuf.Timestamp"
+        ):
+            raise ValueError(f"{descriptor.full_name} has no Timestamp field {field!r}")
+        self.number = field_descriptor.number
+
+    def read(self, data: bytes) -> T.Optional[float]:
+        """Publish time in seconds, None when it was not set"""
+        wire_type, timestamp = scan_field(data, self.number)
+        if timestamp is _MISSING:
+            return None
+        if wire_type != WIRE_LENGTH_DELIMITED:
+            raise WireError(f"Timestamp field has wire type {wire_type}")
+        _, seconds = scan_field(timestamp, 1)
+        _, nanos = scan_field(timestamp, 2)
+        seconds = 0 if seconds is _MISSING else _signed(64)(seconds)
+        nanos = 0 if nanos is _MISSING else _signed(32)(nanos)
+        return float(seconds + nanos / 1_000_000_000)
+
+
+class MaxAgeFilter:
+    """Tells messages published more than max_age seconds ago from their wire bytes"""
+
+    def __init__(self, message_type: T.Type[Message], max_age: float) -> None:
+        self.reader = PublishTimeReader(message_type)
+        self.max_age = max_age
+
+    def is_stale(self, data: T.Any, now: float) -> bool:
+        if isinstance(data, str):
+            data = data.encode()
+        try:
+            published = self.reader.read(data)
+        except (WireError, IndexError, TypeError):
+            return False
+        return published is not None and now - published > self.max_age
+
+
+@dataclass
+class WireChecks:
+    """The checks a subscription makes on the wire bytes of its messages"""
+
+    where: T.Optional[WireFilter] = None
+    max_age: T.Optional[MaxAgeFilter] = None
@@ -0,0 +1,207 @@
+import os
+import tempfile
+import typing as T
+import unittest
+from unittest import mock
+
+from google.protobuf import descriptor_pool, message_factory
+from google.protobuf.descriptor_pb2 import (  # pylint: disable=no-name-in-module
+    FieldDescriptorProto,
+    FileDescriptorProto,
+)
+from google.protobuf.message import Message
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.archive import (
+    WRITERS,
+    ArchivePolicy,
+    ArchiveSink,
+    archive_files,
+    flatten_fields,
+    read_columns,
+)
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.codec import optional_import
+from ry_redis_bus.ipc_logger import LogIpcMessage
+
+# 2026-10-19 05:00:00 UTC
+HOUR = 1792386000.0
+
+
+def make_pose_type() -> T.Type[Message]:
+    file_proto = FileDescriptorProto(
+        name="test/archive_pose.proto",
+        package="archive_test",
+        syntax="proto3",
+        dependency=["google/protobuf/timestamp.proto"],
+    )
+    point = file_proto.message_type.add(name="Point")
+    point.field.add(name="x", number=1, type=FieldDescriptorProto.TYPE_DOUBLE)
+    point.field.add(name="y", number=2, type=FieldDescriptorProto.TYPE_DOUBLE)
+
+    pose_proto = file_proto.message_type.add(name="Pose")
+    pose_proto.field.add(
+        name="utime",
+        number=1,
+        type=FieldDescriptorProto.TYPE_MESSAGE,
+        type_name=".google.protobuf.Timestamp",
+    )
+    pose_proto.field.add(name="robot", number=2, type=FieldDescriptorProto.TYPE_STRING)
+    pose_proto.field.add(
+        name="position",
+        number=3,
+        type=FieldDescriptorProto.TYPE_MESSAGE,
+        type_name=".archive_test.Point",
+    )
+    pose_proto.field.add(name="raw", number=4, type=FieldDescriptorProto.TYPE_BYTES)
+    pose_proto.field.add(
+        name="path",
+        number=5,
+        type=FieldDescriptorProto.TYPE_MESSAGE,
+        type_name=".archive_test.Point",
+        label=FieldDescriptorProto.LABEL_REPEATED,
+    )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(Timestamp.DESCRIPTOR.file.serialized_pb)
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("archive_test.Pose"))
+
+
+POSE_TYPE = make_pose_type()
+POSE = Channel("robot/pose", POSE_TYPE)
+RAW = Channel("raw", None)
+
+
+def log_msg(channel: Channel, logged: float, data: bytes) -> LogIpcMessage:
+    utime = Timestamp()
+    utime.FromNanoseconds(int(logged * 1e9))
+    return LogIpcMessage(utime=utime, message=data, channel=channel.name)
+
+
+def pose(x: float, robot: str = "arm") -> bytes:
+    message = T.cast(T.Any, POSE_TYPE(robot=robot, raw=b"\x00"))
+    message.utime.FromSeconds(int(HOUR))
+    message.position.x = x
+    message.path.add(x=1.0)
+    return T.cast(bytes, message.SerializeToString())
+
+
+class FlattenTest(unittest.TestCase):
+    def test_scalar_columns(self) -> None:
+        columns = flatten_fields(POSE_TYPE.DESCRIPTOR)
+        self.assertEqual(
+            [name for name, _ in columns], ["utime", "robot", "position.x", "position.y"]
+        )
+
+        message = POSE_TYPE.FromString(pose(2.5))
+        self.assertEqual([getter(message) for _, getter in columns], [HOUR, "arm", 2.5, 0.0])
+
+
+@unittest.skipIf(optional_import("numpy") is None, "numpy is not installed")
+class NpzArchiveTest(unittest.TestCase):
+    FORMAT = "npz"
+
+    def setUp(self) -> None:
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def make_sink(self, **kwargs: T.Any) -> ArchiveSink:
+        policy = ArchivePolicy(self.directory, format=self.FORMAT, **kwargs)
+        return ArchiveSink(policy, [POSE, RAW])
+
+    def test_partitions_by_channel_and_hour(self) -> None:
+        sink = self.make_sink()
+        sink.add(log_msg(POSE, HOUR + 10, pose(1.0)), now=HOUR + 10)
+        sink.add(log_msg(POSE, HOUR + 20, pose(2.0)), now=HOUR + 20)
+        sink.add(log_msg(POSE, HOUR + 3610, pose(3.0)), now=HOUR + 3610)
+        sink.close()
+
+        self.assertEqual(sink.rows_written, 3)
+        files = archive_files(self.directory, POSE.name)
+        self.assertEqual(len(files), 2)
+        self.assertIn(os.path.join("channel=robot%2Fpose", "hour=2026101905"), files[0])
+        self.assertEqual(len(archive_files(self.directory, POSE.name, hours={"2026101906"})), 1)
+
+        columns = read_columns(self.directory, POSE.name, ["log_time", "position.x"])
+        self.assertEqual(columns["position.x"], [1.0, 2.0, 3.0])
+        self.assertEqual(columns["log_time"], [HOUR + 10, HOUR + 20, HOUR + 3610])
+        self.assertEqual(
+            read_columns(self.directory, POSE.name, ["robot"], hours={"2026101905"}),
+            {"robot": ["arm", "arm"]},
+        )
+
+    def test_rolls_over_on_rows_and_age(self) -> None:
+        sink = self.make_sink(max_rows=2, max_delay=60.0)
+        for second in range(3):
+            sink.add(log_msg(POSE, HOUR + second, pose(float(second))), now=HOUR + second)
+        self.assertEqual((sink.files_written, sink.rows_written), (1, 2))
+
+        sink.add(log_msg(RAW, HOUR + 100, b"x"), now=HOUR + 100)
+        self.assertEqual((sink.files_written, sink.rows_written), (2, 3))
+
+    def test_unknown_channels_and_bad_payloads(self) -> None:
+        sink = self.make_sink()
+        sink.add(log_msg(RAW, HOUR, b"x"), now=HOUR)
+        sink.add(log_msg(POSE, HOUR, b"\xff\xff"), now=HOUR)
+        sink.close()
+
+        self.assertEqual(sink.skipped["raw"], 1)
+        self.assertEqual(sink.decode_failures[POSE.name], 1)
+        self.assertEqual(sink.files_written, 0)
+
+    def test_failed_writes_keep_their_rows(self) -> None:
+        sink = self.make_sink(max_rows=2)
+
+        def failing(path: str, columns: T.Dict[str, T.List[T.Any]]) -> None:
+            del columns
+            with open(path, "wb") as partial:
+                partial.write(b"half")
+            raise ValueError("cannot convert")
+
+        with mock.patch.dict(WRITERS, {self.FORMAT: failing}):
+            for index in range(2):
+                at = HOUR + index / 10
+                sink.add(log_msg(POSE, at, pose(float(index))), now=at)
+        self.assertEqual((sink.write_failures, sink.files_written), (1, 0))
+        leftovers = [name for _, _, names in os.walk(self.directory) for name in names]
+        self.assertEqual(leftovers, [])
+
+        sink.close()
+        self.assertEqual((sink.files_written, sink.rows_written), (1, 2))
+        columns = read_columns(self.directory, POSE.name, ["position.x"])
+        self.assertEqual(columns["position.x"], [0.0, 1.0])
+
+    def test_failing_buffers_keep_the_newest_rows(self) -> None:
+        sink = self.make_sink(max_rows=10)
+
+        def failing(path: str, columns: T.Dict[str, T.List[T.Any]]) -> None:
+            del path, columns
+            raise OSError("No space left on device")
+
+        with mock.patch.dict(WRITERS, {self.FORMAT: failing}):
+            # Within one flush check, so the full buffer is only tried once
+            for index in range(25):
+                at = HOUR + index / 100
+                sink.add(log_msg(POSE, at, pose(float(index))), now=at)
+        self.assertEqual(sink.write_failures, 1)
+        self.assertEqual(sink.rows_dropped[POSE.name], 15)
+
+        sink.close()
+        columns = read_columns(self.directory, POSE.name, ["position.x"])
+        self.assertEqual(columns["position.x"], [float(index) for index in range(15, 25)])
+
+    def test_unknown_format(self) -> None:
+        with self.assertRaises(ValueError):
+            ArchiveSink(ArchivePolicy(self.directory, format="csv"), [POSE])
+
+
+@unittest.skipIf(optional_import("pyarrow.parquet") is None, "pyarrow is not installed")
+class ParquetArchiveTest(NpzArchiveTest):
+    FORMAT = "parquet"
+
+
+if __name__ == "__main__":
+    unittest.main()
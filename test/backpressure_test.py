@@ -0,0 +1,54 @@
+import unittest
+
+from ry_redis_bus.backpressure import (
+    BufferStats,
+    LoadShedder,
+    SheddingPolicy,
+    parse_client_list,
+)
+from ry_redis_bus.subscription import Priority, SubscriptionOptions
+
+
+class BackpressureTest(unittest.TestCase):
+    def test_parse_client_list_sums_own_pubsub_connections(self) -> None:
+        clients = [
+            {"name": "me", "sub": "3", "psub": "0", "omem": "1024", "qbuf": "10"},
+            {"name": "me", "sub": "0", "psub": "1", "omem": "2048", "qbuf": "0"},
+            {"name": "me", "sub": "0", "psub": "0", "omem": "99999", "qbuf": "0"},
+            {"name": "other", "sub": "1", "psub": "0", "omem": "99999", "qbuf": "0"},
+        ]
+
+        stats = parse_client_list("me", clients, backlog=5, now=1.0)
+
+        self.assertEqual(stats.omem, 3072)
+        self.assertEqual(stats.qbuf, 10)
+        self.assertEqual(stats.connections, 2)
+        self.assertEqual(stats.backlog, 5)
+
+    def test_policy_hysteresis(self) -> None:
+        policy = SheddingPolicy(omem_high_water=100, omem_low_water=10)
+
+        self.assertTrue(policy.should_start(BufferStats(omem=150)))
+        self.assertFalse(policy.should_stop(BufferStats(omem=50)))
+        self.assertTrue(policy.should_stop(BufferStats(omem=5)))
+        self.assertTrue(policy.should_start(BufferStats(backlog=policy.backlog_high_water)))
+
+    def test_shedder_pauses_bulk_channels_until_caught_up(self) -> None:
+        shedder = LoadShedder(SheddingPolicy(omem_high_water=100, omem_low_water=10), "client")
+        subscriptions = {
+            "pose": SubscriptionOptions(),
+            "logs": SubscriptionOptions(priority=Priority.BULK),
+        }
+        self.assertTrue(shedder.due(10.0))
+        self.assertFalse(shedder.due(11.0))
+
+        self.assertEqual(
+            shedder.update(BufferStats(omem=150), subscriptions, False), (["logs"], [])
+        )
+        self.assertTrue(shedder.conflates(priority=False))
+        self.assertFalse(shedder.conflates(priority=True))
+        self.assertEqual(shedder.update(BufferStats(omem=50), subscriptions, False), ([], []))
+
+        self.assertEqual(shedder.update(BufferStats(omem=5), subscriptions, False), ([], ["logs"]))
+        self.assertFalse(shedder.active)
+        self.assertEqual(shedder.paused, set())
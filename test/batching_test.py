@@ -0,0 +1,95 @@
+# pylint: disable=protected-access
+import typing as T
+import unittest
+from test.conflation_test import QueuePubSub
+from test.memory_test_base import make_item
+
+import numpy as np
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.batching import batch_message_handler, to_columns
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+
+def time_item(seconds: int) -> T.Dict[str, T.Any]:
+    return make_item("time", Timestamp(seconds=seconds, nanos=seconds * 10).SerializeToString())
+
+
+class ToColumnsTest(unittest.TestCase):
+    def test_protobuf_fields(self) -> None:
+        messages = [Timestamp(seconds=i, nanos=i * 10) for i in range(3)]
+
+        columns = to_columns(messages, ["seconds", "nanos"])
+
+        np.testing.assert_array_equal(columns["seconds"], [0, 1, 2])
+        np.testing.assert_array_equal(columns["nanos"], [0, 10, 20])
+
+    def test_numpy_records(self) -> None:
+        dtype = np.dtype([("x", "<f4"), ("seq", "<u4")])
+        records = [np.array([(1.0, 1), (2.0, 2)], dtype=dtype), np.array([(3.0, 3)], dtype=dtype)]
+
+        columns = to_columns(records, ["seq"])
+
+        np.testing.assert_array_equal(columns["seq"], [1, 2, 3])
+
+
+class SyncBatchHandlerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = SyncRedisClientBase(
+            RedisInfo("localhost", 6379, 0, "", "", "test_db"),
+            verbose=Verbose(),
+        )
+        self.client._pubsub = QueuePubSub([])  # type: ignore[assignment]
+        self.client.cooldown = 0.0
+        self.batches: T.List[T.Any] = []
+
+    def push(self, count: int) -> None:
+        pubsub = T.cast(QueuePubSub, self.client._pubsub)
+        pubsub.items.extend(time_item(i) for i in range(count))
+
+    def test_one_call_per_step(self) -> None:
+        @batch_message_handler
+        def on_times(messages: T.List[Timestamp]) -> None:
+            self.batches.append([message.seconds for message in messages])
+
+        self.client.subscribe(Channel("time", None), on_times)
+        self.push(5)
+        self.client.step()
+
+        self.assertEqual(self.batches, [[0, 1, 2, 3, 4]])
+
+    def test_max_batch_splits_columns(self) -> None:
+        @batch_message_handler(fields=["seconds"], max_batch=2, message_type=Timestamp)
+        def on_times(columns: T.Dict[str, np.ndarray]) -> None:
+            self.batches.append(columns["seconds"].tolist())
+
+        self.client.subscribe(Channel("time", None), on_times)
+        self.push(5)
+        self.client.step()
+
+        self.assertEqual(self.batches, [[0, 1], [2, 3], [4]])
+
+    def test_max_delay_holds_batch_across_steps(self) -> None:
+        @batch_message_handler(max_delay=60.0)
+        def on_times(messages: T.List[Timestamp]) -> None:
+            self.batches.append(len(messages))
+
+        self.client.subscribe(Channel("time", None), on_times)
+        self.push(2)
+        self.client.step()
+        self.push(3)
+        self.client.step()
+
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.client.backlog, 5)
+
+        self.client.stop()
+
+        self.assertEqual(self.batches, [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
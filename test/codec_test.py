@@ -0,0 +1,131 @@
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase, make_item
+
+import numpy as np
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.codec import (
+    Codec,
+    CodecError,
+    JsonCodec,
+    MsgpackCodec,
+    NumpyCodec,
+    ProtobufCodec,
+    StructCodec,
+    codec_registry,
+    encode_message,
+)
+from ry_redis_bus.helpers import message_handler
+
+POSE_DTYPE = np.dtype([("utime", "<f8"), ("x", "<f4"), ("y", "<f4"), ("seq", "<u4")])
+
+
+class CodecTest(unittest.TestCase):
+    def test_round_trips(self) -> None:
+        timestamp = Timestamp(seconds=12, nanos=34)
+        cases: T.List[T.Tuple[T.Any, T.Any]] = [
+            (ProtobufCodec(Timestamp), timestamp),
+            (MsgpackCodec(), {"x": 1.5, "ids": [1, 2, 3], "raw": b"\x00"}),
+            (JsonCodec(), {"x": 1.5, "ids": [1, 2, 3]}),
+            (StructCodec("<dI"), (1.5, 7)),
+        ]
+        for codec, message in cases:
+            with self.subTest(codec=codec):
+                self.assertEqual(codec.decode(codec.encode(message)), message)
+
+    def test_numpy_records(self) -> None:
+        codec = NumpyCodec(POSE_DTYPE)
+        records = np.array([(1.0, 2.0, 3.0, 4), (5.0, 6.0, 7.0, 8)], dtype=POSE_DTYPE)
+
+        decoded = codec.decode(codec.encode(records))
+
+        np.testing.assert_array_equal(decoded, records)
+        with self.assertRaises(CodecError):
+            codec.decode(b"\x00" * (POSE_DTYPE.itemsize + 1))
+
+    def test_decode_errors(self) -> None:
+        with self.assertRaises(CodecError):
+            StructCodec("<dI").decode(b"\x00")
+        with self.assertRaises(CodecError):
+            JsonCodec().decode(b"{")
+
+    def test_raw_codec_takes_only_bytes_and_str(self) -> None:
+        self.assertEqual(Codec().encode("abc"), b"abc")
+        self.assertEqual(Codec().encode(bytearray(b"abc")), b"abc")
+        with self.assertRaises(CodecError):
+            Codec().encode(3)
+
+
+class ChannelCodecTest(unittest.TestCase):
+    def tearDown(self) -> None:
+        codec_registry.unregister("codec_test_pose")
+
+    def test_protobuf_is_default(self) -> None:
+        channel = Channel("codec_test_time", None)
+        self.assertIsNone(channel.codec)
+        self.assertIsNone(codec_registry.get("codec_test_time"))
+        self.assertEqual(
+            encode_message(str(channel), Timestamp(seconds=1)),
+            Timestamp(seconds=1).SerializeToString(),
+        )
+
+    def test_message_handler_uses_registered_codec(self) -> None:
+        channel = Channel("codec_test_pose", None, NumpyCodec(POSE_DTYPE))
+        self.assertIsNone(codec_registry.get("codec_test_pose"))
+        codec_registry.register(channel)
+        received: T.List[T.Any] = []
+
+        @message_handler(warn_latency=False)
+        def on_pose(message: np.ndarray) -> None:
+            received.append(message)
+
+        record = np.array([(1.0, 2.0, 3.0, 4)], dtype=POSE_DTYPE)
+        on_pose(make_item(str(channel), NumpyCodec(POSE_DTYPE).encode(record)))
+
+        self.assertEqual(len(received), 1)
+        np.testing.assert_array_equal(received[0], record)
+
+    def test_conflicting_registrations(self) -> None:
+        codec_registry.register(Channel("codec_test_pose", None, NumpyCodec(POSE_DTYPE)))
+        # Declaring the same channel again elsewhere is fine
+        codec_registry.register(Channel("codec_test_pose", None, NumpyCodec(POSE_DTYPE)))
+
+        with self.assertRaises(CodecError):
+            codec_registry.register(Channel("codec_test_pose", None, StructCodec("<dff")))
+        with self.assertRaises(CodecError):
+            codec_registry.register(Channel("codec_test_pose", None))
+        self.assertIsInstance(codec_registry.get("codec_test_pose"), NumpyCodec)
+
+
+class SubscribedCodecTest(MemoryBrokerTestBase):
+    def test_handler_decodes_with_codec_of_subscribed_channel(self) -> None:
+        channel = Channel("codec_test_pose", None, NumpyCodec(POSE_DTYPE))
+        received: T.List[T.Any] = []
+
+        @message_handler(warn_latency=False)
+        def on_pose(message: np.ndarray) -> None:
+            received.append(message)
+
+        subscriber = self.make_client()
+        subscriber.subscribe(channel, on_pose)
+        record = np.array([(1.0, 2.0, 3.0, 4)], dtype=POSE_DTYPE)
+        self.make_client().publish(channel, record)
+        subscriber.step()
+
+        self.assertIsNone(codec_registry.get("codec_test_pose"))
+        self.assertEqual(len(received), 1)
+        np.testing.assert_array_equal(received[0], record)
+
+    def test_non_protobuf_handler_needs_a_codec(self) -> None:
+        @message_handler(warn_latency=False)
+        def on_pose(message: np.ndarray) -> None:
+            del message
+
+        with self.assertRaises(AssertionError):
+            self.make_client().subscribe(Channel("codec_test_pose", None), on_pose)
+
+
+if __name__ == "__main__":
+    unittest.main()
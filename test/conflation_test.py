@@ -0,0 +1,100 @@
+# pylint: disable=protected-access
+import typing as T
+import unittest
+from test.memory_test_base import make_item
+
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.conflation import ConflationBuffer
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+from ry_redis_bus.subscription import SubscriptionOptions
+
+
+class QueuePubSub:
+    """Minimal pubsub stand-in that returns queued messages in order"""
+
+    def __init__(self, items: T.List[T.Dict[str, T.Any]]) -> None:
+        self.items = items
+
+    def get_message(self, timeout: float = 0.0) -> T.Optional[T.Dict[str, T.Any]]:
+        del timeout
+        return self.items.pop(0) if self.items else None
+
+    def subscribe(self, *channels: str) -> None:
+        del channels
+
+    def psubscribe(self, *patterns: str) -> None:
+        del patterns
+
+    def unsubscribe(self, *channels: str) -> None:
+        del channels
+
+    def close(self) -> None:
+        pass
+
+
+class ConflationBufferTest(unittest.TestCase):
+    def test_keeps_latest_per_channel(self) -> None:
+        buffer = ConflationBuffer()
+        for i in range(5):
+            buffer.offer("pose", make_item("pose", str(i).encode()))
+        buffer.offer("status", make_item("status", b"ok"))
+
+        items, skipped = buffer.drain()
+
+        self.assertEqual([item["data"] for _, item in items], [b"4", b"ok"])
+        self.assertEqual(skipped["pose"], 4)
+        self.assertEqual(buffer.skipped["pose"], 4)
+        self.assertEqual(len(buffer), 0)
+
+    def test_keeps_latest_per_key(self) -> None:
+        buffer = ConflationBuffer()
+
+        def key(item: T.Any) -> T.Hashable:
+            return T.cast(bytes, item["data"])[:1]
+
+        for data in (b"a1", b"b1", b"a2", b"b2", b"a3"):
+            buffer.offer("pose", make_item("pose", data), key)
+
+        items, skipped = buffer.drain()
+
+        self.assertEqual([item["data"] for _, item in items], [b"b2", b"a3"])
+        self.assertEqual(skipped["pose"], 3)
+
+
+class SyncConflationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = SyncRedisClientBase(
+            RedisInfo("localhost", 6379, 0, "", "", "test_db"),
+            verbose=Verbose(verbose_types=["ipc"]),
+        )
+        self.received: T.List[bytes] = []
+        self.client._pubsub = QueuePubSub([])  # type: ignore[assignment]
+        self.client.cooldown = 0.0
+
+    def test_step_handles_only_latest(self) -> None:
+        self.client.subscribe(
+            Channel("pose", None),
+            lambda item: self.received.append(item["data"]),
+            SubscriptionOptions(conflate=True),
+        )
+        pubsub = T.cast(QueuePubSub, self.client._pubsub)
+        pubsub.items.extend(make_item("pose", str(i).encode()) for i in range(10))
+
+        self.client.step()
+
+        self.assertEqual(self.received, [b"9"])
+        self.assertEqual(self.client.conflation_skipped["pose"], 9)
+
+    def test_step_handles_all_without_conflation(self) -> None:
+        self.client.subscribe(
+            Channel("pose", None), lambda item: self.received.append(item["data"])
+        )
+        pubsub = T.cast(QueuePubSub, self.client._pubsub)
+        pubsub.items.extend(make_item("pose", str(i).encode()) for i in range(3))
+
+        self.client.step()
+
+        self.assertEqual(self.received, [b"0", b"1", b"2"])
@@ -0,0 +1,88 @@
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.dedup import BloomFilter, DedupPolicy, DuplicateFilter
+from ry_redis_bus.subscription import SubscriptionOptions
+
+STATUS = Channel("status", None)
+
+
+def item(data: bytes) -> T.Dict[str, T.Any]:
+    return {"type": "message", "channel": b"status", "data": data}
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_false_positive_rate_at_capacity(self) -> None:
+        bloom = BloomFilter(capacity=5000, false_positive_rate=0.01)
+        collisions = sum(bloom.add(b"seen%d" % value) for value in range(5000))
+        self.assertLess(collisions, 50)
+
+        false_positives = sum(b"unseen%d" % value in bloom for value in range(20000))
+        self.assertLess(false_positives / 20000, 0.02)
+        self.assertAlmostEqual(bloom.false_positive_rate(), 0.01, delta=0.003)
+        self.assertTrue(b"seen1" in bloom)
+
+    def test_invalid_sizes(self) -> None:
+        with self.assertRaises(ValueError):
+            BloomFilter(0, 0.01)
+        with self.assertRaises(ValueError):
+            BloomFilter(10, 1.0)
+
+
+class DuplicateFilterTest(unittest.TestCase):
+    def test_duplicates_within_window(self) -> None:
+        dedup = DuplicateFilter(DedupPolicy(window=10.0), now=0.0)
+
+        self.assertFalse(dedup.is_duplicate(item(b"a"), 0.0))
+        self.assertTrue(dedup.is_duplicate(item(b"a"), 1.0))
+        # Still there one window later, from the previous filter
+        self.assertTrue(dedup.is_duplicate(item(b"a"), 19.0))
+        self.assertFalse(dedup.is_duplicate(item(b"b"), 19.0))
+        self.assertFalse(dedup.is_duplicate(item(b"b"), 50.0))
+
+    def test_memory_is_bounded(self) -> None:
+        dedup = DuplicateFilter(DedupPolicy(capacity=100, false_positive_rate=0.01), now=0.0)
+        for value in range(10000):
+            dedup.is_duplicate(item(b"%d" % value), 0.0)
+
+        self.assertLess(dedup.false_positive_rate(), 0.02)
+
+    def test_message_id_key(self) -> None:
+        policy = DedupPolicy(key=lambda message: message["data"][:4])
+        dedup = DuplicateFilter(policy, now=0.0)
+
+        self.assertFalse(dedup.is_duplicate(item(b"id01first"), 0.0))
+        self.assertTrue(dedup.is_duplicate(item(b"id01again"), 0.0))
+
+
+class ClientDedupTest(MemoryBrokerTestBase):
+    def test_duplicates_are_dropped_before_the_handler(self) -> None:
+        received: T.List[bytes] = []
+        client = self.make_client()
+        client.subscribe(
+            STATUS,
+            lambda message: received.append(message["data"]),
+            SubscriptionOptions(dedup=DedupPolicy()),
+        )
+        for payload in (b"1", b"2", b"1", b"3", b"2"):
+            self.broker.publish(str(STATUS), payload)
+        client.step()
+
+        self.assertEqual(received, [b"1", b"2", b"3"])
+        self.assertEqual(client.sync_client.duplicates_skipped["status"], 2)
+
+    def test_off_by_default(self) -> None:
+        received: T.List[bytes] = []
+        client = self.make_client()
+        client.subscribe(STATUS, lambda message: received.append(message["data"]))
+        for _ in range(3):
+            self.broker.publish(str(STATUS), b"1")
+        client.step()
+
+        self.assertEqual(len(received), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# pylint: disable=protected-access
+import asyncio
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus import envelope as envelope_module
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.envelope import channel_name, intern_channel, make_item
+from ry_redis_bus.helpers import find_message_in_args
+from ry_redis_bus.redis_info import RedisInfo
+
+STATUS = Channel("status", None)
+
+
+def item(channel: bytes = b"status") -> T.Dict[str, T.Any]:
+    return {"type": "message", "pattern": None, "channel": channel, "data": b"1"}
+
+
+class ChannelNameTest(unittest.TestCase):
+    def test_names_are_interned(self) -> None:
+        first, second = channel_name(item()), channel_name(item())
+        self.assertEqual(first, "status")
+        self.assertIs(first, second)
+        self.assertIs(channel_name(make_item("status", b"1")), first)
+
+    def test_interned_names_are_bounded(self) -> None:
+        for index in range(envelope_module.MAX_INTERNED_CHANNELS + 10):
+            intern_channel(f"robot.{index}".encode())
+        self.assertLessEqual(
+            len(envelope_module._CHANNEL_NAMES),
+            envelope_module.MAX_INTERNED_CHANNELS,
+        )
+
+    def test_made_items_match_redis_items(self) -> None:
+        self.assertEqual(make_item("status", b"1"), item())
+
+    def test_find_message_in_args(self) -> None:
+        wrapped = make_item("status", b"1")
+        self.assertEqual(find_message_in_args(wrapped, (), {}), (wrapped, (), {}))
+        self.assertEqual(find_message_in_args(object, (wrapped,), {}), (wrapped, (), {}))
+        self.assertEqual(
+            find_message_in_args(object, (1, wrapped), {"b": 2}), (wrapped, (1,), {"b": 2})
+        )
+
+    def test_null_redis_info(self) -> None:
+        self.assertTrue(RedisInfo.null().is_null())
+        self.assertFalse(RedisInfo("localhost", 6379, 0, "", "", "db").is_null())
+
+
+class ClientEnvelopeTest(MemoryBrokerTestBase):
+    def test_handlers_get_the_redis_item(self) -> None:
+        received: T.List[T.Any] = []
+        client = self.make_client()
+        client.subscribe(STATUS, received.append)
+        self.broker.publish(str(STATUS), b"1")
+        client.step()
+
+        self.assertEqual(received, [item()])
+        self.assertIs(type(received[0]), dict)
+
+    def test_replaced_handler_is_used(self) -> None:
+        first: T.List[bytes] = []
+        second: T.List[bytes] = []
+        client = self.make_client()
+        client.subscribe(STATUS, lambda message: first.append(message["data"]))
+        self.broker.publish(str(STATUS), b"1")
+        client.step()
+
+        client.sync_client.channel_map["status"] = lambda message: second.append(message["data"])
+        self.broker.publish(str(STATUS), b"2")
+        client.step()
+
+        self.assertEqual((first, second), ([b"1"], [b"2"]))
+
+    def test_unsubscribe_forgets_the_dispatcher(self) -> None:
+        client = self.make_client()
+        client.subscribe(STATUS, lambda message: None)
+        self.broker.publish(str(STATUS), b"1")
+        client.step()
+        self.assertIn("status", client.sync_client._dispatchers)
+
+        client.unsubscribe(STATUS)
+        self.assertNotIn("status", client.sync_client._dispatchers)
+
+    def test_async_sync_and_coroutine_handlers(self) -> None:
+        received: T.List[T.Tuple[str, bytes]] = []
+        other = Channel("other", None)
+
+        async def on_other(message: T.Any) -> None:
+            received.append(("async", message["data"]))
+
+        async def run() -> None:
+            client = self.make_client()
+            await client.asubscribe(
+                STATUS, lambda message: received.append(("sync", message["data"]))
+            )
+            await client.asubscribe(other, on_other)
+            self.broker.publish(str(STATUS), b"1")
+            self.broker.publish(str(other), b"2")
+            await client.astep()
+            await asyncio.sleep(0)
+            await client.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(sorted(received), [("async", b"2"), ("sync", b"1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# pylint: disable=protected-access
+import asyncio
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus.key_cache import KeyCache, KeyCachePolicy, tracking_redirect
+
+
+class KeyCacheTest(unittest.TestCase):
+    def test_lru_eviction_and_stats(self) -> None:
+        cache = KeyCache(max_entries=2)
+        for key in (b"a", b"b"):
+            cache.store((key,), key, cache.epoch)
+        cache.lookup((b"a",))
+        cache.store((b"c",), b"c", cache.epoch)
+
+        self.assertEqual(cache.lookup((b"b",)), (False, None))
+        self.assertEqual(cache.lookup((b"a",)), (True, b"a"))
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (2, 1))
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_invalidation_drops_every_field_of_key(self) -> None:
+        cache = KeyCache()
+        cache.store((b"hash", b"x"), b"1", cache.epoch)
+        cache.store((b"hash", b"y"), b"2", cache.epoch)
+        cache.store((b"other",), b"3", cache.epoch)
+
+        cache.invalidate([b"hash"])
+
+        self.assertEqual(len(cache), 1)
+
+    def test_read_in_flight_during_invalidation_is_not_cached(self) -> None:
+        cache = KeyCache()
+        epoch = cache.epoch
+        cache.invalidate([b"a"])
+        cache.store((b"a",), b"old", epoch)
+
+        self.assertEqual(len(cache), 0)
+
+    def test_tracking_redirect(self) -> None:
+        self.assertEqual(tracking_redirect([b"flags", [b"on"], b"redirect", 7]), 7)
+        self.assertIsNone(tracking_redirect({"flags": ["on", "broken_redirect"], "redirect": 7}))
+        self.assertIsNone(tracking_redirect([b"flags", [b"off"], b"redirect", -1]))
+
+
+class ClientKeyCacheTest(MemoryBrokerTestBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.client = self.make_client(key_cache=KeyCachePolicy(check_period=60.0))
+        self.broker.set("mode", b"auto")
+        self.broker.hset("config", "rate", b"10")
+
+    @property
+    def cache(self) -> KeyCache:
+        assert self.client.sync_client.key_cache is not None
+        return self.client.sync_client.key_cache
+
+    def test_hot_reads_stay_local_until_invalidated(self) -> None:
+        self.assertEqual(self.client.get("mode"), b"auto")
+        self.assertEqual(self.client.get("mode"), b"auto")
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.misses), (1, 1))
+
+        self.broker.set("mode", b"manual")
+
+        self.assertEqual(self.client.get("mode"), b"manual")
+        self.assertEqual(self.cache.stats.misses, 2)
+
+    def test_hget_and_mget(self) -> None:
+        self.assertEqual(self.client.hget("config", "rate"), b"10")
+        self.assertEqual(self.client.mget(["mode", "missing"]), [b"auto", None])
+        self.assertEqual(self.client.mget(["missing", "mode"]), [None, b"auto"])
+        self.assertEqual(self.cache.stats.hits, 2)
+
+        self.broker.hset("config", "rate", b"20")
+
+        self.assertEqual(self.client.hget("config", "rate"), b"20")
+
+    def test_broken_redirect_starts_over(self) -> None:
+        self.client.get("mode")
+        reader = self.client.sync_client.key_reader
+        assert reader is not None and reader.invalidations is not None
+        reader.invalidations.close()
+        reader.checked_at = 0.0
+
+        self.broker.set("mode", b"manual")
+
+        self.assertEqual(self.client.get("mode"), b"manual")
+        self.assertIsNotNone(reader.invalidations)
+
+    def test_async_reads(self) -> None:
+        async def run() -> None:
+            self.assertEqual(await self.client.aget("mode"), b"auto")
+            self.assertEqual(await self.client.aget("mode"), b"auto")
+            self.broker.set("mode", b"manual")
+            self.assertEqual(await self.client.amget(["mode"]), [b"manual"])
+            await self.client.aclose()
+
+        asyncio.run(run())
+
+        cache = self.client.async_client.key_cache
+        assert cache is not None
+        self.assertEqual((cache.stats.hits, cache.stats.misses), (1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
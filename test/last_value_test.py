@@ -0,0 +1,58 @@
+import asyncio
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.last_value import latest_hash_key
+
+STATE = Channel("robot_state", None)
+
+
+class LastValueCacheTest(MemoryBrokerTestBase):
+    def test_new_subscribers_get_the_snapshot_first(self) -> None:
+        publisher = self.make_client(last_value_cache=True)
+        publisher.publish(STATE, b"before")
+
+        received: T.List[bytes] = []
+        subscriber = self.make_client(last_value_cache=True)
+        subscriber.subscribe(STATE, lambda item: received.append(item["data"]))
+        publisher.publish(STATE, b"live")
+        subscriber.step()
+
+        # The publish between SUBSCRIBE and HMGET is in the snapshot, its live copy is skipped
+        self.assertEqual(received, [b"live"])
+        self.assertEqual(subscriber.get_latest(STATE), b"live")
+
+        publisher.publish(STATE, b"next")
+        subscriber.step()
+        self.assertEqual(received, [b"live", b"next"])
+        self.assertEqual(subscriber.get_latest(STATE), b"next")
+
+    def test_get_latest_reads_through(self) -> None:
+        self.broker.hset(latest_hash_key(self.redis_info.db_name), str(STATE), b"stored")
+        client = self.make_client(last_value_cache=True)
+
+        self.assertEqual(client.get_latest(STATE), b"stored")
+        self.assertIsNone(client.get_latest(Channel("unknown", None)))
+        self.assertIsNone(self.make_client().get_latest(STATE))
+
+    def test_async_snapshot(self) -> None:
+        self.make_client(last_value_cache=True).publish(STATE, b"before")
+        received: T.List[bytes] = []
+
+        async def run() -> T.Optional[bytes]:
+            client = self.make_client(last_value_cache=True)
+            await client.asubscribe(STATE, lambda item: received.append(item["data"]))
+            await client.astep()
+            await asyncio.sleep(0)
+            latest = await client.aget_latest(STATE)
+            await client.aclose()
+            return latest
+
+        self.assertEqual(asyncio.run(run()), b"before")
+        self.assertEqual(received, [b"before"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+# pylint: disable=protected-access
+import typing as T
+import unittest
+import uuid
+from test.conflation_test import QueuePubSub
+from test.memory_test_base import make_item
+from test.shm_transport_test import FakeRedis
+
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo, message_handler
+from ry_redis_bus.local_router import EchoFilter, LoopbackPolicy, local_router
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+TIME = Channel("time", None)
+
+
+class EchoFilterTest(unittest.TestCase):
+    def test_consumes_one_entry_per_expected_copy(self) -> None:
+        echoes = EchoFilter(window=1.0)
+        echoes.record(make_item("time", b"a"), now=10.0, copies=2)
+
+        self.assertFalse(echoes.consume(make_item("other", b"a"), now=10.5))
+        self.assertTrue(echoes.consume(make_item("time", b"a"), now=10.5))
+        self.assertTrue(echoes.consume(make_item("time", b"a"), now=10.5))
+        self.assertFalse(echoes.consume(make_item("time", b"a"), now=10.5))
+
+    def test_expires_after_window(self) -> None:
+        echoes = EchoFilter(window=1.0)
+        echoes.record(make_item("time", b"a"), now=10.0)
+
+        self.assertFalse(echoes.consume(make_item("time", b"a"), now=11.5))
+
+    def test_bounded(self) -> None:
+        echoes = EchoFilter(window=1.0, max_entries=2)
+        for data in (b"a", b"b", b"c"):
+            echoes.record(make_item("time", data), now=10.0)
+
+        self.assertEqual(len(echoes), 2)
+        self.assertFalse(echoes.consume(make_item("time", b"a"), now=10.0))
+
+
+class SyncLoopbackTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.redis_info = RedisInfo(uuid.uuid4().hex, 6379, 0, "", "", "test_db")
+        self.publisher = self.make_client(LoopbackPolicy())
+        self.redis = FakeRedis(subscribers=1)
+        self.publisher._client = self.redis  # type: ignore[assignment]
+        self.received: T.List[Timestamp] = []
+
+    def tearDown(self) -> None:
+        self.publisher.close()
+
+    def make_client(self, loopback: T.Optional[LoopbackPolicy]) -> SyncRedisClientBase:
+        client = SyncRedisClientBase(
+            self.redis_info, verbose=Verbose(verbose_types=["ipc"]), loopback=loopback
+        )
+        client._pubsub = QueuePubSub([])  # type: ignore[assignment]
+        client.cooldown = 0.0
+        return client
+
+    def make_subscriber(self, loopback: T.Optional[LoopbackPolicy]) -> SyncRedisClientBase:
+        subscriber = self.make_client(loopback)
+        self.addCleanup(subscriber.close)
+
+        @message_handler(warn_latency=False)
+        def on_time(message: Timestamp) -> None:
+            self.received.append(message)
+
+        subscriber.subscribe(TIME, on_time)
+        return subscriber
+
+    def echo(self, subscriber: SyncRedisClientBase) -> None:
+        pubsub = T.cast(QueuePubSub, subscriber._pubsub)
+        pubsub.items.extend(make_item(channel, data) for channel, data in self.redis.published)
+
+    def test_subscriber_gets_published_object_once(self) -> None:
+        subscriber = self.make_subscriber(LoopbackPolicy())
+        message = Timestamp(seconds=7)
+
+        self.publisher.publish(TIME, message)
+        self.echo(subscriber)
+        subscriber.step()
+
+        self.assertEqual(self.redis.published, [("time", message.SerializeToString())])
+        self.assertEqual(self.received, [message])
+        assert subscriber._loopback is not None
+        self.assertEqual(subscriber._loopback.echoes_dropped, 1)
+
+    def test_republished_message_is_not_changed_in_queue(self) -> None:
+        subscriber = self.make_subscriber(LoopbackPolicy())
+        message = Timestamp(seconds=7)
+
+        self.publisher.publish(TIME, message)
+        message.seconds = 8
+        self.publisher.publish(TIME, message)
+        subscriber.step()
+
+        self.assertEqual([received.seconds for received in self.received], [7, 8])
+        self.assertIsNot(self.received[1], message)
+
+    def test_identical_publish_after_echo_is_delivered(self) -> None:
+        subscriber = self.make_subscriber(LoopbackPolicy())
+
+        self.publisher.publish(TIME, Timestamp(seconds=7))
+        self.echo(subscriber)
+        subscriber.step()
+        self.redis.published.clear()
+        pubsub = T.cast(QueuePubSub, subscriber._pubsub)
+        # Another process publishes the same payload within the echo window
+        pubsub.items.append(make_item("time", Timestamp(seconds=7).SerializeToString()))
+        subscriber.step()
+
+        self.assertEqual([message.seconds for message in self.received], [7, 7])
+
+    def test_echo_kept_without_dedup(self) -> None:
+        subscriber = self.make_subscriber(LoopbackPolicy(dedup_echo=False))
+
+        self.publisher.publish(TIME, Timestamp(seconds=7))
+        self.echo(subscriber)
+        subscriber.step()
+
+        self.assertEqual([message.seconds for message in self.received], [7, 7])
+
+    def test_clients_without_loopback_only_use_redis(self) -> None:
+        subscriber = self.make_subscriber(None)
+
+        self.publisher.publish(TIME, Timestamp(seconds=7))
+        subscriber.step()
+        self.assertEqual(self.received, [])
+
+        self.echo(subscriber)
+        subscriber.step()
+        self.assertEqual([message.seconds for message in self.received], [7])
+
+    def test_close_unregisters(self) -> None:
+        subscriber = self.make_subscriber(LoopbackPolicy())
+        registered = len(local_router)
+        subscriber.close()
+
+        self.assertEqual(len(local_router), registered - 1)
+
+    def test_pattern_subscribers(self) -> None:
+        subscriber = self.make_client(LoopbackPolicy())
+        self.addCleanup(subscriber.close)
+        items: T.List[T.Any] = []
+        subscriber.default_message_callback = items.append
+        subscriber.subscribe_all()
+
+        self.publisher.publish(TIME, b"raw")
+        subscriber.step()
+
+        self.assertEqual(len(items), 1)
+        self.assertEqual((items[0]["type"], items[0]["pattern"]), ("pmessage", b"*"))
+        self.assertIsNone(items[0]["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
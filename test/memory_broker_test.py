@@ -0,0 +1,123 @@
+import asyncio
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import message_handler
+from ry_redis_bus.memory_broker import InMemoryBroker, MemoryPubSub
+
+TIME = Channel("time", None)
+
+
+def drain(pubsub: MemoryPubSub) -> T.List[T.Tuple[str, T.Any, T.Any]]:
+    items = []
+    while (item := pubsub.get_message()) is not None:
+        items.append((item["type"], item["channel"], item["data"]))
+    return items
+
+
+class InMemoryBrokerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.broker = InMemoryBroker()
+        self.pubsub = MemoryPubSub(self.broker, "test")
+
+    def test_get_message_contract(self) -> None:
+        self.pubsub.subscribe("a", "b")
+        self.pubsub.psubscribe("a*")
+
+        self.assertEqual(self.broker.publish("a", "x"), 2)
+        self.assertEqual(self.broker.publish("c", 1), 0)
+        self.pubsub.unsubscribe()
+        self.pubsub.punsubscribe()
+
+        self.assertEqual(
+            drain(self.pubsub),
+            [
+                ("subscribe", b"a", 1),
+                ("subscribe", b"b", 2),
+                ("psubscribe", b"a*", 3),
+                ("message", b"a", b"x"),
+                ("pmessage", b"a", b"x"),
+                ("unsubscribe", b"a", 2),
+                ("unsubscribe", b"b", 1),
+                ("punsubscribe", b"a*", 0),
+            ],
+        )
+        self.assertIsNone(self.pubsub.get_message(timeout=0.01))
+
+    def test_numsub_and_client_list(self) -> None:
+        self.pubsub.subscribe("a")
+        MemoryPubSub(self.broker, "other").subscribe("a")
+        self.broker.publish("a", b"12345")
+
+        self.assertEqual(self.broker.pubsub_numsub("a", "b"), [(b"a", 2), (b"b", 0)])
+        mine = [c for c in self.broker.client_list("pubsub") if c["name"] == "test"]
+        self.assertEqual(mine[0]["sub"], 1)
+        self.assertEqual(mine[0]["omem"], 5)
+
+    def test_sorted_sets_and_hashes(self) -> None:
+        self.broker.zadd("series", {"a": 1.0, "b": 2.0, "c": 3.0})
+        self.broker.hset("latest", "time", b"now")
+
+        self.assertEqual(self.broker.zrange("series", "(1", "+inf", byscore=True), [b"b", b"c"])
+        self.assertEqual(self.broker.zrange("series", 0, -2, withscores=True)[-1], (b"b", 2.0))
+        self.assertEqual(self.broker.zremrangebyscore("series", "-inf", "(3"), 2)
+        self.assertEqual(self.broker.hmget("latest", ["time", "other"]), [b"now", None])
+
+
+class MemoryBackendClientTest(MemoryBrokerTestBase):
+    def test_sync_round_trip(self) -> None:
+        subscriber, publisher = self.make_client(), self.make_client()
+        received: T.List[int] = []
+
+        @message_handler(warn_latency=False)
+        def on_time(message: Timestamp) -> None:
+            received.append(message.seconds)
+
+        subscriber.subscribe(TIME, on_time)
+        for seconds in range(3):
+            publisher.publish(TIME, Timestamp(seconds=seconds))
+        subscriber.step()
+
+        self.assertEqual(received, [0, 1, 2])
+
+    def test_resubscribe_without_gap_or_duplicates(self) -> None:
+        client = self.make_client()
+        received: T.List[bytes] = []
+        client.subscribe(TIME, lambda item: received.append(item["data"]))
+        self.broker.publish("time", b"before")
+
+        client.resubscribe()
+        self.broker.publish("time", b"after")
+        client.step()
+
+        self.assertEqual(received, [b"before", b"after"])
+        self.assertEqual(self.broker.pubsub_numsub("time"), [(b"time", 1)])
+
+    def test_async_round_trip(self) -> None:
+        subscriber, publisher = self.make_client(), self.make_client()
+        received: T.List[int] = []
+
+        @message_handler(warn_latency=False)
+        async def on_time(message: Timestamp) -> None:
+            received.append(message.seconds)
+
+        async def run() -> None:
+            await subscriber.asubscribe(TIME, on_time)
+            for seconds in range(3):
+                await publisher.apublish(TIME, Timestamp(seconds=seconds))
+            await subscriber.astep()
+            await asyncio.sleep(0)
+            await subscriber.aclose()
+            await publisher.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(received, [0, 1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
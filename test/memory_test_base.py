@@ -0,0 +1,45 @@
+"""
+Base test class that runs the clients against an in-process broker.
+
+Counterpart of RedisOnlyTestBase for tests about the clients rather than the server: there
+is no container to start, and every publish is queued for its subscribers before it
+returns, so a single step() sees it.
+"""
+
+import typing as T
+import unittest
+import uuid
+
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.memory_broker import InMemoryBroker
+from ry_redis_bus.redis_client_base import RedisClientBase
+
+
+def make_item(channel: str, data: T.Any, kind: str = "message") -> T.Dict[str, T.Any]:
+    """Item redis-py returns for a message, or for a subscription reply of another kind."""
+    return {"type": kind, "pattern": None, "channel": channel.encode(), "data": data}
+
+
+class MemoryBrokerTestBase(unittest.TestCase):
+    """Base test class that provides a fresh broker for every test."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.broker = InMemoryBroker()
+        # Shared memory rings and the local router are keyed by host, keep tests apart
+        self.redis_info = RedisInfo(f"memory-{uuid.uuid4().hex}", 6379, 0, "", "", "test_db")
+
+    def make_client(self, **kwargs: T.Any) -> RedisClientBase:
+        """Client on the broker, closed again when the test ends."""
+        client = RedisClientBase(
+            self.redis_info,
+            verbose=Verbose(verbose_types=["ipc"]),
+            backend=self.broker,
+            **kwargs,
+        )
+        # Otherwise the sync half skips its first steps waiting out the initial cooldown
+        client.sync_client.cooldown = 0.0
+        self.addCleanup(client.close)
+        return client
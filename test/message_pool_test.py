@@ -0,0 +1,63 @@
+import asyncio
+import typing as T
+import unittest
+
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.helpers import message_handler
+from ry_redis_bus.message_pool import MessagePool
+
+
+def make_item(message: Timestamp) -> T.Dict[str, T.Any]:
+    return {"type": "message", "channel": b"time", "data": message.SerializeToString()}
+
+
+class MessagePoolTest(unittest.TestCase):
+    def test_pool_is_bounded(self) -> None:
+        pool = MessagePool(Timestamp, size=1)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+
+        self.assertEqual(pool.allocated, 2)
+        self.assertEqual(len(pool), 1)
+        self.assertIs(pool.acquire(), first)
+
+    def test_sync_handler_reuses_cleared_instance(self) -> None:
+        received: T.List[T.Tuple[int, int, int]] = []
+
+        @message_handler(warn_latency=False, reuse=True)
+        def on_time(message: Timestamp) -> None:
+            received.append((id(message), message.seconds, message.nanos))
+
+        on_time(make_item(Timestamp(seconds=1, nanos=5)))
+        on_time(make_item(Timestamp(seconds=2)))
+
+        self.assertEqual(received[0][0], received[1][0])
+        self.assertEqual([r[1:] for r in received], [(1, 5), (2, 0)])
+        self.assertEqual(on_time.message_pool.allocated, 1)
+
+    def test_async_handlers_in_flight_get_their_own_instance(self) -> None:
+        received: T.List[int] = []
+
+        @message_handler(warn_latency=False, reuse=True)
+        async def on_time(message: Timestamp) -> None:
+            await asyncio.sleep(0)
+            received.append(message.seconds)
+
+        async def run() -> None:
+            await asyncio.gather(*(on_time(make_item(Timestamp(seconds=i))) for i in range(3)))
+
+        asyncio.run(run())
+
+        self.assertEqual(sorted(received), [0, 1, 2])
+        self.assertEqual(on_time.message_pool.allocated, 3)
+
+        def on_raw(message: bytes) -> None:
+            del message
+
+        self.assertIsNone(getattr(message_handler(on_raw), "message_pool"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import asyncio
+import socket
+import typing as T
+import unittest
+from unittest import mock
+
+import redis
+
+from ry_redis_bus import performance
+from ry_redis_bus.helpers import get_redis_client
+from ry_redis_bus.performance import (
+    AsyncTunedConnection,
+    PerformanceProfile,
+    TunedConnection,
+    check_runtime,
+    connection_kwargs,
+    socket_options,
+    tune_socket,
+)
+from ry_redis_bus.redis_info import RedisInfo
+
+REDIS_INFO = RedisInfo("localhost", 6379, 0, "", "", "test")
+
+
+def listener() -> socket.socket:
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    return server
+
+
+def option(sock: T.Any, level: int, name: int) -> int:
+    return int(sock.getsockopt(level, name))
+
+
+class PerformanceProfileTest(unittest.TestCase):
+    def test_socket_options(self) -> None:
+        options = socket_options(PerformanceProfile())
+        self.assertIn((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1), options)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), options)
+
+        options = socket_options(
+            PerformanceProfile(keepalive=False, receive_buffer=None, send_buffer=None)
+        )
+        self.assertEqual(options, [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+
+    def test_tune_socket(self) -> None:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            tune_socket(sock, PerformanceProfile(keepalive_idle=7))
+            self.assertEqual(option(sock, socket.IPPROTO_TCP, socket.TCP_NODELAY), 1)
+            self.assertEqual(option(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                self.assertEqual(option(sock, socket.IPPROTO_TCP, socket.TCP_KEEPIDLE), 7)
+
+    def test_unix_sockets_are_left_alone(self) -> None:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            tune_socket(sock, PerformanceProfile())
+            self.assertEqual(option(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE), 0)
+        tune_socket(None, PerformanceProfile())
+
+    def test_connection_kwargs(self) -> None:
+        profile = PerformanceProfile()
+        self.assertEqual(connection_kwargs(None, is_async=False), {})
+        self.assertEqual(
+            connection_kwargs(profile, is_async=False),
+            {"connection_class": TunedConnection, "profile": profile},
+        )
+        self.assertIs(
+            connection_kwargs(profile, is_async=True)["connection_class"], AsyncTunedConnection
+        )
+
+    def test_client_uses_tuned_connections(self) -> None:
+        profile = PerformanceProfile()
+        client = get_redis_client(REDIS_INFO, client_name="test", profile=profile)
+        pool = client.connection_pool
+        self.assertIs(pool.connection_class, TunedConnection)
+        self.assertIs(pool.connection_kwargs["profile"], profile)
+        self.assertEqual(pool.connection_kwargs["client_name"], "test")
+
+        plain = get_redis_client(REDIS_INFO)
+        self.assertIs(plain.connection_pool.connection_class, redis.connection.Connection)
+
+    def test_tuned_connection_tunes_its_socket(self) -> None:
+        with listener() as server:
+            port = server.getsockname()[1]
+            connection = TunedConnection(host="127.0.0.1", port=port, profile=PerformanceProfile())
+            sock = connection._connect()  # pylint: disable=protected-access
+            try:
+                self.assertEqual(option(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE), 1)
+            finally:
+                sock.close()
+
+    def test_async_tuned_connection_tunes_its_socket(self) -> None:
+        async def connect(port: int) -> int:
+            connection = AsyncTunedConnection(
+                host="127.0.0.1", port=port, profile=PerformanceProfile()
+            )
+            await connection._connect()  # pylint: disable=protected-access
+            try:
+                # pylint: disable-next=protected-access
+                sock = connection._writer.transport.get_extra_info("socket")  # type: ignore
+                return option(sock, socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+            finally:
+                await connection.disconnect()
+
+        with listener() as server:
+            self.assertEqual(asyncio.run(connect(server.getsockname()[1])), 1)
+
+    def test_run_falls_back_to_asyncio(self) -> None:
+        async def loop_module() -> str:
+            return type(asyncio.get_running_loop()).__module__
+
+        with mock.patch.object(performance, "optional_import", return_value=None):
+            self.assertTrue(performance.run(loop_module()).startswith("asyncio"))
+        self.assertTrue(
+            performance.run(loop_module(), PerformanceProfile(uvloop=False)).startswith("asyncio")
+        )
+
+    def test_check_runtime_warns(self) -> None:
+        with (
+            mock.patch.object(performance, "hiredis_available", return_value=False),
+            mock.patch("ry_redis_bus.performance.log.print_warn") as warn,
+        ):
+            check_runtime(PerformanceProfile(), is_async=False)
+            self.assertEqual(warn.call_count, 1)
+
+            warn.reset_mock()
+            check_runtime(PerformanceProfile(require_hiredis=False, uvloop=False), is_async=True)
+            warn.assert_not_called()
+
+            asyncio.run(self._check_async())
+            self.assertIn("uvloop", warn.call_args[0][0])
+
+    async def _check_async(self) -> None:
+        check_runtime(PerformanceProfile(require_hiredis=False), is_async=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
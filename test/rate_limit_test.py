@@ -0,0 +1,111 @@
+# pylint: disable=protected-access
+import asyncio
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.memory_broker import MemoryPubSub
+from ry_redis_bus.rate_limit import PublishLimiter, PublishPolicy, TokenBucket
+
+STATUS = Channel("status", None)
+
+
+class PublishLimiterTest(unittest.TestCase):
+    def test_token_bucket(self) -> None:
+        bucket = TokenBucket(rate=10.0, burst=2, now=0.0)
+        self.assertEqual([bucket.take(0.0) for _ in range(3)], [True, True, False])
+        self.assertFalse(bucket.take(0.05))
+        self.assertTrue(bucket.take(0.1))
+
+    def test_latest_wins(self) -> None:
+        limiter = PublishLimiter()
+        limiter.set_policy("status", PublishPolicy(max_rate=10.0), 0.0)
+
+        self.assertEqual(limiter.admit("status", 1, 0.0), [("status", 1)])
+        self.assertEqual(limiter.admit("status", 2, 0.01), [])
+        self.assertEqual(limiter.admit("status", 3, 0.02), [])
+        self.assertEqual(limiter.due(0.05), [])
+        self.assertEqual(limiter.due(0.1), [("status", 3)])
+        self.assertEqual(limiter.suppressed["status"], 1)
+        self.assertEqual(limiter.admit("other", 1, 0.1), [("other", 1)])
+
+    def test_publish_after_hold_replaces_pending(self) -> None:
+        limiter = PublishLimiter()
+        limiter.set_policy("status", PublishPolicy(max_rate=10.0), 0.0)
+        limiter.admit("status", 1, 0.0)
+        limiter.admit("status", 2, 0.05)
+
+        self.assertEqual(limiter.admit("status", 3, 0.2), [("status", 3)])
+        self.assertEqual(len(limiter), 0)
+        self.assertEqual(limiter.suppressed["status"], 1)
+
+    def test_drop_without_coalescing(self) -> None:
+        limiter = PublishLimiter()
+        limiter.set_policy("status", PublishPolicy(max_rate=1.0, coalesce=False), 0.0)
+        admitted = [limiter.admit("status", value, 0.0) for value in range(5)]
+
+        self.assertEqual(sum(len(items) for items in admitted), 1)
+        self.assertEqual(limiter.suppressed["status"], 4)
+        self.assertEqual(limiter.due(5.0), [])
+
+    def test_invalid_policy(self) -> None:
+        with self.assertRaises(ValueError):
+            PublishLimiter().set_policy("status", PublishPolicy(max_rate=0.0), 0.0)
+
+
+class ClientPublishPolicyTest(MemoryBrokerTestBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.subscriber = MemoryPubSub(self.broker, "subscriber")
+        self.subscriber.subscribe(str(STATUS))
+        self.subscriber.get_message()
+
+    def received(self) -> T.List[bytes]:
+        items = []
+        while (item := self.subscriber.get_message()) is not None:
+            items.append(item["data"])
+        return items
+
+    def test_tight_loop_sends_first_and_newest(self) -> None:
+        client = self.make_client()
+        client.set_publish_policy(STATUS, PublishPolicy(max_rate=0.5))
+        for value in range(100):
+            client.publish(STATUS, str(value))
+
+        self.assertEqual(self.received(), [b"0"])
+        self.assertEqual(client.sync_client.publish_suppressed["status"], 98)
+
+        client.close()
+        self.assertEqual(self.received(), [b"99"])
+
+    def test_step_flushes_when_allowed(self) -> None:
+        client = self.make_client()
+        client.set_publish_policy(STATUS, PublishPolicy(max_rate=1000.0))
+        client.publish(STATUS, "a")
+        client.publish(STATUS, "b")
+        self.assertEqual(self.received(), [b"a"])
+
+        bucket = client.sync_client._publish_limiter._buckets["status"]
+        bucket.updated -= 1.0
+        client.step()
+
+        self.assertEqual(self.received(), [b"b"])
+
+    def test_async_policy_set_before_first_use(self) -> None:
+        client = self.make_client()
+        client.set_publish_policy(STATUS, PublishPolicy(max_rate=0.5))
+
+        async def run() -> None:
+            for value in range(10):
+                await client.apublish(STATUS, str(value))
+            await client.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(self.received(), [b"0", b"9"])
+        self.assertEqual(client.async_client.publish_suppressed["status"], 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,7 @@ from ry_redis_bus.helpers import (
     message_handler,
 )
 from ry_redis_bus.redis_client_base import RedisClientBase
+from ry_redis_bus.timeseries import TimeSeriesWriter
 
 
 class MockProtobufMessageMeta(type):
@@ -205,6 +206,48 @@ class RedisClientTest(RedisOnlyTestBase):
 
         subscriber.join()
 
+    def test_last_value_snapshot(self) -> None:
+        conn_params = self.get_redis_connection_params()
+        redis_info = RedisInfo(
+            host=conn_params["host"],
+            port=conn_params["port"],
+            db=self.DB,
+            user="",
+            password="",
+            db_name="test_db",
+        )
+        publisher = RedisClientBase(
+            redis_info, verbose=Verbose(verbose_types=["ipc"]), last_value_cache=True
+        )
+        publisher.publish(channel=self.channel, message=b"latest_state")
+
+        received: T.List[bytes] = []
+        subscriber = RedisClientBase(
+            redis_info, verbose=Verbose(verbose_types=["ipc"]), last_value_cache=True
+        )
+        subscriber.subscribe(self.channel, lambda item: received.append(item["data"]))
+        subscriber.sync_client.cooldown = 0.0
+        subscriber.step()
+
+        self.assertEqual(received, [b"latest_state"])
+        self.assertEqual(subscriber.get_latest(self.channel), b"latest_state")
+
+        publisher.close()
+        subscriber.close()
+
+    def test_timeseries_range_and_trim(self) -> None:
+        writer = TimeSeriesWriter(self.redis_client.sync_client, retention=100.0, batch_size=10)
+        for i in range(25):
+            # Three members per score so pages have to continue through ties
+            writer.append(str(self.channel), f"member_{i}", score=float(i // 3))
+        writer.flush()
+
+        members = [member for member, _ in writer.range(str(self.channel), chunk=4)]
+        self.assertEqual(sorted(members), sorted(f"member_{i}".encode() for i in range(25)))
+
+        self.assertEqual(writer.trim(now=104.5), 15)
+        self.assertEqual(len(list(writer.range(str(self.channel)))), 10)
+
     def test_deserialize_checks(self) -> None:
         test_message = MockProtobufMessage()
 
@@ -0,0 +1,245 @@
+# pylint: disable=protected-access
+import typing as T
+import unittest
+from test.memory_test_base import make_item
+
+import redis
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.dedup import OverlapFilter
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.reconnect import Backoff, ConnectionState, ReconnectMachine
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+
+
+class AckingPubSub:
+    """Pubsub stand-in that acknowledges commands after the queued messages"""
+
+    def __init__(self, items: T.List[T.Dict[str, T.Any]]) -> None:
+        self.items = items
+        self.channels: T.Dict[str, None] = {}
+        self.patterns: T.Dict[str, None] = {}
+        self.subscribe_calls = 0
+        self.closed = False
+
+    def get_message(self, timeout: float = 0.0) -> T.Optional[T.Dict[str, T.Any]]:
+        del timeout
+        return self.items.pop(0) if self.items else None
+
+    def subscribe(self, *channels: str) -> None:
+        self.subscribe_calls += 1
+        for channel in channels:
+            self.channels[channel] = None
+            self.items.insert(0, make_item(channel, len(self.channels), "subscribe"))
+
+    def psubscribe(self, *patterns: str) -> None:
+        for pattern in patterns:
+            self.patterns[pattern] = None
+            self.items.insert(0, make_item(pattern, len(self.patterns), "psubscribe"))
+
+    def unsubscribe(self, *channels: str) -> None:
+        del channels
+        self.channels.clear()
+        self.items.append(make_item("", 0, "unsubscribe"))
+
+    def punsubscribe(self, *patterns: str) -> None:
+        del patterns
+        self.patterns.clear()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class SplitAckPubSub(AckingPubSub):
+    """Acknowledges the first subscription before the queued messages and the rest after"""
+
+    def subscribe(self, *channels: str) -> None:
+        self.subscribe_calls += 1
+        for index, channel in enumerate(channels):
+            self.channels[channel] = None
+            ack = make_item(channel, len(self.channels), "subscribe")
+            if index == 0:
+                self.items.insert(0, ack)
+            else:
+                self.items.append(ack)
+
+
+class BrokenPubSub(AckingPubSub):
+    def get_message(self, timeout: float = 0.0) -> T.Optional[T.Dict[str, T.Any]]:
+        raise redis.exceptions.ConnectionError("Connection reset by peer")
+
+
+class FakeRedis:
+    def __init__(self, pubsubs: T.List[AckingPubSub]) -> None:
+        self.pubsubs = pubsubs
+
+    def ping(self) -> bool:
+        return True
+
+    def pubsub(self) -> AckingPubSub:
+        return self.pubsubs.pop(0)
+
+
+class LoadingRedis(FakeRedis):
+    """Server that accepts connections but still loads its dataset"""
+
+    def ping(self) -> bool:
+        raise redis.exceptions.ResponseError("LOADING Redis is loading the dataset in memory")
+
+
+class OverlapFilterTest(unittest.TestCase):
+    def test_consumes_each_recorded_copy_once(self) -> None:
+        overlap = OverlapFilter(window=1.0)
+        overlap.record(make_item("pose", b"1"), now=0.0)
+
+        self.assertTrue(overlap.consume(make_item("pose", b"1"), now=0.5))
+        self.assertFalse(overlap.consume(make_item("pose", b"1"), now=0.5))
+        self.assertFalse(overlap.consume(make_item("pose", b"2"), now=0.5))
+
+    def test_expires_after_window(self) -> None:
+        overlap = OverlapFilter(window=1.0)
+        overlap.record(make_item("pose", b"1"), now=0.0)
+
+        self.assertFalse(overlap.consume(make_item("pose", b"1"), now=2.0))
+        self.assertEqual(len(overlap), 0)
+
+
+class ReconnectMachineTest(unittest.TestCase):
+    def test_backoff_grows_with_jitter_up_to_cap(self) -> None:
+        backoff = Backoff(base=1.0, cap=4.0)
+        delays = [backoff.next_delay() for _ in range(5)]
+
+        for delay, ceiling in zip(delays, (1.0, 2.0, 4.0, 4.0, 4.0)):
+            self.assertGreaterEqual(delay, ceiling / 2.0)
+            self.assertLessEqual(delay, ceiling)
+
+    def test_records_outage_and_lost_window(self) -> None:
+        machine = ReconnectMachine(Backoff(base=1.0, cap=1.0))
+        delay = machine.connection_lost(now=10.0, last_message_at=8.0)
+        machine.connection_lost(now=11.0, last_message_at=11.0)
+
+        self.assertFalse(machine.should_restore(10.0 + delay / 2.0))
+        self.assertTrue(machine.should_restore(12.0))
+
+        outage = machine.restored(now=13.0)
+
+        self.assertEqual(machine.state, ConnectionState.CONNECTED)
+        self.assertEqual(outage.duration, 3.0)
+        self.assertEqual(outage.lost_window, (8.0, 13.0))
+        self.assertEqual(outage.attempts, 2)
+        self.assertEqual(machine.metrics.outages, 1)
+        self.assertEqual(machine.metrics.total_lost_time, 5.0)
+        self.assertEqual(machine.backoff.attempts, 0)
+
+
+class SyncResubscribeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = SyncRedisClientBase(
+            RedisInfo("localhost", 6379, 0, "", "", "test_db"),
+            verbose=Verbose(),
+        )
+        self.client.cooldown = 0.0
+        self.received: T.List[bytes] = []
+
+    def test_subscribe_many_sends_one_command(self) -> None:
+        pubsub = AckingPubSub([])
+        self.client._client = FakeRedis([pubsub])  # type: ignore[assignment]
+
+        self.client.subscribe_many(
+            {
+                Channel("pose", None): self.received.append,
+                Channel("status", None): self.received.append,
+            }
+        )
+
+        self.assertEqual(pubsub.subscribe_calls, 1)
+        self.assertEqual(list(pubsub.channels), ["pose", "status"])
+
+    def test_resubscribe_handles_overlap_once(self) -> None:
+        old = AckingPubSub([])
+        new = AckingPubSub([])
+        self.client._client = FakeRedis([old, new])  # type: ignore[assignment]
+        self.client.subscribe(
+            Channel("pose", None), lambda item: self.received.append(item["data"])
+        )
+        old.items = [make_item("pose", b"1"), make_item("pose", b"2")]
+        new.items = [make_item("pose", b"2"), make_item("pose", b"3")]
+
+        self.client.resubscribe()
+        self.client.step()
+
+        self.assertEqual(self.received, [b"1", b"2", b"3"])
+        self.assertTrue(old.closed)
+        self.assertIs(self.client._pubsub, new)
+
+    def test_resubscribe_skips_old_copy_of_message_between_acks(self) -> None:
+        old = AckingPubSub([])
+        new = SplitAckPubSub([])
+        self.client._client = FakeRedis([old, new])  # type: ignore[assignment]
+        self.client.subscribe_many(
+            {
+                Channel("pose", None): lambda item: self.received.append(item["data"]),
+                Channel("status", None): lambda item: self.received.append(item["data"]),
+            }
+        )
+        old.items = [make_item("pose", b"1"), make_item("pose", b"2")]
+        new.items = [make_item("pose", b"2")]
+
+        self.client.resubscribe()
+        self.client.step()
+        self.assertEqual(self.received, [b"2", b"1"])
+
+        new.items = [make_item("pose", b"2")]
+        self.client.step()
+
+        self.assertEqual(self.received, [b"2", b"1", b"2"])
+        self.assertFalse(self.client._resubscribe_overlap)
+
+    def test_restores_subscriptions_after_connection_loss(self) -> None:
+        broken = BrokenPubSub([])
+        restored = AckingPubSub([])
+        self.client._client = FakeRedis([broken, restored])  # type: ignore[assignment]
+        self.client.subscribe_many(
+            {
+                Channel("pose", None): lambda item: self.received.append(item["data"]),
+                Channel("status", None): lambda item: self.received.append(item["data"]),
+            }
+        )
+        self.client.subscribe_all()
+
+        self.client.step()
+        self.assertEqual(self.client.reconnect.state, ConnectionState.DISCONNECTED)
+        self.assertIsNone(self.client._pubsub)
+
+        restored.items = [make_item("pose", b"1")]
+        self.client.cooldown = 0.0
+        self.client.reconnect.retry_at = 0.0
+        self.client.step()
+
+        self.assertEqual(self.client.reconnect.state, ConnectionState.CONNECTED)
+        self.assertEqual(restored.subscribe_calls, 1)
+        self.assertEqual(list(restored.channels), ["pose", "status"])
+        self.assertEqual(list(restored.patterns), ["*"])
+        self.assertEqual(self.received, [b"1"])
+        self.assertEqual(self.client.reconnect.metrics.outages, 1)
+
+    def test_restore_errors_back_off(self) -> None:
+        broken = BrokenPubSub([])
+        self.client._client = FakeRedis([broken])  # type: ignore[assignment]
+        self.client.subscribe(Channel("pose", None), self.received.append)
+        self.client.step()
+        self.assertEqual(self.client.reconnect.state, ConnectionState.DISCONNECTED)
+
+        self.client._client = LoadingRedis([])  # type: ignore[assignment]
+        self.client.cooldown = 0.0
+        self.client.reconnect.retry_at = 0.0
+        self.client.step()
+
+        self.assertEqual(self.client.reconnect.state, ConnectionState.DISCONNECTED)
+        self.assertGreater(self.client.cooldown, 0.0)
+        self.assertGreater(self.client.reconnect.retry_at, 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
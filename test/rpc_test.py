@@ -0,0 +1,155 @@
+# pylint: disable=protected-access
+import asyncio
+import concurrent.futures
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.redis_client_base import RedisClientBase
+from ry_redis_bus.rpc import (
+    STATUS_ERROR,
+    STATUS_OK,
+    PendingCalls,
+    RpcError,
+    decode_request,
+    encode_reply,
+    encode_request,
+    new_correlation_id,
+    rpc_handler,
+)
+
+
+class RpcTest(unittest.TestCase):
+    def test_request_round_trip(self) -> None:
+        correlation_id = new_correlation_id()
+        data = encode_request(correlation_id, "db:rpc:host:1", b"payload")
+
+        request = decode_request(data)
+
+        assert request is not None
+        self.assertEqual(request.correlation_id, correlation_id)
+        self.assertEqual(request.reply_channel, "db:rpc:host:1")
+        self.assertEqual(request.payload, b"payload")
+        self.assertIsNone(decode_request(b"payload"))
+
+    def test_pending_calls_resolve_and_expire(self) -> None:
+        pending = PendingCalls()
+        ok_id, error_id, slow_id = (new_correlation_id() for _ in range(3))
+        futures: T.List[concurrent.futures.Future[T.Any]] = [
+            concurrent.futures.Future() for _ in range(3)
+        ]
+        pending.add(ok_id, futures[0], deadline=10.0)
+        pending.add(error_id, futures[1], deadline=10.0)
+        pending.add(slow_id, futures[2], deadline=1.0)
+
+        self.assertTrue(pending.resolve(encode_reply(ok_id, STATUS_OK, b"pong")))
+        self.assertTrue(pending.resolve(encode_reply(error_id, STATUS_ERROR, b"boom")))
+        self.assertFalse(pending.resolve(encode_reply(new_correlation_id(), STATUS_OK, b"")))
+        self.assertEqual(pending.expire(now=2.0), 1)
+
+        self.assertEqual(futures[0].result(), b"pong")
+        self.assertRaises(RpcError, futures[1].result)
+        self.assertRaises(TimeoutError, futures[2].result)
+        self.assertEqual(len(pending), 0)
+
+    def test_rpc_handler_sends_reply(self) -> None:
+        published: T.List[T.Tuple[str, bytes]] = []
+
+        class Server:
+            @rpc_handler(warn_latency=False)
+            def handle(self, message: Timestamp) -> Timestamp:
+                return Timestamp(seconds=message.seconds + 1)
+
+            def send_rpc(self, channel: str, data: bytes) -> None:
+                published.append((channel, data))
+
+        correlation_id = new_correlation_id()
+        item = {
+            "type": "message",
+            "channel": b"service",
+            "data": encode_request(
+                correlation_id, "reply_channel", Timestamp(seconds=41).SerializeToString()
+            ),
+        }
+        Server().handle(item)
+
+        pending = PendingCalls()
+        future: concurrent.futures.Future[T.Any] = concurrent.futures.Future()
+        pending.add(correlation_id, future, deadline=10.0, reply_type=Timestamp)
+        self.assertEqual(published[0][0], "reply_channel")
+        self.assertTrue(pending.resolve(published[0][1]))
+        self.assertEqual(future.result().seconds, 42)
+
+
+class Incrementer:
+    def __init__(self, client: RedisClientBase) -> None:
+        self.client = client
+
+    @rpc_handler(warn_latency=False)
+    def handle(self, message: Timestamp) -> Timestamp:
+        return Timestamp(seconds=message.seconds + 1)
+
+    def send_rpc(self, channel: str, data: bytes) -> None:
+        self.client.send_rpc(channel, data)
+
+    async def asend_rpc(self, channel: str, data: bytes) -> None:
+        await self.client.asend_rpc(channel, data)
+
+
+class BrokerRpcTest(MemoryBrokerTestBase):
+    def test_step_sends_requests_and_dispatches_replies(self) -> None:
+        service = Channel("increment", None)
+        server = self.make_client()
+        server.subscribe(service, Incrementer(server).handle)
+        caller = self.make_client()
+
+        future = caller.request(service, Timestamp(seconds=41), timeout=5.0, reply_type=Timestamp)
+        # The calling thread leaves the pubsub connections to the thread that steps
+        self.assertIsNone(caller.sync_client._priority_pubsub)
+        self.assertEqual(self.broker.published, 0)
+
+        for _ in range(3):
+            caller.step()
+            server.step()
+        self.assertEqual(future.result(timeout=0).seconds, 42)
+        self.assertNotEqual(
+            caller.sync_client.rpc.reply_channel, server.sync_client.rpc.reply_channel
+        )
+
+    def test_rpc_traffic_skips_last_value_cache(self) -> None:
+        service = Channel("increment", None)
+        server = self.make_client(last_value_cache=True)
+        server.subscribe(service, Incrementer(server).handle)
+        caller = self.make_client(last_value_cache=True)
+
+        future = caller.request(service, Timestamp(seconds=1), timeout=5.0, reply_type=Timestamp)
+        for _ in range(3):
+            caller.step()
+            server.step()
+
+        self.assertEqual(future.result(timeout=0).seconds, 2)
+        self.assertEqual(self.broker.hashes.get(b"test_db:latest", {}), {})
+
+    def test_async_step_sends_requests_and_dispatches_replies(self) -> None:
+        service = Channel("increment", None)
+        server = self.make_client()
+        server.subscribe(service, Incrementer(server).handle)
+
+        async def run() -> int:
+            caller = self.make_client()
+            caller.async_client.cooldown = 0.0
+            future = await caller.arequest(
+                service, Timestamp(seconds=41), timeout=5.0, reply_type=Timestamp
+            )
+            self.assertIsNone(caller.async_client._priority_pubsub)
+            for _ in range(3):
+                await caller.astep()
+                server.step()
+            reply = await asyncio.wait_for(future, timeout=1.0)
+            await caller.aclose()
+            return int(reply.seconds)
+
+        self.assertEqual(asyncio.run(run()), 42)
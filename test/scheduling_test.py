@@ -0,0 +1,35 @@
+import unittest
+
+from ry_redis_bus.scheduling import ChannelScheduler
+from ry_redis_bus.subscription import Priority, SubscriptionOptions
+
+
+class ChannelSchedulerTest(unittest.TestCase):
+    def test_round_robin_by_weight(self) -> None:
+        scheduler = ChannelScheduler()
+        bulk = SubscriptionOptions(priority=Priority.BULK)
+        for i in range(10):
+            scheduler.enqueue("bulk", i, bulk)
+        for i in range(3):
+            scheduler.enqueue("control", i, SubscriptionOptions(weight=2))
+
+        first_round = next(scheduler.rounds())
+
+        self.assertEqual(first_round, [("bulk", 0), ("control", 0), ("control", 1)])
+        self.assertEqual(len(scheduler), 10)
+
+    def test_bulk_budget_leaves_remainder_queued(self) -> None:
+        scheduler = ChannelScheduler(bulk_budget=4)
+        bulk = SubscriptionOptions(priority=Priority.BULK)
+        for i in range(10):
+            scheduler.enqueue("bulk", i, bulk)
+        scheduler.enqueue("status", "ok")
+
+        dispatched = [item for batch in scheduler.rounds() for item in batch]
+
+        self.assertEqual(dispatched.count(("status", "ok")), 1)
+        self.assertEqual([item for channel, item in dispatched if channel == "bulk"], [0, 1, 2, 3])
+        self.assertEqual(len(scheduler), 6)
+
+        next_step = [item for batch in scheduler.rounds() for _, item in batch]
+        self.assertEqual(next_step, [4, 5, 6, 7])
@@ -0,0 +1,199 @@
+import asyncio
+import typing as T
+import unittest
+import uuid
+
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.memory_broker import InMemoryBroker
+from ry_redis_bus.redis_info import RedisInfo
+from ry_redis_bus.rpc import reply_channel_name, rpc_handler
+from ry_redis_bus.sharding import HashRing, ShardedRedisClient, hash_tag, node_name
+
+
+def make_nodes(count: int) -> T.List[RedisInfo]:
+    host = f"memory-{uuid.uuid4().hex}"
+    return [RedisInfo(host, 6379 + port, 0, "", "", "test_db") for port in range(count)]
+
+
+class Cluster:
+    """Backend with one broker per node"""
+
+    def __init__(self, nodes: T.Sequence[RedisInfo]) -> None:
+        self.brokers = {node_name(node): InMemoryBroker() for node in nodes}
+
+    def broker(self, node: RedisInfo) -> InMemoryBroker:
+        return self.brokers[node_name(node)]
+
+    def connect(self, redis_info: RedisInfo, client_name: str) -> T.Any:
+        return self.broker(redis_info).connect(redis_info, client_name)
+
+    async def aconnect(self, redis_info: RedisInfo, client_name: str) -> T.Any:
+        return await self.broker(redis_info).aconnect(redis_info, client_name)
+
+
+class Incrementer:
+    def __init__(self, client: ShardedRedisClient) -> None:
+        self.client = client
+
+    @rpc_handler(warn_latency=False)
+    def handle(self, message: Timestamp) -> Timestamp:
+        return Timestamp(seconds=message.seconds + 1)
+
+    def send_rpc(self, channel: str, data: bytes) -> None:
+        self.client.send_rpc(channel, data)
+
+
+class HashRingTest(unittest.TestCase):
+    def test_channels_spread_and_stay_put(self) -> None:
+        nodes = make_nodes(4)
+        ring = HashRing(nodes)
+        names = [f"robot.{i}.pose" for i in range(2000)]
+        owners = {name: ring.index_for(name) for name in names}
+
+        counts = [list(owners.values()).count(index) for index in range(4)]
+        self.assertTrue(all(300 < count < 700 for count in counts), counts)
+        rebuilt = HashRing(nodes)
+        self.assertEqual(owners, {name: rebuilt.index_for(name) for name in names})
+
+    def test_adding_a_node_only_moves_its_channels(self) -> None:
+        nodes = make_nodes(5)
+        before, after = HashRing(nodes[:4]), HashRing(nodes)
+        for i in range(2000):
+            owner = after.node_for(f"channel{i}")
+            if owner != nodes[4]:
+                self.assertEqual(owner, before.node_for(f"channel{i}"))
+
+    def test_hash_tags(self) -> None:
+        self.assertEqual(hash_tag("robot.{7}.pose"), "7")
+        self.assertEqual(hash_tag("robot.{}.pose"), "robot.{}.pose")
+        ring = HashRing(make_nodes(8))
+        self.assertEqual(
+            {ring.index_for(f"robot.{{7}}.{name}") for name in ("pose", "cmd", "state")},
+            {ring.index_for("7")},
+        )
+
+    def test_invalid_nodes(self) -> None:
+        with self.assertRaises(ValueError):
+            HashRing([])
+        node = make_nodes(1)[0]
+        with self.assertRaises(ValueError):
+            HashRing([node, node])
+
+
+class ShardedClientTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.nodes = make_nodes(3)
+        self.cluster = Cluster(self.nodes)
+        self.client = ShardedRedisClient(
+            self.nodes, Verbose(verbose_types=["ipc"]), backend=self.cluster
+        )
+        for client in self.client.clients:
+            client.sync_client.cooldown = 0.0
+        self.addCleanup(self.client.close)
+
+    def test_publish_and_subscribe_use_the_owning_node(self) -> None:
+        channels = [Channel(f"robot.{i}.pose", None) for i in range(12)]
+        received: T.List[T.Tuple[bytes, bytes]] = []
+        self.client.subscribe_many(
+            {
+                channel: lambda item: received.append((item["channel"], item["data"]))
+                for channel in channels
+            }
+        )
+
+        for channel in channels:
+            self.client.publish(channel, str(channel).encode())
+        self.client.step()
+
+        self.assertEqual(sorted(received), sorted((str(c).encode(),) * 2 for c in channels))
+        for channel in channels:
+            owner = self.cluster.broker(self.client.ring.node_for(str(channel)))
+            self.assertEqual(owner.pubsub_numsub(str(channel))[0][1], 1)
+        self.assertEqual(
+            sum(broker.published for broker in self.cluster.brokers.values()), len(channels)
+        )
+
+    def test_subscribe_all_covers_every_node(self) -> None:
+        received: T.List[bytes] = []
+        sharded = ShardedRedisClient(
+            self.nodes,
+            Verbose(verbose_types=["ipc"]),
+            default_message_callback=lambda item: received.append(item["channel"]),
+            backend=self.cluster,
+        )
+        self.addCleanup(sharded.close)
+        for client in sharded.clients:
+            client.sync_client.cooldown = 0.0
+        sharded.subscribe_all()
+
+        names = [f"channel{i}" for i in range(20)]
+        for name in names:
+            self.client.publish(Channel(name, None), b"x")
+        sharded.step()
+
+        self.assertEqual(sorted(received), sorted(name.encode() for name in names))
+
+    def test_astep_does_not_wait_for_a_slow_node(self) -> None:
+        order: T.List[str] = []
+        slow, *others = self.client.clients
+
+        async def slow_step() -> None:
+            order.append("slow started")
+            await asyncio.sleep(0.05)
+            order.append("slow done")
+
+        def other_step(name: str) -> T.Callable[[], T.Coroutine[T.Any, T.Any, None]]:
+            async def step() -> None:
+                order.append(name)
+
+            return step
+
+        slow.astep = slow_step  # type: ignore[method-assign]
+        for index, client in enumerate(others):
+            client.astep = other_step(f"node{index}")  # type: ignore[method-assign]
+        asyncio.run(self.client.astep())
+
+        self.assertEqual(order, ["slow started", "node0", "node1", "slow done"])
+
+    def test_replies_go_to_the_node_of_the_caller(self) -> None:
+        service = Channel("increment", None)
+        self.client.subscribe(service, Incrementer(self.client).handle)
+        owner = self.client.client_for(service)
+        node = node_name(self.client.ring.node_for(str(service)))
+        # A reply channel that hashes to another node than the one it is subscribed on
+        reply_channel = next(
+            name
+            for name in (reply_channel_name("test_db", node) for _ in range(1000))
+            if self.client.client_for(name) is not owner
+        )
+        owner.sync_client.rpc.reply_channel = reply_channel
+
+        future = self.client.request(service, Timestamp(seconds=41), reply_type=Timestamp)
+        for _ in range(3):
+            self.client.step()
+
+        self.assertEqual(future.result(timeout=0).seconds, 42)
+
+    def test_step_callbacks_run_once_per_step(self) -> None:
+        steps: T.List[float] = []
+        self.client.add_step_callback(steps.append)
+        self.client.step()
+        self.client.remove_step_callback(steps.append)
+        self.client.step()
+
+        self.assertEqual(len(steps), 1)
+
+    def test_mget_keeps_key_order(self) -> None:
+        keys = [f"key{i}" for i in range(10)]
+        for key in keys:
+            self.cluster.broker(self.client.ring.node_for(key)).set(key, key.encode())
+
+        self.assertEqual(self.client.mget(keys + ["missing"]), [k.encode() for k in keys] + [None])
+        self.assertEqual(self.client.get("key3"), b"key3")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,230 @@
+# pylint: disable=protected-access
+import multiprocessing
+import os
+import threading
+import time
+import typing as T
+import unittest
+import uuid
+from test.conflation_test import QueuePubSub
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ryutils.verbose import Verbose
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.helpers import RedisInfo
+from ry_redis_bus.memory_broker import MemoryPubSub
+from ry_redis_bus.redis_client_base_sync import SyncRedisClientBase
+from ry_redis_bus.shm_transport import (
+    FLAG_ON_REDIS,
+    SharedMemoryTransport,
+    ShmRing,
+    ShmRingConfig,
+    ring_lock,
+    ring_name,
+)
+
+SMALL_RING = ShmRingConfig(slot_count=4, slot_size=64)
+
+
+def publish_from_child(namespace: str, channel: str, count: int) -> None:
+    transport = SharedMemoryTransport(namespace)
+    ring = transport.writer(channel, SMALL_RING)
+    assert ring is not None
+    for i in range(count):
+        ring.write(str(i).encode())
+    transport.close()
+
+
+class FakeRedis:
+    def __init__(self, subscribers: int) -> None:
+        self.subscribers = subscribers
+        self.published: T.List[T.Tuple[str, bytes]] = []
+
+    def ping(self) -> bool:
+        return True
+
+    def pubsub_numsub(self, channel: str) -> T.List[T.Tuple[bytes, int]]:
+        return [(channel.encode(), self.subscribers)]
+
+    def pubsub_numpat(self) -> int:
+        return 0
+
+    def publish(self, channel: str, data: bytes) -> None:
+        self.published.append((channel, data))
+
+    def close(self) -> None:
+        pass
+
+
+class ShmRingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.name = ring_name(uuid.uuid4().hex, "ring_test")
+        self.writer = ShmRing(self.name, SMALL_RING)
+        self.reader = ShmRing(self.name, ShmRingConfig())
+
+    def tearDown(self) -> None:
+        self.reader.close()
+        self.writer.close()
+
+    def test_reader_uses_creator_geometry(self) -> None:
+        self.assertEqual(self.reader.slot_count, 4)
+        self.assertEqual(self.reader.slot_size, 64)
+
+    def test_round_trip_with_flags(self) -> None:
+        self.assertTrue(self.writer.write(b"a"))
+        self.assertTrue(self.writer.write(b"b", FLAG_ON_REDIS))
+        self.assertFalse(self.writer.write(b"x" * 65))
+
+        self.assertEqual(self.reader.read(10), [(b"a", 0), (b"b", FLAG_ON_REDIS)])
+        self.assertEqual(self.reader.read(10), [])
+
+    def test_overrun_counts_lost(self) -> None:
+        for i in range(10):
+            self.writer.write(str(i).encode())
+
+        self.assertEqual([data for data, _ in self.reader.read(10)], [b"6", b"7", b"8", b"9"])
+        self.assertEqual(self.reader.lost, 6)
+
+    def test_single_live_writer(self) -> None:
+        self.assertTrue(self.writer.claim_writer(os.getppid()))
+        self.assertFalse(self.reader.claim_writer(os.getpid()))
+        self.writer.release_writer(os.getppid())
+        self.assertTrue(self.reader.claim_writer(os.getpid()))
+        self.reader.release_writer(os.getpid())
+
+    def test_claims_wait_for_the_ring_lock(self) -> None:
+        claimed: T.List[bool] = []
+        claim = threading.Thread(target=lambda: claimed.append(self.reader.claim_writer(1, 2)))
+        with ring_lock(self.name):
+            claim.start()
+            claim.join(timeout=0.1)
+            self.assertTrue(claim.is_alive())
+        claim.join(timeout=10)
+
+        self.assertEqual(claimed, [True])
+        self.reader.release_writer(1, 2)
+
+    def test_clients_of_one_process_get_their_own_slots(self) -> None:
+        namespace = uuid.uuid4().hex
+        first, second = SharedMemoryTransport(namespace), SharedMemoryTransport(namespace)
+        try:
+            first.open_reader("pose", SMALL_RING)
+            second.open_reader("pose", SMALL_RING)
+            self.assertEqual(first.readers["pose"].live_readers(), 2)
+            second.close_reader("pose")
+            self.assertEqual(first.readers["pose"].live_readers(), 1)
+
+            self.assertIsNotNone(first.writer("pose", SMALL_RING))
+            self.assertIsNone(second.writer("pose", SMALL_RING))
+        finally:
+            first.close()
+            second.close()
+
+    def test_remote_answer_is_cached_for_the_check_period(self) -> None:
+        transport = SharedMemoryTransport(uuid.uuid4().hex)
+        transport.set_remote("pose", False, now=10.0)
+
+        self.assertFalse(transport.cached_remote("pose", now=10.5))
+        self.assertIsNone(transport.cached_remote("pose", now=11.5))
+        self.assertIsNone(transport.cached_remote("pose", now=10.0, period=0.0))
+
+    def test_other_process_publishes(self) -> None:
+        namespace = uuid.uuid4().hex
+        transport = SharedMemoryTransport(namespace)
+        transport.open_reader("pose", SMALL_RING)
+        try:
+            child = multiprocessing.Process(target=publish_from_child, args=(namespace, "pose", 3))
+            child.start()
+            child.join(timeout=10)
+
+            messages = transport.poll(10, now=0.0)
+        finally:
+            transport.close()
+
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(messages, [("pose", b"0"), ("pose", b"1"), ("pose", b"2")])
+
+
+class SyncSharedMemoryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.client = SyncRedisClientBase(
+            RedisInfo(uuid.uuid4().hex, 6379, 0, "", "", "test_db"),
+            verbose=Verbose(verbose_types=["ipc"]),
+        )
+        self.client._pubsub = QueuePubSub([])  # type: ignore[assignment]
+        self.client.cooldown = 0.0
+        self.channel = Channel("pose", None, shared_memory=SMALL_RING)
+        self.received: T.List[bytes] = []
+        self.client.subscribe(self.channel, lambda item: self.received.append(item["data"]))
+
+    def tearDown(self) -> None:
+        self.client.close()
+
+    def test_local_subscribers_skip_redis(self) -> None:
+        redis_client = FakeRedis(subscribers=1)
+        self.client._client = redis_client  # type: ignore[assignment]
+
+        self.client.publish(self.channel, b"local")
+        self.client.step()
+
+        self.assertEqual(self.received, [b"local"])
+        self.assertEqual(redis_client.published, [])
+
+    def test_remote_subscribers_get_redis_copy_once(self) -> None:
+        redis_client = FakeRedis(subscribers=2)
+        self.client._client = redis_client  # type: ignore[assignment]
+
+        self.client.publish(self.channel, b"shared")
+        pubsub = T.cast(QueuePubSub, self.client._pubsub)
+        pubsub.items.append(
+            {"type": "message", "pattern": None, "channel": b"pose", "data": b"shared"}
+        )
+        self.client.step()
+
+        self.assertEqual(redis_client.published, [("pose", b"shared")])
+        self.assertEqual(self.received, [b"shared"])
+
+    def test_redis_copy_before_ring_is_delivered_once(self) -> None:
+        redis_client = FakeRedis(subscribers=2)
+        self.client._client = redis_client  # type: ignore[assignment]
+
+        self.client.publish(self.channel, b"shared")
+        # The Redis copy is handled before the next step polls the ring
+        redis_item = {"type": "message", "pattern": None, "channel": b"pose", "data": b"shared"}
+        self.client._handle_item(redis_item, time.time(), priority=False)
+        self.client.step()
+        self.client.publish(self.channel, b"next")
+        self.client.step()
+
+        self.assertEqual(self.received, [b"shared", b"next"])
+
+
+class BrokerSharedMemoryTest(MemoryBrokerTestBase):
+    def test_pattern_subscribers_get_redis_copy(self) -> None:
+        channel = Channel("pose", None, shared_memory=SMALL_RING)
+        received: T.List[bytes] = []
+        reader = self.make_client()
+        reader.subscribe(channel, lambda item: received.append(item["data"]))
+        publisher = self.make_client()
+
+        publisher.publish(channel, b"ring only")
+        self.assertEqual(self.broker.published, 0)
+
+        listener = MemoryPubSub(self.broker, "logger")
+        self.addCleanup(listener.close)
+        listener.psubscribe("*")
+        # Expires the cached answer from before the pattern subscriber came
+        publisher.sync_client._shm.set_remote(str(channel), False, 0.0)
+        publisher.publish(channel, b"both")
+        reader.step()
+
+        self.assertEqual(T.cast(T.Any, listener.get_message())["type"], "psubscribe")
+        message = listener.get_message()
+        assert message is not None
+        self.assertEqual((message["type"], message["data"]), ("pmessage", b"both"))
+        self.assertEqual(received, [b"ring only", b"both"])
+
+
+if __name__ == "__main__":
+    unittest.main()
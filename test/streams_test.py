@@ -0,0 +1,201 @@
+import asyncio
+import json
+import time
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.codec import JsonCodec
+from ry_redis_bus.memory_broker import MemoryPubSub
+from ry_redis_bus.streams import Stream, WindowResult, count, latest, mean, total
+
+READINGS = Channel("stream_readings", None, JsonCodec())
+TOTALS = Channel("stream_totals", None, JsonCodec())
+
+
+def reading(robot: str, value: float, at: float) -> T.Dict[str, T.Any]:
+    return {"robot": robot, "value": value, "at": at}
+
+
+class StreamTest(unittest.TestCase):
+    def test_filter_map_and_running_aggregate(self) -> None:
+        results: T.List[T.Any] = []
+        stream = (
+            Stream(READINGS)
+            .filter(lambda r: r["value"] > 0)
+            .map(lambda r: (r["robot"], r["value"]))
+            .aggregate(total(lambda pair: pair[1]), key=lambda pair: pair[0])
+            .sink(results.append)
+        )
+        for robot, value in (("a", 1.0), ("b", -1.0), ("a", 2.0), ("b", 5.0)):
+            stream.process(reading(robot, value, 0.0))
+
+        self.assertEqual(results, [("a", 1.0), ("a", 3.0), ("b", 5.0)])
+
+    def test_running_aggregate_keys_are_bounded(self) -> None:
+        results: T.List[T.Any] = []
+        stream = Stream(READINGS).aggregate(count(), key=lambda r: r["robot"], max_keys=2)
+        stream.sink(results.append)
+        for robot in "abca":
+            stream.process(reading(robot, 1.0, 0.0))
+
+        self.assertEqual(results[-1], ("a", 1))
+        self.assertEqual(T.cast(T.Any, stream.operators[0]).evicted, 2)
+
+    def test_tumbling_windows(self) -> None:
+        results: T.List[WindowResult] = []
+        stream = (
+            Stream(READINGS)
+            .window(size=10.0, timestamp=lambda r: r["at"])
+            .aggregate(count(), key=lambda r: r["robot"])
+            .sink(results.append)
+        )
+        for robot, at in (("a", 1.0), ("b", 2.0), ("a", 9.0), ("a", 12.0), ("a", 35.0)):
+            stream.process(reading(robot, 1.0, at))
+
+        self.assertEqual(
+            [(r.start, r.end, r.key, r.value) for r in results],
+            [(0.0, 10.0, "a", 2), (0.0, 10.0, "b", 1), (10.0, 20.0, "a", 1)],
+        )
+        stream.flush()
+        self.assertEqual((results[-1].start, results[-1].value), (30.0, 1))
+
+    def test_sliding_windows_and_late_values(self) -> None:
+        results: T.List[WindowResult] = []
+        stream = Stream(READINGS).window(size=3.0, slide=1.0).aggregate(mean(lambda r: r["value"]))
+        stream.sink(results.append)
+        for value, now in ((1.0, 0.5), (2.0, 1.5), (3.0, 2.5), (4.0, 3.5)):
+            stream.process(reading("a", value, 0.0), now)
+        stream.process(reading("a", 100.0, 0.0), 0.2)
+        stream.flush(4.0)
+
+        self.assertEqual(
+            [(r.start, r.end, r.value) for r in results],
+            [(-2.0, 1.0, 1.0), (-1.0, 2.0, 1.5), (0.0, 3.0, 2.0), (1.0, 4.0, 3.0)],
+        )
+        self.assertEqual(T.cast(T.Any, stream.operators[0]).late, 1)
+
+    def test_tick_closes_windows_by_the_clock(self) -> None:
+        results: T.List[WindowResult] = []
+        by_arrival = Stream(READINGS).window(size=10.0).aggregate(count()).sink(results.append)
+        by_arrival.process(reading("a", 1.0, 0.0), now=101.0)
+        by_arrival.tick(109.0)
+        by_arrival.tick(110.0)
+
+        by_timestamp = (
+            Stream(READINGS)
+            .window(size=10.0, timestamp=lambda r: r["at"])
+            .aggregate(count())
+            .sink(results.append)
+        )
+        # Arrived at 500 with timestamp 6, so its window is over 4 seconds later
+        by_timestamp.process(reading("a", 1.0, 6.0), now=500.0)
+        by_timestamp.tick(503.0)
+        self.assertEqual(len(results), 1)
+        by_timestamp.tick(504.0)
+
+        self.assertEqual([(r.start, r.value) for r in results], [(100.0, 1), (0.0, 1)])
+
+    def test_window_keys_are_bounded(self) -> None:
+        stream = (
+            Stream(READINGS)
+            .window(size=1.0)
+            .aggregate(latest(), key=lambda r: r["robot"], max_keys=1)
+        )
+        for robot in "abc":
+            stream.process(reading(robot, 1.0, 0.0), 0.0)
+
+        self.assertEqual(T.cast(T.Any, stream.operators[0]).overflow, 2)
+
+    def test_invalid_windows(self) -> None:
+        with self.assertRaises(ValueError):
+            Stream(READINGS).window(size=2.5, slide=1.0).aggregate(count())
+        with self.assertRaises(ValueError):
+            Stream(READINGS).window(size=2.0, slide=1.0).aggregate(
+                count().__class__(list, list.__add__)
+            )
+
+
+class AttachedStreamTest(MemoryBrokerTestBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.results = MemoryPubSub(self.broker, "results")
+        self.results.subscribe(str(TOTALS))
+        self.results.get_message()
+
+    def published(self) -> T.List[T.Any]:
+        items = []
+        while (item := self.results.get_message()) is not None:
+            items.append(json.loads(item["data"]))
+        return items
+
+    def make_stream(self) -> Stream:
+        return (
+            Stream(READINGS)
+            .window(size=10.0, timestamp=lambda r: r["at"])
+            .aggregate(total(lambda r: r["value"]))
+            .map(lambda result: {"start": result.start, "total": result.value})
+            .publish(TOTALS)
+        )
+
+    def test_results_are_published_back(self) -> None:
+        client = self.make_client()
+        self.make_stream().attach(client)
+        for value, at in ((1.0, 1.0), (2.0, 5.0), (4.0, 11.0)):
+            client.publish(READINGS, reading("a", value, at))
+        client.step()
+
+        self.assertEqual(self.published(), [{"start": 0.0, "total": 3.0}])
+
+    def test_windows_of_quiet_channels_close_on_step(self) -> None:
+        client = self.make_client()
+        self.make_stream().attach(client)
+        # The window ends 0.1 seconds after the newest reading arrives
+        for value, at in ((1.0, 1.0), (2.0, 9.9)):
+            client.publish(READINGS, reading("a", value, at))
+        client.step()
+        self.assertEqual(self.published(), [])
+
+        time.sleep(0.15)
+        client.step()
+
+        self.assertEqual(self.published(), [{"start": 0.0, "total": 3.0}])
+
+    def test_async_windows_of_quiet_channels_close_on_step(self) -> None:
+        client = self.make_client()
+
+        async def run() -> None:
+            await self.make_stream().aattach(client.async_client)
+            await client.apublish(READINGS, reading("a", 1.0, 9.9))
+            await client.astep()
+            await asyncio.sleep(0.15)
+            await client.astep()
+            await client.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(self.published(), [{"start": 0.0, "total": 1.0}])
+
+    def test_async_attach(self) -> None:
+        client = self.make_client()
+        stream = self.make_stream()
+
+        async def run() -> None:
+            await stream.aattach(client.async_client)
+            for value, at in ((1.0, 1.0), (2.0, 15.0)):
+                await client.apublish(READINGS, reading("a", value, at))
+            await client.astep()
+            await asyncio.sleep(0.01)
+            await stream.aflush()
+            await client.aclose()
+
+        asyncio.run(run())
+
+        self.assertEqual(
+            self.published(), [{"start": 0.0, "total": 1.0}, {"start": 10.0, "total": 2.0}]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
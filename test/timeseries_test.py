@@ -0,0 +1,105 @@
+import asyncio
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+from unittest import mock
+
+import redis
+
+from ry_redis_bus.memory_broker import AsyncMemoryPipeline, MemoryPipeline
+from ry_redis_bus.timeseries import AsyncTimeSeriesWriter, TimeSeriesWriter, series_key
+
+
+class TimeSeriesTest(MemoryBrokerTestBase):
+    def test_batches_are_written_in_one_pipeline(self) -> None:
+        client = self.make_client()
+        writer = TimeSeriesWriter(client.sync_client, batch_size=3)
+        key = series_key(self.redis_info.db_name, "pose")
+
+        writer.append("pose", "a", score=1.0)
+        writer.append("pose", "b", score=2.0)
+        self.assertNotIn(key.encode(), self.broker.sorted_sets)
+        writer.append("pose", "c", score=3.0)
+        self.assertEqual(len(self.broker.sorted_sets[key.encode()]), 3)
+
+        writer.append("pose", "d", score=4.0)
+        self.assertEqual(writer.flush(), 1)
+        self.assertEqual(writer.flush(), 0)
+
+    def test_failed_batch_is_written_by_next_flush(self) -> None:
+        writer = TimeSeriesWriter(self.make_client().sync_client, batch_size=10)
+        key = series_key(self.redis_info.db_name, "pose")
+        writer.append("pose", "a", score=1.0)
+        writer.append("pose", "b", score=2.0)
+
+        failure = redis.exceptions.ConnectionError("Connection reset by peer")
+        with mock.patch.object(MemoryPipeline, "execute", side_effect=failure):
+            self.assertEqual(writer.flush(), 0)
+        # Written again since the failure, the newer score wins
+        writer.append("pose", "b", score=3.0)
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(self.broker.sorted_sets[key.encode()], {b"a": 1.0, b"b": 3.0})
+
+    def test_repeated_members_count_once_towards_batch(self) -> None:
+        writer = TimeSeriesWriter(self.make_client().sync_client, batch_size=2)
+        key = series_key(self.redis_info.db_name, "pose")
+
+        writer.append("pose", "a", score=1.0)
+        writer.append("pose", "a", score=2.0)
+        self.assertNotIn(key.encode(), self.broker.sorted_sets)
+        writer.append("pose", "b", score=3.0)
+        self.assertEqual(self.broker.sorted_sets[key.encode()], {b"a": 2.0, b"b": 3.0})
+
+    def test_range_pages_through_ties_and_trim(self) -> None:
+        writer = TimeSeriesWriter(self.make_client().sync_client, retention=100.0, batch_size=10)
+        for i in range(25):
+            # Three members per score so pages have to continue through ties
+            writer.append("pose", f"member_{i}", score=float(i // 3))
+        writer.flush()
+
+        members = [member for member, _ in writer.range("pose", chunk=4)]
+        # Members that tie on score come back in lexicographical order
+        self.assertEqual(len(members), 25)
+        self.assertEqual(sorted(members), sorted(f"member_{i}".encode() for i in range(25)))
+        self.assertEqual([score for _, score in writer.range("pose", 7, 8)], [7.0, 7.0, 7.0, 8.0])
+
+        self.assertEqual(writer.trim(now=104.5), 15)
+        self.assertEqual(len(list(writer.range("pose"))), 10)
+
+    def test_async_writer(self) -> None:
+        client = self.make_client()
+
+        async def run() -> T.Tuple[int, T.List[bytes]]:
+            writer = AsyncTimeSeriesWriter(client.async_client, retention=10.0, batch_size=100)
+            for i in range(7):
+                await writer.append("pose", f"member_{i}", score=float(i))
+            await writer.flush()
+            trimmed = await writer.trim(now=14.5)
+            members = [member async for member, _ in writer.range("pose", chunk=2)]
+            await client.aclose()
+            return trimmed, members
+
+        trimmed, members = asyncio.run(run())
+
+        self.assertEqual(trimmed, 5)
+        self.assertEqual(members, [b"member_5", b"member_6"])
+
+    def test_async_failed_batch_is_written_by_next_flush(self) -> None:
+        client = self.make_client()
+        failure = redis.exceptions.ConnectionError("Connection reset by peer")
+
+        async def run() -> T.Tuple[int, int]:
+            writer = AsyncTimeSeriesWriter(client.async_client, batch_size=10)
+            await writer.append("pose", "a", score=1.0)
+            with mock.patch.object(AsyncMemoryPipeline, "execute", side_effect=failure):
+                failed = await writer.flush()
+            written = await writer.flush()
+            await client.aclose()
+            return failed, written
+
+        self.assertEqual(asyncio.run(run()), (0, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
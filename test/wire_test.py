@@ -0,0 +1,173 @@
+import time
+import typing as T
+import unittest
+from test.memory_test_base import MemoryBrokerTestBase
+
+from google.protobuf import descriptor_pool, message_factory
+from google.protobuf.descriptor_pb2 import (  # pylint: disable=no-name-in-module
+    FieldDescriptorProto,
+    FileDescriptorProto,
+)
+from google.protobuf.message import Message
+from google.protobuf.timestamp_pb2 import Timestamp  # pylint: disable=no-name-in-module
+
+from ry_redis_bus.channels import Channel
+from ry_redis_bus.subscription import SubscriptionOptions
+from ry_redis_bus.wire import (
+    FieldPredicate,
+    FieldReader,
+    PublishTimeReader,
+    WireFilter,
+    scan_field,
+)
+
+SCALAR_FIELDS = [
+    ("robot_id", 2, FieldDescriptorProto.TYPE_INT32),
+    ("name", 3, FieldDescriptorProto.TYPE_STRING),
+    ("speed", 4, FieldDescriptorProto.TYPE_DOUBLE),
+    ("offset", 5, FieldDescriptorProto.TYPE_SINT64),
+    ("active", 6, FieldDescriptorProto.TYPE_BOOL),
+    ("level", 7, FieldDescriptorProto.TYPE_FLOAT),
+]
+
+
+def make_status_type() -> T.Type[Message]:
+    file_proto = FileDescriptorProto(
+        name="test/wire_status.proto",
+        package="wire_test",
+        syntax="proto3",
+        dependency=["google/protobuf/timestamp.proto"],
+    )
+    message_proto = file_proto.message_type.add(name="Status")
+    message_proto.field.add(
+        name="utime",
+        number=1,
+        type=FieldDescriptorProto.TYPE_MESSAGE,
+        type_name=".google.protobuf.Timestamp",
+    )
+    for name, number, field_type in SCALAR_FIELDS:
+        message_proto.field.add(name=name, number=number, type=field_type)
+    message_proto.field.add(
+        name="tags",
+        number=8,
+        type=FieldDescriptorProto.TYPE_STRING,
+        label=FieldDescriptorProto.LABEL_REPEATED,
+    )
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.AddSerializedFile(Timestamp.DESCRIPTOR.file.serialized_pb)
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("wire_test.Status"))
+
+
+STATUS_TYPE = make_status_type()
+STATUS = Channel("wire_status", STATUS_TYPE)
+
+
+def status(published: T.Optional[float] = None, **values: T.Any) -> bytes:
+    message = T.cast(T.Any, STATUS_TYPE(**values))
+    if published is None:
+        message.utime.GetCurrentTime()
+    else:
+        message.utime.FromNanoseconds(int(published * 1e9))
+    return T.cast(bytes, message.SerializeToString())
+
+
+class FieldReaderTest(unittest.TestCase):
+    def test_reads_every_scalar_type(self) -> None:
+        values: T.Dict[str, T.Any] = {
+            "robot_id": -7,
+            "name": "arm",
+            "speed": 1.5,
+            "offset": -3,
+            "active": True,
+            "level": 0.25,
+        }
+        data = status(**values)
+        for name, value in values.items():
+            self.assertEqual(FieldReader(STATUS_TYPE.DESCRIPTOR, name).read(data), value)
+        self.assertEqual(FieldReader(STATUS_TYPE.DESCRIPTOR, 2).read(data), -7)
+
+    def test_missing_field_has_default(self) -> None:
+        self.assertEqual(FieldReader(STATUS_TYPE.DESCRIPTOR, "robot_id").read(status()), 0)
+
+    def test_first_occurrence_is_read(self) -> None:
+        data = status(robot_id=1) + status(robot_id=2)
+        self.assertEqual(scan_field(data, 2), (0, 1))
+
+    def test_only_scalar_fields(self) -> None:
+        for field in ("utime", "tags", "missing"):
+            with self.assertRaises(ValueError):
+                FieldReader(STATUS_TYPE.DESCRIPTOR, field)
+
+    def test_malformed_payload_passes(self) -> None:
+        wire_filter = WireFilter(STATUS_TYPE, [FieldPredicate("robot_id", 7)])
+        self.assertTrue(wire_filter.matches(b"\x10"))
+        self.assertFalse(wire_filter.matches(status(robot_id=8)))
+        self.assertTrue(wire_filter.matches(status(robot_id=7)))
+
+
+class PublishTimeReaderTest(unittest.TestCase):
+    def test_reads_utime(self) -> None:
+        reader = PublishTimeReader(STATUS_TYPE)
+        self.assertAlmostEqual(T.cast(float, reader.read(status(1234.5))), 1234.5)
+        self.assertIsNone(reader.read(STATUS_TYPE(robot_id=1).SerializeToString()))
+
+    def test_needs_a_timestamp_field(self) -> None:
+        with self.assertRaises(ValueError):
+            PublishTimeReader(STATUS_TYPE, "robot_id")
+
+
+class SubscriptionWhereTest(MemoryBrokerTestBase):
+    def test_non_matching_messages_are_not_handled(self) -> None:
+        received: T.List[bytes] = []
+        client = self.make_client()
+        client.subscribe(
+            STATUS,
+            lambda item: received.append(item["data"]),
+            SubscriptionOptions(
+                where=[
+                    FieldPredicate("robot_id", 7),
+                    FieldPredicate("speed", test=lambda speed: speed > 1.0),
+                ]
+            ),
+        )
+        payloads = [
+            status(robot_id=7, speed=2.0),
+            status(robot_id=8, speed=2.0),
+            status(robot_id=7, speed=0.5),
+        ]
+        for payload in payloads:
+            self.broker.publish(str(STATUS), payload)
+        client.step()
+
+        self.assertEqual(received, payloads[:1])
+        self.assertEqual(client.sync_client.filtered_out["wire_status"], 2)
+
+    def test_stale_messages_are_dropped(self) -> None:
+        received: T.List[bytes] = []
+        client = self.make_client()
+        client.subscribe(
+            STATUS, lambda item: received.append(item["data"]), SubscriptionOptions(max_age=1.0)
+        )
+        now = time.time()
+        payloads = [status(now - 10.0), status(now - 0.1), STATUS_TYPE().SerializeToString()]
+        for payload in payloads:
+            self.broker.publish(str(STATUS), payload)
+        client.step()
+
+        self.assertEqual(received, payloads[1:])
+        self.assertEqual(client.sync_client.stale_dropped["wire_status"], 1)
+
+    def test_channel_needs_a_protobuf_type(self) -> None:
+        client = self.make_client()
+        with self.assertRaises(ValueError):
+            client.subscribe(
+                Channel("raw", None),
+                lambda item: None,
+                SubscriptionOptions(where=[FieldPredicate("robot_id", 7)]),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()